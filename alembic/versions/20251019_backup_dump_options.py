@@ -0,0 +1,34 @@
+"""backup_settings: формат дампа, число потоков, метод сжатия
+
+Revision ID: 20251019_backup_dump_options
+Revises: 20251019_products_updated_at
+Create Date: 2025-10-19 15:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20251019_backup_dump_options"
+down_revision = "20251019_products_updated_at"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    cols = {c["name"] for c in sa.inspect(bind).get_columns("backup_settings")}
+    with op.batch_alter_table("backup_settings") as batch:
+        if "dump_format" not in cols:
+            batch.add_column(sa.Column("dump_format", sa.String(16), nullable=False, server_default="custom"))
+        if "dump_jobs" not in cols:
+            batch.add_column(sa.Column("dump_jobs", sa.Integer, nullable=False, server_default="1"))
+        if "compression" not in cols:
+            batch.add_column(sa.Column("compression", sa.String(16), nullable=False, server_default="gzip:9"))
+
+
+def downgrade():
+    with op.batch_alter_table("backup_settings") as batch:
+        batch.drop_column("compression")
+        batch.drop_column("dump_jobs")
+        batch.drop_column("dump_format")
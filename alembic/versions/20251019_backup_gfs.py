@@ -0,0 +1,31 @@
+"""backup_settings: политика хранения GFS (недельные и месячные копии)
+
+Revision ID: 20251019_backup_gfs
+Revises: 20251019_backup_verify
+Create Date: 2025-10-19 19:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20251019_backup_gfs"
+down_revision = "20251019_backup_verify"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    cols = {c["name"] for c in sa.inspect(bind).get_columns("backup_settings")}
+    with op.batch_alter_table("backup_settings") as batch:
+        if "keep_weekly" not in cols:
+            batch.add_column(sa.Column("keep_weekly", sa.Integer, nullable=False, server_default="0"))
+        if "keep_monthly" not in cols:
+            batch.add_column(sa.Column("keep_monthly", sa.Integer, nullable=False, server_default="0"))
+
+
+def downgrade():
+    with op.batch_alter_table("backup_settings") as batch:
+        batch.drop_column("keep_monthly")
+        batch.drop_column("keep_weekly")
@@ -0,0 +1,35 @@
+"""backup_settings: инкрементальные бэкапы (флаг, период полного дампа, состояние цепочки)
+
+Revision ID: 20251019_backup_incremental
+Revises: 20251019_backup_dump_options
+Create Date: 2025-10-19 16:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "20251019_backup_incremental"
+down_revision = "20251019_backup_dump_options"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    cols = {c["name"] for c in sa.inspect(bind).get_columns("backup_settings")}
+    with op.batch_alter_table("backup_settings") as batch:
+        if "incremental_enabled" not in cols:
+            batch.add_column(sa.Column("incremental_enabled", sa.Boolean, nullable=False, server_default=sa.false()))
+        if "full_every_days" not in cols:
+            batch.add_column(sa.Column("full_every_days", sa.Integer, nullable=False, server_default="7"))
+        if "chain_state" not in cols:
+            batch.add_column(sa.Column("chain_state", postgresql.JSONB, nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("backup_settings") as batch:
+        batch.drop_column("chain_state")
+        batch.drop_column("full_every_days")
+        batch.drop_column("incremental_enabled")
@@ -0,0 +1,38 @@
+"""backup_settings: манифест последнего бэкапа и тест-восстановление
+
+Revision ID: 20251019_backup_verify
+Revises: 20251019_backup_incremental
+Create Date: 2025-10-19 17:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "20251019_backup_verify"
+down_revision = "20251019_backup_incremental"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    cols = {c["name"] for c in sa.inspect(bind).get_columns("backup_settings")}
+    with op.batch_alter_table("backup_settings") as batch:
+        if "last_manifest" not in cols:
+            batch.add_column(sa.Column("last_manifest", postgresql.JSONB, nullable=True))
+        if "test_restore_every_days" not in cols:
+            batch.add_column(sa.Column("test_restore_every_days", sa.Integer, nullable=False, server_default="0"))
+        if "last_test_restore_at" not in cols:
+            batch.add_column(sa.Column("last_test_restore_at", sa.TIMESTAMP, nullable=True))
+        if "last_test_restore_status" not in cols:
+            batch.add_column(sa.Column("last_test_restore_status", sa.String(255), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("backup_settings") as batch:
+        batch.drop_column("last_test_restore_status")
+        batch.drop_column("last_test_restore_at")
+        batch.drop_column("test_restore_every_days")
+        batch.drop_column("last_manifest")
@@ -0,0 +1,40 @@
+"""bg_jobs: фоновые задачи админки (бэкап, восстановление, очистка) и их статус
+
+Revision ID: 20251019_bg_jobs
+Revises: 20251019_backup_gfs
+Create Date: 2025-10-19 20:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20251019_bg_jobs"
+down_revision = "20251019_backup_gfs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+
+    if "bg_jobs" not in insp.get_table_names():
+        op.create_table(
+            "bg_jobs",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("kind", sa.String(32), nullable=False),
+            sa.Column("state", sa.String(16), nullable=False, server_default="queued"),
+            sa.Column("progress", sa.String(255)),
+            sa.Column("result", sa.String(1024)),
+            sa.Column("started_by", sa.BigInteger),
+            sa.Column("created_at", sa.TIMESTAMP, nullable=False, server_default=sa.text("CURRENT_TIMESTAMP")),
+            sa.Column("started_at", sa.TIMESTAMP),
+            sa.Column("finished_at", sa.TIMESTAMP),
+        )
+        op.create_index("ix_bg_jobs_created_at", "bg_jobs", ["created_at"])
+
+
+def downgrade():
+    op.drop_index("ix_bg_jobs_created_at", table_name="bg_jobs")
+    op.drop_table("bg_jobs")
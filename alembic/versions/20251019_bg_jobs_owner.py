@@ -0,0 +1,26 @@
+"""bg_jobs.owner: воркер (host:pid), выполняющий задачу
+
+Revision ID: 20251019_bg_jobs_owner
+Revises: 20251019_sm_prihod_doc_idx
+Create Date: 2025-10-20 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20251019_bg_jobs_owner"
+down_revision = "20251019_sm_prihod_doc_idx"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    cols = {c["name"] for c in sa.inspect(bind).get_columns("bg_jobs")}
+    if "owner" not in cols:
+        op.add_column("bg_jobs", sa.Column("owner", sa.String(64)))
+
+
+def downgrade():
+    op.drop_column("bg_jobs", "owner")
@@ -0,0 +1,26 @@
+"""cn_purchases: индекс (status, created_at) для списков по вкладкам
+
+Revision ID: 20251019_cn_status_created_idx
+Revises: 20251019_receiving_docs
+Create Date: 2025-10-19 11:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "20251019_cn_status_created_idx"
+down_revision = "20251019_receiving_docs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # IF NOT EXISTS — индекс мог уже создать init_db()/create_all
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_cn_purchases_status_created "
+        "ON cn_purchases (status, created_at)"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_cn_purchases_status_created")
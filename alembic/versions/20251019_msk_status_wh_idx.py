@@ -0,0 +1,26 @@
+"""msk_inbound_docs: индекс (status, target_warehouse_id, created_at) для вкладок
+
+Revision ID: 20251019_msk_status_wh_idx
+Revises: 20251019_cn_status_created_idx
+Create Date: 2025-10-19 12:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "20251019_msk_status_wh_idx"
+down_revision = "20251019_cn_status_created_idx"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # IF NOT EXISTS — индекс мог уже создать init_db()/create_all
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_msk_inbound_status_wh_created "
+        "ON msk_inbound_docs (status, target_warehouse_id, created_at)"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_msk_inbound_status_wh_created")
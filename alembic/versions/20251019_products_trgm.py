@@ -0,0 +1,42 @@
+"""products: pg_trgm GIN-индексы по name/article для поиска в пикерах
+
+Revision ID: 20251019_products_trgm
+Revises: 20251019_msk_status_wh_idx
+Create Date: 2025-10-19 13:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "20251019_products_trgm"
+down_revision = "20251019_msk_status_wh_idx"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Расширение может требовать прав суперпользователя — без него просто остаёмся на seq scan.
+    op.execute("""
+        DO $$
+        BEGIN
+            CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        EXCEPTION WHEN insufficient_privilege THEN
+            RAISE NOTICE 'pg_trgm: недостаточно прав, индексы поиска не созданы';
+        END$$;
+    """)
+    op.execute("""
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+                CREATE INDEX IF NOT EXISTS ix_products_name_trgm
+                    ON products USING gin (name gin_trgm_ops);
+                CREATE INDEX IF NOT EXISTS ix_products_article_trgm
+                    ON products USING gin (article gin_trgm_ops);
+            END IF;
+        END$$;
+    """)
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_products_article_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_products_name_trgm")
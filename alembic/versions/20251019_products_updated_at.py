@@ -0,0 +1,32 @@
+"""products.updated_at для инкрементального обновления кэша каталога
+
+Revision ID: 20251019_products_updated_at
+Revises: 20251019_products_trgm
+Create Date: 2025-10-19 14:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20251019_products_updated_at"
+down_revision = "20251019_products_trgm"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    cols = {c["name"] for c in sa.inspect(bind).get_columns("products")}
+    if "updated_at" not in cols:
+        op.add_column(
+            "products",
+            sa.Column("updated_at", sa.TIMESTAMP, server_default=sa.text("CURRENT_TIMESTAMP")),
+        )
+        op.execute("UPDATE products SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_products_updated_at ON products (updated_at)")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_products_updated_at")
+    op.drop_column("products", "updated_at")
@@ -0,0 +1,70 @@
+"""receiving_docs: шапки документов поступления + backfill из stock_movements
+
+Revision ID: 20251019_receiving_docs
+Revises: 20250922_supplies_v1
+Create Date: 2025-10-19 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20251019_receiving_docs"
+down_revision = "20250922_supplies_v1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+
+    if "receiving_docs" not in insp.get_table_names():
+        op.create_table(
+            "receiving_docs",
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=False),  # = stock_movements.doc_id
+            sa.Column("name", sa.String(255), nullable=False),
+            sa.Column("date", sa.TIMESTAMP, nullable=False, server_default=sa.text("CURRENT_TIMESTAMP")),
+            sa.Column("warehouse_id", sa.Integer, sa.ForeignKey("warehouses.id")),
+            sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id")),
+            sa.Column("lines_count", sa.Integer, nullable=False, server_default="0"),
+            sa.Column("total_qty", sa.Integer, nullable=False, server_default="0"),
+        )
+        op.create_index("ix_receiving_docs_date", "receiving_docs", ["date"])
+
+    # Backfill: одна шапка на doc_id прихода.
+    # Имя — как в _doc_label: [DOCNAME: ...] → CN-код → «№<doc_id>».
+    op.execute(r"""
+        INSERT INTO receiving_docs (id, name, date, warehouse_id, user_id, lines_count, total_qty)
+        SELECT
+            g.doc_id,
+            LEFT(COALESCE(
+                NULLIF(btrim(substring(g.comment FROM '(?i)\[(?:DOCNAME|NAME)\s*:\s*([^\]]+)\]')), ''),
+                upper(substring(g.comment FROM '(?i)(CN-\d{8}-\d{6})')),
+                '№' || g.doc_id
+            ), 255),
+            COALESCE(g.date, CURRENT_TIMESTAMP),
+            g.warehouse_id,
+            g.user_id,
+            g.lines_count,
+            g.total_qty
+        FROM (
+            SELECT
+                doc_id,
+                max(comment)      AS comment,
+                min(date)         AS date,
+                min(warehouse_id) AS warehouse_id,
+                min(user_id)      AS user_id,
+                count(*)          AS lines_count,
+                COALESCE(sum(qty), 0) AS total_qty
+            FROM stock_movements
+            WHERE type = 'prihod' AND doc_id IS NOT NULL
+            GROUP BY doc_id
+        ) AS g
+        ON CONFLICT (id) DO NOTHING
+    """)
+
+
+def downgrade():
+    op.drop_index("ix_receiving_docs_date", table_name="receiving_docs")
+    op.drop_table("receiving_docs")
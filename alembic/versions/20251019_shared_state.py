@@ -0,0 +1,44 @@
+"""shared_state + fsm_states: общее состояние и FSM для нескольких процессов бота (STATE_BACKEND=db)
+
+Revision ID: 20251019_shared_state
+Revises: 20251019_slow_queries
+Create Date: 2025-10-19 23:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20251019_shared_state"
+down_revision = "20251019_slow_queries"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+    tables = insp.get_table_names()
+
+    if "shared_state" not in tables:
+        op.create_table(
+            "shared_state",
+            sa.Column("namespace", sa.String(64), primary_key=True),
+            sa.Column("key", sa.String(128), primary_key=True),
+            sa.Column("value", sa.Text, nullable=False),
+            sa.Column("updated_at", sa.TIMESTAMP, nullable=False, server_default=sa.text("CURRENT_TIMESTAMP")),
+        )
+
+    if "fsm_states" not in tables:
+        op.create_table(
+            "fsm_states",
+            sa.Column("key", sa.String(255), primary_key=True),
+            sa.Column("state", sa.String(255)),
+            sa.Column("data", sa.Text),
+            sa.Column("updated_at", sa.TIMESTAMP, nullable=False, server_default=sa.text("CURRENT_TIMESTAMP")),
+        )
+
+
+def downgrade():
+    op.drop_table("fsm_states")
+    op.drop_table("shared_state")
@@ -0,0 +1,41 @@
+"""slow_queries: журнал медленных SQL-запросов (кольцо) с планами EXPLAIN
+
+Revision ID: 20251019_slow_queries
+Revises: 20251019_bg_jobs
+Create Date: 2025-10-19 22:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20251019_slow_queries"
+down_revision = "20251019_bg_jobs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+
+    if "slow_queries" not in insp.get_table_names():
+        op.create_table(
+            "slow_queries",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("fingerprint", sa.String(16), nullable=False),
+            sa.Column("statement", sa.Text, nullable=False),
+            sa.Column("params_shape", sa.String(255)),
+            sa.Column("duration_ms", sa.Float, nullable=False),
+            sa.Column("handler", sa.String(64)),
+            sa.Column("plan", sa.Text),
+            sa.Column("created_at", sa.TIMESTAMP, nullable=False, server_default=sa.text("CURRENT_TIMESTAMP")),
+        )
+        op.create_index("ix_slow_queries_created_at", "slow_queries", ["created_at"])
+        op.create_index("ix_slow_queries_fingerprint", "slow_queries", ["fingerprint"])
+
+
+def downgrade():
+    op.drop_index("ix_slow_queries_fingerprint", table_name="slow_queries")
+    op.drop_index("ix_slow_queries_created_at", table_name="slow_queries")
+    op.drop_table("slow_queries")
@@ -0,0 +1,26 @@
+"""stock_movements: частичный индекс doc_id по приходам (next_receiving_doc_id)
+
+Revision ID: 20251019_sm_prihod_doc_idx
+Revises: 20251019_shared_state
+Create Date: 2025-10-20 09:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "20251019_sm_prihod_doc_idx"
+down_revision = "20251019_shared_state"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # IF NOT EXISTS — индекс мог уже создать init_db()/create_all
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_stock_movements_prihod_doc "
+        "ON stock_movements (doc_id) WHERE type = 'prihod'"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_stock_movements_prihod_doc")
@@ -0,0 +1,2 @@
+# bench/ — нагрузочный стенд: синтетическая БД (bench.seed) и прогон сценариев через
+# настоящий Dispatcher.feed_update с подменённой сессией Bot API (bench.run).
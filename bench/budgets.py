@@ -0,0 +1,53 @@
+# bench/budgets.py
+# Бюджеты SQL-запросов на шаг сценария (bench/budgets.json): «открыть карточку поставки ≤ 5».
+#
+#   python -m bench.run --check-budgets                 # exit 1, если шаг превысил бюджет
+#   python -m bench.run --flows manager --update-budgets   # осознанно переснять «эталон» после правки
+#   BENCH_SQL_BUDGETS=1 python -m pytest -q bench          # то же тестами, по тесту на сценарий (CI)
+#
+# Считаются все запросы апдейта, включая RoleCheckMiddleware (поиск пользователя — 1).
+# Сравнивается медиана по итерациям: редкая догрузка кэша каталога не даёт ложных срабатываний,
+# а N+1 (запрос на позицию) поднимает каждую итерацию и ловится.
+# Бюджеты только замеренные: `bench.seed` + `bench.run --update-budgets` на стенде, файл — в коммит.
+# Шаг без записанного бюджета — нарушение (а не «не проверяется»): незамеренный шаг не должен
+# молча проходить проверку.
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Dict, List, Mapping
+
+BUDGETS_FILE = Path(__file__).with_name("budgets.json")
+
+Budgets = Dict[str, Dict[str, int]]   # flow → step → max запросов
+
+
+def load(path: Path = BUDGETS_FILE) -> Budgets:
+    if not path.exists():
+        return {}
+    with path.open(encoding="utf-8") as f:
+        return {flow: {step: int(n) for step, n in steps.items()} for flow, steps in json.load(f).items()}
+
+
+def check(observed: Mapping[str, Mapping[str, int]], budgets: Budgets) -> List[str]:
+    """Нарушения вида 'flow/step: 7 > 5'; observed — flow → step → медиана запросов."""
+    violations: List[str] = []
+    for flow, steps in observed.items():
+        for step, queries in steps.items():
+            limit = budgets.get(flow, {}).get(step)
+            if limit is None:
+                violations.append(f"{flow}/{step}: {queries}, no recorded budget (bench.run --update-budgets)")
+            elif queries > limit:
+                violations.append(f"{flow}/{step}: {queries} > {limit}")
+    return violations
+
+
+def update(observed: Mapping[str, Mapping[str, int]], path: Path = BUDGETS_FILE) -> Budgets:
+    """Переписать бюджеты прогнанных сценариев наблюдёнными значениями; остальные сохраняются."""
+    budgets = load(path)
+    for flow, steps in observed.items():
+        budgets[flow] = dict(steps)
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(budgets, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    return budgets
@@ -0,0 +1,171 @@
+# bench/flows.py
+# Сценарии стенда: последовательности нажатий/сообщений одного пользователя, как в боте.
+#
+# Шаг — имя + функция (контекст, номер итерации) → callback_data или текст сообщения;
+# None — шаг пропускается (например, закончились assembled-поставки для проведения).
+# Идентификаторы берутся из засеянной БД (bench.seed) один раз перед прогоном — load_context().
+# Сценарии с записью (упаковка, поступление, поставки) меняют БД: для сравнимых прогонов — пересев.
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import func, select
+
+from database.db import get_session
+from database.models import (
+    CnPurchase, CnPurchaseStatus, MskInboundDoc, MskInboundStatus,
+    Product, Supply, SupplyStatus, User, Warehouse,
+)
+from bench.seed import BENCH_USER_BASE
+from keyboards.callbacks import CnList, CnOpen, CnPhotos, MskList, MskOpen, SupAdd
+
+
+@dataclass
+class FlowContext:
+    warehouses: List[int] = field(default_factory=list)
+    products: List[int] = field(default_factory=list)
+    assembled_supplies: List[int] = field(default_factory=list)
+    cn_cargo: List[int] = field(default_factory=list)
+    msk_docs: List[int] = field(default_factory=list)
+    users: int = 0                      # виртуальных пользователей (BENCH_USER_BASE+1 …)
+
+    @staticmethod
+    def pick(ids: Sequence[int], i: int) -> Optional[int]:
+        return ids[i % len(ids)] if ids else None
+
+    def wh(self, i: int) -> Optional[int]:
+        return self.pick(self.warehouses, i)
+
+    def product(self, i: int) -> Optional[int]:
+        # шаг 7 — разные товары на соседних итерациях, но стабильно между прогонами
+        return self.pick(self.products, i * 7)
+
+    def take_supply(self, i: int) -> Optional[int]:
+        # проведение необратимо: каждой итерации — своя поставка
+        return self.assembled_supplies[i] if i < len(self.assembled_supplies) else None
+
+
+Data = Callable[[FlowContext, int], Optional[str]]
+
+
+@dataclass
+class Step:
+    name: str
+    data: Data
+    kind: str = "callback"   # callback | message
+
+
+def cb(name: str, data: "str | Data") -> Step:
+    return Step(name, data if callable(data) else (lambda c, i, d=data: d))
+
+
+def msg(name: str, text: "str | Data") -> Step:
+    return Step(name, text if callable(text) else (lambda c, i, t=text: t), kind="message")
+
+
+def _fmt(template: str, value: Optional[int]) -> Optional[str]:
+    return None if value is None else template.format(value)
+
+
+# ---------------------------
+# Сценарии
+# ---------------------------
+FLOWS: Dict[str, List[Step]] = {
+    "reports": [
+        cb("root", "reports"),
+        cb("view", "rep_view"),
+        cb("pick_wh", lambda c, i: _fmt("rep_wh:{}", c.wh(i))),
+        cb("rep_all", "rep_all"),
+        cb("back", "rep_back_to_types"),
+        cb("rep_packed", "rep_packed"),
+        cb("articles", "rep_article"),
+        cb("article", lambda c, i: _fmt("rep_art:{}", c.product(i))),
+    ],
+    "stocks": [
+        cb("root", "stocks"),
+        cb("view", "stocks_view"),
+        cb("pick_wh", lambda c, i: _fmt("pr_wh:{}", c.wh(i))),
+        cb("report_all", "report_all"),
+        cb("back", "back_to_report_type"),
+        cb("report_packed", "report_packed"),
+    ],
+    "packing": [
+        cb("root", "packing"),
+        cb("new", "pack_new"),
+        cb("pick_wh", lambda c, i: _fmt("pack_wh:{}", c.wh(i))),
+        cb("add", lambda c, i: _fmt("pack_add:{}", c.product(i))),
+        msg("qty", "1"),
+        cb("cart", "pack_cart"),
+        cb("post", "pack_post"),
+        cb("docs", "pack_docs"),
+    ],
+    "receiving": [
+        cb("root", "receiving"),
+        cb("docs", "view_docs"),
+        cb("new", "add_doc"),
+        cb("pick_wh", lambda c, i: _fmt("rcv_wh:{}", c.wh(i))),
+        cb("pick_product", lambda c, i: _fmt("rcv_prod:{}", c.product(i))),
+        msg("qty", "5"),
+        cb("skip_comment", "rcv_skip_comment"),
+        cb("confirm", "rcv_confirm"),
+    ],
+    "supplies": [
+        cb("root", "supplies"),
+        cb("list", "sup:list:auto:0"),
+        cb("new", "sup:new"),
+        cb("mp", "sup:mp:wb"),
+        cb("pick_wh", lambda c, i: _fmt("sup:wh:{}", c.wh(i))),
+        cb("add", lambda c, i: None if c.wh(i) is None or c.product(i) is None
+           else SupAdd(c.wh(i), c.product(i)).pack()),
+        msg("qty", "1"),
+        cb("submit", "sup:submit"),
+    ],
+    "supply_post": [
+        cb("open", lambda c, i: _fmt("sup:open:{}", c.take_supply(i))),
+        cb("post", lambda c, i: _fmt("sup:post:{}", c.take_supply(i))),
+    ],
+    "manager": [
+        cb("root", "manager"),
+        cb("list", "mgr:list:assembled"),
+        cb("open", lambda c, i: _fmt("mgr:open:{}", c.pick(c.assembled_supplies, i))),
+    ],
+    "cn": [
+        cb("root", "cn:root"),
+        cb("list_cargo", CnList("cargo").pack()),
+        cb("open", lambda c, i: None if not c.cn_cargo else CnOpen(c.pick(c.cn_cargo, i)).pack()),
+        cb("photos", lambda c, i: None if not c.cn_cargo else CnPhotos(c.pick(c.cn_cargo, i), 1).pack()),
+        cb("list_archive", CnList("archive").pack()),
+    ],
+    "msk": [
+        cb("root", "msk:root"),
+        cb("list_in_ru", MskList("in_ru").pack()),
+        cb("open", lambda c, i: None if not c.msk_docs else MskOpen(c.pick(c.msk_docs, i)).pack()),
+        cb("list_to_our", MskList("to_our").pack()),
+        cb("list_archive", MskList("archive").pack()),
+    ],
+}
+
+
+async def load_context(limit: int = 5000) -> FlowContext:
+    """Идентификаторы из засеянной БД для подстановки в сценарии."""
+    async with get_session() as s:
+        users = await s.scalar(select(func.count(User.id)).where(User.telegram_id > BENCH_USER_BASE))
+        warehouses = (await s.execute(
+            select(Warehouse.id).where(Warehouse.is_active == True).order_by(Warehouse.id)  # noqa: E712
+        )).scalars().all()
+        products = (await s.execute(
+            select(Product.id).where(Product.is_active == True).order_by(Product.id).limit(limit)  # noqa: E712
+        )).scalars().all()
+        supplies = (await s.execute(
+            select(Supply.id).where(Supply.status == SupplyStatus.assembled).order_by(Supply.id).limit(limit)
+        )).scalars().all()
+        cn_cargo = (await s.execute(
+            select(CnPurchase.id).where(CnPurchase.status == CnPurchaseStatus.SENT_TO_CARGO)
+            .order_by(CnPurchase.id).limit(limit)
+        )).scalars().all()
+        msk_docs = (await s.execute(
+            select(MskInboundDoc.id).where(MskInboundDoc.status == MskInboundStatus.PENDING)
+            .order_by(MskInboundDoc.id).limit(limit)
+        )).scalars().all()
+    return FlowContext(list(warehouses), list(products), list(supplies), list(cn_cargo), list(msk_docs), int(users or 0))
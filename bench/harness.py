@@ -0,0 +1,180 @@
+# bench/harness.py
+# Прогон апдейтов через настоящий Dispatcher.feed_update: подменённая сессия Bot API (без сети),
+# фабрики Message/CallbackQuery, замер латентности и числа SQL-запросов на апдейт.
+#
+# Всё, что ниже Bot API, — боевое: middleware (роли, callback_data, метрики), FSM (MemoryStorage),
+# хендлеры, SQLAlchemy и PostgreSQL из DB_URL. Ответы Telegram синтезируются по типу метода
+# (__returning__): Message — фиктивное сообщение, bool — True, списки — пусто.
+from __future__ import annotations
+
+import itertools
+import time
+import typing
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.methods import TelegramMethod
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+from database.sql_stats import track_sql
+
+BOT_ID = 42
+BOT_TOKEN = f"{BOT_ID}:BENCH"
+
+# счётчик вызовов Bot API текущего апдейта (при --concurrency общий session.calls смешивает пользователей)
+_api_calls: ContextVar[Optional[List[int]]] = ContextVar("bench_api_calls", default=None)
+
+
+# ---------------------------
+# Bot API без сети
+# ---------------------------
+class MockedSession(BaseSession):
+    """Сессия, отвечающая на любой метод Bot API локально; считает вызовы."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+        self._ids = itertools.count(10_000)
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[Any], timeout: Optional[int] = None) -> Any:
+        self.calls += 1
+        counter = _api_calls.get()
+        if counter is not None:
+            counter[0] += 1
+        returning = method.__returning__
+        options = typing.get_args(returning) or (returning,)
+        if Message in options:
+            chat_id = getattr(method, "chat_id", None)
+            chat_id = chat_id if isinstance(chat_id, int) else 1
+            return Message(
+                message_id=next(self._ids), date=datetime.now(),
+                chat=Chat(id=chat_id, type="private"),
+                from_user=User(id=BOT_ID, is_bot=True, first_name="bench"),
+                text=getattr(method, "text", None),
+            )
+        if bool in options:
+            return True
+        if typing.get_origin(returning) is list:
+            return []
+        if returning is User:
+            return User(id=BOT_ID, is_bot=True, first_name="bench", username="bench_bot")
+        return True
+
+    async def stream_content(self, url: str, headers: Optional[Dict[str, Any]] = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    async def close(self) -> None:
+        return None
+
+
+def make_bot() -> Bot:
+    return Bot(token=BOT_TOKEN, session=MockedSession())
+
+
+# ---------------------------
+# Апдейты
+# ---------------------------
+_update_ids = itertools.count(1)
+
+
+def _user(tg_id: int) -> User:
+    return User(id=tg_id, is_bot=False, first_name=f"bench{tg_id}")
+
+
+def callback_update(tg_id: int, data: str) -> Update:
+    uid = next(_update_ids)
+    msg = Message(
+        message_id=uid, date=datetime.now(), chat=Chat(id=tg_id, type="private"),
+        from_user=User(id=BOT_ID, is_bot=True, first_name="bench"), text="…",
+    )
+    cb = CallbackQuery(id=str(uid), from_user=_user(tg_id), chat_instance="bench", data=data, message=msg)
+    return Update(update_id=uid, callback_query=cb)
+
+
+def message_update(tg_id: int, text: str) -> Update:
+    uid = next(_update_ids)
+    msg = Message(
+        message_id=uid, date=datetime.now(), chat=Chat(id=tg_id, type="private"),
+        from_user=_user(tg_id), text=text,
+    )
+    return Update(update_id=uid, message=msg)
+
+
+# ---------------------------
+# Замеры
+# ---------------------------
+@dataclass
+class Sample:
+    seconds: float
+    queries: int
+    api_calls: int
+    ok: bool = True
+
+
+@dataclass
+class Series:
+    samples: List[Sample] = field(default_factory=list)
+    errors: int = 0
+    unhandled: int = 0
+
+    def add(self, sample: Sample) -> None:
+        self.samples.append(sample)
+
+    def percentile(self, q: float) -> float:
+        """Nearest-rank перцентиль латентности, мс."""
+        values = sorted(s.seconds for s in self.samples)
+        if not values:
+            return 0.0
+        rank = max(1, min(len(values), int(-(-q * len(values) // 100))))
+        return values[rank - 1] * 1000
+
+    def queries(self) -> List[int]:
+        return [s.queries for s in self.samples]
+
+    def queries_median(self) -> int:
+        """Типичное число запросов шага: разовые догрузки (обновление кэша каталога) не сдвигают его."""
+        qs = sorted(self.queries())
+        return qs[(len(qs) - 1) // 2] if qs else 0
+
+    def summary(self) -> Dict[str, float]:
+        qs = self.queries()
+        n = len(self.samples)
+        return {
+            "n": n,
+            "p50_ms": round(self.percentile(50), 2),
+            "p95_ms": round(self.percentile(95), 2),
+            "p99_ms": round(self.percentile(99), 2),
+            "queries_avg": round(sum(qs) / n, 2) if n else 0.0,
+            "queries_p50": self.queries_median(),
+            "queries_max": max(qs) if qs else 0,
+            "api_calls_avg": round(sum(s.api_calls for s in self.samples) / n, 2) if n else 0.0,
+            "errors": self.errors,
+            "unhandled": self.unhandled,
+        }
+
+
+async def feed(dp: Dispatcher, bot: Bot, update: Update) -> Sample:
+    """Один апдейт через диспетчер: время, SQL-запросы (вкл. middleware), вызовы Bot API."""
+    calls = [0]
+    token = _api_calls.set(calls)
+    try:
+        with track_sql() as sql:
+            t0 = time.perf_counter()
+            result = await dp.feed_update(bot, update)
+            elapsed = time.perf_counter() - t0
+    finally:
+        _api_calls.reset(token)
+    return Sample(elapsed, sql.statements, calls[0], ok=result is not UNHANDLED)
+
+
+async def reset_user_state(dp: Dispatcher, bot: Bot, tg_id: int) -> None:
+    key = StorageKey(bot_id=bot.id, chat_id=tg_id, user_id=tg_id)
+    await dp.storage.set_state(key, None)
+    await dp.storage.set_data(key, {})
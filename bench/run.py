@@ -0,0 +1,170 @@
+# bench/run.py
+# Нагрузочный прогон сценариев (bench/flows.py) через настоящий диспетчер бота.
+#
+#   DB_URL=…/warehouse_bench python -m bench.seed --scale medium
+#   DB_URL=…/warehouse_bench python -m bench.run                             # все сценарии, 30 итераций
+#   DB_URL=…/warehouse_bench python -m bench.run --flows reports,supply_post --iterations 100 --concurrency 4
+#   DB_URL=…/warehouse_bench python -m bench.run --json bench-before.json
+#   DB_URL=…/warehouse_bench python -m bench.run --check-budgets --iterations 5   # CI: бюджеты SQL (bench/budgets.py)
+#
+# На каждый шаг сценария: p50/p95/p99 латентности, SQL-запросов на апдейт (среднее/максимум) и
+# вызовов Bot API; строка «= flow» — все шаги сценария вместе. concurrency — столько виртуальных
+# пользователей (bench.seed создаёт их с ролью admin) проходят сценарии одновременно.
+# Первые --warmup итераций не учитываются (прогрев пула соединений, кэша каталога, планов).
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import Dict
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + "/.."))
+
+from aiogram import Bot, Dispatcher  # noqa: E402
+
+from bench import budgets  # noqa: E402
+from bench.flows import FLOWS, FlowContext, load_context  # noqa: E402
+from bench.harness import Series, callback_update, feed, make_bot, message_update, reset_user_state  # noqa: E402
+from bench.seed import BENCH_USER_BASE  # noqa: E402
+
+logger = logging.getLogger("bench.run")
+
+Results = Dict[str, Dict[str, Series]]   # flow → step → замеры ("=" — весь сценарий)
+TOTAL = "="
+
+
+async def run_iteration(dp: Dispatcher, bot: Bot, ctx: FlowContext, flow: str, i: int, tg_id: int,
+                        results: Results, record: bool) -> None:
+    await reset_user_state(dp, bot, tg_id)
+    per_step = results.setdefault(flow, {})
+    for step in FLOWS[flow]:
+        payload = step.data(ctx, i)
+        if payload is None:
+            continue
+        update = message_update(tg_id, payload) if step.kind == "message" else callback_update(tg_id, payload)
+        series = per_step.setdefault(step.name, Series())
+        try:
+            sample = await feed(dp, bot, update)
+        except Exception as e:
+            if record:
+                series.errors += 1
+            logger.warning("%s/%s #%d failed: %r", flow, step.name, i, e)
+            return  # состояние FSM недостоверно — итерация прерывается
+        if not record:
+            continue
+        series.add(sample)
+        per_step.setdefault(TOTAL, Series()).add(sample)
+        if not sample.ok:
+            series.unhandled += 1
+
+
+async def run_flow(dp: Dispatcher, bot: Bot, ctx: FlowContext, flow: str,
+                   iterations: int, warmup: int, concurrency: int, results: Results) -> float:
+    counter = iter(range(warmup + iterations))
+
+    async def user(slot: int) -> None:
+        tg_id = BENCH_USER_BASE + 1 + slot
+        for i in counter:  # общий счётчик: номера итераций уникальны между пользователями
+            await run_iteration(dp, bot, ctx, flow, i, tg_id, results, record=i >= warmup)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(user(k) for k in range(concurrency)))
+    return time.perf_counter() - t0
+
+
+def print_report(results: Results, wall: Dict[str, float]) -> None:
+    print("| flow | step | n | p50 ms | p95 ms | p99 ms | SQL/upd avg | SQL max | API/upd | err |")
+    print("|---|---|---:|---:|---:|---:|---:|---:|---:|---:|")
+    for flow, steps in results.items():
+        for name, series in steps.items():
+            s = series.summary()
+            label = f"= {flow} ({wall.get(flow, 0):.1f}s)" if name == TOTAL else name
+            err = s["errors"] + s["unhandled"]
+            print(f"| {flow} | {label} | {s['n']} | {s['p50_ms']:.1f} | {s['p95_ms']:.1f} | {s['p99_ms']:.1f} "
+                  f"| {s['queries_avg']:.1f} | {s['queries_max']} | {s['api_calls_avg']:.1f} | {err or ''} |")
+
+
+def observed_queries(results: Results) -> Dict[str, Dict[str, int]]:
+    """flow → step → медиана SQL-запросов (без строки «= flow»)."""
+    return {flow: {name: series.queries_median() for name, series in steps.items() if name != TOTAL and series.samples}
+            for flow, steps in results.items()}
+
+
+def to_json(results: Results) -> Dict[str, Dict[str, dict]]:
+    return {flow: {name: series.summary() for name, series in steps.items()} for flow, steps in results.items()}
+
+
+async def main() -> int:
+    ap = argparse.ArgumentParser(description="Drive bot flows through Dispatcher.feed_update")
+    ap.add_argument("--flows", default=",".join(FLOWS), help=f"comma-separated: {', '.join(FLOWS)}")
+    ap.add_argument("--iterations", type=int, default=30)
+    ap.add_argument("--warmup", type=int, default=3)
+    ap.add_argument("--concurrency", type=int, default=1)
+    ap.add_argument("--json", help="write per-step summary to this file")
+    ap.add_argument("--check-budgets", action="store_true", help="fail if a step exceeds (or has no) budget in bench/budgets.json")
+    ap.add_argument("--update-budgets", action="store_true", help="rewrite budgets of the flows run with observed counts")
+    args = ap.parse_args()
+
+    flows = [f.strip() for f in args.flows.split(",") if f.strip()]
+    unknown = [f for f in flows if f not in FLOWS]
+    if unknown:
+        print(f"ERROR: unknown flows: {', '.join(unknown)}")
+        return 2
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+    from bot import build_dispatcher
+    from database import db
+    from database.product_catalog import catalog as product_catalog
+
+    await db.init_db()
+    await product_catalog.load()
+    ctx = await load_context()
+    if not ctx.warehouses or not ctx.products:
+        print("ERROR: empty database — run `python -m bench.seed` first")
+        return 2
+    if ctx.users < args.concurrency:
+        print(f"ERROR: {ctx.users} bench users seeded, --concurrency {args.concurrency} (bench.seed --users N)")
+        return 2
+
+    dp = build_dispatcher()
+    bot = make_bot()
+    results: Results = {}
+    wall: Dict[str, float] = {}
+    try:
+        for flow in flows:
+            wall[flow] = await run_flow(dp, bot, ctx, flow, args.iterations, args.warmup, args.concurrency, results)
+    finally:
+        await bot.session.close()
+        await db.engine.dispose()
+
+    print(f"{args.iterations} iterations × {args.concurrency} concurrent users "
+          f"(warehouses={len(ctx.warehouses)}, products={len(ctx.products)})\n")
+    print_report(results, wall)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(to_json(results), f, ensure_ascii=False, indent=2)
+    failed = sum(series.errors + series.unhandled
+                 for steps in results.values() for name, series in steps.items() if name != TOTAL)
+
+    observed = observed_queries(results)
+    if args.update_budgets:
+        budgets.update(observed)
+        print(f"\nbudgets updated: {budgets.BUDGETS_FILE}")
+    elif args.check_budgets:
+        violations = budgets.check(observed, budgets.load())
+        if violations:
+            print("\nSQL budget exceeded:")
+            for v in violations:
+                print(f"  {v}")
+            failed += len(violations)
+        else:
+            print("\nSQL budgets: OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
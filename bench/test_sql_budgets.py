@@ -0,0 +1,74 @@
+# bench/test_sql_budgets.py
+# pytest-вход для бюджетов SQL (bench/budgets.py): по тесту на сценарий bench/flows.py.
+#
+#   DB_URL=…/warehouse_bench python -m bench.seed --scale small
+#   DB_URL=…/warehouse_bench BENCH_SQL_BUDGETS=1 python -m pytest -q bench
+#
+# Без BENCH_SQL_BUDGETS=1 модуль пропускается: сценарии с записью меняют БД из DB_URL,
+# случайный прогон против рабочей базы недопустим. Запросы считает фикстура flow_sql —
+# track_sql (database/sql_stats.py) на каждый апдейт через bench.harness.feed.
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import Callable, Dict
+
+import pytest
+
+if os.getenv("BENCH_SQL_BUDGETS") != "1":
+    pytest.skip("set BENCH_SQL_BUDGETS=1 and DB_URL of a seeded bench DB", allow_module_level=True)
+pytest.importorskip("aiogram")
+
+from bench import budgets  # noqa: E402
+from bench.flows import FLOWS, load_context  # noqa: E402
+from bench.harness import make_bot  # noqa: E402
+from bench.run import TOTAL, observed_queries, run_flow  # noqa: E402
+
+ITERATIONS = int(os.getenv("BENCH_SQL_ITERATIONS", "5"))
+WARMUP = 2
+
+
+@pytest.fixture(scope="module")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="module")
+def bench_env(loop):
+    from bot import build_dispatcher
+    from database import db
+    from database.product_catalog import catalog as product_catalog
+
+    loop.run_until_complete(db.init_db())
+    loop.run_until_complete(product_catalog.load())
+    ctx = loop.run_until_complete(load_context())
+    if not ctx.warehouses or not ctx.products:
+        pytest.skip("empty database — run `python -m bench.seed` first")
+    bot = make_bot()
+    yield build_dispatcher(), bot, ctx
+    loop.run_until_complete(bot.session.close())
+    loop.run_until_complete(db.engine.dispose())
+
+
+@pytest.fixture
+def flow_sql(loop, bench_env) -> Callable[[str], Dict[str, int]]:
+    """flow → {step: медиана SQL-запросов на апдейт}; ошибки шагов валят тест."""
+    dp, bot, ctx = bench_env
+
+    def run(flow: str) -> Dict[str, int]:
+        results: dict = {}
+        loop.run_until_complete(run_flow(dp, bot, ctx, flow, ITERATIONS, WARMUP, 1, results))
+        failed = {name: s.errors + s.unhandled for name, s in results.get(flow, {}).items()
+                  if name != TOTAL and s.errors + s.unhandled}
+        assert not failed, f"{flow}: failed/unhandled steps {failed}"
+        return observed_queries(results).get(flow, {})
+
+    return run
+
+
+@pytest.mark.parametrize("flow", list(FLOWS))
+def test_flow_within_sql_budget(flow: str, flow_sql) -> None:
+    violations = budgets.check({flow: flow_sql(flow)}, budgets.load())
+    assert not violations, "SQL budget exceeded:\n  " + "\n  ".join(violations)
@@ -3,9 +3,22 @@ import asyncio
 import logging
 from aiogram import Bot, Dispatcher
 from handlers import admin_menu_visibility
-from config import BOT_TOKEN, DB_URL
+from config import (
+    BOT_TOKEN, DB_URL, METRICS_HOST, METRICS_PORT,
+    BOT_MODE, WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET, WEBHOOK_DRAIN_SEC,
+    WORKER_URLS,
+)
 from database.db import init_db
+from database.sql_stats import register_sql_listeners
+from database.slow_queries import flush as flush_slow_queries
+from database.product_catalog import catalog as product_catalog
 from handlers.common import RoleCheckMiddleware, register_common_handlers
+from handlers.callback_index import CallbackDataMiddleware
+from middleware.metrics import MetricsMiddleware
+from utils.metrics import start_metrics_server, stop_metrics_server
+from utils.webhook import run_router, run_webhook
+from utils.fsm_storage import make_fsm_storage
+from utils.shared_state import close_redis
 from handlers.admin import register_admin_handlers
 from handlers.stocks import register_stocks_handlers
 from handlers.receiving import register_receiving_handlers
@@ -19,28 +32,96 @@ from handlers.msk_inbound import router as msk_router
 from handlers.menu_info import router as menu_info_router
 
 # === Бэкапы ===
+# Роутеры лёгкие: httpx и Google SDK грузятся при первом использовании (utils.lazy),
+# бюджет времени импорта — scripts/import_time.py
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from scheduler.backup_scheduler import reschedule_backup
+from scheduler.backup_scheduler import reschedule_backup, sync_backup_schedule, unschedule_backup
+from scheduler.leader import leader
 from handlers.admin_backup import router as admin_backup_router
+from handlers.admin_jobs import router as admin_jobs_router
+from handlers.admin_perf import router as admin_perf_router
+from utils.jobs import jobs as bg_jobs
+from utils.notify import set_bot as set_notify_bot
+from utils.webdav import close_client as close_webdav_client
+from utils.gdrive_clients import close_all as close_drive_clients
 
 logging.basicConfig(level=logging.INFO)
 
 TIMEZONE = "Europe/Berlin"  # можно вынести в .env
 
 
-async def main():
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher()
+def build_dispatcher() -> Dispatcher:
+    """
+    Диспетчер со всеми middleware и роутерами — один и тот же для бота и стенда bench/.
+    Роутеры — синглтоны модулей: в процессе собирается один раз.
+    """
+    dp = Dispatcher(storage=make_fsm_storage())  # FSM: память процесса или общее хранилище (STATE_BACKEND)
 
     # Авторизация/роли
     dp.message.middleware(RoleCheckMiddleware())
     dp.callback_query.middleware(RoleCheckMiddleware())
+    dp.callback_query.outer_middleware(CallbackDataMiddleware())  # callback_data разбирается один раз
+
+    # Метрики: латентность/ошибки/SQL по хендлерам (после разбора callback_data)
+    register_sql_listeners()
+    dp.message.outer_middleware(MetricsMiddleware())
+    dp.callback_query.outer_middleware(MetricsMiddleware())
+
+    # === Роутеры/регистраторы ===
+    register_admin_handlers(dp)
+    dp.include_router(admin_backup_router)
+    dp.include_router(admin_jobs_router)
+    dp.include_router(admin_perf_router)
+    dp.include_router(admin_menu_visibility.router)
+
+    register_receiving_handlers(dp)
+    register_stocks_handlers(dp)
+    register_supplies_handlers(dp)
+
+    dp.include_router(back_router)
+    dp.include_router(packing_router)
+    dp.include_router(manager_router)
+    dp.include_router(cn_router)
+    dp.include_router(msk_router)
+    dp.include_router(menu_info_router)
+
+    register_reports_handlers(dp)
+    register_common_handlers(dp)  # общий — ПОСЛЕДНИМ
+    return dp
+
+
+async def main():
+    bot = Bot(token=BOT_TOKEN)
+
+    # Маршрутизатор воркеров: ни БД, ни диспетчера — только пересылка апдейтов по chat_id
+    if BOT_MODE == "router":
+        try:
+            await run_router(bot, WORKER_URLS, host=WEBHOOK_HOST, port=WEBHOOK_PORT, path=WEBHOOK_PATH,
+                             secret=WEBHOOK_SECRET, base_url=WEBHOOK_BASE_URL)
+        finally:
+            await bot.session.close()
+        return
+
+    dp = build_dispatcher()
+
+    metrics_runner = None
+    if METRICS_PORT:
+        try:
+            metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+        except OSError as e:
+            logging.warning("Metrics endpoint disabled (%s:%s): %r", METRICS_HOST, METRICS_PORT, e)
 
     # Инициализация БД (без фатального падения при отсутствии базы)
     try:
         await init_db()
     except Exception as e:
         logging.exception("DB init failed – starting in EMERGENCY mode. Reason: %r", e)
+    else:
+        # Кэш каталога товаров (дальше — инкрементально по updated_at и хукам админки)
+        try:
+            await product_catalog.load()
+        except Exception as e:
+            logging.warning("Product catalog preload failed: %r", e)
 
     # === Планировщик (бэкапы) ===
     scheduler = AsyncIOScheduler(timezone=TIMEZONE)
@@ -49,39 +130,50 @@ async def main():
     # Проброс в bot-контекст (v3: через атрибуты)
     bot.scheduler = scheduler
     bot.db_url = DB_URL
-
-    # Поднять задачи бэкапа по текущим настройкам при старте бота
-    async def on_startup():
+    set_notify_bot(bot)  # уведомления админу из фоновых задач
+    bg_jobs.set_scheduler(scheduler)  # тяжёлые операции админки — фоновыми задачами
+    # медленные SQL: из памяти в slow_queries (+ EXPLAIN) вне курсорных событий
+    scheduler.add_job(flush_slow_queries, "interval", seconds=30, id="slow_queries_flush", replace_existing=True)
+    # настройки бэкапа могли поменять в админке другого воркера — ведущий перевешивает джобу
+    scheduler.add_job(sync_backup_schedule, "interval", seconds=60, args=[scheduler, TIMEZONE, DB_URL],
+                      id="backup_schedule_sync", replace_existing=True)
+
+    # Плановые задачи — только у ведущего процесса (pg_advisory_lock), при нескольких воркерах
+    async def on_elected():
+        await bg_jobs.recover()   # только задачи умерших воркеров (их замки строк свободны)
         try:
             await reschedule_backup(scheduler, TIMEZONE, DB_URL)
         except Exception as e:
             logging.exception("Backup scheduler init skipped (DB may be down): %r", e)
 
-    dp.startup.register(on_startup)
+    async def on_lost():
+        unschedule_backup(scheduler)
 
-    # === Роутеры/регистраторы ===
-    register_admin_handlers(dp)
-    dp.include_router(admin_backup_router)
-    dp.include_router(admin_menu_visibility.router)
-
-    register_receiving_handlers(dp)
-    register_stocks_handlers(dp)
-    register_supplies_handlers(dp)
-
-    dp.include_router(back_router)
-    dp.include_router(packing_router)
-    dp.include_router(manager_router)
-    dp.include_router(cn_router)
-    dp.include_router(msk_router)
-    dp.include_router(menu_info_router)
+    async def on_startup():
+        leader.start(on_elected, on_lost)
 
-    register_reports_handlers(dp)
-    register_common_handlers(dp)  # общий — ПОСЛЕДНИМ
+    dp.startup.register(on_startup)
 
     try:
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if BOT_MODE == "webhook":
+            await run_webhook(
+                dp, bot,
+                host=WEBHOOK_HOST, port=WEBHOOK_PORT, path=WEBHOOK_PATH,
+                secret=WEBHOOK_SECRET, base_url=WEBHOOK_BASE_URL, drain_timeout=WEBHOOK_DRAIN_SEC,
+            )
+        else:
+            # long polling: getUpdates сбросит вебхук, если он был установлен прошлым запуском
+            await bot.delete_webhook(drop_pending_updates=False)
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
+        await leader.stop()
         scheduler.shutdown(wait=False)
+        await bg_jobs.close()
+        await dp.storage.close()
+        await close_redis()
+        await stop_metrics_server(metrics_runner)
+        await close_webdav_client()
+        await close_drive_clients()
         await bot.session.close()
 
 
@@ -4,9 +4,13 @@
 
 from __future__ import annotations
 
+import logging
+import time as _time
 from contextlib import asynccontextmanager
 from contextvars import ContextVar
-from typing import AsyncGenerator, Optional
+from functools import lru_cache
+from pathlib import Path
+from typing import AsyncGenerator, Dict, Iterable, Optional
 
 import enum
 from datetime import datetime, date, time
@@ -24,11 +28,14 @@ from database.menu_visibility import ensure_menu_visibility_defaults
 
 # для хелпера available_packed
 from database.models import (
-    StockMovement, ProductStage,
-    Supply, SupplyItem,
+    StockMovement, ProductStage, MovementType,
+    Supply, SupplyItem, ReceivingDoc,
 )
 
 
+logger = logging.getLogger(__name__)
+
+
 # ---------------------------
 # Engine & session factory (устойчивый пул)
 # ---------------------------
@@ -45,8 +52,10 @@ SessionFactory = async_sessionmaker(bind=engine, expire_on_commit=False, autoflu
 async def reset_db_engine() -> None:
     """
     Полностью пересобрать engine/SessionFactory (например, сразу после restore).
+    Кэш «схема уже проверена» сбрасывается: восстановленная БД может быть старой ревизии.
     """
-    global engine, SessionFactory
+    global engine, SessionFactory, _initialized
+    _initialized = False
     try:
         await engine.dispose(close=True)
     except Exception:
@@ -144,20 +153,66 @@ def set_audit_user(user_id: Optional[int]) -> None:
     _current_audit_user_id.set(user_id)
 
 
+# ---------------------------
+# Ревизия схемы (быстрый старт)
+# ---------------------------
+_initialized = False
+_audit_registered = False
+ALEMBIC_DIR = Path(__file__).resolve().parents[1] / "alembic"
+
+
+@lru_cache(maxsize=1)
+def expected_alembic_heads() -> frozenset:
+    """Head-ревизии из alembic/versions (читаются один раз); пусто — alembic недоступен."""
+    try:
+        from alembic.script import ScriptDirectory
+        return frozenset(ScriptDirectory(str(ALEMBIC_DIR)).get_heads())
+    except Exception as e:
+        logger.warning("alembic heads unavailable, full schema check on start: %r", e)
+        return frozenset()
+
+
+async def _schema_is_current() -> bool:
+    """
+    Одно подключение к целевой БД: alembic_version совпадает с head — схема актуальна,
+    create_all (рефлексия всех таблиц) и проверка существования БД не нужны.
+    """
+    heads = expected_alembic_heads()
+    if not heads:
+        return False
+    try:
+        async with engine.connect() as conn:
+            rows = await conn.execute(text("SELECT version_num FROM alembic_version"))
+            return frozenset(r[0] for r in rows) == heads
+    except Exception:
+        return False  # нет БД / нет alembic_version — полный путь
+
+
 # ---------------------------
 # Public API
 # ---------------------------
-async def init_db() -> None:
+async def init_db(force: bool = False) -> None:
     """
     Создаёт БД при её отсутствии, затем таблицы, регистрирует аудит
     и гарантирует дефолтные настройки видимости меню.
+
+    Повторные вызовы в процессе — no-op (например, /start админа); force=True — полный
+    прогон (ремонт после wipe/DROP). Если ревизия Alembic в БД совпадает с head,
+    ensure_database_exists и create_all пропускаются.
     """
-    # 1) Если базы нет после DROP DATABASE — создадим её
-    await ensure_database_exists()
+    global _initialized
+    if _initialized and not force:
+        return
+
+    t0 = _time.monotonic()
+    fast = not force and await _schema_is_current()
+    if not fast:
+        # 1) Если базы нет после DROP DATABASE — создадим её
+        await ensure_database_exists()
 
-    # 2) Создадим таблицы
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        # 2) Создадим таблицы
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
 
     # 3) Аудит (после create_all, чтобы таблица audit_logs точно была)
     register_audit_listeners()
@@ -166,6 +221,12 @@ async def init_db() -> None:
     async with get_session() as session:
         await ensure_menu_visibility_defaults(session)
 
+    _initialized = True
+    logger.info(
+        "init_db: %s in %.0f ms",
+        "schema at alembic head, DDL skipped" if fast else "full schema check", (_time.monotonic() - t0) * 1000,
+    )
+
 
 @asynccontextmanager
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
@@ -221,6 +282,63 @@ async def available_packed(session: AsyncSession, warehouse_id: int, product_id:
     return int((fact or 0) - (reserved or 0))
 
 
+async def available_packed_many(session: AsyncSession, warehouse_id: int,
+                                product_ids: Iterable[int]) -> Dict[int, int]:
+    """
+    available_packed для набора товаров одного склада: два запроса с GROUP BY
+    вместо пары запросов на позицию. Товары без движений/резервов → 0.
+    """
+    pids = sorted(set(product_ids))
+    if not pids:
+        return {}
+    fact = dict((await session.execute(
+        select(StockMovement.product_id, func.coalesce(func.sum(StockMovement.qty), 0))
+        .where(
+            StockMovement.warehouse_id == warehouse_id,
+            StockMovement.product_id.in_(pids),
+            StockMovement.stage == ProductStage.packed,
+        )
+        .group_by(StockMovement.product_id)
+    )).all())
+
+    active_status = ("assembling", "assembled", "in_transit")
+    reserved = dict((await session.execute(
+        select(SupplyItem.product_id, func.coalesce(func.sum(SupplyItem.qty), 0))
+        .join(Supply, Supply.id == SupplyItem.supply_id)
+        .where(
+            Supply.warehouse_id == warehouse_id,
+            Supply.status.in_(active_status),
+            SupplyItem.product_id.in_(pids),
+        )
+        .group_by(SupplyItem.product_id)
+    )).all())
+    return {pid: int((fact.get(pid) or 0) - (reserved.get(pid) or 0)) for pid in pids}
+
+
+# pg_advisory_xact_lock на выдачу номера поступления (пространство ключей — как у LEADER_LOCK_KEY)
+RECEIVING_DOC_LOCK_KEY = 5150201
+
+
+async def next_receiving_doc_id(session: AsyncSession) -> int:
+    """
+    Следующий номер документа поступления: GREATEST(max(receiving_docs.id), max(doc_id прихода)) + 1.
+    Движения учитываются тоже: create_all мог создать пустую receiving_docs раньше backfill-миграции,
+    и номера «от шапок» совпали бы с историческими doc_id (backfill их потом молча пропустит).
+    Оба max — по индексам (PK и ix_stock_movements_prihod_doc).
+
+    Вызывать в той транзакции, что вставит шапку: транзакционный advisory-замок держится до commit,
+    поэтому два одновременных подтверждения получают разные номера (второе ждёт первое).
+    """
+    if session.bind.dialect.name == "postgresql":
+        await session.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": RECEIVING_DOC_LOCK_KEY})
+    max_id = await session.scalar(select(func.greatest(
+        select(func.coalesce(func.max(ReceivingDoc.id), 0)).scalar_subquery(),
+        select(func.coalesce(func.max(StockMovement.doc_id), 0))
+        .where(StockMovement.type == MovementType.prihod).scalar_subquery(),
+    )))
+    return int(max_id or 0) + 1
+
+
 # ---------------------------
 # Audit helpers (JSON-safe)
 # ---------------------------
@@ -276,7 +394,13 @@ def register_audit_listeners() -> None:
     """
     Подписка на ORM-события, чтобы писать AuditLog для INSERT/UPDATE/DELETE.
     Работает и с AsyncSession, т.к. слушатель висит на sync Session-классе.
+    Идемпотентно: повторный init_db не навешивает второй слушатель (дубли в audit_logs).
     """
+    global _audit_registered
+    if _audit_registered:
+        return
+    _audit_registered = True
+
     @event.listens_for(Session, "after_flush")
     def _audit_after_flush(session: Session, flush_context) -> None:
         # чтобы не зациклиться
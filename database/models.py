@@ -6,13 +6,13 @@ from typing import Optional, List
 
 from sqlalchemy import (
     Column, Integer, String, Enum, BigInteger, TIMESTAMP, Boolean,
-    ForeignKey, UniqueConstraint, Numeric, DateTime,
+    ForeignKey, UniqueConstraint, Numeric, DateTime, Index, Float, Text,
 )
 from sqlalchemy import Enum as SAEnum
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, Mapped, mapped_column
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 
 Base = declarative_base()
 
@@ -94,11 +94,22 @@ class Product(Base):
     article = Column(String(100), unique=True, nullable=False)
     name = Column(String(255), nullable=False)
     created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
+    # для инкрементальной догрузки кэша каталога (database/product_catalog.py)
+    updated_at = Column(
+        TIMESTAMP,
+        server_default=func.current_timestamp(),
+        onupdate=func.current_timestamp(),
+        index=True,
+    )
     is_active = Column(Boolean, default=True)
 
 
 class StockMovement(Base):
     __tablename__ = "stock_movements"
+    __table_args__ = (
+        # next_receiving_doc_id(): max(doc_id) по приходам — без скана всех движений
+        Index("ix_stock_movements_prihod_doc", "doc_id", postgresql_where=text("type = 'prihod'")),
+    )
     id = Column(Integer, primary_key=True)
     warehouse_id = Column(Integer, ForeignKey("warehouses.id"))
     product_id = Column(Integer, ForeignKey("products.id"))
@@ -115,6 +126,25 @@ class StockMovement(Base):
     )
 
 
+class ReceivingDoc(Base):
+    """
+    Шапка документа поступления (prihod).
+    id совпадает с StockMovement.doc_id; пишется в момент проведения,
+    чтобы список документов не собирался GROUP BY по всем движениям.
+    """
+    __tablename__ = "receiving_docs"
+    __table_args__ = (
+        Index("ix_receiving_docs_date", "date"),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String(255), nullable=False)
+    date = Column(TIMESTAMP, nullable=False, server_default=func.current_timestamp())
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id"))
+    user_id = Column(Integer, ForeignKey("users.id"))
+    lines_count = Column(Integer, nullable=False, default=0)
+    total_qty = Column(Integer, nullable=False, default=0)
+
+
 # ===== SUPPLIES (ТЗ v1.0) =====
 
 class SupplyStatus(enum.Enum):
@@ -268,6 +298,10 @@ class PackDocItem(Base):
 
 class CnPurchase(Base):
     __tablename__ = "cn_purchases"
+    __table_args__ = (
+        # списки по вкладкам: WHERE status = ? ORDER BY created_at DESC
+        Index("ix_cn_purchases_status_created", "status", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     code: Mapped[str] = mapped_column(String(40), unique=True, nullable=False)
@@ -339,6 +373,10 @@ class CnPurchasePhoto(Base):
 
 class MskInboundDoc(Base):
     __tablename__ = "msk_inbound_docs"
+    __table_args__ = (
+        # вкладки: WHERE status = ? AND target_warehouse_id IS [NOT] NULL ORDER BY created_at DESC
+        Index("ix_msk_inbound_status_wh_created", "status", "target_warehouse_id", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     cn_purchase_id: Mapped[int] = mapped_column(
@@ -412,3 +450,77 @@ class BackupSettings(Base):
     gdrive_sa_json = Column(JSONB)
     last_run_at = Column(TIMESTAMP)
     last_status = Column(String(255))
+    # Параметры pg_dump: формат (custom | directory), потоки для -F d -j N, сжатие (gzip:N | zstd:N | lz4 | none)
+    dump_format = Column(String(16), nullable=False, default="custom", server_default="custom")
+    dump_jobs = Column(Integer, nullable=False, default=1, server_default="1")
+    compression = Column(String(16), nullable=False, default="gzip:9", server_default="gzip:9")
+    # Инкрементальные бэкапы append-only таблиц: полный дамп раз в full_every_days,
+    # между ними — только новые строки (id > watermark). chain_state — манифест текущей цепочки.
+    incremental_enabled = Column(Boolean, nullable=False, default=False, server_default="false")
+    full_every_days = Column(Integer, nullable=False, default=7, server_default="7")
+    chain_state = Column(JSONB)
+    # Проверка бэкапов: манифест последнего полного дампа и периодическое тест-восстановление
+    last_manifest = Column(JSONB)
+    test_restore_every_days = Column(Integer, nullable=False, default=0, server_default="0")  # 0 — выкл.
+    last_test_restore_at = Column(TIMESTAMP)
+    last_test_restore_status = Column(String(255))
+    # Хранение GFS: retention_days — дневное окно, плюс последние копии N недель / N месяцев (0 — не держать)
+    keep_weekly = Column(Integer, nullable=False, default=0, server_default="0")
+    keep_monthly = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+# ===== Фоновые задачи админки (utils/jobs.py) =====
+
+class BackgroundJob(Base):
+    __tablename__ = "bg_jobs"
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(32), nullable=False)                 # backup | restore | wipe | test_restore | retention ...
+    state = Column(String(16), nullable=False, default="queued")  # queued | running | done | failed | cancelled
+    progress = Column(String(255))
+    result = Column(String(1024))
+    started_by = Column(BigInteger)                           # Telegram ID (NULL — планировщик)
+    owner = Column(String(64))                                # воркер host:pid (utils.jobs.WORKER_ID)
+    created_at = Column(TIMESTAMP, nullable=False, server_default=func.current_timestamp())
+    started_at = Column(TIMESTAMP)
+    finished_at = Column(TIMESTAMP)
+
+    __table_args__ = (
+        Index("ix_bg_jobs_created_at", "created_at"),
+    )
+
+
+# ===== Медленные SQL-запросы (database/slow_queries.py) =====
+
+class SlowQuery(Base):
+    __tablename__ = "slow_queries"
+    id = Column(Integer, primary_key=True)
+    fingerprint = Column(String(16), nullable=False)          # хэш текста запроса — группировка «одинаковых»
+    statement = Column(Text, nullable=False)
+    params_shape = Column(String(255))                        # типы параметров, без значений
+    duration_ms = Column(Float, nullable=False)
+    handler = Column(String(64))                              # метка хендлера (middleware/metrics.py); NULL — фон
+    plan = Column(Text)                                       # EXPLAIN (ANALYZE, BUFFERS), если включён
+    created_at = Column(TIMESTAMP, nullable=False, server_default=func.current_timestamp())
+
+    __table_args__ = (
+        Index("ix_slow_queries_created_at", "created_at"),
+        Index("ix_slow_queries_fingerprint", "fingerprint"),
+    )
+
+
+# ===== Общее состояние нескольких процессов бота (utils/shared_state.py, utils/fsm_storage.py) =====
+
+class SharedStateEntry(Base):
+    __tablename__ = "shared_state"
+    namespace = Column(String(64), primary_key=True)          # pending_requests, last_content_msg …
+    key = Column(String(128), primary_key=True)
+    value = Column(Text, nullable=False)                      # JSON
+    updated_at = Column(TIMESTAMP, nullable=False, server_default=func.current_timestamp())
+
+
+class FsmRecord(Base):
+    __tablename__ = "fsm_states"
+    key = Column(String(255), primary_key=True)               # bot:chat:user:thread:business:destiny
+    state = Column(String(255))
+    data = Column(Text)                                       # utils.shared_state.dumps (JSON с метками типов)
+    updated_at = Column(TIMESTAMP, nullable=False, server_default=func.current_timestamp())
@@ -0,0 +1,167 @@
+# database/product_catalog.py
+# Процессный кэш каталога товаров: id -> (article, name, is_active).
+#
+# Каталог меняется редко и только из админки, а имена/артикулы нужны почти в каждом
+# экране (корзина упаковки, карточки поставок/CN/MSK, отчёты). Поэтому:
+#   • load()            — полная загрузка при старте бота;
+#   • ensure_fresh()    — инкрементальная догрузка по products.updated_at не чаще
+#                          CATALOG_REFRESH_SEC (правки из другого процесса/psql) с окном
+#                          CATALOG_OVERLAP_SEC назад от watermark; удаления — сверкой count(*)
+#                          с кэшем (расхождение → полная перезагрузка) и полной перезагрузкой
+#                          не реже CATALOG_FULL_RELOAD_SEC;
+#   • on_product_changed/on_product_deleted — хуки админки (точечное обновление);
+#   • get_products(ids) — промахи кэша добираются из БД одним запросом;
+#   • records()         — все записи (поиск без PostgreSQL, database/product_search.py).
+
+from __future__ import annotations
+
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import CATALOG_FULL_RELOAD_SEC, CATALOG_OVERLAP_SEC, CATALOG_REFRESH_SEC
+from database.db import get_session
+from database.models import Product
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class ProductRecord:
+    id: int
+    article: str
+    name: str
+    is_active: bool
+
+
+class ProductCatalog:
+    def __init__(
+            self,
+            refresh_sec: int = CATALOG_REFRESH_SEC,
+            overlap_sec: int = CATALOG_OVERLAP_SEC,
+            full_reload_sec: int = CATALOG_FULL_RELOAD_SEC,
+    ) -> None:
+        self._by_id: Dict[int, ProductRecord] = {}
+        self._watermark: Optional[datetime] = None   # max(updated_at) из уже загруженного
+        self._checked_at: float = 0.0
+        self._loaded_at: float = 0.0
+        self.refresh_sec = refresh_sec
+        self.overlap = timedelta(seconds=overlap_sec)
+        self.full_reload_sec = full_reload_sec
+        self.loaded = False
+
+    # ---- загрузка ----
+    def _put(self, pid, article, name, is_active, updated_at=None) -> ProductRecord:
+        rec = ProductRecord(int(pid), article or "", name or "", bool(is_active))
+        self._by_id[rec.id] = rec
+        if updated_at is not None and (self._watermark is None or updated_at > self._watermark):
+            self._watermark = updated_at
+        return rec
+
+    async def load(self, session: Optional[AsyncSession] = None) -> int:
+        """Полная (пере)загрузка каталога. Возвращает число записей."""
+        async with _session_scope(session) as s:
+            rows = (await s.execute(
+                select(Product.id, Product.article, Product.name, Product.is_active, Product.updated_at)
+            )).all()
+        self._by_id.clear()
+        self._watermark = None
+        for r in rows:
+            self._put(*r)
+        self._checked_at = self._loaded_at = time.monotonic()
+        self.loaded = True
+        logger.info("Каталог товаров загружен: %s позиций", len(self._by_id))
+        return len(self._by_id)
+
+    async def ensure_fresh(self, session: Optional[AsyncSession] = None) -> None:
+        """
+        Догрузить изменившиеся строки (updated_at >= watermark - overlap), не чаще refresh_sec.
+        Число строк в БД не совпало с кэшем (товар удалили в другом процессе) — полная перезагрузка.
+        """
+        now = time.monotonic()
+        if not self.loaded or now - self._loaded_at >= self.full_reload_sec:
+            await self.load(session)
+            return
+        if now - self._checked_at < self.refresh_sec:
+            return
+        async with _session_scope(session) as s:
+            q = select(Product.id, Product.article, Product.name, Product.is_active, Product.updated_at)
+            if self._watermark is not None:
+                q = q.where(Product.updated_at >= self._watermark - self.overlap)
+            rows = (await s.execute(q)).all()
+            for r in rows:
+                self._put(*r)
+            total = await s.scalar(select(func.count()).select_from(Product))
+            if total != len(self._by_id):
+                logger.info("Каталог: в БД %s позиций, в кэше %s — перезагрузка", total, len(self._by_id))
+                await self.load(s)
+                return
+        self._checked_at = time.monotonic()
+
+    # ---- хуки админки ----
+    async def on_product_changed(self, product_id: int, session: Optional[AsyncSession] = None) -> None:
+        async with _session_scope(session) as s:
+            row = (await s.execute(
+                select(Product.id, Product.article, Product.name, Product.is_active, Product.updated_at)
+                .where(Product.id == product_id)
+            )).first()
+        if row:
+            self._put(*row)
+        else:
+            self._by_id.pop(product_id, None)
+
+    def on_product_deleted(self, product_id: int) -> None:
+        self._by_id.pop(product_id, None)
+
+    # ---- чтение ----
+    def peek(self, product_id: int) -> Optional[ProductRecord]:
+        """Без обращения к БД (None, если записи нет в кэше)."""
+        return self._by_id.get(product_id)
+
+    def records(self) -> Iterable[ProductRecord]:
+        """Все записи кэша (без обращения к БД; свежесть — ensure_fresh())."""
+        return self._by_id.values()
+
+    async def get_products(
+            self, ids: Iterable[int], session: Optional[AsyncSession] = None
+    ) -> Dict[int, ProductRecord]:
+        """id -> ProductRecord; отсутствующие в кэше добираются одним запросом."""
+        await self.ensure_fresh(session)
+        ids = [int(i) for i in ids]
+        out = {i: self._by_id[i] for i in ids if i in self._by_id}
+        missing = [i for i in ids if i not in out]
+        if missing:
+            async with _session_scope(session) as s:
+                rows = (await s.execute(
+                    select(Product.id, Product.article, Product.name, Product.is_active, Product.updated_at)
+                    .where(Product.id.in_(missing))
+                )).all()
+            for r in rows:
+                out[r.id] = self._put(*r)
+        return out
+
+    async def get(self, product_id: int, session: Optional[AsyncSession] = None) -> Optional[ProductRecord]:
+        return (await self.get_products([product_id], session)).get(product_id)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+
+@asynccontextmanager
+async def _session_scope(session: Optional[AsyncSession]):
+    """Использовать переданную сессию или открыть свою."""
+    if session is not None:
+        yield session
+        return
+    async with get_session() as s:
+        yield s
+
+
+# Процессный экземпляр
+catalog = ProductCatalog()
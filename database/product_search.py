@@ -0,0 +1,167 @@
+# database/product_search.py
+# Поиск товаров для пикеров (CN, поступление, упаковка, поставки).
+#
+# PostgreSQL: ILIKE по name/article — ускоряется GIN-индексами pg_trgm
+# (миграция 20251019_products_trgm), total — через count(*) OVER() тем же запросом.
+# Прочие диалекты (SQLite в локальных прогонах): перебор кэша каталога (database/product_catalog.py) —
+# отдельного индекса нет, свежесть и удаления отслеживает сам каталог.
+#
+# Ранжирование везде одинаковое:
+#   0 — точное совпадение артикула, 1 — артикул начинается с запроса,
+#   2 — название начинается с запроса, 3 — прочие вхождения; далее по названию.
+
+from __future__ import annotations
+
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, func, case, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Product
+from database.product_catalog import catalog
+
+
+# ---------------------------
+# Нормализация и ранжирование (общие для SQL и памяти)
+# ---------------------------
+def normalize_query(query: Optional[str]) -> str:
+    """Схлопывает пробелы, приводит к нижнему регистру; пустая строка = без фильтра."""
+    return " ".join((query or "").split()).lower()
+
+
+def _tokens(q: str) -> List[str]:
+    return q.split() if q else []
+
+
+def rank_key(q: str, name: Optional[str], article: Optional[str]) -> Optional[Tuple[int, str]]:
+    """
+    Ключ сортировки для строки каталога или None, если строка не подходит.
+    Каждый токен запроса должен встречаться в названии или артикуле.
+    """
+    name_l = (name or "").lower()
+    art_l = (article or "").lower()
+    for t in _tokens(q):
+        if t not in name_l and t not in art_l:
+            return None
+    if not q:
+        rank = 3
+    elif art_l == q:
+        rank = 0
+    elif art_l.startswith(q):
+        rank = 1
+    elif name_l.startswith(q):
+        rank = 2
+    else:
+        rank = 3
+    return rank, name_l
+
+
+def filter_rows(rows: Sequence, query: Optional[str], name_idx: int = 1, article_idx: int = 2) -> list:
+    """
+    Фильтр+ранжирование уже загруженных кортежей (например, списка из FSM в упаковке/поставках).
+    Без запроса возвращает rows как есть.
+    """
+    q = normalize_query(query)
+    if not q:
+        return list(rows)
+    scored = []
+    for r in rows:
+        key = rank_key(q, r[name_idx], r[article_idx])
+        if key is not None:
+            scored.append((key, r))
+    scored.sort(key=lambda x: x[0])
+    return [r for _, r in scored]
+
+
+# ---------------------------
+# Публичный поиск
+# ---------------------------
+def _like_escape(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+async def search_products(
+        session: AsyncSession,
+        query: Optional[str],
+        offset: int = 0,
+        limit: int = 10,
+        only_active: bool = True,
+        ids: Optional[Iterable[int]] = None,
+) -> Tuple[List[Product], int]:
+    """
+    Страница товаров по запросу + общее количество совпадений.
+    ids — ограничить выборку набором id (например, товары с остатком на складе).
+    """
+    q = normalize_query(query)
+    ids = list(ids) if ids is not None else None
+    if ids is not None and not ids:
+        return [], 0
+
+    if session.bind.dialect.name != "postgresql":
+        return await _search_in_memory(session, q, offset, limit, only_active, ids)
+
+    conds = []
+    if only_active:
+        conds.append(Product.is_active.is_(True))
+    if ids is not None:
+        conds.append(Product.id.in_(ids))
+    for t in _tokens(q):
+        like = f"%{_like_escape(t)}%"
+        conds.append(or_(Product.name.ilike(like, escape="\\"), Product.article.ilike(like, escape="\\")))
+
+    order = [Product.name.asc(), Product.id.asc()]
+    if q:
+        prefix = f"{_like_escape(q)}%"
+        rank = case(
+            (func.lower(Product.article) == q, 0),
+            (Product.article.ilike(prefix, escape="\\"), 1),
+            (Product.name.ilike(prefix, escape="\\"), 2),
+            else_=3,
+        )
+        order.insert(0, rank)
+
+    stmt = (
+        select(Product, func.count().over().label("total"))
+        .where(*conds)
+        .order_by(*order)
+        .offset(offset)
+        .limit(limit)
+    )
+    res = (await session.execute(stmt)).all()
+    if res:
+        return [r[0] for r in res], int(res[0].total)
+    if offset == 0:
+        return [], 0
+    # страница за пределами выборки — total отдельным запросом
+    total = await session.scalar(
+        select(func.count()).select_from(Product).where(*conds)
+    )
+    return [], int(total or 0)
+
+
+async def _search_in_memory(
+        session: AsyncSession,
+        q: str,
+        offset: int,
+        limit: int,
+        only_active: bool,
+        ids: Optional[List[int]],
+) -> Tuple[List[Product], int]:
+    await catalog.ensure_fresh(session)
+    allowed = set(ids) if ids is not None else None
+    scored = []
+    for rec in catalog.records():
+        if only_active and not rec.is_active:
+            continue
+        if allowed is not None and rec.id not in allowed:
+            continue
+        key = rank_key(q, rec.name, rec.article)
+        if key is not None:
+            scored.append((key, rec.id))
+    scored.sort()
+    page_ids = [pid for _, pid in scored[offset:offset + limit]]
+    if not page_ids:
+        return [], len(scored)
+    prods = (await session.execute(select(Product).where(Product.id.in_(page_ids)))).scalars().all()
+    by_id = {p.id: p for p in prods}
+    return [by_id[i] for i in page_ids if i in by_id], len(scored)
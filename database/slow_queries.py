@@ -0,0 +1,223 @@
+# database/slow_queries.py
+# Журнал медленных SQL-запросов: запросы дольше SLOW_QUERY_MS попадают в таблицу slow_queries
+# (кольцо на SLOW_QUERY_KEEP строк) с меткой хендлера, формой параметров и, по желанию, планом.
+#
+# Поток данных:
+#   • database/sql_stats.py (after_cursor_execute, sync) → note(): только очередь в памяти,
+#     никакого I/O внутри курсорного события;
+#   • flush() — периодическая задача планировщика: EXPLAIN (ANALYZE, BUFFERS) для медленных
+#     SELECT (SLOW_QUERY_EXPLAIN=1; запрос выполняется повторно, в откатываемой транзакции
+#     с statement_timeout), запись пачкой, обрезка кольца. SELECT с побочными эффектами, которые
+#     откат не отменяет (nextval/setval, сессионные advisory-замки, pg_sleep, FOR UPDATE …), не
+#     выполняются повторно — для них только EXPLAIN без ANALYZE;
+#   • top_offenders()/get() — для админки (handlers/admin_perf.py).
+# Значения параметров в БД не пишутся — только типы ("int, str, list[12]").
+from __future__ import annotations
+
+import hashlib
+import logging
+import re
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Deque, List, Optional
+
+from sqlalchemy import delete, desc, distinct, func, select
+
+from config import SLOW_QUERY_EXPLAIN, SLOW_QUERY_KEEP, SLOW_QUERY_MS
+from database.db import get_session
+from database.models import SlowQuery
+
+logger = logging.getLogger(__name__)
+
+THRESHOLD_S = SLOW_QUERY_MS / 1000 if SLOW_QUERY_MS > 0 else None
+EXPLAIN_TIMEOUT_MS = max(SLOW_QUERY_MS * 10, 5000)
+MAX_STATEMENT = 8000
+PENDING_LIMIT = 200
+
+_WRITES = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|TRUNCATE|COPY|CALL)\b", re.IGNORECASE)
+_SIDE_EFFECTS = re.compile(
+    r"\b(nextval|setval|pg_\w*lock\w*|pg_sleep\w*|pg_terminate_backend|pg_cancel_backend|pg_notify"
+    r"|pg_reload_conf|pg_rotate_logfile|set_config|lo_\w+|dblink\w*)\s*\("
+    r"|\bFOR\s+(UPDATE|SHARE|NO\s+KEY\s+UPDATE|KEY\s+SHARE)\b",
+    re.IGNORECASE,
+)
+_SPACES = re.compile(r"\s+")
+
+
+@dataclass
+class _Pending:
+    statement: str
+    parameters: Any          # исходные параметры — только для EXPLAIN, в БД не попадают
+    explain: bool
+    analyze: bool            # False — только план, без повторного выполнения
+    shape: str
+    duration_ms: float
+    handler: Optional[str]
+
+
+_pending: Deque[_Pending] = deque(maxlen=PENDING_LIMIT)
+_flushing: ContextVar[bool] = ContextVar("slow_queries_flushing", default=False)
+
+
+# ---------------------------
+# Разбор запроса
+# ---------------------------
+def fingerprint(statement: str) -> str:
+    return hashlib.sha1(_SPACES.sub(" ", statement.strip()).encode()).hexdigest()[:16]
+
+
+def _type_name(value: Any) -> str:
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def params_shape(parameters: Any, executemany: bool = False) -> str:
+    """Типы параметров без значений: "int, str, list[12]" / "executemany×50: int, str"."""
+    if executemany:
+        rows = list(parameters or ())
+        head = params_shape(rows[0]) if rows else ""
+        return f"executemany×{len(rows)}: {head}"[:255]
+    if not parameters:
+        return ""
+    if isinstance(parameters, dict):
+        return ", ".join(f"{k}: {_type_name(v)}" for k, v in parameters.items())[:255]
+    return ", ".join(_type_name(v) for v in parameters)[:255]
+
+
+def is_read_only(statement: str) -> bool:
+    head = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return head in ("SELECT", "WITH") and not _WRITES.search(statement)
+
+
+def is_replay_safe(statement: str) -> bool:
+    """Повтор под EXPLAIN ANALYZE + ROLLBACK ничего не оставит (нет последовательностей, замков, сна)."""
+    return is_read_only(statement) and not _SIDE_EFFECTS.search(statement)
+
+
+# ---------------------------
+# Сбор (из курсорного события)
+# ---------------------------
+def note(statement: str, parameters: Any, executemany: bool, elapsed: float, handler: Optional[str]) -> None:
+    """Поставить медленный запрос в очередь на запись. Вызывается синхронно из after_cursor_execute."""
+    if _flushing.get() or statement.lstrip()[:7].upper() == "EXPLAIN":
+        return
+    duration_ms = elapsed * 1000
+    logger.warning("Slow query %.0f ms [%s]: %s", duration_ms, handler or "-", _SPACES.sub(" ", statement)[:300])
+    explain = SLOW_QUERY_EXPLAIN and not executemany and len(statement) <= MAX_STATEMENT and is_read_only(statement)
+    _pending.append(_Pending(
+        statement=statement[:MAX_STATEMENT],
+        parameters=parameters if explain else None,
+        explain=explain,
+        analyze=explain and is_replay_safe(statement),
+        shape=params_shape(parameters, executemany),
+        duration_ms=duration_ms,
+        handler=handler,
+    ))
+
+
+# ---------------------------
+# Запись (периодическая задача)
+# ---------------------------
+async def _explain(item: _Pending) -> Optional[str]:
+    try:
+        async with get_session() as s:
+            conn = await s.connection()
+            await conn.exec_driver_sql(f"SET LOCAL statement_timeout = {EXPLAIN_TIMEOUT_MS}")
+            sql = ("EXPLAIN (ANALYZE, BUFFERS) " if item.analyze else "EXPLAIN ") + item.statement
+            res = await (conn.exec_driver_sql(sql, item.parameters) if item.parameters else conn.exec_driver_sql(sql))
+            plan = "\n".join(str(row[0]) for row in res)
+            await s.rollback()
+            return plan
+    except Exception as e:
+        return f"EXPLAIN failed: {e!r}"[:1000]
+
+
+async def flush() -> int:
+    """Записать накопленные медленные запросы; возвращает число записанных строк."""
+    if not _pending:
+        return 0
+    items: List[_Pending] = []
+    while _pending:
+        items.append(_pending.popleft())
+
+    token = _flushing.set(True)
+    try:
+        rows = []
+        for item in items:
+            plan = await _explain(item) if item.explain else None
+            rows.append(SlowQuery(
+                fingerprint=fingerprint(item.statement),
+                statement=item.statement,
+                params_shape=item.shape or None,
+                duration_ms=round(item.duration_ms, 1),
+                handler=item.handler,
+                plan=plan,
+            ))
+        async with get_session() as s:
+            s.add_all(rows)
+            await s.flush()
+            last_id = select(func.max(SlowQuery.id)).scalar_subquery()
+            await s.execute(delete(SlowQuery).where(SlowQuery.id <= last_id - SLOW_QUERY_KEEP))
+            await s.commit()
+        return len(rows)
+    except Exception as e:
+        logger.warning("Slow query flush failed (%d dropped): %r", len(items), e)
+        return 0
+    finally:
+        _flushing.reset(token)
+
+
+# ---------------------------
+# Чтение (админка)
+# ---------------------------
+@dataclass
+class Offender:
+    fingerprint: str
+    calls: int
+    total_ms: float
+    max_ms: float
+    avg_ms: float
+    last_id: int
+    handlers: str
+    statement: str
+
+
+async def top_offenders(limit: int = 10) -> List[Offender]:
+    """Группы одинаковых запросов по суммарному времени (худшие сверху)."""
+    total = func.sum(SlowQuery.duration_ms)
+    q = (
+        select(
+            SlowQuery.fingerprint,
+            func.count(SlowQuery.id),
+            total,
+            func.max(SlowQuery.duration_ms),
+            func.avg(SlowQuery.duration_ms),
+            func.max(SlowQuery.id),
+            func.string_agg(distinct(func.coalesce(SlowQuery.handler, "-")), ", "),
+            func.min(SlowQuery.statement),      # в группе текст одинаковый (с точностью до пробелов)
+        )
+        .group_by(SlowQuery.fingerprint)
+        .order_by(desc(total))
+        .limit(limit)
+    )
+    async with get_session() as s:
+        rows = (await s.execute(q)).all()
+    return [Offender(fp, int(n), float(t), float(mx), float(avg), int(last), h or "-", sql)
+            for fp, n, t, mx, avg, last, h, sql in rows]
+
+
+async def get(query_id: int) -> Optional[SlowQuery]:
+    """Запись по id; если у неё нет плана — ближайшая запись той же группы с планом."""
+    async with get_session() as s:
+        row = await s.get(SlowQuery, query_id)
+        if row is None or row.plan:
+            return row
+        with_plan = (await s.execute(
+            select(SlowQuery)
+            .where(SlowQuery.fingerprint == row.fingerprint, SlowQuery.plan.is_not(None))
+            .order_by(desc(SlowQuery.id))
+            .limit(1)
+        )).scalar_one_or_none()
+        return with_plan or row
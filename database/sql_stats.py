@@ -0,0 +1,91 @@
+# database/sql_stats.py
+# Учёт SQL-запросов: сколько и сколько времени выполнено в рамках текущего апдейта.
+#
+# Слушатели висят на классе Engine (sync-ядро и у AsyncEngine), поэтому переживают
+# reset_db_engine() после restore. Счётчик апдейта — в ContextVar: SQLAlchemy переносит
+# контекст в greenlet драйвера, а параллельные апдейты (разные задачи) не смешиваются.
+#
+#   with track_sql("report_all") as stats:     # middleware/metrics.py
+#       await handler(event, data)
+#   stats.statements, stats.seconds
+#
+# Блоки вкладываются: запрос засчитывается всем объемлющим (стенд bench/ меряет апдейт
+# целиком поверх MetricsMiddleware).
+#
+# Запросы дольше SLOW_QUERY_MS уходят в журнал database/slow_queries.py с меткой хендлера.
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from database import slow_queries
+from utils.metrics import SQL_SECONDS, SQL_STATEMENTS
+
+
+@dataclass
+class SqlStats:
+    handler: Optional[str] = None
+    statements: int = 0
+    seconds: float = 0.0
+    parent: Optional["SqlStats"] = None
+
+
+_current: ContextVar[Optional[SqlStats]] = ContextVar("current_sql_stats", default=None)
+_registered = False
+
+
+@contextmanager
+def track_sql(handler: Optional[str] = None) -> Iterator[SqlStats]:
+    """Собирать запросы, выполненные внутри блока (в этой задаче и её greenlet'ах)."""
+    stats = SqlStats(handler, parent=_current.get())
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("sql_stats_t0", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = conn.info.get("sql_stats_t0")
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    SQL_STATEMENTS.inc()
+    SQL_SECONDS.inc(amount=elapsed)
+    stats = node = _current.get()
+    while node is not None:
+        node.statements += 1
+        node.seconds += elapsed
+        node = node.parent
+    threshold = slow_queries.THRESHOLD_S
+    if threshold is not None and elapsed >= threshold:
+        slow_queries.note(statement, parameters, executemany, elapsed, stats.handler if stats else None)
+
+
+def _handle_error(exception_context) -> None:
+    # запрос упал — after_cursor_execute не придёт, снимаем его отметку времени
+    conn = exception_context.connection
+    started = conn.info.get("sql_stats_t0") if conn is not None else None
+    if started:
+        started.pop()
+
+
+def register_sql_listeners() -> None:
+    """Подписка на cursor-события всех engine'ов процесса. Идемпотентно."""
+    global _registered
+    if _registered:
+        return
+    _registered = True
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
@@ -9,6 +9,7 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from sqlalchemy import select, func, update, desc
 
 from database.db import get_session
+from database.product_catalog import catalog as product_catalog
 from database.models import (
     User, UserRole,
     Warehouse, Product,
@@ -17,6 +18,7 @@ from database.models import (
 )
 
 from handlers.common import send_content
+from handlers.callback_index import callback_index
 
 # =========================
 #          FSM
@@ -52,6 +54,7 @@ def kb_admin_root() -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text="👥 Пользователи", callback_data="admin_users")],
         [InlineKeyboardButton(text="🧾 Журнал действий", callback_data="admin_audit")],
         [InlineKeyboardButton(text="💾 Бэкапы", callback_data="admin:backup")],
+        [InlineKeyboardButton(text="🐢 Медленные запросы", callback_data="perf:slow")],
         [InlineKeyboardButton(text="🧩 Настройки меню", callback_data="menuvis:roles")],
         [InlineKeyboardButton(text="⬅️ Назад в меню", callback_data="back_to_menu")],
     ])
@@ -537,6 +540,7 @@ async def admin_product_confirm(cb: types.CallbackQuery, user: User, state: FSMC
     async with get_session() as session:
         p = Product(article=data["article"], name=data["name"], is_active=True)
         session.add(p); await session.commit()
+    await product_catalog.on_product_changed(p.id)
     await state.clear()
     await send_content(cb, "✅ Товар создан.", reply_markup=kb_admin_prod_root())
 
@@ -591,6 +595,7 @@ async def admin_product_rename_apply(message: types.Message, user: User, state:
     async with get_session() as session:
         await session.execute(update(Product).where(Product.id == pid).values(name=name))
         await session.commit()
+    await product_catalog.on_product_changed(pid)
     await state.clear()
     await message.answer("✅ Название товара обновлено.", reply_markup=kb_back("admin_product_edit"))
 
@@ -609,6 +614,7 @@ async def admin_product_toggle(cb: types.CallbackQuery, user: User, state: FSMCo
             await cb.answer("Товар не найден.", show_alert=True); return
         p.is_active = not p.is_active
         await session.commit()
+    await product_catalog.on_product_changed(pid)
     await send_content(cb, f"✅ Готово. Активность товара теперь: {'True' if p.is_active else 'False'}",
                        reply_markup=kb_admin_prod_root())
 
@@ -651,6 +657,7 @@ async def admin_prod_del_confirm(cb: types.CallbackQuery, user: User, state: FSM
             await cb.answer("Товар уже отсутствует."); return
         await session.delete(p)
         await session.commit()
+    product_catalog.on_product_deleted(pid)
     await send_content(cb, "✅ Товар удалён.", reply_markup=kb_admin_prod_root())
 
 
@@ -729,50 +736,51 @@ async def admin_audit_page(cb: types.CallbackQuery, user: User, state: FSMContex
 #     REGISTER ROUTES
 # =========================
 def register_admin_handlers(dp: Dispatcher):
-    dp.callback_query.register(on_admin,                   lambda c: c.data == "admin")
+    cbx = callback_index(dp)
+    cbx.register_exact(on_admin,                           "admin")
 
     # Пользователи
-    dp.callback_query.register(admin_users_menu,           lambda c: c.data == "admin_users")
-    dp.callback_query.register(admin_list_users,           lambda c: c.data == "admin_list_users")
-    dp.callback_query.register(admin_delete_user,          lambda c: c.data == "admin_delete_user")
-    dp.callback_query.register(admin_confirm_delete_user,  lambda c: c.data.startswith("delete_user:"))
-    dp.callback_query.register(admin_send_message,         lambda c: c.data == "admin_send_message")
-    dp.callback_query.register(admin_enter_message,        lambda c: c.data.startswith("send_msg:"))
+    cbx.register_exact(admin_users_menu,                   "admin_users")
+    cbx.register_exact(admin_list_users,                   "admin_list_users")
+    cbx.register_exact(admin_delete_user,                  "admin_delete_user")
+    cbx.register_prefix(admin_confirm_delete_user,         "delete_user:")
+    cbx.register_exact(admin_send_message,                 "admin_send_message")
+    cbx.register_prefix(admin_enter_message,               "send_msg:")
     dp.message.register(admin_send_message_text,           AdminState.entering_message)
 
     # Управление ролями
-    dp.callback_query.register(admin_change_role,          lambda c: c.data == "admin_change_role")
-    dp.callback_query.register(admin_pick_user_for_role,   lambda c: c.data.startswith("role_user:"))
-    dp.callback_query.register(admin_apply_role,           lambda c: c.data.startswith("role_set:"))
+    cbx.register_exact(admin_change_role,                  "admin_change_role")
+    cbx.register_prefix(admin_pick_user_for_role,          "role_user:")
+    cbx.register_prefix(admin_apply_role,                  "role_set:")
 
     # Склады
-    dp.callback_query.register(admin_wh_root,              lambda c: c.data == "admin_wh")
-    dp.callback_query.register(admin_wh_list,              lambda c: c.data == "admin_wh_list")
-    dp.callback_query.register(admin_wh_add,               lambda c: c.data == "admin_wh_add")
+    cbx.register_exact(admin_wh_root,                      "admin_wh")
+    cbx.register_exact(admin_wh_list,                      "admin_wh_list")
+    cbx.register_exact(admin_wh_add,                       "admin_wh_add")
     dp.message.register(admin_wh_add_apply,                WarehouseCreateState.entering_name)
-    dp.callback_query.register(admin_wh_edit,              lambda c: c.data == "admin_wh_edit")
-    dp.callback_query.register(admin_wh_pick,              lambda c: c.data.startswith("admin_wh_pick:"))
-    dp.callback_query.register(admin_wh_rename_start,      lambda c: c.data.startswith("admin_wh_rename:"))
+    cbx.register_exact(admin_wh_edit,                      "admin_wh_edit")
+    cbx.register_prefix(admin_wh_pick,                     "admin_wh_pick:")
+    cbx.register_prefix(admin_wh_rename_start,             "admin_wh_rename:")
     dp.message.register(admin_wh_rename_apply,             WarehouseRenameState.entering_name)
-    dp.callback_query.register(admin_wh_toggle,            lambda c: c.data.startswith("admin_wh_toggle:"))
-    dp.callback_query.register(admin_wh_del,               lambda c: c.data.startswith("admin_wh_del:"))
-    dp.callback_query.register(admin_wh_del_confirm,       lambda c: c.data.startswith("admin_wh_del_confirm:"))
+    cbx.register_prefix(admin_wh_toggle,                   "admin_wh_toggle:")
+    cbx.register_prefix(admin_wh_del,                      "admin_wh_del:")
+    cbx.register_prefix(admin_wh_del_confirm,              "admin_wh_del_confirm:")
 
     # Товары
-    dp.callback_query.register(admin_prod_root,            lambda c: c.data == "admin_prod")
-    dp.callback_query.register(admin_product_add,          lambda c: c.data == "admin_product_add")
+    cbx.register_exact(admin_prod_root,                    "admin_prod")
+    cbx.register_exact(admin_product_add,                  "admin_product_add")
     dp.message.register(admin_product_enter_article,       ProductState.entering_article)
     dp.message.register(admin_product_enter_name,          ProductState.entering_name)
-    dp.callback_query.register(admin_product_confirm,      ProductState.confirming)
+    cbx.register_any(admin_product_confirm,                ProductState.confirming)
 
-    dp.callback_query.register(admin_product_edit,         lambda c: c.data == "admin_product_edit")
-    dp.callback_query.register(admin_product_pick,         lambda c: c.data.startswith("adm_prod_pick:"))
-    dp.callback_query.register(admin_product_rename_start, lambda c: c.data.startswith("adm_prod_rename:"))
+    cbx.register_exact(admin_product_edit,                 "admin_product_edit")
+    cbx.register_prefix(admin_product_pick,                "adm_prod_pick:")
+    cbx.register_prefix(admin_product_rename_start,        "adm_prod_rename:")
     dp.message.register(admin_product_rename_apply,        ProductEditState.renaming)
-    dp.callback_query.register(admin_product_toggle,       lambda c: c.data.startswith("adm_prod_toggle:"))
-    dp.callback_query.register(admin_prod_del,             lambda c: c.data.startswith("adm_prod_del:"))
-    dp.callback_query.register(admin_prod_del_confirm,     lambda c: c.data.startswith("adm_prod_del_confirm:"))
+    cbx.register_prefix(admin_product_toggle,              "adm_prod_toggle:")
+    cbx.register_prefix(admin_prod_del,                    "adm_prod_del:")
+    cbx.register_prefix(admin_prod_del_confirm,            "adm_prod_del_confirm:")
 
     # Журнал
-    dp.callback_query.register(admin_audit_root,           lambda c: c.data == "admin_audit")
-    dp.callback_query.register(admin_audit_page,           lambda c: c.data.startswith("admin_audit_page:"))
+    cbx.register_exact(admin_audit_root,                   "admin_audit")
+    cbx.register_prefix(admin_audit_page,                  "admin_audit_page:")
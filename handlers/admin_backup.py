@@ -6,12 +6,14 @@ import html
 import json
 import os
 import shutil
+import tarfile
 import tempfile
 import time
-from typing import Union, Tuple
+from collections import deque
+from typing import Optional, Union, Tuple
 
 from aiogram import Router, F
-from aiogram.exceptions import TelegramBadRequest
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
@@ -26,7 +28,9 @@ from aiogram.types import (
 from sqlalchemy import select, text
 from sqlalchemy.engine.url import make_url
 
-import httpx  # pip install httpx
+from utils.lazy import lazy_import
+
+httpx = lazy_import("httpx")  # pip install httpx; грузится при первом запросе к Google OAuth
 
 from config import (
     ADMIN_TELEGRAM_ID,
@@ -37,9 +41,22 @@ from config import (
 from database.db import get_session, init_db, reset_db_engine, ping_db
 from database.models import BackupSettings, BackupFrequency
 from scheduler.backup_scheduler import reschedule_backup
-from utils.backup import run_backup, build_restore_cmd
+from utils.backup import (
+    run_backup,
+    run_retention,
+    stream_restore,
+    restore_jobs_for,
+    PhaseTimer,
+    COMPRESSION_CHOICES,
+    DUMP_FORMATS,
+)
+from utils.backup_verify import run_test_restore
+from utils import gdrive_clients
+from utils.jobs import jobs, JobBusy, JobContext, JobInfo, JobFn, DoneFn
+from handlers.callback_index import callback_index
 
 router = Router()
+cbx = callback_index(router)
 
 # --------- Константы путей и сервиса ---------
 GOOGLE_TOKEN_PATH = os.environ.get("GOOGLE_OAUTH_TOKEN_PATH", "/etc/botwb/google/token.json")
@@ -86,7 +103,7 @@ async def _ensure_settings_exists(msg_or_cb: Union[Message, CallbackQuery]) -> B
 
     if not st:
         try:
-            await init_db()
+            await init_db(force=True)  # ремонт: таблицы могло не быть
             async with get_session() as s:
                 st = await s.get(BackupSettings, 1)
                 if not st:
@@ -110,6 +127,30 @@ async def _ensure_settings_exists(msg_or_cb: Union[Message, CallbackQuery]) -> B
     return st
 
 
+def _dump_title(st: BackupSettings) -> str:
+    fmt = st.dump_format or "custom"
+    jobs = f" · j{st.dump_jobs}" if fmt == "directory" else ""
+    return f"{fmt} · {st.compression or 'gzip:9'}{jobs}"
+
+
+def _inc_title(st: BackupSettings) -> str:
+    if not st.incremental_enabled:
+        return "выкл"
+    chain = st.chain_state or {}
+    tail = f" · цепочка {chain['chain_id']} +{len(chain.get('parts') or [])}" if chain.get("chain_id") else ""
+    return f"full раз в {st.full_every_days} дн.{tail}"
+
+
+def _gfs_title(st: BackupSettings) -> str:
+    if not st.retention_days:
+        return "выкл"
+    return f"{st.retention_days}д · {st.keep_weekly or 0}н · {st.keep_monthly or 0}м"
+
+
+def _tr_title(st: BackupSettings) -> str:
+    return f"раз в {st.test_restore_every_days} дн." if st.test_restore_every_days else "выкл"
+
+
 def _kb_main(st: BackupSettings) -> InlineKeyboardMarkup:
     onoff = "🟢 Включено" if st.enabled else "🔴 Выключено"
     freq_map = {"daily": "Ежедневно", "weekly": "Еженедельно", "monthly": "Ежемесячно"}
@@ -124,7 +165,11 @@ def _kb_main(st: BackupSettings) -> InlineKeyboardMarkup:
             )
         ],
         [InlineKeyboardButton(text=f"🧹 Retention: {st.retention_days} дн.", callback_data="bk:retention")],
+        [InlineKeyboardButton(text=f"🗂 Хранение (GFS): {_gfs_title(st)}", callback_data="bk:gfs")],
         [InlineKeyboardButton(text=f"📁 Folder ID: {st.gdrive_folder_id or '—'}", callback_data="bk:folder")],
+        [InlineKeyboardButton(text=f"🗜 Дамп: {_dump_title(st)}", callback_data="bk:dumpcfg")],
+        [InlineKeyboardButton(text=f"🧩 Инкременты: {_inc_title(st)}", callback_data="bk:inc")],
+        [InlineKeyboardButton(text=f"🔎 Тест-восстановление: {_tr_title(st)}", callback_data="bk:verify")],
         [InlineKeyboardButton(text="🔗 Подключить Google (OAuth)", callback_data="bk:oauth")],
         [InlineKeyboardButton(text="⬆️ Загрузить token.json", callback_data="bk:token_upload")],
         [InlineKeyboardButton(text="🧪 Сделать бэкап сейчас", callback_data="bk:run")],
@@ -141,11 +186,14 @@ async def _render(target: Union[CallbackQuery, Message], st: BackupSettings) ->
         "<b>Бэкапы БД → Google Drive</b>\n\n"
         f"Статус: {'🟢 Включено' if st.enabled else '🔴 Выключено'}\n"
         f"Расписание: <code>{st.frequency.value}</code> @ {st.time_hour:02d}:{st.time_minute:02d} ({TIMEZONE})\n"
-        f"Retention: {st.retention_days} дней\n"
+        f"Retention: {st.retention_days} дней (GFS: {_gfs_title(st)})\n"
         f"Folder ID: <code>{st.gdrive_folder_id or '—'}</code>\n"
+        f"Дамп: <code>{_dump_title(st)}</code>\n"
+        f"Инкременты: {_inc_title(st)}\n"
         "Авторизация: <b>OAuth</b> (client_secret.json + token.json, пути берутся из .env)\n"
         f"Последний запуск: {st.last_run_at.strftime('%Y-%m-%d %H:%M:%S') if st.last_run_at else '—'}\n"
-        f"Статус последнего: {st.last_status or '—'}"
+        f"Статус последнего: {st.last_status or '—'}\n"
+        f"Тест-восстановление: {html.escape(st.last_test_restore_status or '—')}"
     )
     kb = _kb_main(st)
     if isinstance(target, CallbackQuery):
@@ -163,6 +211,22 @@ async def _auto_back_to_menu(target: Union[CallbackQuery, Message]) -> None:
     await _render(target, st)
 
 
+async def _submit_job(
+        out: Message, kind: str, fn: JobFn, user_id: int, on_done: DoneFn,
+) -> Optional[JobInfo]:
+    """Тяжёлые операции — фоновой задачей (utils.jobs); при занятом замке — сообщение и None."""
+    try:
+        return await jobs.submit(kind, fn, started_by=user_id, on_done=on_done)
+    except JobBusy as e:
+        await out.answer(f"⏳ Уже выполняется задача #{e.running.id} ({e.running.kind}). Статус и отмена: /jobs")
+        return None
+
+
+def _job_result_text(job: JobInfo) -> str:
+    icon = {"done": "✅", "cancelled": "⏹"}.get(job.state, "❌")
+    return f"{icon} #{job.id}: {html.escape(job.result or job.state)}"
+
+
 async def _restart_service() -> Tuple[bool, str]:
     try:
         proc = await asyncio.create_subprocess_shell(
@@ -211,7 +275,7 @@ async def backup_cmd(message: Message, state: FSMContext):
     await _render(message, st)
 
 
-@router.callback_query(F.data == "admin:backup")
+@cbx.exact("admin:backup")
 async def open_backup(cb: CallbackQuery, state: FSMContext):
     if cb.from_user.id != ADMIN_TELEGRAM_ID:
         return
@@ -225,7 +289,7 @@ async def open_backup(cb: CallbackQuery, state: FSMContext):
 
 
 # ===== toggle on/off =====
-@router.callback_query(F.data == "bk:toggle")
+@cbx.exact("bk:toggle")
 async def bk_toggle(cb: CallbackQuery, state: FSMContext):
     if cb.from_user.id != ADMIN_TELEGRAM_ID:
         return
@@ -260,7 +324,7 @@ def _kb_schedule_time(st: BackupSettings) -> InlineKeyboardMarkup:
     )
 
 
-@router.callback_query(F.data == "bk:schedule")
+@cbx.exact("bk:schedule")
 async def bk_schedule(cb: CallbackQuery, state: FSMContext):
     if cb.from_user.id != ADMIN_TELEGRAM_ID:
         return
@@ -272,7 +336,7 @@ async def bk_schedule(cb: CallbackQuery, state: FSMContext):
     await cb.answer()
 
 
-@router.callback_query(F.data.startswith("bk:f:"))
+@cbx.prefix("bk:f:")
 async def bk_set_freq(cb: CallbackQuery, state: FSMContext):
     if cb.from_user.id != ADMIN_TELEGRAM_ID:
         return
@@ -301,7 +365,7 @@ async def bk_set_freq(cb: CallbackQuery, state: FSMContext):
     await cb.answer("Частота сохранена.")
 
 
-@router.callback_query(F.data == "bk:time")
+@cbx.exact("bk:time")
 async def bk_time(cb: CallbackQuery, state: FSMContext):
     if cb.from_user.id != ADMIN_TELEGRAM_ID:
         return
@@ -346,7 +410,7 @@ async def bk_time_set(msg: Message, state: FSMContext):
 
 
 # ===== retention =====
-@router.callback_query(F.data == "bk:retention")
+@cbx.exact("bk:retention")
 async def bk_retention(cb: CallbackQuery, state: FSMContext):
     if cb.from_user.id != ADMIN_TELEGRAM_ID:
         return
@@ -384,8 +448,395 @@ async def bk_retention_set(msg: Message, state: FSMContext):
     await _render(msg, st)
 
 
+# ===== Хранение GFS (дни / недели / месяцы) =====
+GFS_WEEKLY_CHOICES = (0, 4, 8, 12)
+GFS_MONTHLY_CHOICES = (0, 3, 6, 12)
+GFS_PREVIEW_SETS = 15
+
+
+def _kb_gfs(st: BackupSettings) -> InlineKeyboardMarkup:
+    def mark(cur, val) -> str:
+        return "✅ " if (cur or 0) == val else ""
+
+    rows = [
+        [
+            InlineKeyboardButton(text=f"{mark(st.keep_weekly, n)}{n}н", callback_data=f"bk:gfs:w:{n}")
+            for n in GFS_WEEKLY_CHOICES
+        ],
+        [
+            InlineKeyboardButton(text=f"{mark(st.keep_monthly, n)}{n}м", callback_data=f"bk:gfs:m:{n}")
+            for n in GFS_MONTHLY_CHOICES
+        ],
+        [InlineKeyboardButton(text="👁 Предпросмотр (dry-run)", callback_data="bk:gfs:dry")],
+        [InlineKeyboardButton(text="🧹 Применить сейчас", callback_data="bk:gfs:apply")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="admin:backup")],
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def _gfs_text(st: BackupSettings, extra: str = "") -> str:
+    return (
+        "<b>Хранение бэкапов (GFS)</b>\n\n"
+        f"• все бэкапы за последние <b>{st.retention_days}</b> дн. (кнопка Retention; 0 — не чистить)\n"
+        f"• плюс последний бэкап каждой из <b>{st.keep_weekly or 0}</b> недель\n"
+        f"• плюс последний бэкап каждого из <b>{st.keep_monthly or 0}</b> месяцев\n"
+        "Самый свежий бэкап (и его цепочка инкрементов) не удаляется никогда.\n"
+        "Очистка идёт после каждого успешного и проверенного бэкапа."
+        + (f"\n\n{extra}" if extra else "")
+    )
+
+
+async def _render_gfs(cb: CallbackQuery, st: BackupSettings, extra: str = "") -> None:
+    try:
+        await cb.message.edit_text(_gfs_text(st, extra), reply_markup=_kb_gfs(st), parse_mode="HTML")
+    except TelegramBadRequest:
+        pass
+
+
+@cbx.exact("bk:gfs")
+async def bk_gfs(cb: CallbackQuery, state: FSMContext):
+    if cb.from_user.id != ADMIN_TELEGRAM_ID:
+        return
+    st = await _ensure_settings_exists(cb)
+    if not st:
+        await cb.answer()
+        return
+    await _render_gfs(cb, st)
+    await cb.answer()
+
+
+@cbx.prefix(("bk:gfs:w:", "bk:gfs:m:"))
+async def bk_gfs_set(cb: CallbackQuery, state: FSMContext):
+    if cb.from_user.id != ADMIN_TELEGRAM_ID:
+        return
+    st = await _ensure_settings_exists(cb)
+    if not st:
+        await cb.answer()
+        return
+    _, _, kind, raw = cb.data.split(":", 3)
+    choices = GFS_WEEKLY_CHOICES if kind == "w" else GFS_MONTHLY_CHOICES
+    if not raw.isdigit() or int(raw) not in choices:
+        await cb.answer("Неверное значение.")
+        return
+
+    async with get_session() as s:
+        if kind == "w":
+            st.keep_weekly = int(raw)
+        else:
+            st.keep_monthly = int(raw)
+        s.add(st)
+        await s.commit()
+
+    st = await _load_settings()
+    await _render_gfs(cb, st)
+    await cb.answer("Сохранено.")
+
+
+@cbx.exact(("bk:gfs:dry", "bk:gfs:apply"))
+async def bk_gfs_run(cb: CallbackQuery, state: FSMContext):
+    if cb.from_user.id != ADMIN_TELEGRAM_ID:
+        return
+    dry_run = cb.data == "bk:gfs:dry"
+    await cb.answer("Считаю…" if dry_run else "Удаляю…")
+    ok, msg, report = await run_retention(cb.bot.db_url, dry_run=dry_run)
+    lines = [f"{'✅' if ok else '❌'} {html.escape(msg)}"]
+    if report and report.deleted_sets:
+        title = "К удалению" if dry_run else "Удалено"
+        shown = report.deleted_sets[:GFS_PREVIEW_SETS]
+        more = len(report.deleted_sets) - len(shown)
+        lines.append(f"{title}: " + ", ".join(f"<code>{k}</code>" for k in shown) + (f" … (+{more})" if more > 0 else ""))
+    if report and report.failed:
+        lines.append("Ошибки: " + html.escape("; ".join(report.failed[:5])))
+    st = await _load_settings()
+    if st:
+        await _render_gfs(cb, st, "\n".join(lines))
+
+
+# ===== Параметры pg_dump (формат / сжатие / потоки) =====
+DUMP_JOBS_CHOICES = (1, 2, 4, 8)
+
+
+def _kb_dump_cfg(st: BackupSettings) -> InlineKeyboardMarkup:
+    def mark(cur, val) -> str:
+        return "✅ " if cur == val else ""
+
+    fmt = st.dump_format or "custom"
+    z = st.compression or "gzip:9"
+    rows = [
+        [
+            InlineKeyboardButton(text=f"{mark(fmt, f)}{f}", callback_data=f"bk:dc:fmt:{f}")
+            for f in DUMP_FORMATS
+        ],
+    ]
+    row: list[InlineKeyboardButton] = []
+    for spec in COMPRESSION_CHOICES:
+        row.append(InlineKeyboardButton(text=f"{mark(z, spec)}{spec}", callback_data=f"bk:dc:z:{spec}"))
+        if len(row) == 4:
+            rows.append(row)
+            row = []
+    if row:
+        rows.append(row)
+    if fmt == "directory":
+        rows.append([
+            InlineKeyboardButton(text=f"{mark(st.dump_jobs, j)}j{j}", callback_data=f"bk:dc:j:{j}")
+            for j in DUMP_JOBS_CHOICES
+        ])
+    rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="admin:backup")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+DUMP_CFG_TEXT = (
+    "<b>Параметры дампа</b>\n\n"
+    "• <b>custom</b> — один архив, идёт в хранилище потоком без временных файлов.\n"
+    "• <b>directory</b> — <code>pg_dump -F d -j N</code>: таблицы выгружаются параллельно во временный "
+    "каталог, затем загружаются одним tar. Быстрее на больших базах, требует места на диске.\n"
+    "• zstd/lz4 — только pg_dump ≥ 16, иначе будет использован gzip:6.\n\n"
+    "Сравнить варианты на своей базе: <code>python scripts/backup_bench.py</code>"
+)
+
+
+@cbx.exact("bk:dumpcfg")
+async def bk_dump_cfg(cb: CallbackQuery, state: FSMContext):
+    if cb.from_user.id != ADMIN_TELEGRAM_ID:
+        return
+    st = await _ensure_settings_exists(cb)
+    if not st:
+        await cb.answer()
+        return
+    await cb.message.edit_text(DUMP_CFG_TEXT, reply_markup=_kb_dump_cfg(st), parse_mode="HTML")
+    await cb.answer()
+
+
+@cbx.prefix("bk:dc:")
+async def bk_dump_cfg_set(cb: CallbackQuery, state: FSMContext):
+    if cb.from_user.id != ADMIN_TELEGRAM_ID:
+        return
+    st = await _ensure_settings_exists(cb)
+    if not st:
+        await cb.answer()
+        return
+
+    _, _, key, value = cb.data.split(":", 3)
+    if key == "fmt" and value in DUMP_FORMATS:
+        st.dump_format = value
+    elif key == "z" and value in COMPRESSION_CHOICES:
+        st.compression = value
+    elif key == "j" and value.isdigit() and int(value) in DUMP_JOBS_CHOICES:
+        st.dump_jobs = int(value)
+    else:
+        await cb.answer("Неверное значение.")
+        return
+
+    async with get_session() as s:
+        s.add(st)
+        await s.commit()
+
+    st = await _load_settings()
+    try:
+        await cb.message.edit_text(DUMP_CFG_TEXT, reply_markup=_kb_dump_cfg(st), parse_mode="HTML")
+    except TelegramBadRequest:
+        pass
+    await cb.answer("Сохранено.")
+
+
+# ===== Инкрементальные бэкапы =====
+FULL_EVERY_CHOICES = (3, 7, 14, 30)
+
+
+def _kb_inc(st: BackupSettings) -> InlineKeyboardMarkup:
+    rows = [
+        [InlineKeyboardButton(
+            text="🟢 Включены — выключить" if st.incremental_enabled else "🔴 Выключены — включить",
+            callback_data="bk:inc:toggle",
+        )],
+        [
+            InlineKeyboardButton(
+                text=f"{'✅ ' if st.full_every_days == d else ''}full/{d}д", callback_data=f"bk:inc:every:{d}"
+            )
+            for d in FULL_EVERY_CHOICES
+        ],
+        [InlineKeyboardButton(text="🔁 Следующий запуск — полный", callback_data="bk:inc:reset")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="admin:backup")],
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def _inc_text(st: BackupSettings) -> str:
+    chain = st.chain_state or {}
+    if chain.get("chain_id"):
+        marks = ", ".join(f"{t}≤{v}" for t, v in (chain.get("watermarks") or {}).items())
+        chain_line = (
+            f"Текущая цепочка: <code>{chain['chain_id']}</code>, инкрементов: {len(chain.get('parts') or [])}\n"
+            f"Watermarks: <code>{html.escape(marks)}</code>\n"
+        )
+    else:
+        chain_line = "Текущей цепочки нет — следующий запуск сделает полный дамп.\n"
+    return (
+        "<b>Инкрементальные бэкапы</b>\n\n"
+        "stock_movements и audit_logs только дописываются, поэтому между полными дампами "
+        "выгружаются лишь новые строки (COPY, gzip) и небольшой дамп остальных таблиц.\n"
+        "Полный дамп — по периоду, при смене схемы (alembic) и если цепочка сломана.\n\n"
+        f"{chain_line}\n"
+        "Восстановление цепочки: <code>python scripts/restore_chain.py &lt;каталог&gt;</code>"
+    )
+
+
+async def _render_inc(cb: CallbackQuery, st: BackupSettings) -> None:
+    try:
+        await cb.message.edit_text(_inc_text(st), reply_markup=_kb_inc(st), parse_mode="HTML")
+    except TelegramBadRequest:
+        pass
+
+
+@cbx.exact("bk:inc")
+async def bk_inc(cb: CallbackQuery, state: FSMContext):
+    if cb.from_user.id != ADMIN_TELEGRAM_ID:
+        return
+    st = await _ensure_settings_exists(cb)
+    if not st:
+        await cb.answer()
+        return
+    await _render_inc(cb, st)
+    await cb.answer()
+
+
+@cbx.prefix("bk:inc:")
+async def bk_inc_set(cb: CallbackQuery, state: FSMContext):
+    if cb.from_user.id != ADMIN_TELEGRAM_ID:
+        return
+    st = await _ensure_settings_exists(cb)
+    if not st:
+        await cb.answer()
+        return
+
+    parts = cb.data.split(":")
+    action = parts[2]
+    if action == "toggle":
+        st.incremental_enabled = not st.incremental_enabled
+    elif action == "every" and len(parts) == 4 and parts[3].isdigit() and int(parts[3]) in FULL_EVERY_CHOICES:
+        st.full_every_days = int(parts[3])
+    elif action == "reset":
+        st.chain_state = None
+    else:
+        await cb.answer("Неверное значение.")
+        return
+
+    async with get_session() as s:
+        s.add(st)
+        await s.commit()
+
+    st = await _load_settings()
+    await _render_inc(cb, st)
+    await cb.answer("Сохранено.")
+
+
+# ===== Проверка бэкапов (манифест + тест-восстановление) =====
+TEST_RESTORE_CHOICES = (0, 1, 7, 30)
+
+
+def _kb_verify(st: BackupSettings) -> InlineKeyboardMarkup:
+    rows = [
+        [
+            InlineKeyboardButton(
+                text=f"{'✅ ' if st.test_restore_every_days == d else ''}{'выкл' if d == 0 else f'{d}д'}",
+                callback_data=f"bk:tr:every:{d}",
+            )
+            for d in TEST_RESTORE_CHOICES
+        ],
+        [InlineKeyboardButton(text="▶️ Проверить последний бэкап сейчас", callback_data="bk:tr:run")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="admin:backup")],
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def _verify_text(st: BackupSettings) -> str:
+    m = st.last_manifest or {}
+    if m:
+        man = (
+            f"Файл: <code>{html.escape(m.get('file', '—'))}</code>\n"
+            f"Размер: {m.get('size', 0) / (1024 * 1024):.2f} MB, sha256: <code>{m.get('sha256', '')[:16]}…</code>\n"
+            f"Таблиц: {len(m.get('row_counts') or {})}, дамп: {m.get('duration_sec', '—')}s\n"
+        )
+    else:
+        man = "Манифеста ещё нет — сделайте бэкап.\n"
+    last = st.last_test_restore_at.strftime('%Y-%m-%d %H:%M') if st.last_test_restore_at else "—"
+    return (
+        "<b>Проверка бэкапов</b>\n\n"
+        "Каждый бэкап получает манифест (sha256, размер, строки по таблицам); загруженная копия "
+        "сверяется сразу после заливки. Тест-восстановление скачивает последний бэкап и "
+        "восстанавливает его во временную БД, сравнивая число строк.\n\n"
+        f"{man}\n"
+        f"Последнее тест-восстановление ({last}):\n{html.escape(st.last_test_restore_status or '—')}"
+    )
+
+
+@cbx.exact("bk:verify")
+async def bk_verify(cb: CallbackQuery, state: FSMContext):
+    if cb.from_user.id != ADMIN_TELEGRAM_ID:
+        return
+    st = await _ensure_settings_exists(cb)
+    if not st:
+        await cb.answer()
+        return
+    await cb.message.edit_text(_verify_text(st), reply_markup=_kb_verify(st), parse_mode="HTML")
+    await cb.answer()
+
+
+@cbx.prefix("bk:tr:every:")
+async def bk_tr_every(cb: CallbackQuery, state: FSMContext):
+    if cb.from_user.id != ADMIN_TELEGRAM_ID:
+        return
+    st = await _ensure_settings_exists(cb)
+    if not st:
+        await cb.answer()
+        return
+    raw = cb.data.split(":")[-1]
+    if not raw.isdigit() or int(raw) not in TEST_RESTORE_CHOICES:
+        await cb.answer("Неверное значение.")
+        return
+
+    async with get_session() as s:
+        st.test_restore_every_days = int(raw)
+        s.add(st)
+        await s.commit()
+
+    st = await _load_settings()
+    try:
+        await cb.message.edit_text(_verify_text(st), reply_markup=_kb_verify(st), parse_mode="HTML")
+    except TelegramBadRequest:
+        pass
+    await cb.answer("Сохранено.")
+
+
+@cbx.exact("bk:tr:run")
+async def bk_tr_run(cb: CallbackQuery, state: FSMContext):
+    if cb.from_user.id != ADMIN_TELEGRAM_ID:
+        return
+    await cb.answer()
+    db_url = cb.bot.db_url
+
+    async def work(ctx: JobContext) -> str:
+        ok, msg = await run_test_restore(db_url)
+        if not ok:
+            raise RuntimeError(msg)
+        return msg
+
+    async def done(job: JobInfo) -> None:
+        await cb.message.edit_text(_job_result_text(job), parse_mode="HTML")
+        await _auto_back_to_menu(cb)
+
+    job = await _submit_job(cb.message, "test_restore", work, cb.from_user.id, done)
+    if job:
+        try:
+            await cb.message.edit_text(
+                f"Скачиваю последний бэкап и восстанавливаю во временную БД (задача #{job.id})… это может занять время."
+            )
+        except TelegramBadRequest:
+            pass
+
+
 # ===== Folder ID =====
-@router.callback_query(F.data == "bk:folder")
+@cbx.exact("bk:folder")
 async def bk_folder(cb: CallbackQuery, state: FSMContext):
     if cb.from_user.id != ADMIN_TELEGRAM_ID:
         return
@@ -423,7 +874,7 @@ async def bk_folder_set(msg: Message, state: FSMContext):
 
 
 # ===== OAuth: Device Flow =====
-@router.callback_query(F.data == "bk:oauth")
+@cbx.exact("bk:oauth")
 async def bk_oauth(cb: CallbackQuery, state: FSMContext):
     if cb.from_user.id != ADMIN_TELEGRAM_ID:
         return
@@ -502,9 +953,10 @@ async def bk_oauth(cb: CallbackQuery, state: FSMContext):
                     ensure_ascii=False,
                 )
                 await _save_token_json(token_json)
+                _, check = await gdrive_clients.check_oauth()  # кэш Drive-клиента — на новый токен
                 ok, log = await _restart_service()
-                msg = "✅ Токен получен и сохранён. Сервис перезапущен." if ok else \
-                    f"✅ Токен получен, но рестарт не удался:\n<pre>{html.escape(log)}</pre>"
+                msg = f"✅ Токен получен и сохранён ({check}). Сервис перезапущен." if ok else \
+                    f"✅ Токен получен ({html.escape(check)}), но рестарт не удался:\n<pre>{html.escape(log)}</pre>"
                 await cb.message.edit_text(msg, parse_mode="HTML")
                 await state.clear()
                 await _auto_back_to_menu(cb)
@@ -536,7 +988,7 @@ async def bk_oauth(cb: CallbackQuery, state: FSMContext):
 
 
 # ===== Загрузка token.json файлом =====
-@router.callback_query(F.data == "bk:token_upload")
+@cbx.exact("bk:token_upload")
 async def bk_token_upload(cb: CallbackQuery, state: FSMContext):
     if cb.from_user.id != ADMIN_TELEGRAM_ID:
         return
@@ -567,31 +1019,101 @@ async def bk_token_file(msg: Message, state: FSMContext):
         return
 
     await _save_token_json(raw)
+    _, check = await gdrive_clients.check_oauth()  # кэш Drive-клиента — на новый токен
     ok, log = await _restart_service()
     await state.clear()
     if ok:
-        await msg.answer("✅ Токен загружен и сохранён. Сервис перезапущен.")
+        await msg.answer(f"✅ Токен загружен и сохранён ({check}). Сервис перезапущен.")
     else:
         safe = html.escape(log)
-        await msg.answer(f"✅ Токен сохранён, но рестарт не удался:\n<pre>{safe}</pre>", parse_mode="HTML")
+        await msg.answer(f"✅ Токен сохранён ({html.escape(check)}), но рестарт не удался:\n<pre>{safe}</pre>", parse_mode="HTML")
     await _auto_back_to_menu(msg)
 
 
 # ===== Run backup now =====
-@router.callback_query(F.data == "bk:run")
+@cbx.exact("bk:run")
 async def bk_run(cb: CallbackQuery):
     if cb.from_user.id != ADMIN_TELEGRAM_ID:
         return
-    await cb.message.edit_text("Делаю бэкап… это может занять до нескольких минут.")
-    ok, msg = await run_backup(cb.bot.db_url)
-    text = f"✅ {msg}" if ok else f"❌ {msg}"
-    await cb.message.edit_text(text, parse_mode="HTML")
-    await _auto_back_to_menu(cb)
+    await cb.answer()
+    db_url = cb.bot.db_url
+
+    async def work(ctx: JobContext) -> str:
+        ok, msg = await run_backup(db_url)
+        if not ok:
+            raise RuntimeError(msg)
+        return msg
+
+    async def done(job: JobInfo) -> None:
+        await cb.message.edit_text(_job_result_text(job), parse_mode="HTML")
+        await _auto_back_to_menu(cb)
+
+    job = await _submit_job(cb.message, "backup", work, cb.from_user.id, done)
+    if job:
+        try:
+            await cb.message.edit_text(f"Делаю бэкап (задача #{job.id})… это может занять до нескольких минут. /jobs — статус.")
+        except TelegramBadRequest:
+            pass
 
 
 # ===== Restore =====
-ALLOWED_EXT = {".backup", ".backup.gz", ".dump", ".sql", ".sql.gz"}
+ALLOWED_EXT = {".backup", ".backup.gz", ".dump", ".sql", ".sql.gz", ".dir.tar"}
 MAX_BACKUP_SIZE_MB = 2048
+PROGRESS_EDIT_SEC = 3.0     # не чаще одного редактирования сообщения за интервал (лимиты Telegram)
+PROGRESS_TAIL_LINES = 12
+
+
+class _RestoreProgress:
+    """Одно сообщение с фазой, временем и хвостом лога; редактируется не чаще PROGRESS_EDIT_SEC."""
+
+    def __init__(self, message: Message, timer: PhaseTimer, jobs: int, ctx: Optional[JobContext] = None):
+        self.message = message
+        self.timer = timer
+        self.jobs = jobs
+        self.ctx = ctx
+        self.tail: deque[str] = deque(maxlen=PROGRESS_TAIL_LINES)
+        self.lines = 0
+        self.t0 = time.monotonic()
+        self._last_edit = 0.0
+        self._last_text = ""
+
+    def _text(self, done: bool = False) -> str:
+        head = "✅ Готово" if done else f"⏳ Фаза: <b>{html.escape(self.timer.current or '—')}</b>"
+        tail = html.escape("\n".join(self.tail)[-3000:]) or "…"
+        return (
+            f"♻️ Восстановление (потоков: {self.jobs})\n{head} · {time.monotonic() - self.t0:.0f}s · строк: {self.lines}\n"
+            f"<pre>{tail}</pre>"
+        )
+
+    async def line(self, line: str) -> None:
+        self.tail.append(line)
+        self.lines += 1
+        if self.ctx:
+            await self.ctx.progress(f"{self.timer.current or '—'}: {line}")
+        if time.monotonic() - self._last_edit >= PROGRESS_EDIT_SEC:
+            await self.flush()
+
+    async def flush(self, done: bool = False) -> None:
+        self._last_edit = time.monotonic()
+        text = self._text(done)
+        if text == self._last_text:
+            return
+        try:
+            await self.message.edit_text(text, parse_mode="HTML")
+            self._last_text = text
+        except TelegramRetryAfter as e:
+            self._last_edit += e.retry_after
+        except TelegramBadRequest:
+            pass
+
+
+def _untar_dump_dir(tar_path: str, tmpdir: str) -> str:
+    out_dir = os.path.join(tmpdir, "dump")
+    os.makedirs(out_dir, exist_ok=True)
+    with tarfile.open(tar_path, "r:") as tf:
+        tf.extractall(out_dir, filter="data")
+    os.remove(tar_path)
+    return out_dir
 
 
 async def _restore_open_common(target: Union[CallbackQuery, Message], state: FSMContext):
@@ -601,7 +1123,7 @@ async def _restore_open_common(target: Union[CallbackQuery, Message], state: FSM
         "♻️ Восстановление БД\n\n"
         "Пришлите файл бэкапа <b>документом</b>.\n"
         "Поддерживаемые форматы: <code>.backup</code>, <code>.backup.gz</code>, <code>.dump</code>, "
-        "<code>.sql</code>, <code>.sql.gz</code>\n"
+        "<code>.sql</code>, <code>.sql.gz</code>, <code>.dir.tar</code>\n"
         "⚠️ ВНИМАНИЕ: действующая БД будет перезаписана."
     )
     if isinstance(target, CallbackQuery):
@@ -612,7 +1134,7 @@ async def _restore_open_common(target: Union[CallbackQuery, Message], state: FSM
 
 
 # Обычный сценарий (через меню)
-@router.callback_query(F.data == "bk:restore")
+@cbx.exact("bk:restore")
 async def bk_restore_open(cb: CallbackQuery, state: FSMContext):
     if cb.from_user.id != ADMIN_TELEGRAM_ID:
         return
@@ -627,7 +1149,7 @@ async def bk_restore_open(cb: CallbackQuery, state: FSMContext):
 
 
 # Emergency Restore (без обращения к БД)
-@router.callback_query(F.data == "bk:restore_emergency")
+@cbx.exact("bk:restore_emergency")
 async def bk_restore_emergency(cb: CallbackQuery, state: FSMContext):
     if cb.from_user.id != ADMIN_TELEGRAM_ID:
         return
@@ -649,7 +1171,7 @@ async def bk_restore_file(msg: Message, state: FSMContext):
 
     name = (msg.document.file_name or "").lower()
     if not any(name.endswith(ext) for ext in ALLOWED_EXT):
-        await msg.answer("Неподдерживаемый формат. Разрешены: .backup, .backup.gz, .dump, .sql, .sql.gz")
+        await msg.answer("Неподдерживаемый формат. Разрешены: .backup, .backup.gz, .dump, .sql, .sql.gz, .dir.tar")
         return
     if msg.document.file_size and msg.document.file_size > MAX_BACKUP_SIZE_MB * 1024 * 1024:
         await msg.answer(f"Файл слишком большой (> {MAX_BACKUP_SIZE_MB} МБ).")
@@ -657,9 +1179,13 @@ async def bk_restore_file(msg: Message, state: FSMContext):
 
     tmpdir = tempfile.mkdtemp(prefix="wb_restore_")
     filepath = os.path.join(tmpdir, msg.document.file_name)
+    t0 = time.monotonic()
     await msg.bot.download(msg.document, destination=filepath)
+    if name.endswith(".dir.tar"):
+        # directory-формат: распаковываем, скрипт восстановления получает путь к каталогу
+        filepath = await asyncio.to_thread(_untar_dump_dir, filepath, tmpdir)
 
-    await state.update_data(tmpdir=tmpdir, filepath=filepath)
+    await state.update_data(tmpdir=tmpdir, filepath=filepath, download_sec=round(time.monotonic() - t0, 2))
     await state.set_state(BackupState.waiting_restore_confirm)
     await msg.answer(
         "Файл получен: <code>{}</code>\n\n"
@@ -704,11 +1230,6 @@ async def bk_restore_confirm(msg: Message, state: FSMContext):
         return
     # --- /Preflight ---
 
-    await msg.answer("Запускаю восстановление… Пришлю лог выполнения.")
-
-    # Команда: централизованная сборка (sudo -n $RESTORE_SCRIPT_PATH <file>)
-    cmd = build_restore_cmd(filepath)
-
     # Пробрасываем PG-переменные из DB_URL (удобно для инструментов)
     env = os.environ.copy()
     try:
@@ -726,58 +1247,57 @@ async def bk_restore_confirm(msg: Message, state: FSMContext):
     except Exception:
         pass
 
-    try:
-        proc = await asyncio.create_subprocess_shell(
-            cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.STDOUT,
-            env=env,
-        )
-        out, _ = await proc.communicate()
-        code = proc.returncode
-        log = out.decode(errors="ignore") if out else "(нет вывода)"
-
-        # Если лог длинный — отправляем файлом
-        if len(log) > 3500:
-            logpath = os.path.join(data["tmpdir"], "restore.log")
-            with open(logpath, "w", encoding="utf-8") as f:
-                f.write(log)
-            await msg.answer_document(FSInputFile(logpath), caption=f"Код завершения: {code}")
-        else:
-            safe = html.escape(log)
-            text = f"Код завершения: {code}\n\n<pre>{safe}</pre>"
-            try:
-                await msg.answer(text, parse_mode="HTML")
-            except TelegramBadRequest:
-                logpath = os.path.join(data["tmpdir"], "restore.log")
-                with open(logpath, "w", encoding="utf-8") as f:
-                    f.write(log)
-                await msg.answer_document(FSInputFile(logpath), caption=f"Код завершения: {code}")
+    # Вывод скрипта читается построчно: прогресс в одном сообщении, полный лог — в файл.
+    # Само восстановление — фоновая задача "restore" (single-flight вместе с wipe).
+    timer = PhaseTimer()
+    timer.add("download", data.get("download_sec", 0.0))
+    jobs_n = restore_jobs_for(filepath)
+    tmpdir = data["tmpdir"]
+    logpath = os.path.join(tmpdir, "restore.log")
+    await state.clear()
+
+    async def work(ctx: JobContext) -> str:
+        status = await msg.answer(f"♻️ Запускаю восстановление (задача #{ctx.info.id}, отмена — /jobs)…")
+        progress = _RestoreProgress(status, timer, jobs_n, ctx)
+        code = await stream_restore(filepath, env, logpath, progress.line, timer, jobs=jobs_n)
+        await progress.flush(done=code == 0)
 
         # Пересобираем пул и пингуем БД ТОЛЬКО при успешном восстановлении
+        engine_note = ""
         if code == 0:
+            timer.start("engine reset")
             try:
                 await reset_db_engine()
                 await ping_db()
-                await msg.answer("✅ Пул подключений к БД пересоздан, соединение проверено.")
+                engine_note = "✅ Пул подключений к БД пересоздан, соединение проверено."
             except Exception as e:
-                err = html.escape(repr(e))
-                await msg.answer(
-                    f"⚠️ Бэкап восстановлен, но не удалось проверить соединение:\n<pre>{err}</pre>",
-                    parse_mode="HTML",
-                )
+                engine_note = f"⚠️ Бэкап восстановлен, но не удалось проверить соединение:\n<pre>{html.escape(repr(e))}</pre>"
+            timer.stop()
 
-    except Exception as e:
-        try:
-            await msg.answer(f"<b>Ошибка запуска восстановления</b>:\n<pre>{html.escape(repr(e))}</pre>", parse_mode="HTML")
-        except TelegramBadRequest:
-            await msg.answer(f"Ошибка запуска восстановления: {repr(e)}")
-    finally:
-        try:
-            shutil.rmtree(data.get("tmpdir", ""), ignore_errors=True)
-        except Exception:
-            pass
-        await state.clear()
+        caption = f"Код завершения: {code}\nФазы: {timer.summary()}"
+        if progress.lines > PROGRESS_TAIL_LINES:
+            await msg.answer_document(FSInputFile(logpath), caption=caption)
+        else:
+            tail = html.escape("\n".join(progress.tail)) or "(нет вывода)"
+            await msg.answer(f"{caption}\n\n<pre>{tail}</pre>", parse_mode="HTML")
+        if engine_note:
+            await msg.answer(engine_note, parse_mode="HTML")
+        if code != 0:
+            raise RuntimeError(f"restore script exited with code {code}")
+        return f"restored {os.path.basename(filepath)}; {timer.summary()}"
+
+    async def done(job: JobInfo) -> None:
+        await asyncio.to_thread(shutil.rmtree, tmpdir, True)
+        if job.state != "done":
+            try:
+                await msg.answer(f"<b>Восстановление не выполнено</b>:\n<pre>{html.escape(job.result)}</pre>", parse_mode="HTML")
+            except TelegramBadRequest:
+                await msg.answer(f"Восстановление не выполнено: {job.result}")
+        await _auto_back_to_menu(msg)
+
+    job = await _submit_job(msg, "restore", work, msg.from_user.id, done)
+    if not job:
+        shutil.rmtree(tmpdir, ignore_errors=True)
         await _auto_back_to_menu(msg)
 
 
@@ -792,7 +1312,7 @@ def _mask_db_url() -> tuple[str, str]:
     except Exception:
         return "(не удалось разобрать DB_URL)", ""
 
-@router.callback_query(F.data == "bk:wipe")
+@cbx.exact("bk:wipe")
 async def bk_wipe(cb: CallbackQuery, state: FSMContext):
     if cb.from_user.id != ADMIN_TELEGRAM_ID:
         return
@@ -855,6 +1375,7 @@ async def bk_wipe_do(msg: Message, state: FSMContext):
         return
 
     # Чистим БЕЗ пересоздания схемы: TRUNCATE всех таблиц public с каскадом и сбросом идентификаторов
+    # (кроме bg_jobs — история фоновых задач, в т.ч. этой)
     sql_truncate_all = text("""
 DO $$
 DECLARE
@@ -867,7 +1388,8 @@ BEGIN
     FROM pg_class c
     JOIN pg_namespace n ON n.oid = c.relnamespace
     WHERE c.relkind = 'r'
-      AND n.nspname = 'public';
+      AND n.nspname = 'public'
+      AND c.relname <> 'bg_jobs';
 
     IF stmt IS NOT NULL THEN
         EXECUTE stmt;
@@ -875,19 +1397,26 @@ BEGIN
 END $$;
 """)
 
-    try:
+    await state.clear()
+
+    async def work(ctx: JobContext) -> str:
         async with get_session() as s:
             await s.execute(sql_truncate_all)
             await s.commit()
 
         # Пул на всякий случай пересоздадим и проверим подключение
+        await ctx.progress("engine reset", force=True)
         await reset_db_engine()
         await ping_db()
+        return "TRUNCATE … RESTART IDENTITY CASCADE"
 
-        await msg.answer("✅ База очищена (TRUNCATE … RESTART IDENTITY CASCADE).")
-    except Exception as e:
-        safe = html.escape(repr(e))
-        await msg.answer(f"❌ Ошибка очистки: <pre>{safe}</pre>", parse_mode="HTML")
-    finally:
-        await state.clear()
+    async def done(job: JobInfo) -> None:
+        if job.state == "done":
+            await msg.answer("✅ База очищена (TRUNCATE … RESTART IDENTITY CASCADE).")
+        else:
+            await msg.answer(f"❌ Ошибка очистки: <pre>{html.escape(job.result)}</pre>", parse_mode="HTML")
+        await _auto_back_to_menu(msg)
+
+    job = await _submit_job(msg, "wipe", work, msg.from_user.id, done)
+    if not job:
         await _auto_back_to_menu(msg)
@@ -0,0 +1,84 @@
+# handlers/admin_jobs.py
+# /jobs — фоновые задачи админки (utils.jobs): последние запуски, прогресс, отмена.
+from __future__ import annotations
+
+import html
+from typing import Union
+
+from aiogram import Router
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command
+from aiogram.types import CallbackQuery, Message, InlineKeyboardMarkup, InlineKeyboardButton
+
+from config import ADMIN_TELEGRAM_ID
+from utils.jobs import jobs, JobInfo, WORKER_ID
+from handlers.callback_index import callback_index
+
+router = Router()
+cbx = callback_index(router)
+
+STATE_ICONS = {"queued": "🕓", "running": "⏳", "done": "✅", "failed": "❌", "cancelled": "⏹"}
+
+
+def _job_line(j: JobInfo) -> str:
+    dur = f" · {j.duration_sec:.0f}s" if j.duration_sec is not None else ""
+    line = (
+        f"{STATE_ICONS.get(j.state, '•')} <b>#{j.id}</b> {html.escape(j.kind)} · "
+        f"{j.created_at.strftime('%m-%d %H:%M')}{dur}"
+    )
+    if j.owner and j.owner != WORKER_ID:
+        line += f" · {html.escape(j.owner)}"
+    detail = j.progress if j.state in ("queued", "running") else j.result
+    if detail:
+        line += f"\n    <i>{html.escape(detail[:200])}</i>"
+    return line
+
+
+def _kb_jobs(items: list[JobInfo]) -> InlineKeyboardMarkup:
+    rows = [
+        [InlineKeyboardButton(text=f"⏹ Отменить #{j.id} ({j.kind})", callback_data=f"jobs:cancel:{j.id}")]
+        for j in items if j.state in ("queued", "running")
+    ]
+    rows.append([InlineKeyboardButton(text="🔄 Обновить", callback_data="jobs:list")])
+    rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="admin:backup")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+async def _render(target: Union[CallbackQuery, Message]) -> None:
+    items = await jobs.recent()
+    body = "\n".join(_job_line(j) for j in items) or "Задач ещё не было."
+    text = f"<b>Фоновые задачи</b>\n\n{body}"
+    kb = _kb_jobs(items)
+    if isinstance(target, CallbackQuery):
+        try:
+            await target.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
+        except TelegramBadRequest:
+            pass
+    else:
+        await target.answer(text, reply_markup=kb, parse_mode="HTML")
+
+
+@router.message(Command("jobs"))
+async def jobs_cmd(message: Message):
+    if message.from_user.id != ADMIN_TELEGRAM_ID:
+        return
+    await _render(message)
+
+
+@cbx.exact("jobs:list")
+async def jobs_list(cb: CallbackQuery):
+    if cb.from_user.id != ADMIN_TELEGRAM_ID:
+        return
+    await _render(cb)
+    await cb.answer()
+
+
+@cbx.prefix("jobs:cancel:")
+async def jobs_cancel(cb: CallbackQuery):
+    if cb.from_user.id != ADMIN_TELEGRAM_ID:
+        return
+    raw = cb.data.split(":")[-1]
+    ok = raw.lstrip("-").isdigit() and jobs.cancel(int(raw))
+    # отменить можно только задачу этого воркера (таска живёт в его процессе)
+    await cb.answer("Отмена отправлена." if ok else "Задача уже завершена или выполняется другим воркером.")
+    await _render(cb)
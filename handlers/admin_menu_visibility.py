@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 
 from database.db import get_session
@@ -12,8 +12,10 @@ from database.menu_visibility import (
     get_visibility_map_for_role,
     toggle_menu_visibility,
 )
+from handlers.callback_index import callback_index
 
 router = Router()
+cbx = callback_index(router)
 # Короткие описания пунктов меню (единая точка правды)
 DESCRIPTIONS = {
     MenuItem.stocks:        "Показать текущие остатки по складам и товарам.",
@@ -46,7 +48,7 @@ def _kb_visibility(role: UserRole, vis_map: dict[MenuItem, bool]) -> InlineKeybo
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
-@router.callback_query(F.data == "menuvis:roles")
+@cbx.exact("menuvis:roles")
 async def menuvis_roles(cb: CallbackQuery):
     """Экран выбора роли для настройки видимости."""
     kb = InlineKeyboardMarkup(inline_keyboard=[
@@ -59,7 +61,7 @@ async def menuvis_roles(cb: CallbackQuery):
     await cb.answer()
 
 
-@router.callback_query(F.data.startswith("menuvis:open:"))
+@cbx.prefix("menuvis:open:")
 async def open_menu_visibility(cb: CallbackQuery):
     """Открыть экран видимости роли. Формат: menuvis:open:<ROLE>"""
     role = UserRole[cb.data.split(":")[2]]
@@ -76,7 +78,7 @@ async def open_menu_visibility(cb: CallbackQuery):
     await cb.answer()
 
 
-@router.callback_query(F.data.startswith("menuvis:"))
+@cbx.prefix("menuvis:")
 async def toggle_visibility(cb: CallbackQuery):
     """
     Переключить флаг. Формат: menuvis:<ROLE>:<ITEM>:<NEWVAL>
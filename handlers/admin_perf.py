@@ -0,0 +1,107 @@
+# handlers/admin_perf.py
+# /slow — медленные SQL-запросы (database/slow_queries.py): худшие группы и план выбранного запроса.
+from __future__ import annotations
+
+import html
+from typing import Union
+
+from aiogram import Router
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command
+from aiogram.types import CallbackQuery, Message, InlineKeyboardMarkup, InlineKeyboardButton
+
+from config import ADMIN_TELEGRAM_ID, SLOW_QUERY_EXPLAIN, SLOW_QUERY_MS
+from database import slow_queries
+from handlers.callback_index import callback_index
+
+router = Router()
+cbx = callback_index(router)
+
+TOP_LIMIT = 10
+MAX_TEXT = 3900  # лимит сообщения Telegram 4096 с запасом на разметку
+
+
+def _cut(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def _short(statement: str, limit: int = 90) -> str:
+    return _cut(" ".join(statement.split()), limit)
+
+
+async def _render_top(target: Union[CallbackQuery, Message]) -> None:
+    try:
+        items = await slow_queries.top_offenders(TOP_LIMIT)
+    except Exception as e:
+        items, error = [], f"Журнал недоступен: {html.escape(repr(e))}"
+    else:
+        error = ""
+    mode = f"порог {SLOW_QUERY_MS} мс" if SLOW_QUERY_MS > 0 else "запись выключена (SLOW_QUERY_MS=0)"
+    lines = [f"<b>Медленные запросы</b> · {mode}{' · EXPLAIN' if SLOW_QUERY_EXPLAIN else ''}\n"]
+    for i, o in enumerate(items, 1):
+        lines.append(
+            f"{i}. <b>{o.total_ms / 1000:.1f}s</b> всего · {o.calls}× · max {o.max_ms:.0f} / avg {o.avg_ms:.0f} мс\n"
+            f"    <i>{html.escape(o.handlers[:60])}</i>\n"
+            f"    <code>{html.escape(_short(o.statement))}</code>"
+        )
+    body = "\n".join(lines) if items else lines[0] + (error or "Медленных запросов не было.")
+
+    rows = [[InlineKeyboardButton(text=f"🔍 #{i} план / текст", callback_data=f"perf:q:{o.last_id}")]
+            for i, o in enumerate(items, 1)]
+    rows.append([InlineKeyboardButton(text="🔄 Обновить", callback_data="perf:slow")])
+    rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="admin")])
+    await _show(target, body[:MAX_TEXT], InlineKeyboardMarkup(inline_keyboard=rows))
+
+
+async def _show(target: Union[CallbackQuery, Message], text: str, kb: InlineKeyboardMarkup) -> None:
+    if isinstance(target, CallbackQuery):
+        try:
+            await target.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
+        except TelegramBadRequest:
+            pass
+    else:
+        await target.answer(text, reply_markup=kb, parse_mode="HTML")
+
+
+@router.message(Command("slow"))
+async def slow_cmd(message: Message):
+    if message.from_user.id != ADMIN_TELEGRAM_ID:
+        return
+    await _render_top(message)
+
+
+@cbx.exact("perf:slow")
+async def slow_list(cb: CallbackQuery):
+    if cb.from_user.id != ADMIN_TELEGRAM_ID:
+        return
+    await _render_top(cb)
+    await cb.answer()
+
+
+@cbx.prefix("perf:q:")
+async def slow_detail(cb: CallbackQuery):
+    if cb.from_user.id != ADMIN_TELEGRAM_ID:
+        return
+    raw = cb.data.split(":")[-1]
+    row = await slow_queries.get(int(raw)) if raw.isdigit() else None
+    if row is None:
+        await cb.answer("Запись уже вытеснена из журнала.", show_alert=True)
+        return
+    head = (
+        f"<b>{row.duration_ms:.0f} мс</b> · {html.escape(row.handler or 'фон')} · "
+        f"{row.created_at:%m-%d %H:%M}\n"
+        f"Параметры: <code>{html.escape(row.params_shape or '—')}</code>\n\n"
+    )
+    sql = f"<pre>{html.escape(_cut(row.statement, 1500))}</pre>\n"
+    if row.plan:
+        # план важнее хвоста SQL: режем его до влезающего размера, теги остаются закрытыми
+        room = MAX_TEXT - len(head) - len(sql) - 30
+        plan = row.plan
+        while len(html.escape(plan)) > room and len(plan) > 200:
+            plan = _cut(plan, len(plan) * 3 // 4)
+        plan = f"<b>План</b>\n<pre>{html.escape(plan)}</pre>"
+    else:
+        plan = "<i>План не снят (SLOW_QUERY_EXPLAIN=0 или не SELECT).</i>"
+    kb = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="⬅️ К списку", callback_data="perf:slow")]])
+    await _show(cb, head + sql + plan, kb)
+    await cb.answer()
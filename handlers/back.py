@@ -3,10 +3,12 @@ from aiogram import Router, F
 from aiogram.filters import StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, Message, ReplyKeyboardRemove
+from handlers.callback_index import callback_index
 
 router = Router()
+cbx = callback_index(router)
 
-@router.callback_query(StateFilter("*"), F.data == "back_to_menu")
+@cbx.exact("back_to_menu", StateFilter("*"))
 async def back_to_menu_cb(cb: CallbackQuery, state: FSMContext):
     await state.clear()
     try:
@@ -0,0 +1,165 @@
+# handlers/callback_index.py
+# Маршрутизация callback_query через словарь вместо цепочки фильтров.
+#
+# Раньше каждый хендлер регистрировался со своим `lambda c: c.data == "…"` /
+# `F.data.startswith("…")`, и aiogram проверял их по очереди, пока не сработает
+# (общие хендлеры — в самом конце). Теперь на роутер вешается ОДИН хендлер-диспетчер:
+#   • callback_data разбирается один раз: "ns:action:arg1:arg2" → CallbackKey(ns, action, args);
+#   • точные маршруты — dict[data], префиксные — dict[ns] (префикс сверяется только внутри своего ns);
+#   • типизированные маршруты (keyboards.callbacks) — dict[класс] по уже декодированному объекту;
+#   • маршруты без data (только состояние FSM, напр. "confirming") проверяются всегда;
+#   • из кандидатов берётся первый по порядку регистрации, чьи остальные фильтры (State и т.п.) прошли —
+#     т.е. семантика прежней линейной цепочки сохраняется; ничего не подошло — апдейт идёт дальше
+#     по роутерам, как раньше.
+#
+#   cbx = callback_index(router)           # один индекс на роутер/диспетчер
+#   @cbx.exact("bk:run")
+#   @cbx.prefix("sup:wh:", SupFSM.WH)
+#   @cbx.data(CnPhotos)                    # хендлер получает callback_data: CnPhotos
+#   cbx.register_exact(on_admin, "admin")  # для register_*-функций
+#
+# Разбор — один раз на апдейт в CallbackDataMiddleware (outer middleware диспетчера):
+# хендлер может принять `callback_key: CallbackKey` и `callback_data` (объект или None).
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Type, Union
+
+from aiogram import BaseMiddleware, Router
+from aiogram.dispatcher.event.handler import FilterObject, HandlerObject
+from aiogram.types import CallbackQuery
+
+from keyboards.callbacks import PackedCallback, unpack
+
+Keys = Union[str, Iterable[str]]
+Types = Union[Type[PackedCallback], Iterable[Type[PackedCallback]]]
+
+
+class CallbackKey(NamedTuple):
+    namespace: str
+    action: str
+    args: Tuple[str, ...]
+
+
+def parse_callback(data: str) -> CallbackKey:
+    parts = data.split(":")
+    return CallbackKey(parts[0], parts[1] if len(parts) > 1 else "", tuple(parts[2:]))
+
+
+@dataclass
+class _Route:
+    seq: int
+    handler: HandlerObject
+    prefix: str = ""
+
+
+def _as_keys(keys: Keys) -> Tuple[str, ...]:
+    return (keys,) if isinstance(keys, str) else tuple(keys)
+
+
+class CallbackIndex:
+    def __init__(self):
+        self._exact: Dict[str, List[_Route]] = {}
+        self._prefix: Dict[str, List[_Route]] = {}   # ns → префиксные маршруты этого ns
+        self._loose: List[_Route] = []               # префикс без ":" (ns неизвестен) — сверяем всегда
+        self._typed: Dict[type, List[_Route]] = {}   # класс callback_data → маршруты
+        self._any: List[_Route] = []                 # без data: только фильтры (состояние FSM)
+        self._seq = 0
+
+    # ---- Регистрация ----
+    def _route(self, callback: Callable, filters: tuple, prefix: str = "") -> _Route:
+        self._seq += 1
+        handler = HandlerObject(callback=callback, filters=[FilterObject(f) for f in filters])
+        return _Route(self._seq, handler, prefix)
+
+    def register_exact(self, callback: Callable, data: Keys, *filters: Any) -> Callable:
+        route = self._route(callback, filters)
+        for key in _as_keys(data):
+            self._exact.setdefault(key, []).append(route)
+        return callback
+
+    def register_prefix(self, callback: Callable, prefix: Keys, *filters: Any) -> Callable:
+        for p in _as_keys(prefix):
+            route = self._route(callback, filters, p)
+            if ":" in p:
+                self._prefix.setdefault(p.split(":", 1)[0], []).append(route)
+            else:
+                self._loose.append(route)
+        return callback
+
+    def register_data(self, callback: Callable, types: Types, *filters: Any) -> Callable:
+        route = self._route(callback, filters)
+        for cls in ((types,) if isinstance(types, type) else tuple(types)):
+            self._typed.setdefault(cls, []).append(route)
+        return callback
+
+    def register_any(self, callback: Callable, *filters: Any) -> Callable:
+        self._any.append(self._route(callback, filters))
+        return callback
+
+    def exact(self, data: Keys, *filters: Any) -> Callable[[Callable], Callable]:
+        return lambda callback: self.register_exact(callback, data, *filters)
+
+    def prefix(self, prefix: Keys, *filters: Any) -> Callable[[Callable], Callable]:
+        return lambda callback: self.register_prefix(callback, prefix, *filters)
+
+    def data(self, types: Types, *filters: Any) -> Callable[[Callable], Callable]:
+        return lambda callback: self.register_data(callback, types, *filters)
+
+    # ---- Поиск ----
+    def candidates(self, data: str, key: CallbackKey, obj: Optional[PackedCallback] = None) -> List[_Route]:
+        """Маршруты, подходящие по data, в порядке регистрации (без проверки остальных фильтров)."""
+        found = list(self._exact.get(data, ()))
+        if obj is not None:
+            found.extend(self._typed.get(type(obj), ()))
+        found.extend(r for r in self._prefix.get(key.namespace, ()) if data.startswith(r.prefix))
+        if self._loose:
+            found.extend(r for r in self._loose if data.startswith(r.prefix))
+        if self._any:
+            found.extend(self._any)
+        if len(found) > 1:
+            found.sort(key=lambda r: r.seq)
+        return found
+
+    async def _select(self, cb: CallbackQuery, **kwargs: Any) -> Union[bool, Dict[str, Any]]:
+        data = cb.data
+        if data is None:
+            return False
+        key = kwargs.get("callback_key") or parse_callback(data)
+        obj = kwargs["callback_data"] if "callback_data" in kwargs else unpack(data)
+        for route in self.candidates(data, key, obj):
+            ok, extra = await route.handler.check(cb, **kwargs)
+            if ok:
+                return {**extra, "callback_route": route.handler, "callback_key": key, "callback_data": obj}
+        return False
+
+    async def _dispatch(self, cb: CallbackQuery, callback_route: HandlerObject, **kwargs: Any) -> Any:
+        return await callback_route.call(cb, **kwargs)
+
+    def attach(self, router: Router) -> "CallbackIndex":
+        router.callback_query.register(self._dispatch, self._select)
+        return self
+
+
+def callback_index(router: Router) -> CallbackIndex:
+    """Индекс роутера (или диспетчера); создаётся и подключается при первом обращении."""
+    index: Optional[CallbackIndex] = getattr(router, "callback_index", None)
+    if index is None:
+        index = CallbackIndex().attach(router)
+        router.callback_index = index
+    return index
+
+
+class CallbackDataMiddleware(BaseMiddleware):
+    """Outer middleware: callback_data разбирается один раз — ключ и типизированный объект в data апдейта."""
+
+    async def __call__(
+            self,
+            handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+            event: CallbackQuery,
+            data: Dict[str, Any],
+    ) -> Any:
+        if event.data is not None:
+            data["callback_key"] = parse_callback(event.data)
+            data["callback_data"] = unpack(event.data)
+        return await handler(event, data)
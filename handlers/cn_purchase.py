@@ -1,9 +1,8 @@
 # handlers/cn_purchase.py
 from __future__ import annotations
-import re
 from datetime import datetime
 from decimal import Decimal, InvalidOperation
-from typing import Optional, Tuple, List
+from typing import Optional, List
 
 from aiogram import Router, F
 from aiogram.exceptions import TelegramBadRequest
@@ -14,9 +13,12 @@ from aiogram.types import (
     InlineKeyboardMarkup, InlineKeyboardButton,
     InputMediaPhoto,
 )
-from sqlalchemy import select, or_, func
+from sqlalchemy import select, func, tuple_
+from sqlalchemy.orm import noload
 
 from database.db import get_session
+from database.product_search import search_products
+from database.product_catalog import catalog as product_catalog
 from database.models import (
     CnPurchase, CnPurchaseItem, CnPurchaseStatus,
     MskInboundDoc, MskInboundItem,
@@ -29,8 +31,14 @@ try:
     HAS_PHOTO_MODEL = True
 except Exception:
     HAS_PHOTO_MODEL = False
+from handlers.callback_index import callback_index
+from keyboards.callbacks import (
+    CnCommentEdit, CnItemAdd, CnList, CnOpen, CnPhotoAdd, CnPhotoDone, CnPhotoMore, CnPhotos,
+    CnProdChoose, CnProdList, CnProdSearch, CnStatus, MskOpenByCn,
+)
 
 router = Router()
+cbx = callback_index(router)
 PAGE_SIZE = 8
 PHOTO_PAGE = 8  # по сколько фото показывать за раз
 
@@ -60,24 +68,6 @@ def fmt_dt(dt: datetime | None) -> str:
         return "—"
     return dt.strftime("%d.%m.%Y %H:%M")
 
-_re_int = re.compile(r"(\d+)")
-
-def last_int(data: str) -> Optional[int]:
-    if not data:
-        return None
-    m = _re_int.findall(data)
-    return int(m[-1]) if m else None
-
-def last_two_ints(data: str) -> Tuple[Optional[int], Optional[int]]:
-    if not data:
-        return None, None
-    m = _re_int.findall(data)
-    if not m:
-        return None, None
-    if len(m) == 1:
-        return None, int(m[0])
-    return int(m[-2]), int(m[-1])
-
 # -------- FSM ----------
 class CnCreateState(StatesGroup):
     picking_product = State()   # список товаров
@@ -89,34 +79,48 @@ class CnCreateState(StatesGroup):
     uploading_photos = State()  # 📷 загрузка фото к документу
 
 # -------- Keyboards ----------
-def cn_root_kb() -> InlineKeyboardMarkup:
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="➕ Создать документ",      callback_data="cn:new")],
-        [InlineKeyboardButton(text="📦 Доставляется в карго", callback_data="cn:list:cargo")],
-        [InlineKeyboardButton(text="🚚 Доставляется в РФ",    callback_data="cn:list:ru")],
-        [InlineKeyboardButton(text="🗄️ Архив",                callback_data="cn:list:archive")],
-        [InlineKeyboardButton(text="⬅️ Назад",                 callback_data="back_to_menu")],
-    ])
+# вкладки списков: mode -> (статус, заголовок)
+CN_LIST_MODES: dict[str, tuple[CnPurchaseStatus, str]] = {
+    "cargo":   (CnPurchaseStatus.SENT_TO_CARGO,    "📦 Доставляется в карго"),
+    "ru":      (CnPurchaseStatus.SENT_TO_MSK,      "🚚 Доставляется в РФ"),
+    "archive": (CnPurchaseStatus.DELIVERED_TO_MSK, "🗄️ Архив"),
+}
+
+def cn_root_kb(counts: dict[CnPurchaseStatus, int] | None = None) -> InlineKeyboardMarkup:
+    rows = [[InlineKeyboardButton(text="➕ Создать документ", callback_data="cn:new")]]
+    for mode, (status, title) in CN_LIST_MODES.items():
+        label = title if counts is None else f"{title} ({counts.get(status, 0)})"
+        rows.append([InlineKeyboardButton(text=label, callback_data=CnList(mode).pack())])
+    rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_menu")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+async def fetch_status_counts() -> dict[CnPurchaseStatus, int]:
+    """Счётчики по статусам одним GROUP BY (index-only по ix_cn_purchases_status_created)."""
+    async with get_session() as s:
+        res = await s.execute(
+            select(CnPurchase.status, func.count()).group_by(CnPurchase.status)
+        )
+        return {status: int(cnt) for status, cnt in res.all()}
 
 def cn_doc_actions_kb(doc_id: int, status: CnPurchaseStatus, photos_cnt: int | None = None) -> InlineKeyboardMarkup:
     rows: List[List[InlineKeyboardButton]] = []
 
     # Фото — просмотр всегда; добавление — пока не архив
     label = "🖼 Фото" if photos_cnt is None else f"🖼 Фото ({photos_cnt})"
-    rows.append([InlineKeyboardButton(text=label, callback_data=f"cn:photos:{doc_id}:1")])
+    rows.append([InlineKeyboardButton(text=label, callback_data=CnPhotos(doc_id, 1).pack())])
     if status != CnPurchaseStatus.DELIVERED_TO_MSK:
-        rows.append([InlineKeyboardButton(text="📷 Добавить фото", callback_data=f"cn:photo:add:{doc_id}")])
+        rows.append([InlineKeyboardButton(text="📷 Добавить фото", callback_data=CnPhotoAdd(doc_id).pack())])
 
     if status == CnPurchaseStatus.SENT_TO_CARGO:
         rows.append([InlineKeyboardButton(
             text="➡️ Перевести: Доставка склад МСК",
-            callback_data=f"cn:status:{doc_id}:to_msk"
+            callback_data=CnStatus(doc_id, "to_msk").pack()
         )])
-        rows.append([InlineKeyboardButton(text="➕ Добавить позицию", callback_data=f"cn:item:add:{doc_id}")])
-        rows.append([InlineKeyboardButton(text="✏️ Комментарий", callback_data=f"cn:comment:edit:{doc_id}")])
+        rows.append([InlineKeyboardButton(text="➕ Добавить позицию", callback_data=CnItemAdd(doc_id).pack())])
+        rows.append([InlineKeyboardButton(text="✏️ Комментарий", callback_data=CnCommentEdit(doc_id).pack())])
     elif status == CnPurchaseStatus.SENT_TO_MSK:
-        rows.append([InlineKeyboardButton(text="🏢 Открыть в «Склад МСК»", callback_data=f"msk:open:by_cn:{doc_id}")])
-        rows.append([InlineKeyboardButton(text="✏️ Комментарий", callback_data=f"cn:comment:edit:{doc_id}")])
+        rows.append([InlineKeyboardButton(text="🏢 Открыть в «Склад МСК»", callback_data=MskOpenByCn(doc_id).pack())])
+        rows.append([InlineKeyboardButton(text="✏️ Комментарий", callback_data=CnCommentEdit(doc_id).pack())])
 
     rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="cn:root")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
@@ -129,35 +133,28 @@ def cn_lists_kb() -> InlineKeyboardMarkup:
 # -------- Products picker ----------
 async def fetch_products(search: Optional[str], page: int) -> tuple[list[Product], int]:
     async with get_session() as s:
-        q = select(Product).where(Product.is_active.is_(True))
-        if search:
-            like = f"%{search.strip()}%"
-            q = q.where(or_(Product.name.ilike(like), Product.article.ilike(like)))
-        total = (await s.execute(select(func.count()).select_from(q.subquery()))).scalar_one()
-        q = q.order_by(Product.name.asc()).offset(page * PAGE_SIZE).limit(PAGE_SIZE)
-        rows = (await s.execute(q)).scalars().all()
-    return rows, int(total)
+        return await search_products(s, search, offset=page * PAGE_SIZE, limit=PAGE_SIZE)
 
 def product_picker_kb(doc_id: int, page: int, total: int, rows: list[Product], search: Optional[str]) -> InlineKeyboardMarkup:
     buttons: list[list[InlineKeyboardButton]] = []
     for p in rows:
         cap = f"{p.name} · {p.article}"
-        buttons.append([InlineKeyboardButton(text=cap, callback_data=f"cn:prod:choose:{doc_id}:{p.id}")])
+        buttons.append([InlineKeyboardButton(text=cap, callback_data=CnProdChoose(doc_id, p.id).pack())])
 
     max_page = max((total - 1) // PAGE_SIZE, 0)
     nav: list[InlineKeyboardButton] = []
     if page > 0:
-        nav.append(InlineKeyboardButton(text="⬅️", callback_data=f"cn:prod:list:{doc_id}:{page-1}"))
+        nav.append(InlineKeyboardButton(text="⬅️", callback_data=CnProdList(doc_id, page - 1).pack()))
     if page < max_page:
-        nav.append(InlineKeyboardButton(text="➡️", callback_data=f"cn:prod:list:{doc_id}:{page+1}"))
+        nav.append(InlineKeyboardButton(text="➡️", callback_data=CnProdList(doc_id, page + 1).pack()))
     if nav:
         buttons.append(nav)
 
     buttons.append([InlineKeyboardButton(
         text=("🔎 Изменить поиск" if search else "🔎 Поиск"),
-        callback_data=f"cn:prod:search:{doc_id}:{page}"
+        callback_data=CnProdSearch(doc_id, page).pack()
     )])
-    buttons.append([InlineKeyboardButton(text="⬅️ Назад к документу", callback_data=f"cn:open:{doc_id}")])
+    buttons.append([InlineKeyboardButton(text="⬅️ Назад к документу", callback_data=CnOpen(doc_id).pack())])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 async def show_product_picker(msg: Message, doc_id: int, state: FSMContext, page: int = 0):
@@ -173,30 +170,69 @@ async def show_product_picker(msg: Message, doc_id: int, state: FSMContext, page
 @router.message(F.text == "Закупка CN")
 async def cn_entry(msg: Message):
     await msg.answer("Раздел «Закупка CN».", reply_markup=None)
-    await msg.answer("Выберите:", reply_markup=cn_root_kb())
+    await msg.answer("Выберите:", reply_markup=cn_root_kb(await fetch_status_counts()))
 
-@router.callback_query(F.data == "cn:root")
+@cbx.exact("cn:root")
 async def cn_root(cb: CallbackQuery):
     await safe_edit_text(cb.message, "Раздел «Закупка CN».")
-    await safe_edit_reply_markup(cb.message, cn_root_kb())
+    await safe_edit_reply_markup(cb.message, cn_root_kb(await fetch_status_counts()))
     await cb.answer()
 
 # -------- Lists as buttons --------
-@router.callback_query(F.data.startswith("cn:list:"))
-async def cn_list(cb: CallbackQuery):
-    mode = cb.data.split(":")[-1]  # cargo | ru | archive
+async def fetch_cn_page(
+        status: CnPurchaseStatus,
+        direction: str = "next",
+        cursor_id: Optional[int] = None,
+) -> tuple[list, bool, bool]:
+    """
+    Страница списка по статусу: keyset по (created_at, id) desc.
+    Курсор — id крайней строки, его created_at берём подзапросом по PK.
+    Возвращает (rows, has_newer, has_older); rows — только id/code/status, без photos/items.
+    """
+    order_key = tuple_(CnPurchase.created_at, CnPurchase.id)
+    base = select(CnPurchase.id, CnPurchase.code, CnPurchase.status).where(CnPurchase.status == status)
+
+    def _key_of(pk):
+        return (
+            select(CnPurchase.created_at).where(CnPurchase.id == pk).scalar_subquery(),
+            pk,
+        )
+
     async with get_session() as s:
-        rows = (await s.execute(select(CnPurchase).order_by(CnPurchase.created_at.desc()))).scalars().all()
-
-    if mode == "cargo":
-        rows = [r for r in rows if r.status == CnPurchaseStatus.SENT_TO_CARGO]
-        title = "📦 Доставляется в карго"
-    elif mode == "ru":
-        rows = [r for r in rows if r.status == CnPurchaseStatus.SENT_TO_MSK]
-        title = "🚚 Доставляется в РФ"
-    else:
-        rows = [r for r in rows if r.status == CnPurchaseStatus.DELIVERED_TO_MSK]
-        title = "🗄️ Архив"
+        if direction == "prev" and cursor_id is not None:
+            q = base.where(order_key > tuple_(*_key_of(cursor_id))) \
+                .order_by(CnPurchase.created_at.asc(), CnPurchase.id.asc())
+        else:
+            q = base
+            if cursor_id is not None:
+                q = q.where(order_key < tuple_(*_key_of(cursor_id)))
+            q = q.order_by(CnPurchase.created_at.desc(), CnPurchase.id.desc())
+        rows = list((await s.execute(q.limit(PAGE_SIZE + 1))).all())
+
+        more = len(rows) > PAGE_SIZE
+        rows = rows[:PAGE_SIZE]
+        if direction == "prev" and cursor_id is not None:
+            rows.reverse()
+            return rows, more, True
+
+        has_newer = False
+        if rows and cursor_id is not None:
+            has_newer = (await s.execute(
+                base.with_only_columns(CnPurchase.id)
+                .where(order_key > tuple_(*_key_of(rows[0].id)))
+                .limit(1)
+            )).first() is not None
+    return rows, has_newer, more
+
+@cbx.data(CnList)
+async def cn_list(cb: CallbackQuery, callback_data: CnList):
+    mode = callback_data.mode if callback_data.mode in CN_LIST_MODES else "archive"
+    status, title = CN_LIST_MODES[mode]
+    direction, cursor_id = "next", None
+    if callback_data.cursor is not None:
+        direction, cursor_id = callback_data.direction or "next", callback_data.cursor
+
+    rows, has_newer, has_older = await fetch_cn_page(status, direction, cursor_id)
 
     if not rows:
         await safe_edit_text(cb.message, f"{title}\n\nСписок пуст.")
@@ -208,8 +244,15 @@ async def cn_list(cb: CallbackQuery):
     for r in rows:
         kb_rows.append([InlineKeyboardButton(
             text=f"📄 {r.code} — {r.status.value}",
-            callback_data=f"cn:open:{r.id}"
+            callback_data=CnOpen(r.id).pack()
         )])
+    nav: list[InlineKeyboardButton] = []
+    if has_newer:
+        nav.append(InlineKeyboardButton(text="⬅️", callback_data=CnList(mode, "prev", rows[0].id).pack()))
+    if has_older:
+        nav.append(InlineKeyboardButton(text="➡️", callback_data=CnList(mode, "next", rows[-1].id).pack()))
+    if nav:
+        kb_rows.append(nav)
     kb_rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="cn:root")])
 
     await safe_edit_text(cb.message, title)
@@ -217,7 +260,7 @@ async def cn_list(cb: CallbackQuery):
     await cb.answer()
 
 # -------- Create: initial status = SENT_TO_CARGO -> picker --------
-@router.callback_query(F.data == "cn:new")
+@cbx.exact("cn:new")
 async def cn_new(cb: CallbackQuery, state: FSMContext):
     code = "CN-" + datetime.utcnow().strftime("%Y%m%d-%H%M%S")
     async with get_session() as s:
@@ -240,26 +283,19 @@ async def cn_new(cb: CallbackQuery, state: FSMContext):
     await cb.answer()
 
 # -------- Picker / search / choose --------
-@router.callback_query(F.data.startswith("cn:item:add:"))
-async def cn_item_add_from_card(cb: CallbackQuery, state: FSMContext):
-    doc_id = last_int(cb.data)
-    if not doc_id:
-        await cb.answer("Не удалось определить документ.", show_alert=True)
-        return
+@cbx.data(CnItemAdd)
+async def cn_item_add_from_card(cb: CallbackQuery, state: FSMContext, callback_data: CnItemAdd):
+    doc_id = callback_data.doc_id
     await state.update_data(cn_doc_id=doc_id, selected_product_id=None, qty=None, cost=None)
     await show_product_picker(cb.message, doc_id, state, page=0)
     await cb.answer()
 
-@router.callback_query(F.data.startswith("cn:prod:list:"))
-async def cn_prod_list(cb: CallbackQuery, state: FSMContext):
-    doc_id, page = last_two_ints(cb.data)
-    if doc_id is None or page is None:
-        await cb.answer("Неверные параметры пагинации.", show_alert=True)
-        return
-    await show_product_picker(cb.message, doc_id, state, page=page)
+@cbx.data(CnProdList)
+async def cn_prod_list(cb: CallbackQuery, state: FSMContext, callback_data: CnProdList):
+    await show_product_picker(cb.message, callback_data.doc_id, state, page=callback_data.page)
     await cb.answer()
 
-@router.callback_query(F.data.startswith("cn:prod:search:"))
+@cbx.data(CnProdSearch)
 async def cn_prod_search(cb: CallbackQuery, state: FSMContext):
     await state.set_state(CnCreateState.entering_search)
     await safe_edit_text(cb.message, "Введите строку поиска (имя или артикул). Отправьте '-' чтобы очистить фильтр.")
@@ -277,13 +313,9 @@ async def cn_receive_search_text(msg: Message, state: FSMContext):
     await show_product_picker(out, doc_id, state, page=0)
 
 # -------- Choose -> qty -> cost -> confirm --------
-@router.callback_query(F.data.startswith("cn:prod:choose:"))
-async def cn_prod_choose(cb: CallbackQuery, state: FSMContext):
-    doc_id, product_id = last_two_ints(cb.data)
-    if doc_id is None or product_id is None:
-        await cb.answer("Не удалось определить товар/документ.", show_alert=True)
-        return
-    await state.update_data(cn_doc_id=doc_id, selected_product_id=product_id)
+@cbx.data(CnProdChoose)
+async def cn_prod_choose(cb: CallbackQuery, state: FSMContext, callback_data: CnProdChoose):
+    await state.update_data(cn_doc_id=callback_data.doc_id, selected_product_id=callback_data.product_id)
     await safe_edit_text(cb.message, "Введите количество единиц (шт.).")
     await safe_edit_reply_markup(cb.message, None)
     await state.set_state(CnCreateState.waiting_qty)
@@ -331,7 +363,7 @@ async def cn_item_cost(msg: Message, state: FSMContext):
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🧾 Создать документ", callback_data="cn:item:commit:finish")],
         [InlineKeyboardButton(text="➕ Добавить товар",   callback_data="cn:item:commit:add_more")],
-        [InlineKeyboardButton(text="⬅️ Назад",            callback_data=f"cn:prod:list:{data['cn_doc_id']}:0")],
+        [InlineKeyboardButton(text="⬅️ Назад",            callback_data=CnProdList(data["cn_doc_id"], 0).pack())],
     ])
     out = await msg.answer(text, reply_markup=kb)
     await state.update_data(confirm_msg_id=out.message_id)
@@ -358,7 +390,7 @@ async def _commit_item(state: FSMContext):
             ))
         await s.commit()
 
-@router.callback_query(F.data == "cn:item:commit:add_more")
+@cbx.exact("cn:item:commit:add_more")
 async def cn_commit_add_more(cb: CallbackQuery, state: FSMContext):
     await _commit_item(state)
     await state.update_data(selected_product_id=None, qty=None, cost=None)
@@ -366,7 +398,7 @@ async def cn_commit_add_more(cb: CallbackQuery, state: FSMContext):
     await show_product_picker(cb.message, (await state.get_data())["cn_doc_id"], state, page=0)
     await cb.answer("Добавлено.")
 
-@router.callback_query(F.data == "cn:item:commit:finish")
+@cbx.exact("cn:item:commit:finish")
 async def cn_commit_finish(cb: CallbackQuery, state: FSMContext):
     await _commit_item(state)
     data = await state.get_data()
@@ -381,13 +413,10 @@ async def cn_commit_finish(cb: CallbackQuery, state: FSMContext):
 # -------- View / comment / status --------
 async def _fetch_cn_view(doc_id: int):
     async with get_session() as s:
-        doc = await s.get(CnPurchase, doc_id)
+        # фото считаем отдельным COUNT — selectin-подгрузка photos здесь не нужна
+        doc = await s.get(CnPurchase, doc_id, options=[noload(CnPurchase.photos)])
         items = (await s.execute(select(CnPurchaseItem).where(CnPurchaseItem.cn_purchase_id == doc_id))).scalars().all()
-        pmap = {}
-        if items:
-            pids = [it.product_id for it in items]
-            prows = (await s.execute(select(Product).where(Product.id.in_(pids)))).scalars().all()
-            pmap = {p.id: p for p in prows}
+        pmap = await product_catalog.get_products([it.product_id for it in items], s) if items else {}
         photos_cnt = 0
         if HAS_PHOTO_MODEL:
             photos_cnt = (await s.execute(
@@ -441,17 +470,12 @@ async def render_doc(msg: Message, doc_id: int):
     await safe_edit_text(msg, "\n".join(lines))
     await safe_edit_reply_markup(msg, cn_doc_actions_kb(doc_id, doc.status, photos_cnt))
 
-@router.callback_query(F.data.startswith("cn:open"))
-async def cn_open(cb: CallbackQuery):
+@cbx.data(CnOpen)
+async def cn_open(cb: CallbackQuery, callback_data: CnOpen):
     """
-    Универсальный open:
-    - ловит и 'cn:open:123', и случайные вариации 'cn:open'
-    - если нажато под медиа — удаляет медиа и присылает карточку
+    Универсальный open: если нажато под медиа — удаляет медиа и присылает карточку.
     """
-    doc_id = last_int(cb.data)
-    if not doc_id:
-        await cb.answer("Не удалось определить документ (нет ID).", show_alert=True)
-        return
+    doc_id = callback_data.doc_id
 
     # если кнопка под медиа — удаляем сообщение с медиа
     if getattr(cb.message, "photo", None) or getattr(cb.message, "video", None) \
@@ -467,12 +491,9 @@ async def cn_open(cb: CallbackQuery):
 
     await cb.answer()
 
-@router.callback_query(F.data.startswith("cn:comment:edit:"))
-async def cn_comment_edit(cb: CallbackQuery, state: FSMContext):
-    doc_id = last_int(cb.data)
-    if not doc_id:
-        await cb.answer("Не удалось определить документ.", show_alert=True)
-        return
+@cbx.data(CnCommentEdit)
+async def cn_comment_edit(cb: CallbackQuery, state: FSMContext, callback_data: CnCommentEdit):
+    doc_id = callback_data.doc_id
     async with get_session() as s:
         doc = await s.get(CnPurchase, doc_id)
         if doc.status == CnPurchaseStatus.DELIVERED_TO_MSK:
@@ -496,15 +517,12 @@ async def cn_comment_edit_save(msg: Message, state: FSMContext):
     out = await msg.answer("Комментарий обновлён. Открываю документ…")
     await render_doc(out, doc_id)
 
-@router.callback_query(F.data.startswith("cn:status:"))
-async def cn_set_status(cb: CallbackQuery):
-    if not cb.data.endswith(":to_msk"):
+@cbx.data(CnStatus)
+async def cn_set_status(cb: CallbackQuery, callback_data: CnStatus):
+    if callback_data.target != "to_msk":
         await cb.answer("Недоступный переход", show_alert=True)
         return
-    doc_id = last_int(cb.data)
-    if not doc_id:
-        await cb.answer("Не удалось определить документ.", show_alert=True)
-        return
+    doc_id = callback_data.doc_id
 
     async with get_session() as s:
         doc = await s.get(CnPurchase, doc_id)
@@ -542,20 +560,17 @@ async def cn_set_status(cb: CallbackQuery):
     await render_doc(cb.message, doc_id)
 
 # -------- Фото: добавление/просмотр --------
-@router.callback_query(F.data.startswith("cn:photo:add:"))
-async def cn_photo_add_entry(cb: CallbackQuery, state: FSMContext):
+@cbx.data(CnPhotoAdd)
+async def cn_photo_add_entry(cb: CallbackQuery, state: FSMContext, callback_data: CnPhotoAdd):
     if not HAS_PHOTO_MODEL:
         await cb.answer("Модуль фото не активирован (нужна миграция).", show_alert=True)
         return
-    doc_id = last_int(cb.data)
-    if not doc_id:
-        await cb.answer("Не удалось определить документ.", show_alert=True)
-        return
+    doc_id = callback_data.doc_id
     await state.update_data(cn_doc_id=doc_id)
     await state.set_state(CnCreateState.uploading_photos)
     await safe_edit_text(cb.message, "Загрузите 1–N фото (изображениями).")
     await safe_edit_reply_markup(cb.message, InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="⬅️ Назад к документу", callback_data=f"cn:open:{doc_id}")],
+        [InlineKeyboardButton(text="⬅️ Назад к документу", callback_data=CnOpen(doc_id).pack())],
     ]))
     await cb.answer()
 
@@ -584,19 +599,16 @@ async def cn_photo_save(msg: Message, state: FSMContext):
 
     # после сохранения отправляем НАШЕ фото с кнопками
     kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="➕ Добавить ещё фото", callback_data=f"cn:photo:more:{doc_id}")],
-        [InlineKeyboardButton(text="✅ Готово", callback_data=f"cn:photo:done:{doc_id}")],
-        [InlineKeyboardButton(text="⬅️ Назад к документу", callback_data=f"cn:open:{doc_id}")],
+        [InlineKeyboardButton(text="➕ Добавить ещё фото", callback_data=CnPhotoMore(doc_id).pack())],
+        [InlineKeyboardButton(text="✅ Готово", callback_data=CnPhotoDone(doc_id).pack())],
+        [InlineKeyboardButton(text="⬅️ Назад к документу", callback_data=CnOpen(doc_id).pack())],
     ])
     await msg.answer_photo(file_id, caption=caption or "", reply_markup=kb)
 
-@router.callback_query(F.data.startswith("cn:photo:more:"))
-async def cn_photo_more(cb: CallbackQuery, state: FSMContext):
+@cbx.data(CnPhotoMore)
+async def cn_photo_more(cb: CallbackQuery, state: FSMContext, callback_data: CnPhotoMore):
     """Удаляем превью с кнопками и остаёмся в режиме загрузки — просим прислать следующее фото."""
-    doc_id = last_int(cb.data)
-    if not doc_id:
-        await cb.answer("Документ не найден.", show_alert=True)
-        return
+    doc_id = callback_data.doc_id
 
     # удалить наше превью с кнопками
     try:
@@ -610,12 +622,9 @@ async def cn_photo_more(cb: CallbackQuery, state: FSMContext):
     await cb.message.answer("Фото сохранено. Пришлите следующее фото или нажмите «⬅️ Назад к документу».")
     await cb.answer("Ок, ждём следующее фото.")
 
-@router.callback_query(F.data.startswith("cn:photo:done:"))
-async def cn_photo_done_btn(cb: CallbackQuery, state: FSMContext):
-    doc_id = last_int(cb.data)
-    if not doc_id:
-        await cb.answer("Документ не найден.", show_alert=True)
-        return
+@cbx.data(CnPhotoDone)
+async def cn_photo_done_btn(cb: CallbackQuery, state: FSMContext, callback_data: CnPhotoDone):
+    doc_id = callback_data.doc_id
 
     await state.clear()
 
@@ -629,14 +638,13 @@ async def cn_photo_done_btn(cb: CallbackQuery, state: FSMContext):
     await render_doc(out, doc_id)
     await cb.answer("Готово.")
 
-@router.callback_query(F.data.startswith("cn:photos:"))
-async def cn_photos_view(cb: CallbackQuery):
-    # формат: cn:photos:{cn_id}:{page}
+@cbx.data(CnPhotos)
+async def cn_photos_view(cb: CallbackQuery, callback_data: CnPhotos):
     if not HAS_PHOTO_MODEL:
         await cb.answer("Модуль фото не активирован (нужна миграция).", show_alert=True)
         return
-    cn_id, page = last_two_ints(cb.data)
-    if not cn_id or not page:
+    cn_id, page = callback_data.doc_id, callback_data.page
+    if page < 1:
         await cb.answer("Параметры не распознаны.", show_alert=True)
         return
 
@@ -657,13 +665,13 @@ async def cn_photos_view(cb: CallbackQuery):
     buttons: list[list[InlineKeyboardButton]] = []
     nav_row: list[InlineKeyboardButton] = []
     if prev_page:
-        nav_row.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"cn:photos:{cn_id}:{prev_page}"))
+        nav_row.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=CnPhotos(cn_id, prev_page).pack()))
     if next_page:
-        nav_row.append(InlineKeyboardButton(text="Вперёд ➡️", callback_data=f"cn:photos:{cn_id}:{next_page}"))
+        nav_row.append(InlineKeyboardButton(text="Вперёд ➡️", callback_data=CnPhotos(cn_id, next_page).pack()))
     if nav_row:
         buttons.append(nav_row)
-    buttons.append([InlineKeyboardButton(text="⬅️ Назад к документу", callback_data=f"cn:open:{cn_id}")])
-    buttons.append([InlineKeyboardButton(text="✅ Готово", callback_data=f"cn:photo:done:{cn_id}")])
+    buttons.append([InlineKeyboardButton(text="⬅️ Назад к документу", callback_data=CnOpen(cn_id).pack())])
+    buttons.append([InlineKeyboardButton(text="✅ Готово", callback_data=CnPhotoDone(cn_id).pack())])
     kb = InlineKeyboardMarkup(inline_keyboard=buttons)
 
     # отправляем фото с inline-клавиатурой
@@ -2,9 +2,9 @@
 import contextlib
 import logging
 from types import SimpleNamespace
-from typing import Dict, Optional
+from typing import Optional
 
-from aiogram import Dispatcher, types, BaseMiddleware, Bot, Router, F
+from aiogram import Dispatcher, types, BaseMiddleware, Bot, Router
 from aiogram.filters import CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
@@ -24,11 +24,13 @@ from database.models import User, UserRole
 # ➕ добавляем функции и описания для пунктов меню
 from database.menu_visibility import get_visible_menu_items_for_role
 from database import menu_visibility as mv
+from handlers.callback_index import callback_index
+from utils.shared_state import shared_map
 
 
-# Память процесса (локально в процессе бота)
-pending_requests: Dict[int, str] = {}
-last_content_msg: Dict[int, int] = {}
+# Общее состояние процессов бота (STATE_BACKEND: memory | db | redis)
+pending_requests = shared_map("pending_requests")     # tg_id -> имя заявителя
+last_content_msg = shared_map("last_content_msg")     # tg_id -> message_id контентного сообщения
 
 
 # ---------------------------
@@ -51,7 +53,7 @@ async def send_content(
     Удаляем прошлый контент и отправляем новый текст отдельным сообщением — ниже клавиатуры.
     """
     uid = cb.from_user.id
-    mid = last_content_msg.get(uid)
+    mid = await last_content_msg.get(uid)
     if mid:
         with contextlib.suppress(Exception):
             await cb.bot.delete_message(chat_id=cb.message.chat.id, message_id=mid)
@@ -61,7 +63,7 @@ async def send_content(
     else:
         m = await cb.message.answer(text, reply_markup=reply_markup)
 
-    last_content_msg[uid] = m.message_id
+    await last_content_msg.set(uid, m.message_id)
 
 
 def _is_emergency_allowed(event: types.TelegramObject) -> bool:
@@ -160,7 +162,7 @@ async def cmd_start(message: types.Message, bot: Bot):
     # 1) Админ: пытаемся поднять схему и самозавести запись админа.
     if user_id == ADMIN_TELEGRAM_ID:
         try:
-            # если таблиц нет — создаст
+            # если таблиц нет — создаст; после успешного старта — no-op без DDL/рефлексии
             await init_db()
         except Exception:
             pass
@@ -211,7 +213,7 @@ async def cmd_start(message: types.Message, bot: Bot):
 
     # Заявка админу
     set_audit_user(None)
-    pending_requests[user_id] = message.from_user.full_name or str(user_id)
+    await pending_requests.set(user_id, message.from_user.full_name or str(user_id))
     kb = InlineKeyboardMarkup(inline_keyboard=[[
         InlineKeyboardButton(text="✅ Принять",  callback_data=f"approve:{user_id}"),
         InlineKeyboardButton(text="❌ Отклонить", callback_data=f"reject:{user_id}"),
@@ -306,7 +308,8 @@ async def handle_admin_decision(cb: types.CallbackQuery, bot: Bot):
     if cb.from_user.id != ADMIN_TELEGRAM_ID:
         await cb.answer("У вас нет прав для этого действия.", show_alert=True)
         return
-    if uid not in pending_requests:
+    name = await pending_requests.get(uid)
+    if name is None:
         await cb.answer("Запрос уже обработан или не найден.", show_alert=True)
         return
 
@@ -318,7 +321,7 @@ async def handle_admin_decision(cb: types.CallbackQuery, bot: Bot):
         async with get_session() as session:
             new_user = User(
                 telegram_id=uid,
-                name=pending_requests[uid],
+                name=name,
                 role=UserRole.user,
                 password_hash="approved",
             )
@@ -332,7 +335,7 @@ async def handle_admin_decision(cb: types.CallbackQuery, bot: Bot):
             await bot.send_message(uid, "Ваш запрос на доступ отклонён.")
         await cb.answer("Пользователь отклонён.")
 
-    pending_requests.pop(uid, None)
+    await pending_requests.pop(uid)
 
 
 # ---------------------------
@@ -416,8 +419,9 @@ async def show_pack_menu(cb: types.CallbackQuery, user: User):
 # NOOP router (закрыть "часики")
 # ---------------------------
 noop_router = Router()
+noop_cbx = callback_index(noop_router)
 
-@noop_router.callback_query(F.data == "noop")
+@noop_cbx.exact("noop")
 async def noop_cb(cb: types.CallbackQuery):
     await cb.answer()
 
@@ -426,21 +430,22 @@ async def noop_cb(cb: types.CallbackQuery):
 # Register
 # ---------------------------
 def register_common_handlers(dp: Dispatcher):
+    cbx = callback_index(dp)
     dp.message.register(cmd_start, CommandStart())
-    dp.callback_query.register(handle_admin_decision, lambda c: c.data.startswith(("approve:", "reject:")))
+    cbx.register_prefix(handle_admin_decision, ("approve:", "reject:"))
 
     # Корневая навигация (с описаниями)
-    dp.callback_query.register(show_root_menu,    lambda c: c.data == "root:main")
-    dp.callback_query.register(show_procure_menu, lambda c: c.data == "root:procure")
-    dp.callback_query.register(show_pack_menu,    lambda c: c.data == "root:pack")
+    cbx.register_exact(show_root_menu,    "root:main")
+    cbx.register_exact(show_procure_menu, "root:procure")
+    cbx.register_exact(show_pack_menu,    "root:pack")
 
     # Прежние заглушки (если где-то используются старые callbacks)
-    dp.callback_query.register(on_ostatki,  lambda c: c.data == "ostatki")
-    dp.callback_query.register(on_prihod,   lambda c: c.data == "prihod")
-    dp.callback_query.register(on_korr_ost, lambda c: c.data == "korr_ost")
-    dp.callback_query.register(on_postavki, lambda c: c.data == "postavki")
-    dp.callback_query.register(on_otchety,   lambda c: c.data == "otchety")
-    dp.callback_query.register(back_to_main_menu, lambda c: c.data == "back_to_menu")
+    cbx.register_exact(on_ostatki,  "ostatki")
+    cbx.register_exact(on_prihod,   "prihod")
+    cbx.register_exact(on_korr_ost, "korr_ost")
+    cbx.register_exact(on_postavki, "postavki")
+    cbx.register_exact(on_otchety,  "otchety")
+    cbx.register_exact(back_to_main_menu, "back_to_menu")
 
     # Подключить совместимость (последним из меню-роутеров)
     from handlers import common_compat
@@ -2,9 +2,10 @@
 from aiogram import Router
 from aiogram.types import CallbackQuery
 from database.models import User
-from aiogram import F
+from handlers.callback_index import callback_index
 
 router = Router()
+cbx = callback_index(router)
 
 # Русские старые коллбэки → новые
 COMPAT = {
@@ -16,7 +17,7 @@ COMPAT = {
     "back_to_menu": "root:main",
 }
 
-@router.callback_query(F.data.in_(list(COMPAT.keys())))
+@cbx.exact(tuple(COMPAT))
 async def compat_router(cb: CallbackQuery, user: User):
     target = COMPAT.get(cb.data)
     if not target:
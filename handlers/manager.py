@@ -3,19 +3,22 @@ from __future__ import annotations
 
 from typing import List, Tuple
 
-from aiogram import Router, F, types
+from aiogram import Router, types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from sqlalchemy import select, func, desc
 
-from database.db import get_session, available_packed
+from database.db import get_session, available_packed_many
+from database.product_catalog import catalog as product_catalog
 from database.models import (
     User, UserRole,
-    Supply, SupplyItem, Warehouse, Product,
+    Supply, SupplyItem, Warehouse,
     StockMovement, MovementType, ProductStage,
 )
 from handlers.common import send_content
+from handlers.callback_index import callback_index
 
 router = Router()
+cbx = callback_index(router)
 PAGE = 10
 
 # ---------------------------
@@ -82,7 +85,7 @@ def _kb_card(s: Supply) -> InlineKeyboardMarkup:
 # Root
 # ---------------------------
 
-@router.callback_query(F.data == "manager")
+@cbx.exact("manager")
 async def manager_root(cb: types.CallbackQuery, user: User):
     if user.role not in (UserRole.manager, UserRole.admin):
         await cb.answer("Нет прав", show_alert=True)
@@ -94,7 +97,7 @@ async def manager_root(cb: types.CallbackQuery, user: User):
 # Списки по статусам (с пагинацией)
 # ---------------------------
 
-@router.callback_query(F.data.startswith("mgr:list:"))
+@cbx.prefix("mgr:list:")
 async def mgr_list(cb: types.CallbackQuery, user: User):
     if user.role not in (UserRole.manager, UserRole.admin):
         await cb.answer("Нет прав", show_alert=True)
@@ -135,7 +138,7 @@ async def mgr_list(cb: types.CallbackQuery, user: User):
 # Карточка поставки (просмотр)
 # ---------------------------
 
-@router.callback_query(F.data.startswith("mgr:open:"))
+@cbx.prefix("mgr:open:")
 async def mgr_open(cb: types.CallbackQuery, user: User):
     if user.role not in (UserRole.manager, UserRole.admin):
         await cb.answer("Нет прав", show_alert=True)
@@ -159,10 +162,13 @@ async def mgr_open(cb: types.CallbackQuery, user: User):
         lines: List[str] = []
         total_qty = 0
         total_def = 0
+        pids = [pid for pid, _ in items]
+        recs = await product_catalog.get_products(pids, s)
+        avail_map = await available_packed_many(s, sup.warehouse_id, pids)
         for pid, need in items:
-            prod = (await s.execute(select(Product.name, Product.article).where(Product.id == pid))).first()
-            name, art = prod if prod else (f"#{pid}", None)
-            avail = await available_packed(s, sup.warehouse_id, pid)
+            rec = recs.get(pid)
+            name, art = (rec.name, rec.article) if rec else (f"#{pid}", None)
+            avail = avail_map.get(pid, 0)
             deficit = max(0, need - max(avail, 0))
             total_qty += int(need)
             total_def += int(deficit)
@@ -190,7 +196,7 @@ async def _next_doc_id() -> int:
         max_doc = (await s.execute(select(func.max(StockMovement.doc_id)))).scalar()
         return int((max_doc or 0) + 1)
 
-@router.callback_query(F.data.startswith("mgr:delivered:"))
+@cbx.prefix("mgr:delivered:")
 async def mgr_delivered(cb: types.CallbackQuery, user: User):
     if user.role not in (UserRole.manager, UserRole.admin):
         await cb.answer("Нет прав", show_alert=True)
@@ -211,7 +217,7 @@ async def mgr_delivered(cb: types.CallbackQuery, user: User):
     await mgr_open(cb, user)  # перерисовать карточку
 
 
-@router.callback_query(F.data.startswith("mgr:return:"))
+@cbx.prefix("mgr:return:")
 async def mgr_return(cb: types.CallbackQuery, user: User):
     """
     Возврат: приход PACKED по всем позициям поставки и статус -> archived_returned.
@@ -253,7 +259,7 @@ async def mgr_return(cb: types.CallbackQuery, user: User):
     await mgr_open(cb, user)
 
 
-@router.callback_query(F.data.startswith("mgr:unpost:"))
+@cbx.prefix("mgr:unpost:")
 async def mgr_unpost(cb: types.CallbackQuery, user: User):
     """
     Расформировать: приход PACKED (возврат на склад) и статус -> assembled.
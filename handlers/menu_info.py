@@ -1,15 +1,17 @@
 # handlers/menu_info.py
 from __future__ import annotations
 
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import CallbackQuery
 
 from database.models import MenuItem
 from database import menu_visibility as mv  # ⬅️ меняем импорт
+from handlers.callback_index import callback_index
 
 router = Router()
+cbx = callback_index(router)
 
-@router.callback_query(F.data.startswith("info:"))
+@cbx.prefix("info:")
 async def show_item_info(cb: CallbackQuery):
     try:
         _, raw = cb.data.split(":", 1)
@@ -3,23 +3,28 @@ from __future__ import annotations
 
 import re
 from datetime import datetime
-from typing import Optional, Tuple, List, Dict
+from typing import Optional, List
 
 from aiogram import Router, F
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import CallbackQuery, Message, InlineKeyboardMarkup, InlineKeyboardButton
-from sqlalchemy import select
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import noload
 
-from database.db import get_session
+from database.db import get_session, next_receiving_doc_id
+from database.product_catalog import catalog as product_catalog
 from database.models import (
     MovementType, ProductStage,
     CnPurchase,  # нужен для кода и таймлайна
     CnPurchaseStatus,
     MskInboundDoc, MskInboundItem, MskInboundStatus,
-    Warehouse, Product, StockMovement, User,
+    Warehouse, StockMovement, User, ReceivingDoc,
 )
+from handlers.callback_index import callback_index
+from keyboards.callbacks import CnPhotos, MskDeliver, MskList, MskOpen, MskOpenByCn, MskToOur, MskWhChoose
 
 router = Router()
+cbx = callback_index(router)
 
 # ========= safe edit =========
 async def safe_edit_text(msg: Message, text: str):
@@ -42,25 +47,8 @@ async def safe_edit_reply_markup(msg: Message, markup: InlineKeyboardMarkup | No
                 await msg.answer("⬇️", reply_markup=markup)
 
 # ========= helpers =========
-_re_int = re.compile(r"(\d+)")
 _DOCNAME_RE = re.compile(r"\[(?:DOCNAME|NAME)\s*:\s*([^\]]+)\]", re.IGNORECASE)
 
-def last_int(data: str) -> Optional[int]:
-    if not data:
-        return None
-    m = _re_int.findall(data)
-    return int(m[-1]) if m else None
-
-def last_two_ints(data: str) -> Tuple[Optional[int], Optional[int]]:
-    if not data:
-        return None, None
-    m = _re_int.findall(data)
-    if not m:
-        return None, None
-    if len(m) == 1:
-        return None, int(m[0])
-    return int(m[-2]), int(m[-1])
-
 def fmt_dt(dt: datetime | None) -> str:
     return dt.strftime("%d.%m.%Y %H:%M") if dt else "—"
 
@@ -74,9 +62,9 @@ def docname_from_text(text: Optional[str]) -> Optional[str]:
 # ========= keyboards =========
 def msk_root_kb() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🚚 Доставка в РФ",          callback_data="msk:list:in_ru")],
-        [InlineKeyboardButton(text="🏢 Доставка на наш склад",  callback_data="msk:list:to_our")],
-        [InlineKeyboardButton(text="🗄️ Архив",                  callback_data="msk:list:archive")],
+        [InlineKeyboardButton(text="🚚 Доставка в РФ",          callback_data=MskList("in_ru").pack())],
+        [InlineKeyboardButton(text="🏢 Доставка на наш склад",  callback_data=MskList("to_our").pack())],
+        [InlineKeyboardButton(text="🗄️ Архив",                  callback_data=MskList("archive").pack())],
         [InlineKeyboardButton(text="⬅️ Назад",                  callback_data="back_to_menu")],
     ])
 
@@ -84,17 +72,17 @@ def msk_doc_kb(msk_id: int, status: MskInboundStatus, warehouse_id: Optional[int
     rows: List[List[InlineKeyboardButton]] = []
 
     if cn_id:
-        rows.append([InlineKeyboardButton(text="👀 Фото CN", callback_data=f"cn:photos:{cn_id}:1")])
+        rows.append([InlineKeyboardButton(text="👀 Фото CN", callback_data=CnPhotos(cn_id, 1).pack())])
 
     if status == MskInboundStatus.PENDING and not warehouse_id:
         rows.append([InlineKeyboardButton(
             text="➡️ Перевести: Доставка на наш склад",
-            callback_data=f"msk:to_our:{msk_id}"
+            callback_data=MskToOur(msk_id).pack()
         )])
     if status == MskInboundStatus.PENDING and warehouse_id:
         rows.append([InlineKeyboardButton(
             text="✅ Принято (оприходовать)",
-            callback_data=f"msk:deliver:{msk_id}"
+            callback_data=MskDeliver(msk_id).pack()
         )])
 
     rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="msk:root")])
@@ -103,8 +91,8 @@ def msk_doc_kb(msk_id: int, status: MskInboundStatus, warehouse_id: Optional[int
 def msk_wh_kb(msk_id: int, warehouses: list[Warehouse]) -> InlineKeyboardMarkup:
     buttons: list[list[InlineKeyboardButton]] = []
     for w in warehouses:
-        buttons.append([InlineKeyboardButton(text=w.name, callback_data=f"msk:whchoose:{msk_id}:{w.id}")])
-    buttons.append([InlineKeyboardButton(text="⬅️ Отмена", callback_data=f"msk:open:{msk_id}")])
+        buttons.append([InlineKeyboardButton(text=w.name, callback_data=MskWhChoose(msk_id, w.id).pack())])
+    buttons.append([InlineKeyboardButton(text="⬅️ Отмена", callback_data=MskOpen(msk_id).pack())])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 # ========= entry =========
@@ -113,35 +101,79 @@ async def msk_entry(msg: Message):
     await msg.answer("Раздел «Склад МСК».", reply_markup=None)
     await msg.answer("Выберите:", reply_markup=msk_root_kb())
 
-@router.callback_query(F.data == "msk:root")
+@cbx.exact("msk:root")
 async def msk_root(cb: CallbackQuery):
     await safe_edit_text(cb.message, "Раздел «Склад МСК».")
     await safe_edit_reply_markup(cb.message, msk_root_kb())
     await cb.answer()
 
 # ========= lists =========
-@router.callback_query(F.data.startswith("msk:list:"))
-async def msk_list(cb: CallbackQuery):
-    mode = cb.data.split(":")[-1]  # in_ru | to_our | archive
+PAGE_SIZE = 10
+
+# вкладки: mode -> (заголовок, SQL-предикат)
+MSK_LIST_MODES = {
+    "in_ru":   ("🚚 Доставка в РФ",
+                lambda: (MskInboundDoc.status == MskInboundStatus.PENDING) & MskInboundDoc.warehouse_id.is_(None)),
+    "to_our":  ("🏢 Доставка на наш склад",
+                lambda: (MskInboundDoc.status == MskInboundStatus.PENDING) & MskInboundDoc.warehouse_id.is_not(None)),
+    "archive": ("🗄️ Архив",
+                lambda: MskInboundDoc.status == MskInboundStatus.RECEIVED),
+}
+
+async def fetch_msk_page(mode: str, direction: str = "next", cursor_id: Optional[int] = None):
+    """
+    Страница вкладки: предикат в SQL + один LEFT JOIN на cn_purchases за кодом.
+    Keyset по (created_at, id) desc, курсор — id крайней строки.
+    Возвращает (rows, has_newer, has_older); rows: id, comment, cn_purchase_id, cn_code.
+    """
+    _, pred = MSK_LIST_MODES[mode]
+    order_key = tuple_(MskInboundDoc.created_at, MskInboundDoc.id)
+    base = (
+        select(MskInboundDoc.id, MskInboundDoc.comment, MskInboundDoc.cn_purchase_id,
+               CnPurchase.code.label("cn_code"))
+        .outerjoin(CnPurchase, CnPurchase.id == MskInboundDoc.cn_purchase_id)
+        .where(pred())
+    )
+
+    def _key_of(pk):
+        return tuple_(
+            select(MskInboundDoc.created_at).where(MskInboundDoc.id == pk).scalar_subquery(),
+            pk,
+        )
+
     async with get_session() as s:
-        all_rows = (await s.execute(select(MskInboundDoc).order_by(MskInboundDoc.created_at.desc()))).scalars().all()
-
-        # подгружаем коды CN одним запросом
-        cn_ids = [r.cn_purchase_id for r in all_rows if r and r.cn_purchase_id]
-        cn_map: Dict[int, str] = {}
-        if cn_ids:
-            cn_rows = (await s.execute(select(CnPurchase.id, CnPurchase.code).where(CnPurchase.id.in_(cn_ids)))).all()
-            cn_map = {i: code for i, code in cn_rows}
-
-    if mode == "in_ru":
-        rows = [r for r in all_rows if r.status == MskInboundStatus.PENDING and not r.warehouse_id]
-        title = "🚚 Доставка в РФ"
-    elif mode == "to_our":
-        rows = [r for r in all_rows if r.status == MskInboundStatus.PENDING and r.warehouse_id]
-        title = "🏢 Доставка на наш склад"
-    else:
-        rows = [r for r in all_rows if r.status == MskInboundStatus.RECEIVED]
-        title = "🗄️ Архив"
+        if direction == "prev" and cursor_id is not None:
+            q = base.where(order_key > _key_of(cursor_id)) \
+                .order_by(MskInboundDoc.created_at.asc(), MskInboundDoc.id.asc())
+        else:
+            q = base
+            if cursor_id is not None:
+                q = q.where(order_key < _key_of(cursor_id))
+            q = q.order_by(MskInboundDoc.created_at.desc(), MskInboundDoc.id.desc())
+        rows = list((await s.execute(q.limit(PAGE_SIZE + 1))).all())
+
+        more = len(rows) > PAGE_SIZE
+        rows = rows[:PAGE_SIZE]
+        if direction == "prev" and cursor_id is not None:
+            rows.reverse()
+            return rows, more, True
+
+        has_newer = False
+        if rows and cursor_id is not None:
+            has_newer = (await s.execute(
+                select(MskInboundDoc.id).where(pred(), order_key > _key_of(rows[0].id)).limit(1)
+            )).first() is not None
+    return rows, has_newer, more
+
+@cbx.data(MskList)
+async def msk_list(cb: CallbackQuery, callback_data: MskList):
+    mode = callback_data.mode if callback_data.mode in MSK_LIST_MODES else "archive"
+    title, _ = MSK_LIST_MODES[mode]
+    direction, cursor_id = "next", None
+    if callback_data.cursor is not None:
+        direction, cursor_id = callback_data.direction or "next", callback_data.cursor
+
+    rows, has_newer, has_older = await fetch_msk_page(mode, direction, cursor_id)
 
     if not rows:
         await safe_edit_text(cb.message, f"{title}\n\nСписок пуст.")
@@ -154,11 +186,18 @@ async def msk_list(cb: CallbackQuery):
     kb_rows: list[list[InlineKeyboardButton]] = []
     for r in rows:
         # имя документа: DOCNAME из комментария MSK или код CN
-        human = docname_from_text(r.comment) or cn_map.get(r.cn_purchase_id, f"CN#{r.cn_purchase_id}")
+        human = docname_from_text(r.comment) or r.cn_code or f"CN#{r.cn_purchase_id}"
         kb_rows.append([InlineKeyboardButton(
             text=f"📦 {human} · MSK #{r.id}",
-            callback_data=f"msk:open:{r.id}"
+            callback_data=MskOpen(r.id).pack()
         )])
+    nav: list[InlineKeyboardButton] = []
+    if has_newer:
+        nav.append(InlineKeyboardButton(text="⬅️", callback_data=MskList(mode, "prev", rows[0].id).pack()))
+    if has_older:
+        nav.append(InlineKeyboardButton(text="➡️", callback_data=MskList(mode, "next", rows[-1].id).pack()))
+    if nav:
+        kb_rows.append(nav)
     kb_rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="msk:root")])
 
     await safe_edit_text(cb.message, title)
@@ -171,16 +210,12 @@ async def _fetch_msk_view(msk_id: int):
         msk = await s.get(MskInboundDoc, msk_id)
         items = (await s.execute(select(MskInboundItem).where(MskInboundItem.msk_inbound_id == msk_id))).scalars().all()
 
-        pmap = {}
-        if items:
-            pids = [it.product_id for it in items]
-            prows = (await s.execute(select(Product).where(Product.id.in_(pids)))).scalars().all()
-            pmap = {p.id: p for p in prows}
+        pmap = await product_catalog.get_products([it.product_id for it in items], s) if items else {}
 
         wh_name = msk.warehouse.name if msk and msk.warehouse else None
 
-        # связанный CN
-        cn = await s.get(CnPurchase, msk.cn_purchase_id) if msk else None
+        # связанный CN — только шапка (код, хронология); selectin-подгрузка photos здесь не нужна
+        cn = await s.get(CnPurchase, msk.cn_purchase_id, options=[noload(CnPurchase.photos)]) if msk else None
 
     return msk, items, pmap, wh_name, cn
 
@@ -232,35 +267,27 @@ async def render_msk_doc(msg: Message, msk_id: int):
     await safe_edit_text(msg, "\n".join(lines))
     await safe_edit_reply_markup(msg, msk_doc_kb(msk.id, msk.status, msk.warehouse_id, msk.cn_purchase_id))
 
-@router.callback_query(F.data.startswith("msk:open:"))
-async def msk_open(cb: CallbackQuery):
-    parts = cb.data.split(":")
-    # msk:open:by_cn:{cn_id}
-    if len(parts) >= 3 and parts[2] == "by_cn":
-        cn_id = last_int(cb.data)
+@cbx.data((MskOpen, MskOpenByCn))
+async def msk_open(cb: CallbackQuery, callback_data: MskOpen | MskOpenByCn):
+    if isinstance(callback_data, MskOpenByCn):
         async with get_session() as s:
-            msk = (await s.execute(select(MskInboundDoc).where(MskInboundDoc.cn_purchase_id == cn_id))).scalar_one_or_none()
+            msk = (await s.execute(
+                select(MskInboundDoc).where(MskInboundDoc.cn_purchase_id == callback_data.cn_id)
+            )).scalar_one_or_none()
         if not msk:
             await cb.answer("MSK-документ не найден.", show_alert=True)
             return
         msk_id = msk.id
     else:
-        msk_id = last_int(cb.data)
-
-    if not msk_id:
-        await cb.answer("Не удалось определить документ.", show_alert=True)
-        return
+        msk_id = callback_data.msk_id
 
     await render_msk_doc(cb.message, msk_id)
     await cb.answer()
 
 # ========= choose target warehouse =========
-@router.callback_query(F.data.startswith("msk:to_our:"))
-async def msk_to_our(cb: CallbackQuery):
-    msk_id = last_int(cb.data)
-    if not msk_id:
-        await cb.answer("Не удалось определить документ.", show_alert=True)
-        return
+@cbx.data(MskToOur)
+async def msk_to_our(cb: CallbackQuery, callback_data: MskToOur):
+    msk_id = callback_data.msk_id
 
     async with get_session() as s:
         warehouses = (await s.execute(select(Warehouse).order_by(Warehouse.name.asc()))).scalars().all()
@@ -272,12 +299,9 @@ async def msk_to_our(cb: CallbackQuery):
     await safe_edit_reply_markup(cb.message, msk_wh_kb(msk_id, warehouses))
     await cb.answer()
 
-@router.callback_query(F.data.startswith("msk:whchoose:"))
-async def msk_whchoose(cb: CallbackQuery):
-    msk_id, wh_id = last_two_ints(cb.data)
-    if not msk_id or not wh_id:
-        await cb.answer("Не удалось определить склад.", show_alert=True)
-        return
+@cbx.data(MskWhChoose)
+async def msk_whchoose(cb: CallbackQuery, callback_data: MskWhChoose):
+    msk_id, wh_id = callback_data.msk_id, callback_data.wh_id
 
     async with get_session() as s:
         w = await s.get(Warehouse, wh_id)
@@ -302,12 +326,9 @@ async def msk_whchoose(cb: CallbackQuery):
     await cb.answer("Склад выбран. Теперь нажмите «✅ Принято (оприходовать)».", show_alert=True)
 
 # ========= deliver (create stock movements) =========
-@router.callback_query(F.data.startswith("msk:deliver:"))
-async def msk_deliver(cb: CallbackQuery):
-    msk_id = last_int(cb.data)
-    if not msk_id:
-        await cb.answer("Не удалось определить документ.", show_alert=True)
-        return
+@cbx.data(MskDeliver)
+async def msk_deliver(cb: CallbackQuery, callback_data: MskDeliver):
+    msk_id = callback_data.msk_id
 
     async with get_session() as s:
         msk = await s.get(MskInboundDoc, msk_id)
@@ -343,12 +364,17 @@ async def msk_deliver(cb: CallbackQuery):
 
         now = datetime.utcnow()
         # под одним doc_id — групповое поступление
-        # определение doc_id перенесено в СУБД (автоинкремент StockMovement.doc_id отсутствует),
-        # поэтому используем «следующий»: max(doc_id)+1 среди прихода.
-        max_doc = (await s.execute(
-            select(StockMovement.doc_id).where(StockMovement.type == MovementType.prihod).order_by(StockMovement.doc_id.desc())
-        )).scalars().first()
-        next_doc = (max_doc or 0) + 1
+        # номер документа — next_receiving_doc_id (под замком до commit этой сессии)
+        next_doc = await next_receiving_doc_id(s)
+        s.add(ReceivingDoc(
+            id=next_doc,
+            name=docname,
+            date=now,
+            warehouse_id=msk.warehouse_id,
+            user_id=user_id,
+            lines_count=len(items),
+            total_qty=sum(int(it.qty or 0) for it in items),
+        ))
 
         for it in items:
             s.add(StockMovement(
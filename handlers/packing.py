@@ -2,15 +2,18 @@
 from __future__ import annotations
 
 import datetime
+import html
 from typing import Dict, List, Tuple, Union
 
-from aiogram import Router, F, types
+from aiogram import Router, types
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from sqlalchemy import select, func, and_, desc
 from sqlalchemy.orm import aliased
 
 from database.db import get_session
+from database.product_search import filter_rows
+from database.product_catalog import catalog as product_catalog
 from database.models import (
     User, UserRole,
     Warehouse, Product, StockMovement,
@@ -19,8 +22,10 @@ from database.models import (
 )
 from handlers.common import send_content
 from keyboards.inline import warehouses_kb
+from handlers.callback_index import callback_index
 
 router = Router()
+cbx = callback_index(router)
 
 # сколько товаров показываем на странице при подборе
 PAGE_SIZE = 12
@@ -30,6 +35,7 @@ class PackFSM(StatesGroup):
     choose_wh = State()
     picking = State()
     input_qty = State()
+    search = State()
 
 
 # ===== ВСПОМОГАТЕЛЬНЫЕ =====
@@ -99,6 +105,7 @@ def _kb_picking(
         pages: int,
         cart_cnt: int,
         cart_sum: int,
+        search: str | None = None,
 ) -> types.InlineKeyboardMarkup:
     """
     Клавиатура для страницы подбора: список товаров (RAW>0), пагинация, корзина/назад
@@ -119,6 +126,10 @@ def _kb_picking(
             types.InlineKeyboardButton(text="▶", callback_data=next_cb),
         ])
 
+    rows.append([
+        types.InlineKeyboardButton(text=("🔎 Изменить поиск" if search else "🔎 Поиск"), callback_data="pack_search"),
+    ])
+
     # корзина/навигация
     rows.append([
         types.InlineKeyboardButton(text=f"🧾 Корзина ({cart_cnt}/{cart_sum})", callback_data="pack_cart"),
@@ -170,26 +181,32 @@ async def _render_picking(target: Union[types.CallbackQuery, types.Message], sta
     page: int = int(data.get("page", 1))
     cart: Dict[int, int] = data.get("cart", {})
     raw_map: Dict[int, int] = data["raw_map"]
-    products: List[Tuple[int, str, str | None]] = data["products"]
+    search: str | None = data.get("search")
+    products: List[Tuple[int, str, str | None]] = filter_rows(data["products"], search)
 
     pages = max(1, (len(products) + PAGE_SIZE - 1) // PAGE_SIZE)
     start, end = (page - 1) * PAGE_SIZE, (page - 1) * PAGE_SIZE + PAGE_SIZE
     slice_rows = [(pid, name, art, raw_map.get(pid, 0)) for (pid, name, art) in products[start:end]]
 
     cnt, summ = _cart_summary(cart)
-    text = f"🏬 *{wh_name}*\nВыберите товар для упаковки (RAW > 0).\n\n🧾 Корзина: {cnt} поз., {summ} шт."
-
-    await send_content(
-        target,
-        text,
-        parse_mode="Markdown",
-        reply_markup=_kb_picking(slice_rows, page, pages, cnt, summ),
+    # HTML, а не Markdown: строку поиска вводит пользователь, в `code` легаси-Markdown её не экранировать
+    text = (
+        f"🏬 <b>{html.escape(wh_name)}</b>\nВыберите товар для упаковки (RAW > 0).\n\n"
+        f"🧾 Корзина: {cnt} поз., {summ} шт."
     )
+    if search:
+        text += f"\n🔎 Поиск: <code>{html.escape(search)}</code> (найдено: {len(products)})"
+    kb = _kb_picking(slice_rows, page, pages, cnt, summ, search)
+
+    if isinstance(target, types.Message):
+        await target.answer(text, parse_mode="HTML", reply_markup=kb)
+        return
+    await send_content(target, text, parse_mode="HTML", reply_markup=kb)
 
 
 # ===== ROOT / МЕНЮ =====
 
-@router.callback_query(F.data == "packing")
+@cbx.exact("packing")
 async def pack_root(cb: types.CallbackQuery, user: User, state: FSMContext):
     await state.clear()
     kb = types.InlineKeyboardMarkup(inline_keyboard=[
@@ -202,7 +219,7 @@ async def pack_root(cb: types.CallbackQuery, user: User, state: FSMContext):
 
 # ===== СОЗДАНИЕ НОВОЙ УПАКОВКИ =====
 
-@router.callback_query(F.data == "pack_new")
+@cbx.exact("pack_new")
 async def pack_new(cb: types.CallbackQuery, user: User, state: FSMContext):
     await state.clear()
     async with get_session() as session:
@@ -215,7 +232,7 @@ async def pack_new(cb: types.CallbackQuery, user: User, state: FSMContext):
     await send_content(cb, "Выберите склад для новой упаковки:", reply_markup=warehouses_kb(wh, prefix="pack_wh"))
 
 
-@router.callback_query(F.data.startswith("pack_wh:"))
+@cbx.prefix("pack_wh:")
 async def pack_choose_wh(cb: types.CallbackQuery, user: User, state: FSMContext):
     # фикс состояния
     if await state.get_state() != PackFSM.choose_wh:
@@ -241,20 +258,21 @@ async def pack_choose_wh(cb: types.CallbackQuery, user: User, state: FSMContext)
         page=1,
         cart={},
         raw_map=raw,
-        products=prod_rows,
+        products=[tuple(r) for r in prod_rows],   # FSM-данные — сериализуемые значения, не Row
+        search=None,
     )
     await state.set_state(PackFSM.picking)
     await _render_picking(cb, state)
 
 
-@router.callback_query(F.data.startswith("pack_page:"))
+@cbx.prefix("pack_page:")
 async def pack_page(cb: types.CallbackQuery, state: FSMContext):
     page = int(cb.data.split(":")[1])
     await state.update_data(page=page)
     await _render_picking(cb, state)
 
 
-@router.callback_query(F.data.startswith("pack_add:"))
+@cbx.prefix("pack_add:")
 async def pack_add(cb: types.CallbackQuery, state: FSMContext):
     """
     Клик по товару — запрос количества
@@ -301,20 +319,32 @@ async def pack_input_qty(msg: types.Message, state: FSMContext):
     await _render_picking(msg, state)
 
 
+@cbx.exact("pack_search")
+async def pack_search(cb: types.CallbackQuery, state: FSMContext):
+    await state.set_state(PackFSM.search)
+    await cb.message.answer("🔎 Введите часть названия или артикул (« - » — сбросить поиск):")
+    await cb.answer()
+
+
+@router.message(PackFSM.search)
+async def pack_search_input(msg: types.Message, state: FSMContext):
+    search = (msg.text or "").strip()
+    await state.update_data(search=None if search in ("", "-") else search, page=1)
+    await state.set_state(PackFSM.picking)
+    await _render_picking(msg, state)
+
+
 # ===== КОРЗИНА И РЕДАКТИРОВАНИЕ =====
 
-@router.callback_query(F.data == "pack_cart")
+@cbx.exact("pack_cart")
 async def pack_cart(cb: types.CallbackQuery, state: FSMContext):
     data = await state.get_data()
     cart: Dict[int, int] = data.get("cart", {})
     if not cart:
         return await cb.answer("Корзина пуста", show_alert=True)
 
-    async with get_session() as session:
-        rows = (await session.execute(
-            select(Product.id, Product.name, Product.article).where(Product.id.in_(cart.keys()))
-        )).all()
-    info = {pid: (name, art) for pid, name, art in rows}
+    recs = await product_catalog.get_products(cart.keys())
+    info = {pid: (r.name, r.article) for pid, r in recs.items()}
 
     lines = ["🧾 *Подбор упаковки*:", ""]
     total = 0
@@ -346,7 +376,7 @@ async def pack_cart(cb: types.CallbackQuery, state: FSMContext):
     await send_content(cb, "\n".join(lines), parse_mode="Markdown", reply_markup=kb)
 
 
-@router.callback_query(F.data.startswith("pack_inc:"))
+@cbx.prefix("pack_inc:")
 async def pack_inc(cb: types.CallbackQuery, state: FSMContext):
     pid = int(cb.data.split(":")[1])
     data = await state.get_data()
@@ -361,7 +391,7 @@ async def pack_inc(cb: types.CallbackQuery, state: FSMContext):
     await pack_cart(cb, state)
 
 
-@router.callback_query(F.data.startswith("pack_dec:"))
+@cbx.prefix("pack_dec:")
 async def pack_dec(cb: types.CallbackQuery, state: FSMContext):
     pid = int(cb.data.split(":")[1])
     data = await state.get_data()
@@ -379,7 +409,7 @@ async def pack_dec(cb: types.CallbackQuery, state: FSMContext):
     await pack_cart(cb, state)
 
 
-@router.callback_query(F.data.startswith("pack_del:"))
+@cbx.prefix("pack_del:")
 async def pack_del(cb: types.CallbackQuery, state: FSMContext):
     pid = int(cb.data.split(":")[1])
     data = await state.get_data()
@@ -392,7 +422,7 @@ async def pack_del(cb: types.CallbackQuery, state: FSMContext):
     await pack_cart(cb, state)
 
 
-@router.callback_query(F.data == "pack_clear")
+@cbx.exact("pack_clear")
 async def pack_clear(cb: types.CallbackQuery, state: FSMContext):
     """
     Очистить корзину и пересчитать доступный RAW из базы
@@ -405,14 +435,14 @@ async def pack_clear(cb: types.CallbackQuery, state: FSMContext):
     await _render_picking(cb, state)
 
 
-@router.callback_query(F.data == "pack_continue")
+@cbx.exact("pack_continue")
 async def pack_continue(cb: types.CallbackQuery, state: FSMContext):
     await _render_picking(cb, state)
 
 
 # ===== СОЗДАНИЕ ДОКУМЕНТА (ПРОВЕДЕНИЕ) =====
 
-@router.callback_query(F.data == "pack_post")
+@cbx.exact("pack_post")
 async def pack_post(cb: types.CallbackQuery, user: User, state: FSMContext):
     data = await state.get_data()
     cart: Dict[int, int] = data.get("cart", {})
@@ -491,7 +521,7 @@ async def _show_doc(cb: types.CallbackQuery, doc_id: int | None = None, number:
 
 # ===== СПИСОК ДОКУМЕНТОВ =====
 
-@router.callback_query(F.data == "pack_docs")
+@cbx.exact("pack_docs")
 async def pack_docs(cb: types.CallbackQuery, state: FSMContext):
     async with get_session() as session:
         rows = (await session.execute(
@@ -515,7 +545,7 @@ async def pack_docs(cb: types.CallbackQuery, state: FSMContext):
     await send_content(cb, "Последние документы упаковки:", reply_markup=_kb_docs(rows))
 
 
-@router.callback_query(F.data.startswith("pack_doc:"))
+@cbx.prefix("pack_doc:")
 async def pack_doc_open(cb: types.CallbackQuery, state: FSMContext):
     did = int(cb.data.split(":")[1])
     await _show_doc(cb, doc_id=did)
@@ -523,14 +553,14 @@ async def pack_doc_open(cb: types.CallbackQuery, state: FSMContext):
 
 # ===== НАВИГАЦИЯ =====
 
-@router.callback_query(F.data == "pack_back_wh")
+@cbx.exact("pack_back_wh")
 async def pack_back_wh(cb: types.CallbackQuery, state: FSMContext):
     # заново начало флоу выбора склада
     await pack_new(cb, user=None, state=state)  # user в pack_new не используется
 
 
 # Локальный обработчик «Назад» для упаковки
-@router.callback_query(F.data == "back_to_packing")
+@cbx.exact("back_to_packing")
 async def back_to_packing(cb: types.CallbackQuery, state: FSMContext):
     await state.clear()
     try:
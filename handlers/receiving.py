@@ -7,23 +7,25 @@ from typing import Optional
 from aiogram import Dispatcher, types
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
-from sqlalchemy import select, func, desc
+from sqlalchemy import select
 from database.models import ProductStage
 from html import escape as h  # для безопасной разметки HTML
 
-from database.db import get_session
-from database.models import User, Warehouse, Product, StockMovement, MovementType
+from database.db import get_session, next_receiving_doc_id
+from database.product_search import search_products
+from database.models import User, Warehouse, Product, StockMovement, MovementType, ReceivingDoc
 from keyboards.inline import (
     warehouses_kb, products_page_kb, qty_kb, comment_kb, receiving_confirm_kb
 )
 from handlers.common import send_content
+from handlers.callback_index import callback_index
 from utils.validators import validate_positive_int
-from utils.pagination import build_pagination_keyboard
 
 
 class IncomingState(StatesGroup):
     choosing_warehouse = State()
     choosing_product = State()
+    entering_search = State()
     entering_qty = State()
     entering_comment = State()
     confirming = State()
@@ -73,29 +75,47 @@ async def receiving_root(cb: types.CallbackQuery, user: User, state: FSMContext)
 
 
 # ===== Просмотреть документы =====
-async def view_docs(cb: types.CallbackQuery, user: User, state: FSMContext, page: int = 1):
+async def view_docs(
+        cb: types.CallbackQuery,
+        user: User,
+        state: FSMContext,
+        direction: str = "next",
+        cursor: Optional[int] = None,
+):
+    """
+    Список документов из шапок receiving_docs — keyset по PK (id ~ порядок проведения).
+    direction="next": id < cursor (к более старым), "prev": id > cursor (к более новым).
+    callback: view_docs_page:<next|prev>:<cursor_id>
+    """
     await cb.answer()
     await state.set_state(ReceivingViewState.viewing_docs)
 
     async with get_session() as session:
-        total_stmt = select(func.count(func.distinct(StockMovement.doc_id))).where(
-            StockMovement.type == MovementType.prihod
-        )
-        total = await session.scalar(total_stmt)
-
-        res = await session.execute(
-            select(
-                StockMovement.doc_id,
-                func.min(StockMovement.date).label("date"),
-                func.max(StockMovement.comment).label("comment"),  # берём любой комментарий из группы
-            )
-            .where(StockMovement.type == MovementType.prihod)
-            .group_by(StockMovement.doc_id)
-            .order_by(desc("date"))
-            .offset((page - 1) * PAGE_SIZE_DOCS)
-            .limit(PAGE_SIZE_DOCS)
-        )
-        docs = res.all()
+        stmt = select(ReceivingDoc.id, ReceivingDoc.name, ReceivingDoc.date)
+        if direction == "prev" and cursor is not None:
+            stmt = stmt.where(ReceivingDoc.id > cursor).order_by(ReceivingDoc.id.asc())
+        else:
+            if cursor is not None:
+                stmt = stmt.where(ReceivingDoc.id < cursor)
+            stmt = stmt.order_by(ReceivingDoc.id.desc())
+        docs = (await session.execute(stmt.limit(PAGE_SIZE_DOCS + 1))).all()
+
+        # лишняя строка = «есть ещё» в направлении листания
+        more = len(docs) > PAGE_SIZE_DOCS
+        docs = docs[:PAGE_SIZE_DOCS]
+        if direction == "prev" and cursor is not None:
+            docs.reverse()
+
+        has_newer = has_older = False
+        if docs:
+            first_id, last_id = docs[0].id, docs[-1].id
+            if direction == "prev" and cursor is not None:
+                has_newer, has_older = more, True
+            else:
+                has_older = more
+                has_newer = cursor is not None and bool(await session.scalar(
+                    select(ReceivingDoc.id).where(ReceivingDoc.id > first_id).limit(1)
+                ))
 
     if not docs:
         await send_content(
@@ -109,23 +129,21 @@ async def view_docs(cb: types.CallbackQuery, user: User, state: FSMContext, page
 
     rows = []
     for row in docs:
-        doc_id = row.doc_id
-        date_str = row.date.strftime("%Y-%m-%d %H:%M")
-        human = _doc_label(doc_id, row.comment)
+        date_str = row.date.strftime("%Y-%m-%d %H:%M") if row.date else "—"
         rows.append([types.InlineKeyboardButton(
-            text=f"Документ {human} от {date_str}",
-            callback_data=f"view_doc:{doc_id}"
+            text=f"Документ {row.name} от {date_str}",
+            callback_data=f"view_doc:{row.id}"
         )])
 
-    pag_row = build_pagination_keyboard(
-        page=page,
-        page_size=PAGE_SIZE_DOCS,
-        total=total,
-        prev_cb_prefix="view_docs_page",
-        next_cb_prefix="view_docs_page",
-        prev_text="◀ Предыдущая",
-        next_text="Следующая ▶"
-    )
+    pag_row = []
+    if has_newer:
+        pag_row.append(types.InlineKeyboardButton(
+            text="◀ Предыдущая", callback_data=f"view_docs_page:prev:{first_id}"
+        ))
+    if has_older:
+        pag_row.append(types.InlineKeyboardButton(
+            text="Следующая ▶", callback_data=f"view_docs_page:next:{last_id}"
+        ))
     if pag_row:
         rows.append(pag_row)
 
@@ -138,11 +156,11 @@ async def view_docs(cb: types.CallbackQuery, user: User, state: FSMContext, page
 async def view_docs_page(cb: types.CallbackQuery, user: User, state: FSMContext):
     await cb.answer()
     try:
-        _, page_str = cb.data.split(":")
-        page = int(page_str)
+        _, direction, cursor_str = cb.data.split(":")
+        cursor = int(cursor_str)
     except Exception:
-        page = 1
-    await view_docs(cb, user, state, page=page)
+        direction, cursor = "next", None
+    await view_docs(cb, user, state, direction=direction, cursor=cursor)
 
 
 # ===== Просмотр конкретного документа =====
@@ -165,13 +183,14 @@ async def view_doc(cb: types.CallbackQuery, user: User, state: FSMContext):
             .order_by(StockMovement.id)
         )
         movements = res.all()
+        doc_name = await session.scalar(select(ReceivingDoc.name).where(ReceivingDoc.id == doc_id))
 
     if not movements:
         await send_content(cb, "Документ не найден.")
         return
 
     first_mv: StockMovement = movements[0][0]
-    human = _doc_label(doc_id, first_mv.comment)
+    human = doc_name or _doc_label(doc_id, first_mv.comment)
     header = f"📑 <b>Документ {h(human)} от {h(first_mv.date.strftime('%Y-%m-%d %H:%M:%S'))}</b>\n\n"
 
     parts = [header]
@@ -252,33 +271,63 @@ async def back_to_warehouses(cb: types.CallbackQuery, user: User, state: FSMCont
 
 
 # ===== Список товаров с пагинацией =====
-async def list_products(cb: types.CallbackQuery, user: User, state: FSMContext, page: int = 1):
+async def _products_view(state: FSMContext, page: int):
+    """Текст и клавиатура страницы товаров с учётом строки поиска из FSM (rcv_search)."""
+    search = (await state.get_data()).get("rcv_search")
     async with get_session() as session:
-        total = (await session.execute(
-            select(func.count()).select_from(Product).where(Product.is_active == True)
-        )).scalar_one()
-        res = await session.execute(
-            select(Product)
-            .where(Product.is_active == True)
-            .order_by(Product.name)
-            .offset((page - 1) * PAGE_SIZE_PRODUCTS)
-            .limit(PAGE_SIZE_PRODUCTS)
+        products, total = await search_products(
+            session, search,
+            offset=(page - 1) * PAGE_SIZE_PRODUCTS,
+            limit=PAGE_SIZE_PRODUCTS,
         )
-        products = res.scalars().all()
+    if not products and not search:
+        return None, None
 
+    text = "📦 Выберите товар:" if not search else f"📦 Выберите товар (поиск: «{search}», найдено: {total}):"
     if not products:
+        text = f"🔎 По запросу «{search}» ничего не найдено."
+    kb = products_page_kb(
+        products, page, PAGE_SIZE_PRODUCTS, total,
+        back_to="rcv_back_wh",
+        search_cb="rcv_search",
+        search_active=bool(search),
+    )
+    return text, kb
+
+
+async def list_products(cb: types.CallbackQuery, user: User, state: FSMContext, page: int = 1):
+    text, kb = await _products_view(state, page)
+    if text is None:
         await send_content(cb, "🚫 Активных товаров нет. Попросите администратора добавить товар.",
                            reply_markup=warehouses_kb([]))
         return
 
     await state.set_state(IncomingState.choosing_product)
+    await send_content(cb, text, reply_markup=kb)
+
+
+# ===== Поиск товара =====
+async def ask_search(cb: types.CallbackQuery, user: User, state: FSMContext):
+    await cb.answer()
+    await state.set_state(IncomingState.entering_search)
     await send_content(
         cb,
-        "📦 Выберите товар:",
-        reply_markup=products_page_kb(products, page, PAGE_SIZE_PRODUCTS, total, back_to="rcv_back_wh")
+        "🔎 Введите часть названия или артикул (« - » — сбросить поиск):",
+        reply_markup=qty_kb(back_to="rcv_back_products"),
     )
 
 
+async def enter_search(message: types.Message, user: User, state: FSMContext):
+    search = (message.text or "").strip()
+    await state.update_data(rcv_search=None if search in ("", "-") else search)
+    text, kb = await _products_view(state, 1)
+    if text is None:
+        await message.answer("🚫 Активных товаров нет. Попросите администратора добавить товар.")
+        return
+    await state.set_state(IncomingState.choosing_product)
+    await message.answer(text, reply_markup=kb)
+
+
 async def products_page(cb: types.CallbackQuery, user: User, state: FSMContext):
     await cb.answer()
     if not cb.data.startswith("rcv_prod_page:"):
@@ -426,10 +475,16 @@ async def confirm(cb: types.CallbackQuery, user: User, state: FSMContext):
 
     data = await state.get_data()
     async with get_session() as session:
-        max_doc = (await session.execute(
-            select(func.max(StockMovement.doc_id)).where(StockMovement.type == MovementType.prihod)
-        )).scalar()
-        next_doc = (max_doc or 0) + 1
+        next_doc = await next_receiving_doc_id(session)
+        doc_name = _doc_label(next_doc, data.get("comment", ""))
+        session.add(ReceivingDoc(
+            id=next_doc,
+            name=doc_name,
+            warehouse_id=data["warehouse_id"],
+            user_id=user.id,
+            lines_count=1,
+            total_qty=data["qty"],
+        ))
 
         sm = StockMovement(
             warehouse_id=data["warehouse_id"],
@@ -448,7 +503,7 @@ async def confirm(cb: types.CallbackQuery, user: User, state: FSMContext):
     await state.clear()
     done = (
         f"✅ <b>Поступление записано.</b>\n\n"
-        f"📑 Документ <b>{h(_doc_label(sm.doc_id, sm.comment))}</b>\n"
+        f"📑 Документ <b>{h(doc_name)}</b>\n"
         f"📅 Дата: <b>{h(sm.date.strftime('%Y-%m-%d %H:%M:%S'))}</b>\n"
         f"🏬 Склад: <b>{h(str(data['warehouse_name']))}</b>\n"
         f"📦 Товар: <b>{h(str(data['product_name']))}</b> (арт. <code>{h(str(data['product_article']))}</code>)\n"
@@ -459,35 +514,38 @@ async def confirm(cb: types.CallbackQuery, user: User, state: FSMContext):
 
 
 def register_receiving_handlers(dp: Dispatcher):
+    cbx = callback_index(dp)
     # Корень
-    dp.callback_query.register(receiving_root, lambda c: c.data == "receiving")
+    cbx.register_exact(receiving_root, "receiving")
 
     # Просмотр документов
-    dp.callback_query.register(view_docs, lambda c: c.data == "view_docs")
-    dp.callback_query.register(view_docs_page, lambda c: c.data.startswith("view_docs_page:"))
-    dp.callback_query.register(view_doc, lambda c: c.data.startswith("view_doc:"))
+    cbx.register_exact(view_docs, "view_docs")
+    cbx.register_prefix(view_docs_page, "view_docs_page:")
+    cbx.register_prefix(view_doc, "view_doc:")
 
     # Добавить документ
-    dp.callback_query.register(add_doc, lambda c: c.data == "add_doc")
+    cbx.register_exact(add_doc, "add_doc")
 
     # Склад -> сразу товары
-    dp.callback_query.register(pick_warehouse, lambda c: c.data.startswith("rcv_wh:"))
-    dp.callback_query.register(back_to_warehouses, lambda c: c.data == "rcv_back_wh")
+    cbx.register_prefix(pick_warehouse, "rcv_wh:")
+    cbx.register_exact(back_to_warehouses, "rcv_back_wh")
 
     # Товары и пагинация
-    dp.callback_query.register(products_page, lambda c: c.data.startswith("rcv_prod_page:"))
-    dp.callback_query.register(pick_product, lambda c: c.data.startswith("rcv_prod:"))
-    dp.callback_query.register(back_to_products, lambda c: c.data == "rcv_back_products")
+    cbx.register_prefix(products_page, "rcv_prod_page:")
+    cbx.register_prefix(pick_product, "rcv_prod:")
+    cbx.register_exact(back_to_products, "rcv_back_products")
+    cbx.register_exact(ask_search, "rcv_search")
 
     # Комментарий/Qty/Отмена/Назад
-    dp.callback_query.register(skip_comment, lambda c: c.data == "rcv_skip_comment")
-    dp.callback_query.register(back_to_qty, lambda c: c.data == "rcv_back_qty")
-    dp.callback_query.register(back_to_comment, lambda c: c.data == "rcv_back_comment")
-    dp.callback_query.register(cancel_flow, lambda c: c.data == "rcv_cancel")
+    cbx.register_exact(skip_comment, "rcv_skip_comment")
+    cbx.register_exact(back_to_qty, "rcv_back_qty")
+    cbx.register_exact(back_to_comment, "rcv_back_comment")
+    cbx.register_exact(cancel_flow, "rcv_cancel")
 
     # Вводы
+    dp.message.register(enter_search, IncomingState.entering_search)
     dp.message.register(enter_qty, IncomingState.entering_qty)
     dp.message.register(set_comment, IncomingState.entering_comment)
 
     # Подтверждение
-    dp.callback_query.register(confirm, IncomingState.confirming)
+    cbx.register_any(confirm, IncomingState.confirming)
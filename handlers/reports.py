@@ -6,8 +6,10 @@ from sqlalchemy import select, func, and_
 from sqlalchemy.orm import aliased
 
 from database.db import get_session
+from database.product_catalog import catalog as product_catalog
 from database.models import User, Warehouse, Product, StockMovement, ProductStage
 from handlers.common import send_content
+from handlers.callback_index import callback_index
 from keyboards.inline import warehouses_kb, products_page_kb
 
 PAGE_SIZE_REPORTS = 15
@@ -313,7 +315,7 @@ async def rep_pick_article(cb: types.CallbackQuery, user: User, state: FSMContex
 
     SM = aliased(StockMovement)
     async with get_session() as session:
-        product = await session.get(Product, product_id)
+        product = await product_catalog.get(product_id, session)
         if not product or not product.is_active:
             await send_content(cb, "🚫 Товар не найден или неактивен.")
             return
@@ -380,22 +382,23 @@ async def rep_back_to_warehouses(cb: types.CallbackQuery, user: User, state: FSM
 
 # ===== Регистрация =====
 def register_reports_handlers(dp: Dispatcher):
+    cbx = callback_index(dp)
     # Корень раздела
-    dp.callback_query.register(reports_root, lambda c: c.data == "reports")
+    cbx.register_exact(reports_root, "reports")
 
     # Просмотр остатков (через отчёты)
-    dp.callback_query.register(rep_view,           lambda c: c.data == "rep_view")
-    dp.callback_query.register(rep_pick_warehouse, lambda c: c.data.startswith("rep_wh:"))
+    cbx.register_exact(rep_view,            "rep_view")
+    cbx.register_prefix(rep_pick_warehouse, "rep_wh:")
 
     # Типы отчётов
-    dp.callback_query.register(rep_all,    lambda c: c.data == "rep_all")
-    dp.callback_query.register(rep_packed, lambda c: c.data == "rep_packed")
-    dp.callback_query.register(rep_article, lambda c: c.data == "rep_article")
+    cbx.register_exact(rep_all,     "rep_all")
+    cbx.register_exact(rep_packed,  "rep_packed")
+    cbx.register_exact(rep_article, "rep_article")
 
     # Пагинация и выбор артикула
-    dp.callback_query.register(rep_articles_page_handler, lambda c: c.data.startswith("rep_art_page:"))
-    dp.callback_query.register(rep_pick_article,          lambda c: c.data.startswith("rep_art:"))
+    cbx.register_prefix(rep_articles_page_handler, "rep_art_page:")
+    cbx.register_prefix(rep_pick_article,          "rep_art:")
 
     # Навигация назад
-    dp.callback_query.register(rep_back_to_types,      lambda c: c.data == "rep_back_to_types")
-    dp.callback_query.register(rep_back_to_warehouses, lambda c: c.data == "rep_back_to_wh")
+    cbx.register_exact(rep_back_to_types,      "rep_back_to_types")
+    cbx.register_exact(rep_back_to_warehouses, "rep_back_to_wh")
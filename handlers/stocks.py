@@ -6,8 +6,10 @@ from sqlalchemy import select, func, and_
 from sqlalchemy.orm import aliased
 
 from database.db import get_session
+from database.product_catalog import catalog as product_catalog
 from database.models import User, Warehouse, Product, StockMovement, ProductStage
 from handlers.common import send_content
+from handlers.callback_index import callback_index
 from keyboards.inline import warehouses_kb, products_page_kb
 
 
@@ -313,7 +315,7 @@ async def pick_article(cb: types.CallbackQuery, user: User, state: FSMContext):
 
     SM = aliased(StockMovement)
     async with get_session() as session:
-        product = await session.get(Product, product_id)
+        product = await product_catalog.get(product_id, session)
         if not product or not product.is_active:
             await send_content(cb, "🚫 Товар не найден или неактивен.")
             return
@@ -368,15 +370,16 @@ async def back_to_warehouses(cb: types.CallbackQuery, user: User, state: FSMCont
 
 
 def register_stocks_handlers(dp: Dispatcher):
-    dp.callback_query.register(stocks_root, lambda c: c.data == "stocks")
-    dp.callback_query.register(stocks_view, lambda c: c.data == "stocks_view")
+    cbx = callback_index(dp)
+    cbx.register_exact(stocks_root, "stocks")
+    cbx.register_exact(stocks_view, "stocks_view")
 
     # Флоу для просмотра/отчёта
-    dp.callback_query.register(pick_warehouse_for_view, lambda c: c.data.startswith("pr_wh:"))
-    dp.callback_query.register(report_all, lambda c: c.data == "report_all")
-    dp.callback_query.register(report_packed, lambda c: c.data == "report_packed")  # <— НОВОЕ
-    dp.callback_query.register(report_article, lambda c: c.data == "report_article")
-    dp.callback_query.register(report_articles_page_handler, lambda c: c.data.startswith("report_art_page:"))
-    dp.callback_query.register(pick_article, lambda c: c.data.startswith("report_art:"))
-    dp.callback_query.register(back_to_report_type, lambda c: c.data == "back_to_report_type")
-    dp.callback_query.register(back_to_warehouses, lambda c: c.data == "stocks_back_to_wh")
+    cbx.register_prefix(pick_warehouse_for_view, "pr_wh:")
+    cbx.register_exact(report_all, "report_all")
+    cbx.register_exact(report_packed, "report_packed")  # <— НОВОЕ
+    cbx.register_exact(report_article, "report_article")
+    cbx.register_prefix(report_articles_page_handler, "report_art_page:")
+    cbx.register_prefix(pick_article, "report_art:")
+    cbx.register_exact(back_to_report_type, "back_to_report_type")
+    cbx.register_exact(back_to_warehouses, "stocks_back_to_wh")
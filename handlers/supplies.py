@@ -11,14 +11,19 @@ from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
 
-from database.db import get_session, available_packed
+from database.db import get_session, available_packed_many
+from database.product_search import filter_rows
+from database.product_catalog import catalog as product_catalog
 from database.models import (
     Warehouse, Product, StockMovement,
     Supply, SupplyItem, SupplyBox, SupplyFile, User,
     MovementType, ProductStage, UserRole, SupplyStatus
 )
+from handlers.callback_index import callback_index
+from keyboards.callbacks import SupAdd
 
 router = Router()
+cbx = callback_index(router)
 
 PAGE = 10
 
@@ -27,6 +32,7 @@ class SupFSM(StatesGroup):
     MP = State()
     WH = State()
     ITEMS = State()
+    SEARCH = State()
     QTY = State()
     CONFIRM = State()
 
@@ -78,12 +84,13 @@ def kb_wh_list(warehouses, page=0) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
-def kb_products_packed(products, page: int, wh_id: int) -> InlineKeyboardMarkup:
+def kb_products_packed(products, page: int, wh_id: int, search: str | None = None) -> InlineKeyboardMarkup:
+    products = filter_rows(products, search)
     start = page * PAGE
     chunk = products[start:start + PAGE]
     rows = [[InlineKeyboardButton(
         text=f"{name} (art. {article}) — PACKED {packed}",
-        callback_data=f"sup:add:{wh_id}:{pid}"
+        callback_data=SupAdd(wh_id, pid).pack()
     )] for pid, name, article, packed in chunk]
     nav = []
     if start > 0:
@@ -91,6 +98,8 @@ def kb_products_packed(products, page: int, wh_id: int) -> InlineKeyboardMarkup:
     if start + PAGE < len(products):
         nav.append(InlineKeyboardButton(text="➡️", callback_data=f"sup:prod:page:{page + 1}"))
     if nav: rows.append(nav)
+    rows.append([InlineKeyboardButton(text=("🔎 Изменить поиск" if search else "🔎 Поиск"),
+                                      callback_data="sup:prod:search")])
     rows.append([InlineKeyboardButton(text="📩 Сохранить черновик", callback_data="sup:submit")])
     rows.append([InlineKeyboardButton(text="❌ Отмена", callback_data="sup:cancel")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
@@ -287,13 +296,13 @@ async def _render_supply_card(call_or_msg, s_id: int, user: User):
 
 
 # ---------- Entry ----------
-@router.callback_query(F.data == "supplies")
+@cbx.exact("supplies")
 async def supplies_root(call: types.CallbackQuery, user: User):
     await call.answer()
     await call.message.edit_text("Раздел «Поставки»", reply_markup=kb_sup_tabs(user.role))
 
 
-@router.callback_query(F.data.startswith("sup:list:"))
+@cbx.prefix("sup:list:")
 async def sup_list(call: types.CallbackQuery, user: User):
     _, _, tab, page_s = call.data.split(":")
     if tab == "auto":
@@ -303,21 +312,21 @@ async def sup_list(call: types.CallbackQuery, user: User):
     await call.message.edit_text(f"Поставки — {tab}", reply_markup=_kb_sup_list(tab, s_list, page, has_next))
 
 
-@router.callback_query(F.data.startswith("sup:open:"))
+@cbx.prefix("sup:open:")
 async def sup_open(call: types.CallbackQuery, user: User):
     sid = int(call.data.split(":")[-1])
     await _render_supply_card(call, sid, user)
 
 
 # ---------- Create (FSM) ----------
-@router.callback_query(F.data == "sup:new")
+@cbx.exact("sup:new")
 async def sup_new(call: types.CallbackQuery, state: FSMContext):
     await state.clear()
     await state.set_state(SupFSM.MP)
     await call.message.edit_text("Выберите маркетплейс:", reply_markup=kb_mp())
 
 
-@router.callback_query(SupFSM.MP, F.data.startswith("sup:mp:"))
+@cbx.prefix("sup:mp:", SupFSM.MP)
 async def sup_pick_mp(call: types.CallbackQuery, state: FSMContext):
     mp = call.data.split(":")[-1]  # wb|ozon
     await state.update_data(mp=mp)
@@ -326,36 +335,55 @@ async def sup_pick_mp(call: types.CallbackQuery, state: FSMContext):
     await call.message.edit_text("Выберите склад-источник:", reply_markup=kb_wh_list(ws, 0))
 
 
-@router.callback_query(SupFSM.WH, F.data.startswith("sup:wh:page:"))
+@cbx.prefix("sup:wh:page:", SupFSM.WH)
 async def sup_wh_page(call: types.CallbackQuery, state: FSMContext):
     page = int(call.data.split(":")[-1])
     ws = await _warehouses_list()
     await call.message.edit_reply_markup(reply_markup=kb_wh_list(ws, page))
 
 
-@router.callback_query(SupFSM.WH, F.data.startswith("sup:wh:"))
+@cbx.prefix("sup:wh:", SupFSM.WH)
 async def sup_wh_pick(call: types.CallbackQuery, state: FSMContext):
     wh_id = int(call.data.split(":")[-1])
     async with get_session() as s:
         products = await _products_with_packed(s, wh_id)
-    await state.update_data(wh_id=wh_id, products=products, page=0, cart={})
+    await state.update_data(wh_id=wh_id, products=products, page=0, cart={}, search=None)
     await state.set_state(SupFSM.ITEMS)
     await call.message.edit_text("Добавьте позиции (из упакованного PACKED):",
                                  reply_markup=kb_products_packed(products, 0, wh_id))
 
 
-@router.callback_query(SupFSM.ITEMS, F.data.startswith("sup:prod:page:"))
+@cbx.prefix("sup:prod:page:", SupFSM.ITEMS)
 async def sup_products_page(call: types.CallbackQuery, state: FSMContext):
     page = int(call.data.split(":")[-1])
     data = await state.get_data()
     await state.update_data(page=page)
-    await call.message.edit_reply_markup(reply_markup=kb_products_packed(data["products"], page, data["wh_id"]))
+    await call.message.edit_reply_markup(
+        reply_markup=kb_products_packed(data["products"], page, data["wh_id"], data.get("search"))
+    )
+
 
+@cbx.exact("sup:prod:search", SupFSM.ITEMS)
+async def sup_products_search(call: types.CallbackQuery, state: FSMContext):
+    await state.set_state(SupFSM.SEARCH)
+    await call.message.answer("🔎 Введите часть названия или артикул (« - » — сбросить поиск):")
+    await call.answer()
 
-@router.callback_query(SupFSM.ITEMS, F.data.startswith("sup:add:"))
-async def sup_add_product(call: types.CallbackQuery, state: FSMContext):
-    _, _, wh, pid = call.data.split(":")
-    await state.update_data(cur_pid=int(pid))
+
+@router.message(SupFSM.SEARCH)
+async def sup_products_search_input(msg: types.Message, state: FSMContext):
+    search = (msg.text or "").strip()
+    search = None if search in ("", "-") else search
+    data = await state.get_data()
+    await state.update_data(search=search, page=0)
+    await state.set_state(SupFSM.ITEMS)
+    title = "Добавьте позиции (из упакованного PACKED):" + (f"\n🔎 Поиск: {search}" if search else "")
+    await msg.answer(title, reply_markup=kb_products_packed(data["products"], 0, data["wh_id"], search))
+
+
+@cbx.data(SupAdd, SupFSM.ITEMS)
+async def sup_add_product(call: types.CallbackQuery, state: FSMContext, callback_data: SupAdd):
+    await state.update_data(cur_pid=callback_data.product_id)
     await state.set_state(SupFSM.QTY)
     await call.message.edit_text("Введите количество для добавления в поставку:")
 
@@ -380,9 +408,8 @@ async def sup_qty_input(msg: types.Message, state: FSMContext):
     await state.update_data(cart=cart)
     await state.set_state(SupFSM.CONFIRM)
 
-    async with get_session() as s:
-        prod = (await s.execute(select(Product.name, Product.article).where(Product.id == pid))).first()
-    name, article = prod
+    rec = await product_catalog.get(pid)
+    name, article = (rec.name, rec.article) if rec else (f"#{pid}", None)
     await msg.answer(
         f"Добавлено: {name} (art. {article}) — {qty}\n{warn}\n"
         f"Что дальше?",
@@ -390,18 +417,18 @@ async def sup_qty_input(msg: types.Message, state: FSMContext):
     )
 
 
-@router.callback_query(SupFSM.CONFIRM, F.data == "sup:more")
+@cbx.exact("sup:more", SupFSM.CONFIRM)
 async def sup_more(call: types.CallbackQuery, state: FSMContext):
     data = await state.get_data()
     async with get_session() as s:
         products = await _products_with_packed(s, data["wh_id"])
-    await state.update_data(products=products, page=0)
+    await state.update_data(products=products, page=0, search=None)
     await state.set_state(SupFSM.ITEMS)
     await call.message.edit_text("Добавьте позиции (из упакованного PACKED):",
                                  reply_markup=kb_products_packed(products, 0, data["wh_id"]))
 
 
-@router.callback_query(SupFSM.CONFIRM, F.data == "sup:submit")
+@cbx.exact("sup:submit", SupFSM.CONFIRM)
 async def sup_submit(call: types.CallbackQuery, state: FSMContext, user: User):
     data = await state.get_data()
     cart: Dict[int, int] = data.get("cart", {})
@@ -436,7 +463,7 @@ async def sup_submit(call: types.CallbackQuery, state: FSMContext, user: User):
 
 
 # ---------- Status transitions ----------
-@router.callback_query(F.data.startswith("sup:queue:"))
+@cbx.prefix("sup:queue:")
 async def sup_to_queue(call: types.CallbackQuery, user: User):
     sid = int(call.data.split(":")[-1])
     async with get_session() as s:
@@ -450,7 +477,7 @@ async def sup_to_queue(call: types.CallbackQuery, user: User):
     await _render_supply_card(call, sid, user)
 
 
-@router.callback_query(F.data.startswith("sup:assign:"))
+@cbx.prefix("sup:assign:")
 async def sup_assign(call: types.CallbackQuery, user: User):
     sid = int(call.data.split(":")[-1])
     async with get_session() as s:
@@ -463,7 +490,7 @@ async def sup_assign(call: types.CallbackQuery, user: User):
     await _render_supply_card(call, sid, user)
 
 
-@router.callback_query(F.data.startswith("sup:assembled:"))
+@cbx.prefix("sup:assembled:")
 async def sup_mark_assembled(call: types.CallbackQuery, user: User):
     sid = int(call.data.split(":")[-1])
     async with get_session() as s:
@@ -476,7 +503,7 @@ async def sup_mark_assembled(call: types.CallbackQuery, user: User):
     await _render_supply_card(call, sid, user)
 
 
-@router.callback_query(F.data.startswith("sup:post:"))
+@cbx.prefix("sup:post:")
 async def sup_post(call: types.CallbackQuery, user: User):
     sid = int(call.data.split(":")[-1])
     async with get_session() as s:
@@ -484,9 +511,10 @@ async def sup_post(call: types.CallbackQuery, user: User):
         if not sup: return await call.answer("Не найдена", show_alert=True)
         if sup.status != SupplyStatus.assembled: return await call.answer("Только из 'assembled'", show_alert=True)
 
-        # Валидация доступности PACKED c учетом резервов
+        # Валидация доступности PACKED c учетом резервов (одним заходом по всем позициям)
+        avail = await available_packed_many(s, sup.warehouse_id, [it.product_id for it in sup.items])
         for it in sup.items:
-            can = await available_packed(s, sup.warehouse_id, it.product_id)
+            can = avail.get(it.product_id, 0)
             if it.qty > can:
                 return await call.answer(f"Недостаточно PACKED по товару {it.product_id}: доступно {can}, нужно {it.qty}", show_alert=True)
 
@@ -513,7 +541,7 @@ async def sup_post(call: types.CallbackQuery, user: User):
     await _render_supply_card(call, sid, user)
 
 
-@router.callback_query(F.data.startswith("sup:delivered:"))
+@cbx.prefix("sup:delivered:")
 async def sup_delivered(call: types.CallbackQuery, user: User):
     sid = int(call.data.split(":")[-1])
     async with get_session() as s:
@@ -527,7 +555,7 @@ async def sup_delivered(call: types.CallbackQuery, user: User):
     await _render_supply_card(call, sid, user)
 
 
-@router.callback_query(F.data.startswith("sup:return:"))
+@cbx.prefix("sup:return:")
 async def sup_return(call: types.CallbackQuery, user: User):
     sid = int(call.data.split(":")[-1])
     async with get_session() as s:
@@ -558,7 +586,7 @@ async def sup_return(call: types.CallbackQuery, user: User):
     await _render_supply_card(call, sid, user)
 
 
-@router.callback_query(F.data.startswith("sup:unpost:"))
+@cbx.prefix("sup:unpost:")
 async def sup_unpost(call: types.CallbackQuery, user: User):
     sid = int(call.data.split(":")[-1])
     async with get_session() as s:
@@ -590,7 +618,7 @@ async def sup_unpost(call: types.CallbackQuery, user: User):
 
 
 # ---------- Boxes (MVP действия) ----------
-@router.callback_query(F.data.startswith("sup:box:add:"))
+@cbx.prefix("sup:box:add:")
 async def sup_box_add(call: types.CallbackQuery, user: User):
     sid = int(call.data.split(":")[-1])
     async with get_session() as s:
@@ -605,7 +633,7 @@ async def sup_box_add(call: types.CallbackQuery, user: User):
     await _render_supply_card(call, sid, user)
 
 
-@router.callback_query(F.data.startswith("sup:box:seal_all:"))
+@cbx.prefix("sup:box:seal_all:")
 async def sup_box_seal_all(call: types.CallbackQuery, user: User):
     sid = int(call.data.split(":")[-1])
     async with get_session() as s:
@@ -616,7 +644,7 @@ async def sup_box_seal_all(call: types.CallbackQuery, user: User):
     await _render_supply_card(call, sid, user)
 
 
-@router.callback_query(F.data.startswith("sup:box:unseal_all:"))
+@cbx.prefix("sup:box:unseal_all:")
 async def sup_box_unseal_all(call: types.CallbackQuery, user: User):
     sid = int(call.data.split(":")[-1])
     async with get_session() as s:
@@ -628,7 +656,7 @@ async def sup_box_unseal_all(call: types.CallbackQuery, user: User):
 
 
 # ---------- Files (PDF) ----------
-@router.callback_query(F.data.startswith("sup:file:add:"))
+@cbx.prefix("sup:file:add:")
 async def sup_file_add_hint(call: types.CallbackQuery, state: FSMContext):
     sid = int(call.data.split(":")[-1])
     await state.update_data(upload_sup_id=sid)
@@ -651,7 +679,7 @@ async def sup_file_upload(msg: types.Message, user: User, state: FSMContext):
 
 
 # ---------- Cancel (FSM) ----------
-@router.callback_query(F.data == "sup:cancel")
+@cbx.exact("sup:cancel")
 async def sup_cancel(call: types.CallbackQuery, state: FSMContext):
     await state.clear()
     await call.message.edit_text("Операция отменена.", reply_markup=kb_sup_tabs(UserRole.manager))  # роль не знаем тут ⇒ вернёмся из меню
@@ -0,0 +1,325 @@
+# keyboards/callbacks.py
+# Типизированные callback_data с компактной упаковкой.
+#
+# Вместо ручных строк f"sup:add:{wh_id}:{pid}" и разбора last_int()/split(":") в каждом хендлере:
+#
+#   @dataclass(frozen=True)
+#   class SupAdd(PackedCallback, prefix="sa", legacy="sup:add"):
+#       wh_id: int
+#       product_id: int
+#
+#   InlineKeyboardButton(text=…, callback_data=SupAdd(wh_id, pid).pack())   # "~sa:3:2n9"
+#
+#   @cbx.data(SupAdd)                       # handlers.callback_index
+#   async def sup_add(cb, callback_data: SupAdd): …
+#
+# Формат: "~<prefix>:<поле>:<поле>…", поля:
+#   int            — base-36 (id 1 000 000 → "lfls");
+#   bool           — "1" / "0";
+#   str            — как есть (без ":"), для коротких режимов ("cargo", "next");
+#   Tuple[int,...] — varint (LEB128) + base64url: списки id/фильтров/курсоров;
+#   Optional[...]  — None → пустое поле, хвостовые пустые поля не пишутся.
+# Итог проверяется на лимит Telegram в 64 байта (ValueError при превышении).
+#
+# legacy — префикс старой строки ("cn:photos"): кнопки в уже отправленных сообщениях
+# ("cn:photos:12:3") декодируются в тот же класс (поля — десятичные, по порядку).
+# Разбор — один раз на апдейт (CallbackDataMiddleware), результат кэшируется по строке.
+from __future__ import annotations
+
+import base64
+import dataclasses
+import functools
+import typing
+from typing import ClassVar, Dict, Iterable, List, Optional, Tuple, Type
+
+SIGIL = "~"
+SEP = ":"
+MAX_BYTES = 64
+_B36 = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+_REGISTRY: Dict[str, Type["PackedCallback"]] = {}
+_LEGACY: Dict[str, Type["PackedCallback"]] = {}
+
+
+# ---------------------------
+# Кодеки
+# ---------------------------
+def b36encode(n: int) -> str:
+    if n < 0:
+        return "-" + b36encode(-n)
+    out = ""
+    while True:
+        n, r = divmod(n, 36)
+        out = _B36[r] + out
+        if not n:
+            return out
+
+
+def b36decode(s: str) -> int:
+    return int(s, 36)
+
+
+def varint_pack(values: Iterable[int]) -> str:
+    buf = bytearray()
+    for v in values:
+        if v < 0:
+            raise ValueError("varint fields hold non-negative ints only")
+        while True:
+            byte, v = v & 0x7F, v >> 7
+            buf.append(byte | (0x80 if v else 0))
+            if not v:
+                break
+    return base64.urlsafe_b64encode(bytes(buf)).decode().rstrip("=")
+
+
+def varint_unpack(s: str) -> Tuple[int, ...]:
+    raw = base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+    out: List[int] = []
+    value = shift = 0
+    for byte in raw:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        out.append(value)
+        value = shift = 0
+    if shift:
+        raise ValueError("truncated varint")
+    return tuple(out)
+
+
+@dataclasses.dataclass(frozen=True)
+class _Field:
+    name: str
+    kind: str            # "int" | "bool" | "str" | "ints"
+    optional: bool
+    default: object
+
+
+def _kind_of(hint) -> Tuple[str, bool]:
+    optional = False
+    args = typing.get_args(hint)
+    if typing.get_origin(hint) is typing.Union and type(None) in args:
+        optional = True
+        hint = next(a for a in args if a is not type(None))
+    if hint is bool:
+        return "bool", optional
+    if hint is int:
+        return "int", optional
+    if hint is str:
+        return "str", optional
+    if typing.get_origin(hint) is tuple and typing.get_args(hint) == (int, Ellipsis):
+        return "ints", optional
+    raise TypeError(f"unsupported callback field type: {hint!r}")
+
+
+@functools.lru_cache(maxsize=None)
+def _fields(cls: type) -> Tuple[_Field, ...]:
+    hints = typing.get_type_hints(cls)
+    out = []
+    for f in dataclasses.fields(cls):
+        kind, optional = _kind_of(hints[f.name])
+        default = f.default if f.default is not dataclasses.MISSING else dataclasses.MISSING
+        out.append(_Field(f.name, kind, optional, default))
+    return tuple(out)
+
+
+def _encode(f: _Field, value) -> str:
+    if value is None:
+        if not f.optional:
+            raise ValueError(f"{f.name}: None in a required field")
+        return ""
+    if f.kind == "bool":
+        return "1" if value else "0"
+    if f.kind == "int":
+        return b36encode(int(value))
+    if f.kind == "ints":
+        return varint_pack(value)
+    value = str(value)
+    if SEP in value:
+        raise ValueError(f"{f.name}: {SEP!r} is not allowed in str fields")
+    return value
+
+
+def _decode(f: _Field, raw: str, legacy: bool):
+    if raw == "" and (f.optional or f.default is not dataclasses.MISSING):
+        return None if f.default is dataclasses.MISSING else f.default
+    if f.kind == "bool":
+        return raw == "1"
+    if f.kind == "int":
+        return int(raw) if legacy else b36decode(raw)
+    if f.kind == "ints":
+        return tuple(int(x) for x in raw.split(",") if x) if legacy else varint_unpack(raw)
+    return raw
+
+
+# ---------------------------
+# Базовый класс
+# ---------------------------
+class PackedCallback:
+    """База для @dataclass(frozen=True)-классов callback_data; prefix — уникальный короткий код."""
+
+    __prefix__: ClassVar[str] = ""
+    __legacy__: ClassVar[Optional[str]] = None
+
+    def __init_subclass__(cls, prefix: str = "", legacy: Optional[str] = None, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if not prefix or SEP in prefix or prefix.startswith(SIGIL):
+            raise TypeError(f"{cls.__name__}: bad callback prefix {prefix!r}")
+        if prefix in _REGISTRY:
+            raise ValueError(f"{cls.__name__}: callback prefix {prefix!r} already used by {_REGISTRY[prefix].__name__}")
+        cls.__prefix__, cls.__legacy__ = prefix, legacy
+        _REGISTRY[prefix] = cls
+        if legacy:
+            _LEGACY[legacy] = cls
+
+    def pack(self) -> str:
+        parts = [SIGIL + self.__prefix__] + [_encode(f, getattr(self, f.name)) for f in _fields(type(self))]
+        while len(parts) > 1 and parts[-1] == "":
+            parts.pop()
+        data = SEP.join(parts)
+        if len(data.encode()) > MAX_BYTES:
+            raise ValueError(f"callback_data is {len(data.encode())} bytes (limit {MAX_BYTES}): {data!r}")
+        return data
+
+    @classmethod
+    def _from_parts(cls, values: List[str], legacy: bool = False):
+        fields = _fields(cls)
+        if len(values) > len(fields):
+            raise ValueError(f"{cls.__name__}: too many fields")
+        values = values + [""] * (len(fields) - len(values))
+        return cls(**{f.name: _decode(f, raw, legacy) for f, raw in zip(fields, values)})
+
+
+def _legacy_class(parts: List[str]) -> Tuple[Optional[Type[PackedCallback]], int]:
+    for k in range(min(len(parts), 3), 0, -1):
+        cls = _LEGACY.get(SEP.join(parts[:k]))
+        if cls is not None:
+            return cls, k
+    return None, 0
+
+
+@functools.lru_cache(maxsize=4096)
+def unpack(data: str) -> Optional[PackedCallback]:
+    """Объект по строке callback_data (упакованной или legacy); None — не наш формат/битые данные."""
+    try:
+        if data.startswith(SIGIL):
+            prefix, *values = data[len(SIGIL):].split(SEP)
+            cls = _REGISTRY.get(prefix)
+            return cls._from_parts(values) if cls else None
+        if not _LEGACY:
+            return None
+        parts = data.split(SEP)
+        cls, k = _legacy_class(parts)
+        return cls._from_parts(parts[k:], legacy=True) if cls else None
+    except (ValueError, TypeError):
+        return None
+
+
+# ===== Закупка CN =====
+@dataclasses.dataclass(frozen=True)
+class CnList(PackedCallback, prefix="cL", legacy="cn:list"):
+    mode: str
+    direction: Optional[str] = None     # "next" | "prev"
+    cursor: Optional[int] = None        # id крайней строки страницы
+
+
+@dataclasses.dataclass(frozen=True)
+class CnOpen(PackedCallback, prefix="co", legacy="cn:open"):
+    doc_id: int
+
+
+@dataclasses.dataclass(frozen=True)
+class CnItemAdd(PackedCallback, prefix="ci", legacy="cn:item:add"):
+    doc_id: int
+
+
+@dataclasses.dataclass(frozen=True)
+class CnProdList(PackedCallback, prefix="cp", legacy="cn:prod:list"):
+    doc_id: int
+    page: int
+
+
+@dataclasses.dataclass(frozen=True)
+class CnProdSearch(PackedCallback, prefix="cs", legacy="cn:prod:search"):
+    doc_id: int
+    page: int
+
+
+@dataclasses.dataclass(frozen=True)
+class CnProdChoose(PackedCallback, prefix="cc", legacy="cn:prod:choose"):
+    doc_id: int
+    product_id: int
+
+
+@dataclasses.dataclass(frozen=True)
+class CnCommentEdit(PackedCallback, prefix="ce", legacy="cn:comment:edit"):
+    doc_id: int
+
+
+@dataclasses.dataclass(frozen=True)
+class CnStatus(PackedCallback, prefix="ct", legacy="cn:status"):
+    doc_id: int
+    target: str                         # "to_msk"
+
+
+@dataclasses.dataclass(frozen=True)
+class CnPhotoAdd(PackedCallback, prefix="fa", legacy="cn:photo:add"):
+    doc_id: int
+
+
+@dataclasses.dataclass(frozen=True)
+class CnPhotoMore(PackedCallback, prefix="fm", legacy="cn:photo:more"):
+    doc_id: int
+
+
+@dataclasses.dataclass(frozen=True)
+class CnPhotoDone(PackedCallback, prefix="fd", legacy="cn:photo:done"):
+    doc_id: int
+
+
+@dataclasses.dataclass(frozen=True)
+class CnPhotos(PackedCallback, prefix="fv", legacy="cn:photos"):
+    doc_id: int
+    page: int                           # с 1, одно фото на страницу
+
+
+# ===== Склад МСК =====
+@dataclasses.dataclass(frozen=True)
+class MskList(PackedCallback, prefix="mL", legacy="msk:list"):
+    mode: str
+    direction: Optional[str] = None
+    cursor: Optional[int] = None
+
+
+@dataclasses.dataclass(frozen=True)
+class MskOpen(PackedCallback, prefix="mo", legacy="msk:open"):
+    msk_id: int
+
+
+@dataclasses.dataclass(frozen=True)
+class MskOpenByCn(PackedCallback, prefix="mc", legacy="msk:open:by_cn"):
+    cn_id: int
+
+
+@dataclasses.dataclass(frozen=True)
+class MskToOur(PackedCallback, prefix="mt", legacy="msk:to_our"):
+    msk_id: int
+
+
+@dataclasses.dataclass(frozen=True)
+class MskWhChoose(PackedCallback, prefix="mw", legacy="msk:whchoose"):
+    msk_id: int
+    wh_id: int
+
+
+@dataclasses.dataclass(frozen=True)
+class MskDeliver(PackedCallback, prefix="md", legacy="msk:deliver"):
+    msk_id: int
+
+
+# ===== Поставки =====
+@dataclasses.dataclass(frozen=True)
+class SupAdd(PackedCallback, prefix="sa", legacy="sup:add"):
+    wh_id: int
+    product_id: int
@@ -61,12 +61,15 @@ def products_page_kb(
         show_cancel: bool = False,
         cancel_to: str = "cancel",
         trim_len: int = 48,
+        search_cb: Optional[str] = None,
+        search_active: bool = False,
 ) -> InlineKeyboardMarkup:
     """
     Список товаров с пагинацией.
     callback_data:
       - <item_prefix>:<product_id>
       - <page_prefix>:<page>
+      - search_cb (опц.) — кнопка «Поиск» / «Изменить поиск»
       - back_to (например, rcv_back_wh / stocks_back_wh / reports_back)
     """
     rows: List[List[InlineKeyboardButton]] = []
@@ -94,6 +97,12 @@ def products_page_kb(
     if pag_row:
         rows.append(pag_row)
 
+    if search_cb:
+        rows.append([InlineKeyboardButton(
+            text=("🔎 Изменить поиск" if search_active else "🔎 Поиск"),
+            callback_data=search_cb,
+        )])
+
     # Назад / Отмена
     if back_to:
         last_row: List[InlineKeyboardButton] = [InlineKeyboardButton(text="⬅️ Назад", callback_data=back_to)]
@@ -0,0 +1,59 @@
+# middleware/metrics.py
+# Outer middleware: латентность, ошибки и SQL на апдейт в разрезе хендлера (utils/metrics.py).
+#
+# Хендлер определяется без прогона фильтров, по самому апдейту:
+#   • callback — класс типизированной callback_data ("CnPhotos") или пространство имён
+#     строки ("report_all", "bk"): ставить ПОСЛЕ CallbackDataMiddleware, ключ уже разобран;
+#   • message  — команда ("/start"), иначе состояние FSM ("SupFSM:QTY"), иначе "text"/тип контента.
+# Набор значений ограничен кодом бота — кардинальность меток не растёт от пользовательского ввода.
+from __future__ import annotations
+
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from database.sql_stats import track_sql
+from handlers.callback_index import parse_callback
+from utils.metrics import UPDATE_ERRORS, UPDATE_SECONDS, UPDATE_SQL_SECONDS, UPDATE_SQL_STATEMENTS
+
+
+def handler_label(event: TelegramObject, data: Dict[str, Any]) -> tuple:
+    """(event, handler) — метки для метрик апдейта."""
+    if isinstance(event, CallbackQuery):
+        obj = data.get("callback_data")
+        if obj is not None:
+            return "callback", type(obj).__name__
+        key = data.get("callback_key") or parse_callback(event.data or "")
+        return "callback", key.namespace or "empty"
+    if isinstance(event, Message):
+        text = event.text or ""
+        if text.startswith("/"):
+            return "message", text.split(maxsplit=1)[0].split("@", 1)[0]
+        state = data.get("raw_state")
+        if state:
+            return "message", state
+        return "message", event.content_type if text == "" else "text"
+    return type(event).__name__.lower(), "-"
+
+
+class MetricsMiddleware(BaseMiddleware):
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        labels = handler_label(event, data)
+        t0 = time.perf_counter()
+        with track_sql(labels[1]) as sql:
+            try:
+                return await handler(event, data)
+            except Exception as e:
+                UPDATE_ERRORS.inc(*labels, type(e).__name__)
+                raise
+            finally:
+                UPDATE_SECONDS.observe(time.perf_counter() - t0, *labels)
+                UPDATE_SQL_STATEMENTS.observe(sql.statements, *labels)
+                UPDATE_SQL_SECONDS.observe(sql.seconds, *labels)
@@ -10,11 +10,24 @@ from sqlalchemy import select
 
 from database.db import get_session
 from database.models import BackupSettings, BackupFrequency
+from scheduler.leader import leader
 from utils.backup import run_backup
+from utils.backup_verify import maybe_test_restore
+from utils.jobs import jobs, JobBusy, JobContext, JobInfo
+from utils.notify import notify_admin
 
 JOB_ID = "warehouse_backup_job"
 logger = logging.getLogger(__name__)
 
+# настройки, по которым повешена джоба у ведущего (sync_backup_schedule сравнивает с БД)
+_applied: tuple | None = None
+
+
+def _signature(st: BackupSettings | None) -> tuple:
+    if not st or not st.enabled:
+        return (False,)
+    return (True, st.frequency, st.time_hour, st.time_minute)
+
 
 def _calc_trigger(st: BackupSettings, tzname: str) -> CronTrigger:
     tz = pytz.timezone(tzname)
@@ -32,7 +45,15 @@ def _calc_trigger(st: BackupSettings, tzname: str) -> CronTrigger:
 async def reschedule_backup(scheduler: AsyncIOScheduler, tzname: str, db_url: str) -> None:
     """
     Снимает старую задачу и вешает новую по настройкам из БД (id=1).
+    Только в ведущем процессе (scheduler/leader.py); остальные воркеры задачу не держат —
+    ведущий подхватит изменённые настройки через sync_backup_schedule().
     """
+    global _applied
+    if not leader.is_leader:
+        unschedule_backup(scheduler)
+        logger.info("Backup job is managed by the leader process — skipped here")
+        return
+
     # 1) Читаем настройки
     async with get_session() as s:
         st: BackupSettings | None = (
@@ -47,6 +68,7 @@ async def reschedule_backup(scheduler: AsyncIOScheduler, tzname: str, db_url: st
         pass
 
     # 3) Проверяем, надо ли планировать
+    _applied = _signature(st)
     if not st or not st.enabled:
         logger.info("Backups are disabled or settings missing — job not scheduled")
         return
@@ -54,15 +76,51 @@ async def reschedule_backup(scheduler: AsyncIOScheduler, tzname: str, db_url: st
     # 4) Считаем триггер и навешиваем джобу
     trigger = _calc_trigger(st, tzname)
 
-    async def _job():
+    async def _work(ctx: JobContext) -> str:
         ok, msg = await run_backup(db_url)
-        if ok:
-            logger.info(f"[BACKUP] {msg}")
-        else:
-            logger.error(f"[BACKUP] {msg}")
-        # здесь при желании можно уведомлять админа в TG
+        if not ok:
+            raise RuntimeError(msg)
+        logger.info(f"[BACKUP] {msg}")
+        await ctx.progress("test restore check", force=True)
+        await maybe_test_restore(db_url)
+        return msg
+
+    async def _done(job: JobInfo) -> None:
+        if job.state != "done":
+            logger.error(f"[BACKUP] {job.result}")
+            await notify_admin(f"❌ Плановый бэкап не выполнен\n{job.result}")
+
+    async def _job():
+        # через utils.jobs: не пересекается с ручным бэкапом/тест-восстановлением, виден в /jobs
+        try:
+            await jobs.submit("backup", _work, on_done=_done)
+        except JobBusy as e:
+            logger.warning(f"[BACKUP] scheduled run skipped: {e}")
 
     scheduler.add_job(_job, trigger=trigger, id=JOB_ID, replace_existing=True)
     logger.info(
         f"Backup job scheduled: {st.frequency.name} at {st.time_hour:02d}:{st.time_minute:02d} ({tzname})"
     )
+
+
+def unschedule_backup(scheduler: AsyncIOScheduler) -> None:
+    """Снять плановый бэкап (процесс перестал быть ведущим)."""
+    global _applied
+    _applied = None
+    try:
+        scheduler.remove_job(JOB_ID)
+    except Exception:
+        pass
+
+
+async def sync_backup_schedule(scheduler: AsyncIOScheduler, tzname: str, db_url: str) -> None:
+    """
+    Периодически у ведущего: настройки могли поменять в админке другого воркера —
+    перевешиваем джобу, только если они отличаются от применённых.
+    """
+    if not leader.is_leader:
+        return
+    async with get_session() as s:
+        st = (await s.execute(select(BackupSettings).where(BackupSettings.id == 1))).scalar_one_or_none()
+    if _signature(st) != _applied:
+        await reschedule_backup(scheduler, tzname, db_url)
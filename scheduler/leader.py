@@ -0,0 +1,111 @@
+# scheduler/leader.py
+# Выбор «ведущего» процесса через PostgreSQL advisory lock: плановые задачи (бэкап) ведёт один
+# процесс, даже если воркеров бота несколько.
+#
+#   leader.start(on_elected=..., on_lost=...)   # фоновая задача: захват/проверка раз в LEADER_RETRY_SEC
+#   leader.is_leader                            # True — этот процесс держит замок
+#   await leader.stop()                         # отпустить замок (другой процесс подхватит)
+#
+# Замок сессионный (pg_try_advisory_lock) и живёт, пока открыто соединение: отдельный engine без
+# пула и в AUTOCOMMIT (не висим «idle in transaction»), reset_db_engine() после restore его не трогает.
+# Упало соединение/процесс — Postgres снимает замок сам, следующий воркер захватит его в течение
+# LEADER_RETRY_SEC; бывший ведущий, заметив обрыв, снимает свои плановые задачи (on_lost).
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from config import DB_URL, LEADER_LOCK_KEY, LEADER_RETRY_SEC
+
+logger = logging.getLogger(__name__)
+
+Callback = Callable[[], Awaitable[None]]
+
+
+class Leadership:
+    def __init__(self, lock_key: int, retry_sec: float):
+        self.lock_key = lock_key
+        self.retry_sec = retry_sec
+        self.is_leader = False
+        self._engine = None
+        self._conn: Optional[AsyncConnection] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, on_elected: Callback, on_lost: Callback) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(on_elected, on_lost), name="leader-election")
+
+    async def _close_conn(self) -> None:
+        if self._conn is not None:
+            with contextlib.suppress(Exception):
+                await self._conn.close()
+            self._conn = None
+
+    async def _tick(self) -> bool:
+        """Один шаг: проверить удерживаемый замок или попытаться захватить; True — мы ведущий."""
+        if self._conn is not None:
+            await self._conn.execute(text("SELECT 1"))   # соединение живо → замок наш
+            return True
+        if self._engine is None:
+            self._engine = create_async_engine(DB_URL, poolclass=NullPool, isolation_level="AUTOCOMMIT")
+        conn = await self._engine.connect()
+        try:
+            got = await conn.scalar(text("SELECT pg_try_advisory_lock(:k)"), {"k": self.lock_key})
+        except Exception:
+            await conn.close()
+            raise
+        if not got:
+            await conn.close()
+            return False
+        self._conn = conn
+        return True
+
+    async def _loop(self, on_elected: Callback, on_lost: Callback) -> None:
+        while True:
+            try:
+                leading = await self._tick()
+            except Exception as e:
+                logger.warning("Leader lock check failed: %r", e)
+                await self._close_conn()
+                leading = False
+
+            if leading and not self.is_leader:
+                self.is_leader = True
+                logger.info("Leader lock %s acquired — this process runs scheduled jobs", self.lock_key)
+                try:
+                    await on_elected()
+                except Exception:
+                    logger.exception("Leader on_elected failed")
+            elif not leading and self.is_leader:
+                self.is_leader = False
+                logger.warning("Leader lock %s lost — scheduled jobs removed", self.lock_key)
+                try:
+                    await on_lost()
+                except Exception:
+                    logger.exception("Leader on_lost failed")
+
+            await asyncio.sleep(self.retry_sec)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._conn is not None:
+            with contextlib.suppress(Exception):
+                await self._conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": self.lock_key})
+        await self._close_conn()
+        self.is_leader = False
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = None
+
+
+leader = Leadership(LEADER_LOCK_KEY, LEADER_RETRY_SEC)
@@ -0,0 +1,129 @@
+# scripts/backup_bench.py
+# Сравнение вариантов pg_dump на реальной базе: формат × сжатие × потоки.
+#
+#   python scripts/backup_bench.py                          # матрица по умолчанию, DB_URL из .env
+#   python scripts/backup_bench.py --jobs 1,4 --compress gzip:1,gzip:6,zstd:3 --out report.md
+#
+# Каждый вариант выгружается во временный каталог (в хранилище ничего не уходит),
+# замеряются время и размер; в конце печатается markdown-таблица.
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + "/.."))
+
+from config import DB_URL  # noqa: E402
+from utils.backup import (  # noqa: E402
+    COMPRESSION_CHOICES,
+    _pg_dump_cmd,
+    _pg_env,
+    _resolve_pg_dump,
+    compression_args,
+    parse_db_url,
+    pg_dump_major,
+)
+
+
+def _size(path: Path) -> int:
+    if path.is_file():
+        return path.stat().st_size
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+async def _run(cmd: list[str], env: dict, stdout_path: Path | None) -> None:
+    out = open(stdout_path, "wb") if stdout_path else None
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdout=out or asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE, env=env
+        )
+        _, err = await proc.communicate()
+    finally:
+        if out:
+            out.close()
+    if proc.returncode != 0:
+        raise RuntimeError((err or b"").decode(errors="ignore")[:300])
+
+
+async def bench(db_url: str, formats: list[str], compress: list[str], jobs: list[int]) -> list[dict]:
+    pg_dump_bin = _resolve_pg_dump()
+    if not pg_dump_bin:
+        raise SystemExit("pg_dump not found (PATH / PG_DUMP_PATH)")
+    major = await pg_dump_major(pg_dump_bin)
+    params = parse_db_url(db_url)
+    env = _pg_env(params)
+
+    results: list[dict] = []
+    for fmt in formats:
+        for spec in compress:
+            for j in (jobs if fmt == "directory" else [1]):
+                args, used = compression_args(spec, major)
+                tmp = Path(tempfile.mkdtemp(prefix="botwb_bench_"))
+                try:
+                    if fmt == "directory":
+                        target = tmp / "dump"
+                        cmd = _pg_dump_cmd(pg_dump_bin, params, args, fmt="directory", out_dir=str(target), jobs=j)
+                        stdout_path = None
+                    else:
+                        target = tmp / "dump.backup"
+                        cmd = _pg_dump_cmd(pg_dump_bin, params, args)
+                        stdout_path = target
+                    t0 = time.monotonic()
+                    row = {"format": fmt, "compression": used, "jobs": j}
+                    try:
+                        await _run(cmd, env, stdout_path)
+                        row["sec"] = round(time.monotonic() - t0, 2)
+                        row["mb"] = round(_size(target) / (1024 * 1024), 2)
+                    except Exception as e:
+                        row["error"] = str(e)
+                    results.append(row)
+                    print(row, flush=True)
+                finally:
+                    shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+
+def to_markdown(results: list[dict], major: int) -> str:
+    lines = [
+        f"pg_dump major: {major or '?'}",
+        "",
+        "| format | compression | jobs | time, s | size, MB |",
+        "|---|---|---|---|---|",
+    ]
+    for r in results:
+        if "error" in r:
+            lines.append(f"| {r['format']} | {r['compression']} | {r['jobs']} | ошибка | {r['error'][:60]} |")
+        else:
+            lines.append(f"| {r['format']} | {r['compression']} | {r['jobs']} | {r['sec']} | {r['mb']} |")
+    return "\n".join(lines) + "\n"
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Бенчмарк параметров pg_dump")
+    ap.add_argument("--db-url", default=DB_URL)
+    ap.add_argument("--formats", default="custom,directory")
+    ap.add_argument("--compress", default="gzip:1,gzip:6,gzip:9,zstd:3,lz4")
+    ap.add_argument("--jobs", default="1,2,4")
+    ap.add_argument("--out", help="записать отчёт в markdown-файл")
+    a = ap.parse_args()
+
+    formats = [f for f in a.formats.split(",") if f in ("custom", "directory")]
+    compress = [c for c in a.compress.split(",") if c in COMPRESSION_CHOICES]
+    jobs = [int(j) for j in a.jobs.split(",") if j.strip().isdigit()]
+
+    results = asyncio.run(bench(a.db_url, formats, compress, jobs or [1]))
+    major = asyncio.run(pg_dump_major(_resolve_pg_dump() or "pg_dump"))
+    report = to_markdown(results, major)
+    print(report)
+    if a.out:
+        Path(a.out).write_text(report, encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
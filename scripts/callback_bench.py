@@ -0,0 +1,144 @@
+# scripts/callback_bench.py
+# Стоимость маршрутизации callback_query: линейная цепочка фильтров vs handlers.callback_index.
+#
+#   python scripts/callback_bench.py                        # 120 маршрутов в 8 роутерах, 20000 апдейтов
+#   python scripts/callback_bench.py --routes 300 --routers 12 --updates 50000
+#
+# Синтетический набор повторяет форму маршрутов бота: пространства имён "nsK", у каждого — точные
+# ("nsK:action") и префиксные ("nsK:action:") маршруты, разложенные по роутерам. Апдейты идут через
+# настоящий Dispatcher.feed_update (middleware FSM, DI), сеть не используется. Печатается время на
+# апдейт: baseline (один хендлер без фильтров), linear (lambda/F-фильтры), indexed; разница с
+# baseline — накладные расходы маршрутизации.
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + "/.."))
+
+from aiogram import Bot, Dispatcher, F, Router  # noqa: E402
+from aiogram.types import CallbackQuery, Chat, Message, Update, User  # noqa: E402
+
+from handlers.callback_index import callback_index  # noqa: E402
+
+Route = Tuple[str, str]  # ("exact" | "prefix", data)
+
+
+def synthetic_routes(n: int) -> List[Route]:
+    routes: List[Route] = []
+    ns = 0
+    while len(routes) < n:
+        for a in range(6):
+            routes.append(("exact", f"ns{ns}:act{a}"))
+            routes.append(("prefix", f"ns{ns}:item{a}:"))
+        ns += 1
+    return routes[:n]
+
+
+def sample_data(routes: List[Route], count: int, seed: int) -> List[str]:
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(count):
+        kind, data = rnd.choice(routes)
+        out.append(data if kind == "exact" else f"{data}{rnd.randint(1, 99999)}")
+    return out
+
+
+def _handler() -> Callable:
+    async def handler(cb: CallbackQuery) -> None:
+        return None
+    return handler
+
+
+def _split(routes: List[Route], routers: int) -> List[List[Route]]:
+    size = max(1, -(-len(routes) // routers))
+    return [routes[i:i + size] for i in range(0, len(routes), size)]
+
+
+def build_baseline(routes: List[Route], routers: int) -> Dispatcher:
+    dp = Dispatcher()
+    dp.callback_query.register(_handler())
+    return dp
+
+
+def build_linear(routes: List[Route], routers: int) -> Dispatcher:
+    dp = Dispatcher()
+    for chunk in _split(routes, routers):
+        r = Router()
+        for kind, data in chunk:
+            if kind == "exact":
+                r.callback_query.register(_handler(), F.data == data)
+            else:
+                r.callback_query.register(_handler(), lambda c, p=data: c.data.startswith(p))
+        dp.include_router(r)
+    return dp
+
+
+def build_indexed(routes: List[Route], routers: int) -> Dispatcher:
+    dp = Dispatcher()
+    for chunk in _split(routes, routers):
+        r = Router()
+        cbx = callback_index(r)
+        for kind, data in chunk:
+            if kind == "exact":
+                cbx.register_exact(_handler(), data)
+            else:
+                cbx.register_prefix(_handler(), data)
+        dp.include_router(r)
+    return dp
+
+
+def make_update(i: int, data: str) -> Update:
+    user = User(id=1, is_bot=False, first_name="bench")
+    msg = Message(message_id=1, date=datetime.now(), chat=Chat(id=1, type="private"))
+    cb = CallbackQuery(id=str(i), from_user=user, chat_instance="bench", data=data, message=msg)
+    return Update(update_id=i, callback_query=cb)
+
+
+async def measure(dp: Dispatcher, bot: Bot, updates: List[Update]) -> float:
+    """Среднее время на апдейт, мкс (лучший из трёх проходов)."""
+    for u in updates[:200]:
+        await dp.feed_update(bot, u)  # прогрев
+    best = float("inf")
+    for _ in range(3):
+        t0 = time.perf_counter()
+        for u in updates:
+            await dp.feed_update(bot, u)
+        best = min(best, (time.perf_counter() - t0) / len(updates) * 1e6)
+    return best
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser(description="Callback routing benchmark")
+    ap.add_argument("--routes", type=int, default=120)
+    ap.add_argument("--routers", type=int, default=8)
+    ap.add_argument("--updates", type=int, default=20000)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    routes = synthetic_routes(args.routes)
+    updates = [make_update(i, d) for i, d in enumerate(sample_data(routes, args.updates, args.seed))]
+    bot = Bot(token="42:BENCH")
+    try:
+        results = []
+        for name, build in (("baseline", build_baseline), ("linear", build_linear), ("indexed", build_indexed)):
+            results.append((name, await measure(build(routes, args.routers), bot, updates)))
+    finally:
+        await bot.session.close()
+
+    base = results[0][1]
+    print(f"{args.routes} routes in {args.routers} routers, {args.updates} updates\n")
+    print("| variant | µs/update | routing overhead µs |")
+    print("|---|---:|---:|")
+    for name, us in results:
+        print(f"| {name} | {us:.1f} | {us - base:.1f} |")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
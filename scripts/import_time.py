@@ -0,0 +1,137 @@
+# scripts/import_time.py
+# Отчёт `python -X importtime` по импорту bot.py и бюджет на холодный старт.
+#
+#   python scripts/import_time.py --calibrate 7   # медиана 7 холодных импортов → рекомендуемый бюджет
+#   IMPORT_BUDGET_MS=420 python scripts/import_time.py          # отчёт + проверка бюджета
+#   python scripts/import_time.py --budget-ms 900 --top 25
+#
+# Проверки (код выхода 1 при нарушении):
+#   • суммарное время импорта bot (self-время всех модулей) ≤ бюджета (IMPORT_BUDGET_MS / --budget-ms);
+#     бюджет не задан — только отчёт: число зависит от машины, его снимают --calibrate на целевом хосте
+#     (медиана × BUDGET_HEADROOM) и прописывают в окружение CI/деплоя;
+#   • тяжёлые SDK (LAZY_MODULES) не исполняются при импорте — только при первом использовании (utils.lazy).
+#     asyncpg в список не входит: database/db.py создаёт engine при импорте, драйвер нужен сразу.
+# Код выхода 2 — bot не импортируется вовсе (нет зависимостей / ошибка в модуле).
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+REPO = os.path.abspath(os.path.dirname(__file__) + "/..")
+
+DEFAULT_BUDGET_MS = int(os.getenv("IMPORT_BUDGET_MS", "0")) or None
+BUDGET_HEADROOM = 1.3        # запас над медианой --calibrate на шум диска/CPU
+
+# Грузятся только по требованию: бэкапы, Google Drive, WebDAV
+LAZY_MODULES = (
+    "httpx",
+    "googleapiclient",
+    "google_auth_oauthlib",
+    "google.oauth2",
+    "requests",
+)
+
+PROBE = (
+    "import json, bot\n"
+    "from utils.lazy import is_loaded\n"
+    "print('@@' + json.dumps(sorted(m for m in %r if is_loaded(m))))\n"
+) % (LAZY_MODULES,)
+
+
+def run_probe() -> Tuple[int, str, str]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=REPO, capture_output=True, text=True,
+    )
+    return proc.returncode, proc.stdout, proc.stderr
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """[(модуль, self µs, cumulative µs, глубина)] из строк `import time: self | cumulative | name`."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        try:
+            self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+            depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+            rows.append((name.strip(), int(self_us), int(cum_us), depth))
+        except ValueError:
+            continue
+    return rows
+
+
+def top_packages(rows: List[Tuple[str, int, int, int]]) -> Dict[str, int]:
+    """Self-время, сгруппированное по пакету верхнего уровня."""
+    out: Dict[str, int] = {}
+    for name, self_us, _, _ in rows:
+        pkg = name.split(".")[0]
+        out[pkg] = out.get(pkg, 0) + self_us
+    return out
+
+
+def calibrate(runs: int) -> int:
+    totals = []
+    for i in range(runs):
+        rc, _, err = run_probe()
+        if rc != 0:
+            print(f"ERROR: `import bot` failed (rc={rc}) on run {i + 1}")
+            return 2
+        totals.append(sum(r[1] for r in parse_importtime(err)) / 1000)
+    totals.sort()
+    median = totals[len(totals) // 2]
+    print("runs: " + ", ".join(f"{t:.0f}" for t in totals) + " ms")
+    print(f"median {median:.0f} ms → IMPORT_BUDGET_MS={int(median * BUDGET_HEADROOM)}")
+    return 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Import-time report for bot.py")
+    ap.add_argument("--budget-ms", type=int, default=DEFAULT_BUDGET_MS)
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--calibrate", type=int, metavar="RUNS", help="measure RUNS cold imports and print a budget")
+    args = ap.parse_args()
+
+    if args.calibrate:
+        return calibrate(args.calibrate)
+
+    rc, out, err = run_probe()
+    if rc != 0:
+        tail = "\n".join(ln for ln in err.splitlines() if not ln.startswith("import time:"))[-2000:]
+        print(f"ERROR: `import bot` failed (rc={rc}):\n{tail}")
+        return 2
+
+    rows = parse_importtime(err)
+    total_ms = sum(r[1] for r in rows) / 1000
+    budget = f"budget {args.budget_ms} ms" if args.budget_ms else "no budget set, see --calibrate"
+    print(f"import bot: {total_ms:.0f} ms self-time over {len(rows)} modules ({budget})\n")
+
+    print(f"Top {args.top} packages (self-time):")
+    for pkg, us in sorted(top_packages(rows).items(), key=lambda kv: kv[1], reverse=True)[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {pkg}")
+
+    print(f"\nTop {args.top} imports (cumulative):")
+    for name, _, cum_us, depth in sorted(rows, key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"  {cum_us / 1000:8.1f} ms  {'  ' * depth}{name}")
+
+    errors: List[str] = []
+    if args.budget_ms and total_ms > args.budget_ms:
+        errors.append(f"import time {total_ms:.0f} ms exceeds budget {args.budget_ms} ms")
+    marker = [ln for ln in out.splitlines() if ln.startswith("@@")]
+    eager = json.loads(marker[-1][2:]) if marker else []
+    if eager:
+        errors.append("heavy modules executed at import (must be lazy, see utils/lazy.py): " + ", ".join(eager))
+
+    if errors:
+        print("\nERRORS:\n  - " + "\n  - ".join(errors))
+        return 1
+    print("\nOK: " + ("within budget; " if args.budget_ms else "") + "heavy SDKs are loaded lazily.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+# scripts/restore_chain.py
+# Восстановление инкрементальной цепочки бэкапов (полный дамп + инкременты).
+#
+#   1) скачайте в один каталог файлы цепочки: <db>_<chain>.full.*, *.inc*.rest.backup,
+#      *.copy.gz и последний <db>_<chain>.manifestNNNN.json;
+#   2) python scripts/restore_chain.py /path/to/dir                 # до последнего инкремента
+#      python scripts/restore_chain.py /path/to/manifest.json --upto 3
+#
+# ⚠️ Целевая БД (DB_URL или --db-url) будет перезаписана.
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + "/.."))
+
+from config import DB_URL  # noqa: E402
+from utils.backup_incremental import find_latest_manifest, restore_chain  # noqa: E402
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Восстановление цепочки full + инкременты")
+    ap.add_argument("path", help="манифест или каталог со скачанными файлами цепочки")
+    ap.add_argument("--db-url", default=DB_URL)
+    ap.add_argument("--upto", type=int, help="восстановить до инкремента N включительно")
+    ap.add_argument("--yes", action="store_true", help="не спрашивать подтверждение")
+    a = ap.parse_args()
+
+    manifest = a.path
+    if os.path.isdir(manifest):
+        manifest = find_latest_manifest(manifest)
+        if not manifest:
+            raise SystemExit("В каталоге нет *.manifest*.json")
+
+    if not a.yes:
+        ans = input(f"Перезаписать БД из {os.path.basename(manifest)}? Введите YES: ")
+        if ans.strip() != "YES":
+            raise SystemExit("Отменено.")
+
+    asyncio.run(restore_chain(manifest, a.db_url, upto_seq=a.upto))
+
+
+if __name__ == "__main__":
+    main()
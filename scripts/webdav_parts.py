@@ -0,0 +1,247 @@
+# scripts/webdav_parts.py
+# Утилиты для загрузчика WebDAV (utils/webdav.py).
+#
+#   join  — склеить скачанный каталог <file>.parts в файл (с проверкой sha256):
+#       python scripts/webdav_parts.py join ./db_20251019_031500.backup.parts
+#
+#   check — загрузка во всех режимах (stream, parts, nextcloud) против WebDAV-стенда в памяти
+#           (MemoryDAV — транспорт httpx, без сети и внешнего сервера), сверка прочитанного через
+#           artifact_stream/join_parts с отправленным. PUT-ы рвутся с вероятностью --fail-rate,
+#           первый потоковый PUT — всегда посередине тела (stream проверяется со спулом на весь
+#           файл — иначе повторить его нечем; по умолчанию WEBDAV_STREAM_SPOOL_MB=0 спул выключен).
+#           Код выхода 1 — хоть один режим не сошёлся:
+#       python scripts/webdav_parts.py check
+#       python scripts/webdav_parts.py check --size-mb 40 --fail-rate 0.3
+#       python scripts/webdav_parts.py check --url http://127.0.0.1:8081   # живой сервер вместо стенда
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+from xml.sax.saxutils import escape
+
+import httpx
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + "/.."))
+
+from utils import webdav  # noqa: E402
+
+STAND_URL = "http://dav.local/remote.php/dav/files/check"   # вид Nextcloud — работают все режимы
+STAND_ROOTS = ("/remote.php/dav/files/check", "/remote.php/dav/uploads/check")
+
+
+# ---------------------------
+# WebDAV-стенд в памяти
+# ---------------------------
+class MemoryDAV(httpx.AsyncBaseTransport):
+    """Минимальный WebDAV: MKCOL/PUT/GET/PROPFIND/MOVE/DELETE + сборка chunking v2 Nextcloud."""
+
+    def __init__(self, *roots: str):
+        self.files: Dict[str, bytes] = {}
+        self.dirs = {"/"}
+        for root in roots:   # базовый путь клиента и его предки уже «есть» на сервере
+            cur = ""
+            for seg in [p for p in root.split("/") if p]:
+                cur += "/" + seg
+                self.dirs.add(cur)
+
+    @staticmethod
+    def _norm(path: str) -> str:
+        return "/" + path.strip("/")
+
+    def _parent_ok(self, path: str) -> bool:
+        return self._norm(os.path.dirname(path)) in self.dirs
+
+    def _children(self, path: str) -> List[str]:
+        prefix = path.rstrip("/") + "/"
+        names = {p[len(prefix):].split("/")[0] for p in list(self.files) + list(self.dirs) if p.startswith(prefix)}
+        return sorted(prefix + n for n in names if n)
+
+    def _remove(self, path: str) -> bool:
+        prefix = path.rstrip("/") + "/"
+        found = path in self.files or path in self.dirs
+        self.files = {p: b for p, b in self.files.items() if p != path and not p.startswith(prefix)}
+        self.dirs = {d for d in self.dirs if d != path and not d.startswith(prefix)}
+        return found
+
+    def _propentry(self, path: str) -> str:
+        if path in self.dirs:
+            prop = "<d:resourcetype><d:collection/></d:resourcetype>"
+        else:
+            prop = f"<d:resourcetype/><d:getcontentlength>{len(self.files[path])}</d:getcontentlength>"
+        name = escape(path.rstrip("/").split("/")[-1])
+        return (f"<d:response><d:href>{escape(path)}</d:href><d:propstat><d:prop>"
+                f"<d:displayname>{name}</d:displayname>{prop}</d:prop></d:propstat></d:response>")
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        path = self._norm(request.url.path)
+        body = b"".join([c async for c in request.stream])
+        method = request.method
+
+        if method == "MKCOL":
+            if path in self.dirs or path in self.files:
+                return httpx.Response(405)
+            if not self._parent_ok(path):
+                return httpx.Response(409)
+            self.dirs.add(path)
+            return httpx.Response(201)
+        if method == "PUT":
+            if not self._parent_ok(path) or path in self.dirs:
+                return httpx.Response(409)
+            self.files[path] = body
+            return httpx.Response(201)
+        if method == "GET":
+            if path not in self.files:
+                return httpx.Response(404)
+            return httpx.Response(200, content=self.files[path])
+        if method == "PROPFIND":
+            if path not in self.files and path not in self.dirs:
+                return httpx.Response(404)
+            entries = [path] + (self._children(path) if request.headers.get("Depth") == "1" else [])
+            xml = '<?xml version="1.0"?><d:multistatus xmlns:d="DAV:">' + "".join(
+                self._propentry(p) for p in entries) + "</d:multistatus>"
+            return httpx.Response(207, content=xml.encode("utf-8"))
+        if method == "MOVE":
+            dst = self._norm(httpx.URL(request.headers["Destination"]).path)
+            if path.endswith("/.file"):
+                # Nextcloud: собрать части загрузки в файл назначения
+                upload_dir = self._norm(os.path.dirname(path))
+                self.files[dst] = b"".join(self.files[p] for p in self._children(upload_dir) if p in self.files)
+                self._remove(upload_dir)
+                return httpx.Response(201)
+            if path not in self.files and path not in self.dirs:
+                return httpx.Response(404)
+            self._remove(dst)
+            prefix = path.rstrip("/") + "/"
+            for p in [p for p in self.files if p == path or p.startswith(prefix)]:
+                self.files[dst + p[len(path):]] = self.files.pop(p)
+            for d in [d for d in self.dirs if d == path or d.startswith(prefix)]:
+                self.dirs.discard(d)
+                self.dirs.add(dst + d[len(path):])
+            return httpx.Response(201)
+        if method == "DELETE":
+            return httpx.Response(204 if self._remove(path) else 404)
+        return httpx.Response(405)
+
+
+class FlakyTransport(httpx.AsyncBaseTransport):
+    """Обёртка: PUT рвётся с вероятностью fail_rate; первый потоковый PUT — всегда, на середине тела."""
+
+    def __init__(self, inner: httpx.AsyncBaseTransport, fail_rate: float, seed: int = 42):
+        self.inner = inner
+        self.fail_rate = fail_rate
+        self.rnd = random.Random(seed)
+        self.failures = 0
+        self._stream_failed = False
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method == "PUT":
+            streamed = "content-length" not in request.headers
+            if streamed and not self._stream_failed:
+                self._stream_failed = True
+                self.failures += 1
+                async for _ in request.stream:   # первый чанк «ушёл», дальше обрыв
+                    break
+                raise httpx.WriteError("injected failure mid-body", request=request)
+            if self.rnd.random() < self.fail_rate:
+                self.failures += 1
+                raise httpx.ConnectError("injected failure", request=request)
+        return await self.inner.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+# ---------------------------
+# Проверка
+# ---------------------------
+async def _source(size: int, chunk: int):
+    rnd = random.Random(42)
+    sent = 0
+    while sent < size:
+        n = min(chunk, size - sent)
+        yield rnd.randbytes(n)
+        sent += n
+
+
+async def _read_back(client: webdav.WebDAVClient, mode: str, artifact: str) -> str:
+    got = hashlib.sha256()
+    if mode != "parts":
+        async for c in webdav.artifact_stream(client, artifact):
+            got.update(c)
+        return got.hexdigest()
+    # parts — как при восстановлении: скачать каталог и склеить join_parts (сверяет index.json)
+    with tempfile.TemporaryDirectory() as tmp:
+        local = os.path.join(tmp, os.path.basename(artifact))
+        os.makedirs(local)
+        for it in await client.list_dir(artifact):
+            with open(os.path.join(local, it["name"]), "wb") as f:
+                f.write(await client.get_bytes(f"{artifact}/{it['name']}"))
+        with open(webdav.join_parts(local), "rb") as f:
+            while buf := f.read(1024 * 1024):
+                got.update(buf)
+    return got.hexdigest()
+
+
+async def check(url: Optional[str], user: str, password: str, size_mb: int, part_mb: int, fail_rate: float) -> int:
+    size = size_mb * 1024 * 1024
+    expected = hashlib.sha256()
+    async for c in _source(size, 1024 * 1024):
+        expected.update(c)
+
+    if url is None:
+        webdav.RETRY_BASE_SEC = 0.01   # стенд в памяти — паузы между повторами ни к чему
+    transport = FlakyTransport(MemoryDAV(*STAND_ROOTS) if url is None else httpx.AsyncHTTPTransport(), fail_rate)
+    modes = ["stream", "parts"] + (["nextcloud"] if webdav._NEXTCLOUD_RE.match(url or STAND_URL) else [])
+    failed = 0
+    async with webdav.WebDAVClient(url or STAND_URL, user, password, transport=transport) as client:
+        for mode in modes:
+            path = f"/botwb-check/{mode}/blob.bin"
+            t0 = time.monotonic()
+            try:
+                artifact = await webdav.upload(
+                    client, _source(size, 1024 * 1024), path, mode=mode, part_size=part_mb * 1024 * 1024,
+                    spool_limit=size,
+                )
+                ok = await _read_back(client, mode, artifact) == expected.hexdigest()
+            except Exception as e:
+                print(f"{mode:9s} FAIL: {e}")
+                failed += 1
+                continue
+            if not ok:
+                failed += 1
+            print(f"{mode:9s} {'OK ' if ok else 'BAD'} {size_mb} MB in {time.monotonic() - t0:.1f}s, "
+                  f"injected failures so far: {transport.failures}")
+            await client.delete(f"/botwb-check/{mode}")
+    return 1 if failed else 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="WebDAV parts: склейка и проверка загрузчика")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    j = sub.add_parser("join")
+    j.add_argument("parts_dir")
+    j.add_argument("-o", "--out")
+    c = sub.add_parser("check")
+    c.add_argument("--url", help="живой WebDAV-сервер (по умолчанию — стенд в памяти)")
+    c.add_argument("--user", default="")
+    c.add_argument("--password", default="")
+    c.add_argument("--size-mb", type=int, default=6)
+    c.add_argument("--part-mb", type=int, default=1)
+    c.add_argument("--fail-rate", type=float, default=0.2)
+    a = ap.parse_args()
+
+    if a.cmd == "join":
+        print(webdav.join_parts(a.parts_dir, a.out))
+        return 0
+    return asyncio.run(check(a.url, a.user, a.password, a.size_mb, a.part_mb, a.fail_rate))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
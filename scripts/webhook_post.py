@@ -0,0 +1,81 @@
+# scripts/webhook_post.py
+# Локальная проверка режима вебхука: POST апдейта на запущенный бот (BOT_MODE=webhook) с секретом.
+#
+#   BOT_MODE=webhook WEBHOOK_SECRET=dev python bot.py                 # WEBHOOK_BASE_URL пустой — без setWebhook
+#   WEBHOOK_SECRET=dev python scripts/webhook_post.py --user 123456 --text /start
+#   WEBHOOK_SECRET=dev python scripts/webhook_post.py --user 123456 --callback reports --count 200 --parallel 20
+#   python scripts/webhook_post.py --secret wrong                      # ожидаем 401
+#
+# Печатает коды ответов и время подтверждения (обработка идёт фоном — её видно в логах бота и в /metrics).
+# Ответы бота уходят в настоящий Bot API, поэтому --user — ваш реальный Telegram id.
+from __future__ import annotations
+
+import argparse
+import asyncio
+import collections
+import itertools
+import os
+import sys
+import time
+from typing import Optional
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + "/.."))
+
+from config import WEBHOOK_PATH, WEBHOOK_PORT, WEBHOOK_SECRET  # noqa: E402
+from utils.webhook import SECRET_HEADER  # noqa: E402
+
+_update_ids = itertools.count(int(time.time()))
+
+
+def make_update(user_id: int, text: Optional[str] = None, callback: Optional[str] = None) -> dict:
+    uid = next(_update_ids)
+    user = {"id": user_id, "is_bot": False, "first_name": "webhook_post"}
+    chat = {"id": user_id, "type": "private"}
+    if callback is not None:
+        return {"update_id": uid, "callback_query": {
+            "id": str(uid), "from": user, "chat_instance": "local", "data": callback,
+            "message": {"message_id": 1, "date": int(time.time()), "chat": chat, "text": "…"},
+        }}
+    return {"update_id": uid, "message": {
+        "message_id": uid, "date": int(time.time()), "chat": chat, "from": user, "text": text or "/start",
+    }}
+
+
+async def main() -> int:
+    ap = argparse.ArgumentParser(description="POST Telegram updates to the local webhook")
+    ap.add_argument("--url", default=f"http://127.0.0.1:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    ap.add_argument("--secret", default=WEBHOOK_SECRET)
+    ap.add_argument("--user", type=int, default=1)
+    group = ap.add_mutually_exclusive_group()
+    group.add_argument("--text", default="/start")
+    group.add_argument("--callback")
+    ap.add_argument("--count", type=int, default=1)
+    ap.add_argument("--parallel", type=int, default=1)
+    args = ap.parse_args()
+
+    from aiohttp import ClientSession
+
+    codes: collections.Counter = collections.Counter()
+    timings = []
+    sem = asyncio.Semaphore(max(1, args.parallel))
+
+    async def post_one(http: ClientSession) -> None:
+        body = make_update(args.user, text=args.text, callback=args.callback)
+        async with sem:
+            t0 = time.perf_counter()
+            async with http.post(args.url, json=body, headers={SECRET_HEADER: args.secret or ""}) as resp:
+                await resp.read()
+                codes[resp.status] += 1
+            timings.append(time.perf_counter() - t0)
+
+    async with ClientSession() as http:
+        await asyncio.gather(*(post_one(http) for _ in range(args.count)))
+
+    timings.sort()
+    print(f"{args.url}: " + ", ".join(f"{code}×{n}" for code, n in sorted(codes.items())))
+    print(f"ack p50 {timings[len(timings) // 2] * 1000:.1f} ms, max {timings[-1] * 1000:.1f} ms")
+    return 0 if set(codes) == {200} else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -1,46 +1,45 @@
-# utils/backup.py
 from __future__ import annotations
 
+import asyncio
+import contextlib
+import hashlib
+import json
 import os
+import re
 import sys
 import time
 import shlex
 import shutil
-import subprocess
 import tempfile
-from datetime import datetime, timedelta, timezone
+from dataclasses import dataclass
+from datetime import datetime
 from pathlib import Path
-from typing import Tuple, List
-
-import requests
-from xml.etree import ElementTree as ET
-from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple, List
 
+import asyncpg
 from sqlalchemy import select
 from sqlalchemy.engine.url import make_url
 
 from database.db import get_session
 from database.models import BackupSettings
-
-# --- Google Drive (оставляем для совместимости; не используется при BACKUP_DRIVER=webdav)
-from utils.gdrive_oauth import build_drive_oauth, upload_file, cleanup_old  # type: ignore
-try:
-    from utils.gdrive import build_drive as build_drive_sa  # type: ignore
-except Exception:
-    build_drive_sa = None  # noqa: F401
+from utils import webdav
+from utils.backup_retention import (
+    DriveStore, LocalStore, RetentionPolicy, RetentionReport, WebDAVStore, apply_retention, partition_for,
+)
+from utils.notify import notify_admin
+from utils import gdrive_clients
 
 from config import (
     PG_DUMP_PATH,
     GOOGLE_AUTH_MODE,             # 'oauth' | 'sa' (для совместимости)
-    GOOGLE_OAUTH_CLIENT_PATH,     # client_secret.json
-    GOOGLE_OAUTH_TOKEN_PATH,      # token.json
 
     # --- новый блок для WebDAV / выбора драйвера ---
-    BACKUP_DRIVER,                # "webdav" | "oauth" | "sa"
-    WEBDAV_BASE_URL,              # напр. https://webdav.yandex.ru
-    WEBDAV_USERNAME,              # логин/почта Яндекс
-    WEBDAV_PASSWORD,              # пароль или пароль приложения
+    BACKUP_DRIVER,                # "webdav" | "oauth" | "sa" | "local"; несколько через запятую — fan-out
+    BACKUP_DIR,                   # каталог драйвера local
+    BACKUP_FANOUT_RETRIES,        # fan-out: перезаливок упавшего места из готовой копии
+    BACKUP_VERIFY,                # "size" | "full" | "off" — проверка загруженной копии
     WEBDAV_ROOT,                  # удалённая папка, напр. /botwb
+    RESTORE_JOBS,                 # потоков pg_restore -j при восстановлении
 )
 
 
@@ -57,6 +56,57 @@ def parse_db_url(db_url: str) -> dict:
     }
 
 
+async def pg_connect(params: dict, database: Optional[str] = None) -> asyncpg.Connection:
+    return await asyncpg.connect(
+        host=params["host"], port=params["port"], user=params["user"],
+        password=params["password"] or None, database=database or params["database"],
+    )
+
+
+async def count_rows(conn: asyncpg.Connection) -> Dict[str, int]:
+    """Точное число строк в каждой таблице схемы public."""
+    tables = [r["tablename"] for r in await conn.fetch(
+        "SELECT tablename FROM pg_tables WHERE schemaname = 'public' ORDER BY tablename"
+    )]
+    out: Dict[str, int] = {}
+    for t in tables:
+        out[t] = int(await conn.fetchval(f'SELECT count(*) FROM public."{t.replace(chr(34), chr(34) * 2)}"'))
+    return out
+
+
+class SnapshotCounts:
+    """
+    REPEATABLE READ-транзакция с pg_export_snapshot(): pg_dump --snapshot видит ровно
+    те же данные, по которым посчитаны строки. Держим транзакцию, пока pg_dump не закончит.
+    """
+
+    def __init__(self, conn: asyncpg.Connection, tr, snapshot_id: str, counts: Dict[str, int]):
+        self.conn = conn
+        self._tr = tr
+        self.snapshot_id = snapshot_id
+        self.counts = counts
+
+    @classmethod
+    async def open(cls, params: dict) -> "SnapshotCounts":
+        conn = await pg_connect(params)
+        try:
+            tr = conn.transaction(isolation="repeatable_read", readonly=True)
+            await tr.start()
+            snapshot_id = await conn.fetchval("SELECT pg_export_snapshot()")
+            counts = await count_rows(conn)
+        except Exception:
+            await conn.close()
+            raise
+        return cls(conn, tr, snapshot_id, counts)
+
+    async def close(self) -> None:
+        if self.conn.is_closed():
+            return
+        with contextlib.suppress(Exception):
+            await self._tr.rollback()
+        await self.conn.close()
+
+
 def _human_mb(path: str) -> float:
     try:
         return os.path.getsize(path) / (1024 * 1024)
@@ -79,153 +129,634 @@ def _resolve_pg_dump() -> str | None:
     return None
 
 
-# ------------------------- WebDAV client -------------------------
+def resolve_pg_restore() -> str | None:
+    """pg_restore из PATH или рядом с найденным pg_dump (та же версия клиента)."""
+    found = shutil.which("pg_restore")
+    if found:
+        return found
+    pg_dump = _resolve_pg_dump()
+    if pg_dump:
+        sibling = os.path.join(os.path.dirname(pg_dump), "pg_restore")
+        if os.path.isfile(sibling):
+            return sibling
+    return None
 
-class WebDAVClient:
-    def __init__(self, base_url: str, username: str, password: str):
-        self.base = base_url.rstrip("/")
-        self.session = requests.Session()
-        self.session.auth = (username, password)
 
-    def _url(self, path: str) -> str:
-        return f"{self.base}/{path.lstrip('/')}"
+# ------------------------- pg_dump → поток -------------------------
+
+DUMP_TIMEOUT_SEC = 900
+# Размер части потока: кратен 256 KiB (требование resumable upload Google Drive).
+STREAM_CHUNK = 8 * 1024 * 1024
 
-    def mkcol_recursive(self, remote_dir: str) -> None:
-        parts = [p for p in remote_dir.strip("/").split("/") if p]
-        cur = ""
-        for seg in parts:
-            cur = f"{cur}/{seg}"
-            url = self._url(cur)
-            r = self.session.request("MKCOL", url)
-            # 201 — создано, 405 — уже существует, 409 — родителя нет (создадим на следующей итерации)
-            if r.status_code in (201, 405, 409):
-                continue
 
-    def put_file(self, local_path: str, remote_path: str) -> None:
-        url = self._url(remote_path)
-        with open(local_path, "rb") as f:
-            r = self.session.put(url, data=f)
-        if r.status_code not in (200, 201, 204):
-            raise RuntimeError(f"WebDAV PUT failed ({r.status_code}): {r.text[:400]}")
+def _pg_env(params: dict) -> dict:
+    env = os.environ.copy()
+    if params["password"]:
+        env["PGPASSWORD"] = params["password"]
+    return env
 
-    def list_dir(self, remote_dir: str) -> List[dict]:
+
+# Варианты сжатия для BackupSettings.compression (подпись для админки → спецификация)
+COMPRESSION_CHOICES = ["gzip:1", "gzip:3", "gzip:6", "gzip:9", "zstd:3", "zstd:9", "lz4", "none"]
+DUMP_FORMATS = ("custom", "directory")
+DEFAULT_COMPRESSION = "gzip:9"
+
+_pg_dump_major_cache: dict[str, int] = {}
+
+
+async def pg_dump_major(pg_dump_bin: str) -> int:
+    """Мажорная версия pg_dump (кэшируется на процесс); 0 — не удалось определить."""
+    if pg_dump_bin in _pg_dump_major_cache:
+        return _pg_dump_major_cache[pg_dump_bin]
+    major = 0
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            pg_dump_bin, "--version", stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+        out, _ = await proc.communicate()
+        m = re.search(r"(\d+)(?:\.\d+)?", out.decode(errors="ignore"))
+        major = int(m.group(1)) if m else 0
+    except Exception:
+        major = 0
+    _pg_dump_major_cache[pg_dump_bin] = major
+    return major
+
+
+def compression_args(spec: str | None, major: int) -> Tuple[List[str], str]:
+    """
+    Аргументы сжатия pg_dump и фактически применённая спецификация.
+    gzip:N работает на любой версии (-Z N); zstd/lz4 — только pg_dump >= 16,
+    иначе откатываемся на gzip:6.
+    """
+    spec = (spec or DEFAULT_COMPRESSION).strip().lower()
+    if spec == "none":
+        return ["-Z", "0"], "none"
+    method, _, level = spec.partition(":")
+    if method == "gzip":
+        lvl = level if level.isdigit() and 0 <= int(level) <= 9 else "6"
+        return ["-Z", lvl], f"gzip:{lvl}"
+    if method in ("zstd", "lz4"):
+        if major >= 16:
+            return [f"--compress={spec}"], spec
+        return ["-Z", "6"], "gzip:6"
+    return ["-Z", "6"], "gzip:6"
+
+
+def _pg_dump_cmd(
+        pg_dump_bin: str,
+        params: dict,
+        compress: List[str] | None = None,
+        fmt: str = "custom",
+        out_dir: str | None = None,
+        jobs: int = 1,
+) -> List[str]:
+    cmd = [
+        pg_dump_bin,
+        "-h", params["host"],
+        "-p", str(params["port"]),
+        "-U", params["user"],
+        "-d", params["database"],
+    ]
+    if fmt == "directory":
+        # -F d пишет каталог (по файлу на таблицу) и умеет -j N
+        cmd += ["-F", "d", "-j", str(max(1, jobs)), "-f", out_dir or "."]
+    else:
+        # без -f: архив идёт в stdout и сразу уходит в хранилище
+        cmd += ["-F", "c"]
+    return cmd + (compress if compress is not None else ["-Z", "9"])
+
+
+async def _run_pg_dump_dir(cmd: List[str], env: dict) -> None:
+    """pg_dump -F d -j N: ждём завершения (stdout пуст, stderr — в сообщение об ошибке)."""
+    kw = {}
+    if sys.platform.startswith("win"):
+        kw["creationflags"] = 0x08000000  # CREATE_NO_WINDOW
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE, env=env, **kw
+    )
+    try:
+        _, err = await proc.communicate()
+    except asyncio.CancelledError:
+        with contextlib.suppress(ProcessLookupError):
+            proc.kill()
+        raise
+    if proc.returncode != 0:
+        raise RuntimeError(f"pg_dump failed (rc={proc.returncode}): {(err or b'').decode(errors='ignore')[:400]}")
+
+
+def _tar_stream_cmd(src_dir: str) -> List[str]:
+    # содержимое каталога уже сжато pg_dump — tar без компрессии
+    return ["tar", "-cf", "-", "-C", src_dir, "."]
+
+
+class DumpStream:
+    """
+    pg_dump через asyncio.create_subprocess_exec: stdout читается чанками по STREAM_CHUNK,
+    stderr дренируется фоном (чтобы процесс не встал на заполненном пайпе).
+    После EOF итератор ждёт код возврата и бросает RuntimeError, если pg_dump упал —
+    загрузчик при этом не завершает запись файла.
+    """
+
+    def __init__(self, cmd: List[str], env: dict, chunk_size: int = STREAM_CHUNK):
+        self.cmd = cmd
+        self.env = env
+        self.chunk_size = chunk_size
+        self.bytes_total = 0
+        self.proc: asyncio.subprocess.Process | None = None
+        self._stderr = bytearray()
+        self._stderr_task: asyncio.Task | None = None
+
+    async def start(self) -> "DumpStream":
+        kw = {}
+        if sys.platform.startswith("win"):
+            kw["creationflags"] = 0x08000000  # CREATE_NO_WINDOW
+        self.proc = await asyncio.create_subprocess_exec(
+            *self.cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=self.env,
+            **kw,
+        )
+        self._stderr_task = asyncio.create_task(self._drain_stderr())
+        return self
+
+    async def _drain_stderr(self) -> None:
+        assert self.proc and self.proc.stderr
+        while True:
+            line = await self.proc.stderr.read(4096)
+            if not line:
+                break
+            if len(self._stderr) < 8192:
+                self._stderr += line
+
+    @property
+    def stderr_text(self) -> str:
+        return self._stderr.decode(errors="ignore")[:400]
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        assert self.proc and self.proc.stdout
+        buf = bytearray()
+        while True:
+            data = await self.proc.stdout.read(1024 * 1024)
+            if not data:
+                break
+            buf += data
+            while len(buf) >= self.chunk_size:
+                out = bytes(buf[:self.chunk_size])
+                del buf[:self.chunk_size]
+                self.bytes_total += len(out)
+                yield out
+        rc = await self.proc.wait()
+        if self._stderr_task:
+            await self._stderr_task
+        if rc != 0:
+            raise RuntimeError(f"pg_dump failed (rc={rc}): {self.stderr_text}")
+        if buf:
+            self.bytes_total += len(buf)
+            yield bytes(buf)
+
+    async def kill(self) -> None:
+        if self.proc and self.proc.returncode is None:
+            with contextlib.suppress(ProcessLookupError):
+                self.proc.kill()
+            with contextlib.suppress(Exception):
+                await self.proc.wait()
+
+
+# ------------------------- Основной бэкап -------------------------
+
+class UploadTarget:
+    """
+    Одно место хранения (драйвер из BACKUP_DRIVER): проверки конфигурации и учётные данные
+    готовятся один раз — до запуска pg_dump; upload() можно вызывать многократно
+    (полный дамп + файлы инкрементов + манифест). Очистка старых — cleanup()
+    по политике GFS (utils.backup_retention), после проверки загруженной копии.
+    WebDAV и local: файлы раскладываются по папкам <root>/YYYY/MM по метке времени в имени.
+    """
+
+    def __init__(self, driver: str, folder_id: str | None, policy: RetentionPolicy, name_prefix: str):
+        self.driver = driver
+        self.folder_id = folder_id
+        self.policy = policy
+        self.name_prefix = name_prefix
+        self.drive = None    # клиент utils.gdrive_clients (общий на процесс)
+
+    @classmethod
+    async def resolve(
+            cls, folder_id: str | None, sa_json, policy: RetentionPolicy, name_prefix: str,
+            driver: str | None = None,
+    ) -> "UploadTarget":
+        """RuntimeError с понятным текстом, если драйвер не настроен."""
+        t = cls((driver or BACKUP_DRIVER or "oauth").lower(), folder_id, policy, name_prefix)
+        if t.driver == "local":
+            if not BACKUP_DIR:
+                raise RuntimeError("Local backups requested but BACKUP_DIR is empty")
+        elif t.driver != "webdav":
+            if not gdrive_clients.is_drive_driver(t.driver):
+                raise RuntimeError(f"Unknown backup driver: {t.driver}")
+            if not folder_id and t.driver != "fake":
+                raise RuntimeError("Google Drive not configured: Folder ID is empty")
+            # клиент и токен — из кэша процесса; токен обновляется заранее
+            t.drive = gdrive_clients.get_client(t.driver, sa_json)
+            await t.drive.creds()
+        return t
+
+    async def upload(self, chunks: AsyncIterator[bytes], filename: str) -> Tuple[str, str]:
         """
-        Список элементов каталога (1 уровень).
-        Возвращает словари: {"href","name","is_dir","modified"(datetime|None)}.
+        Возвращает (где лежит файл, ref).
+        ref — путь WebDAV или file id Drive (для проверки и скачивания).
         """
-        url = self._url(remote_dir)
-        headers = {"Depth": "1", "Content-Type": "text/xml; charset=utf-8"}
-        body = """<?xml version="1.0" encoding="utf-8" ?>
-<d:propfind xmlns:d="DAV:">
-  <d:prop>
-    <d:displayname />
-    <d:getlastmodified />
-    <d:resourcetype />
-  </d:prop>
-</d:propfind>"""
-        r = self.session.request("PROPFIND", url, data=body.encode("utf-8"), headers=headers)
-        if r.status_code != 207:
-            raise RuntimeError(f"WebDAV PROPFIND failed ({r.status_code}): {r.text[:400]}")
-
-        out: List[dict] = []
-        ns = {"d": "DAV:"}
-        root = ET.fromstring(r.text)
-        for resp in root.findall("d:response", ns):
-            href_el = resp.find("d:href", ns)
-            if href_el is None:
-                continue
-            href = href_el.text or ""
-            prop = resp.find("d:propstat/d:prop", ns)
-            if prop is None:
+        if self.driver == "webdav":
+            root = (WEBDAV_ROOT or "/").rstrip("/")
+            remote_path = await webdav.upload(
+                webdav.get_client(), chunks, f"{root}/{partition_for(filename)}/{filename}",
+            )
+            return f"WebDAV ({remote_path})", remote_path
+        if self.driver == "local":
+            path = await _local_write(chunks, os.path.join(BACKUP_DIR, partition_for(filename), filename))
+            return f"local ({path})", path
+        file_id = await self.drive.upload(chunks, filename, self.folder_id)
+        return f"Google Drive (id={file_id})", file_id
+
+    def store(self):
+        if self.driver == "webdav":
+            return WebDAVStore(webdav.get_client(), WEBDAV_ROOT or "/")
+        if self.driver == "local":
+            return LocalStore(BACKUP_DIR)
+        return DriveStore(self.drive, self.folder_id)
+
+    async def cleanup(self, dry_run: bool = False) -> RetentionReport:
+        return await apply_retention(self.store(), self.name_prefix, self.policy, dry_run=dry_run)
+
+    async def remote_meta(self, ref: str) -> Tuple[Optional[int], Optional[str]]:
+        """(размер, sha256) загруженного файла; sha256 есть только у Drive."""
+        if self.driver == "webdav":
+            return await webdav.artifact_size(webdav.get_client(), ref), None
+        if self.driver == "local":
+            return await asyncio.to_thread(os.path.getsize, ref), None
+        return await self.drive.meta(ref)
+
+    def download(self, ref: str) -> AsyncIterator[bytes]:
+        if self.driver == "webdav":
+            return webdav.artifact_stream(webdav.get_client(), ref)
+        if self.driver == "local":
+            return _local_read(ref)
+        return self.drive.download(ref)
+
+    async def verify(self, ref: str, size: int, sha256: str) -> str:
+        return await verify_remote(self, ref, size, sha256)
+
+
+async def _local_write(chunks: AsyncIterator[bytes], path: str) -> str:
+    """Запись во временный файл рядом и атомарный rename — недописанный бэкап не виден retention."""
+    await asyncio.to_thread(os.makedirs, os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    f = await asyncio.to_thread(open, tmp, "wb")
+    try:
+        async for c in chunks:
+            await asyncio.to_thread(f.write, c)
+    except BaseException:
+        f.close()
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
+    await asyncio.to_thread(f.close)
+    await asyncio.to_thread(os.replace, tmp, path)
+    return path
+
+
+async def _local_read(path: str, chunk_size: int = STREAM_CHUNK) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            data = await asyncio.to_thread(f.read, chunk_size)
+            if not data:
+                return
+            yield data
+
+
+_EOF = object()
+FANOUT_QUEUE_CHUNKS = 4     # чанков в очереди на место: память ≈ N мест × 4 × STREAM_CHUNK
+
+
+class FanOutTarget:
+    """
+    Несколько мест сразу (BACKUP_DRIVER="webdav,local,oauth"): один поток дампа
+    раздаётся в ограниченные очереди, загрузки идут параллельно — время ≈ самому медленному месту.
+    Упавшее место не тормозит остальные; после окончания потока оно перезаливается
+    из уже залитой копии (BACKUP_FANOUT_RETRIES раз). ref — JSON {driver: ref}.
+    Проверки/тест-восстановление идут по первому успешному месту; retention — по каждому.
+    """
+
+    def __init__(self, targets: List[UploadTarget]):
+        self.targets = targets
+        self.driver = "+".join(t.driver for t in targets)
+        self.failures: Dict[str, str] = {}    # driver → ошибка (после всех попыток)
+
+    async def upload(self, chunks: AsyncIterator[bytes], filename: str) -> Tuple[str, str]:
+        queues = [asyncio.Queue(maxsize=FANOUT_QUEUE_CHUNKS) for _ in self.targets]
+        dead: set[int] = set()
+
+        async def feed() -> None:
+            try:
+                async for c in chunks:
+                    live = [i for i in range(len(queues)) if i not in dead]
+                    if not live:
+                        break  # все места упали — их ошибки соберёт gather ниже
+                    for i in live:
+                        await queues[i].put(c)
+                end = _EOF
+            except BaseException as e:
+                end = e
+            for i, q in enumerate(queues):
+                if i not in dead:
+                    await q.put(end)
+            if end is not _EOF:
+                raise end
+
+        async def consume(q: asyncio.Queue) -> AsyncIterator[bytes]:
+            while True:
+                item = await q.get()
+                if item is _EOF:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+
+        async def one(i: int, t: UploadTarget) -> Tuple[str, str]:
+            try:
+                return await t.upload(consume(queues[i]), filename)
+            except BaseException:
+                # место выбывает: раздача его пропускает, очередь освобождаем от ждущего put()
+                dead.add(i)
+                while not queues[i].empty():
+                    queues[i].get_nowait()
+                raise
+
+        results = await asyncio.gather(feed(), *(one(i, t) for i, t in enumerate(self.targets)), return_exceptions=True)
+        if isinstance(results[0], BaseException):
+            raise results[0]  # поток дампа упал — это ошибка бэкапа, а не мест
+
+        done = {t.driver: r for t, r in zip(self.targets, results[1:]) if not isinstance(r, BaseException)}
+        errors = {t.driver: r for t, r in zip(self.targets, results[1:]) if isinstance(r, BaseException)}
+        if not done:
+            raise RuntimeError("; ".join(f"{d}: {e}" for d, e in errors.items()))
+
+        # перезаливка упавших мест из первой готовой копии
+        src = next(t for t in self.targets if t.driver in done)
+        for t in self.targets:
+            if t.driver not in errors:
                 continue
-            name_el = prop.find("d:displayname", ns)
-            name = name_el.text if name_el is not None else ""
-            rtype = prop.find("d:resourcetype", ns)
-            is_dir = rtype is not None and rtype.find("d:collection", ns) is not None
-            mod_el = prop.find("d:getlastmodified", ns)
-            modified_dt = None
-            if mod_el is not None and mod_el.text:
+            for _ in range(max(0, BACKUP_FANOUT_RETRIES)):
                 try:
-                    modified_dt = parsedate_to_datetime(mod_el.text)
-                    if modified_dt.tzinfo is None:
-                        modified_dt = modified_dt.replace(tzinfo=timezone.utc)
-                except Exception:
-                    modified_dt = None
-
-            # пропускаем сам каталог
-            if href.rstrip("/").endswith(remote_dir.strip("/")):
+                    done[t.driver] = await t.upload(src.download(done[src.driver][1]), filename)
+                    errors.pop(t.driver)
+                    break
+                except Exception as e:
+                    errors[t.driver] = e
+        for d, e in errors.items():
+            self.failures[d] = f"{filename}: {e}"
+
+        status = [f"{d} ✓" if d in done else f"{d} ✗ ({errors[d]})" for d in (t.driver for t in self.targets)]
+        ref = json.dumps({d: r for d, (_, r) in done.items()}, ensure_ascii=False)
+        return ", ".join(status), ref
+
+    def _refs(self, ref: str) -> List[Tuple[UploadTarget, str]]:
+        refs = json.loads(ref)
+        return [(t, refs[t.driver]) for t in self.targets if t.driver in refs]
+
+    async def verify(self, ref: str, size: int, sha256: str) -> str:
+        """Сверка во всех местах параллельно; расхождение где угодно — ошибка."""
+        pairs = self._refs(ref)
+        notes = await asyncio.gather(*(verify_remote(t, r, size, sha256) for t, r in pairs), return_exceptions=True)
+        bad = [f"{t.driver}: {n}" for (t, _), n in zip(pairs, notes) if isinstance(n, BaseException)]
+        if bad:
+            raise RuntimeError("; ".join(bad))
+        return ", ".join(f"{t.driver} {n}" for (t, _), n in zip(pairs, notes))
+
+    def download(self, ref: str) -> AsyncIterator[bytes]:
+        t, r = self._refs(ref)[0]
+        return t.download(r)
+
+    async def cleanup(self, dry_run: bool = False) -> RetentionReport:
+        """Retention по каждому месту отдельно; отчёт — объединённый."""
+        reports = await asyncio.gather(*(t.cleanup(dry_run=dry_run) for t in self.targets), return_exceptions=True)
+        out = RetentionReport(dry_run=dry_run)
+        for t, r in zip(self.targets, reports):
+            if isinstance(r, BaseException):
+                out.failed.append(f"{t.driver}: {r}")
                 continue
+            out.kept_sets.update(r.kept_sets)
+            out.deleted_sets = sorted(set(out.deleted_sets) | set(r.deleted_sets))
+            out.deleted_items += r.deleted_items
+            out.failed += [f"{t.driver}: {f}" for f in r.failed]
+            out.elapsed_sec = max(out.elapsed_sec, r.elapsed_sec)
+        return out
 
-            if not name:
-                name = href.rstrip("/").split("/")[-1]
 
-            out.append({"href": href, "name": name, "is_dir": is_dir, "modified": modified_dt})
-        return out
+async def resolve_target(
+        folder_id: str | None, sa_json, policy: RetentionPolicy, name_prefix: str,
+) -> "UploadTarget | FanOutTarget":
+    """Один драйвер — UploadTarget, список через запятую — FanOutTarget. RuntimeError, если место не настроено."""
+    drivers = [d.strip() for d in (BACKUP_DRIVER or "oauth").lower().split(",") if d.strip()]
+    targets = [await UploadTarget.resolve(folder_id, sa_json, policy, name_prefix, driver=d) for d in dict.fromkeys(drivers)]
+    return targets[0] if len(targets) == 1 else FanOutTarget(targets)
+
+
+class HashingStream:
+    """Прозрачная обёртка над потоком чанков: sha256 и размер считаются по ходу загрузки."""
 
-    def delete(self, remote_path: str) -> None:
-        url = self._url(remote_path)
-        r = self.session.delete(url)
-        if r.status_code not in (200, 204):
-            raise RuntimeError(f"WebDAV DELETE failed ({r.status_code}): {r.text[:400]}")
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self._chunks = chunks
+        self._sha = hashlib.sha256()
+        self.size = 0
 
+    async def chunks(self) -> AsyncIterator[bytes]:
+        async for c in self._chunks:
+            self._sha.update(c)
+            self.size += len(c)
+            yield c
 
-def _webdav_upload_and_cleanup(
-        local_path: str,
+    @property
+    def sha256(self) -> str:
+        return self._sha.hexdigest()
+
+
+async def verify_remote(target: UploadTarget, ref: str, size: int, sha256: str, mode: str = BACKUP_VERIFY) -> str:
+    """
+    Сверка загруженной копии. size — размер (WebDAV: getcontentlength; Drive: size +
+    sha256Checksum, который Drive считает сам); full — скачать и пересчитать sha256.
+    RuntimeError при расхождении, иначе короткая заметка для статуса.
+    """
+    if mode == "off":
+        return "verify off"
+    remote_size, remote_sha = await target.remote_meta(ref)
+    if remote_size is not None and remote_size != size:
+        raise RuntimeError(f"remote size mismatch: {remote_size} != {size}")
+    if remote_sha and remote_sha.lower() != sha256:
+        raise RuntimeError("remote sha256 mismatch")
+    if remote_sha:
+        return "verified sha256"
+    if mode == "full":
+        h = hashlib.sha256()
+        n = 0
+        async for c in target.download(ref):
+            h.update(c)
+            n += len(c)
+        if n != size or h.hexdigest() != sha256:
+            raise RuntimeError(f"remote copy differs (downloaded {n} bytes)")
+        return "verified sha256 (download)"
+    return "verified size" if remote_size is not None else "size unknown"
+
+
+@dataclass
+class DumpResult:
+    where: str
+    note: str
+    ref: str
+    size: int
+    sha256: str
+    dump_sec: float
+    manifest: Optional[dict] = None
+
+
+async def dump_and_upload(
+        target: UploadTarget | FanOutTarget,
+        params: dict,
+        pg_dump_bin: str,
         filename: str,
-        retention_days: int,
-        name_prefix: str,
-) -> Tuple[str, int]:
+        compress: List[str],
+        dump_format: str = "custom",
+        dump_jobs: int = 1,
+        extra_args: List[str] | None = None,
+        cleanup: bool = True,
+        manifest: bool = False,
+) -> DumpResult:
     """
-    Заливает файл на WEBDAV_ROOT и удаляет старые с тем же префиксом имени.
-    Возвращает (remote_path, deleted_count).
+    pg_dump → поток → хранилище.
+      custom:    pg_dump -F c → stdout
+      directory: pg_dump -F d -j N во временный каталог → tar -cf - → stdout
+    Поток хэшируется по ходу загрузки; загруженная копия сверяется (BACKUP_VERIFY).
+    manifest=True: pg_dump работает на экспортированном снимке, в нём же считаются строки
+    таблиц; рядом заливается <file>.manifest.json (sha256, размер, строки, длительность).
+    Ошибки — RuntimeError с готовым текстом.
     """
-    if not WEBDAV_BASE_URL or not WEBDAV_USERNAME or not WEBDAV_PASSWORD:
-        raise RuntimeError("WebDAV not configured: WEBDAV_BASE_URL/WEBDAV_USERNAME/WEBDAV_PASSWORD are required")
-
-    client = WebDAVClient(WEBDAV_BASE_URL, WEBDAV_USERNAME, WEBDAV_PASSWORD)
+    env = _pg_env(params)
+    extra = list(extra_args or [])
+    t0 = time.monotonic()
+    tmp_dir: str | None = None
+    snap: Optional[SnapshotCounts] = None
+    try:
+        if manifest:
+            try:
+                snap = await SnapshotCounts.open(params)
+            except Exception as e:
+                raise RuntimeError(f"snapshot/row counts failed: {e}")
+            extra.append(f"--snapshot={snap.snapshot_id}")
 
-    remote_dir = WEBDAV_ROOT or "/"
-    client.mkcol_recursive(remote_dir)
+        if dump_format == "directory":
+            tmp_dir = tempfile.mkdtemp(prefix="botwb_dump_")
+            out_dir = os.path.join(tmp_dir, "dump")
+            cmd = _pg_dump_cmd(pg_dump_bin, params, compress, fmt="directory", out_dir=out_dir, jobs=dump_jobs)
+            try:
+                await asyncio.wait_for(_run_pg_dump_dir(cmd + extra, env), timeout=DUMP_TIMEOUT_SEC)
+            except asyncio.TimeoutError:
+                raise RuntimeError(f"pg_dump timeout ({DUMP_TIMEOUT_SEC}s)")
+            if snap:
+                await snap.close()
+            dump = DumpStream(_tar_stream_cmd(out_dir), env)
+        else:
+            dump = DumpStream(_pg_dump_cmd(pg_dump_bin, params, compress) + extra, env)
+        dump_sec = round(time.monotonic() - t0, 2)
 
-    remote_path = f"{remote_dir.rstrip('/')}/{filename}"
-    client.put_file(local_path, remote_path)
+        try:
+            await dump.start()
+        except Exception as e:
+            raise RuntimeError(f"pg_dump start failed: {e}")
 
-    deleted = 0
-    if retention_days > 0:
+        hashed = HashingStream(dump.chunks())
         try:
-            items = client.list_dir(remote_dir)
-            cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
-            for it in items:
-                if it.get("is_dir"):
-                    continue
-                nm = it.get("name") or ""
-                mod = it.get("modified")
-                if not nm.startswith(name_prefix):
-                    continue
-                if mod and mod < cutoff:
-                    href = it.get("href") or ""
-                    # href вида /botwb/filename.backup → берём относительный путь
-                    rel = "/" + href.lstrip("/").split("/", 1)[-1] if href.startswith("/") else href
-                    try:
-                        client.delete(rel)
-                        deleted += 1
-                    except Exception:
-                        continue
-        except Exception:
-            # Не считаем ошибку очистки фатальной для бэкапа
-            pass
+            where, ref = await asyncio.wait_for(
+                target.upload(hashed.chunks(), filename), timeout=DUMP_TIMEOUT_SEC,
+            )
+        except asyncio.TimeoutError:
+            await dump.kill()
+            raise RuntimeError(f"pg_dump/upload timeout ({DUMP_TIMEOUT_SEC}s)")
+        except Exception as e:
+            await dump.kill()
+            if str(e).startswith("pg_dump failed"):
+                raise
+            raise RuntimeError(f"Upload failed ({target.driver}): {e}")
+    finally:
+        if snap:
+            await snap.close()
+        if tmp_dir:
+            await asyncio.to_thread(shutil.rmtree, tmp_dir, True)
 
-    return remote_path, deleted
+    try:
+        note = await target.verify(ref, hashed.size, hashed.sha256)
+    except Exception as e:
+        raise RuntimeError(f"Verify failed for {filename}: {e}")
 
+    # старые бэкапы чистим только когда новый точно на месте
+    if cleanup:
+        try:
+            note += ", " + (await target.cleanup()).summary()
+        except Exception as e:
+            note += f", cleanup failed: {e}"
+
+    res = DumpResult(
+        where=where, note=note, ref=ref,
+        size=hashed.size, sha256=hashed.sha256, dump_sec=dump_sec,
+    )
+    if manifest and snap:
+        res.manifest = {
+            "file": filename,
+            "ref": ref,
+            "driver": target.driver,
+            "format": dump_format,
+            "size": hashed.size,
+            "sha256": hashed.sha256,
+            "created_at": datetime.utcnow().replace(microsecond=0).isoformat(),
+            "duration_sec": round(time.monotonic() - t0, 2),
+            "database": params["database"],
+            "row_counts": snap.counts,
+        }
+        data = json.dumps(res.manifest, ensure_ascii=False, indent=1).encode("utf-8")
+        await target.upload(_single_chunk(data), f"{filename}.manifest.json")
+    return res
+
+
+async def _single_chunk(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+
+def retention_policy(st: BackupSettings) -> RetentionPolicy:
+    return RetentionPolicy(
+        daily_days=st.retention_days or 0,
+        weekly=st.keep_weekly or 0,
+        monthly=st.keep_monthly or 0,
+    )
+
+
+async def save_backup_status(msg: str, manifest: Optional[dict] = None) -> None:
+    async with get_session() as s:
+        st = await s.get(BackupSettings, 1)
+        if st:
+            st.last_run_at = datetime.utcnow()
+            st.last_status = msg[:255]
+            if manifest:
+                st.last_manifest = manifest
+            await s.commit()
 
-# ------------------------- Основной бэкап -------------------------
 
 async def run_backup(db_url: str) -> Tuple[bool, str]:
     """
-    Делает pg_dump и отправляет в хранилище по BACKUP_DRIVER:
+    Делает pg_dump и потоково отправляет его в хранилище по BACKUP_DRIVER:
       - 'webdav' → Яндекс.Диск/любой WebDAV
       - 'oauth'  → Google Drive (личный)
       - 'sa'     → Google Drive (Service Account на Shared Drive)
+    Временный файл не создаётся (кроме directory-формата); event loop бота не блокируется.
+    При включённых инкрементах работу делает utils.backup_incremental.
     """
     # Охранный флаг: бэкап только на сервере
     if os.environ.get("HOST_ROLE") and os.environ["HOST_ROLE"] != "server":
@@ -238,108 +769,102 @@ async def run_backup(db_url: str) -> Tuple[bool, str]:
             return False, "Backup settings not found (id=1)"
         if not st.enabled:
             return False, "Backups disabled"
+        policy = retention_policy(st)
+        folder_id = st.gdrive_folder_id
+        sa_json = st.gdrive_sa_json
+        dump_format = st.dump_format if st.dump_format in DUMP_FORMATS else "custom"
+        dump_jobs = max(1, int(st.dump_jobs or 1))
+        compression = st.compression or DEFAULT_COMPRESSION
+        incremental = bool(st.incremental_enabled)
+
+    params = parse_db_url(db_url)
+
+    pg_dump_bin = _resolve_pg_dump()
+    if not pg_dump_bin:
+        return False, "pg_dump not found on PATH and PG_DUMP_PATH is invalid"
+    compress, compression_used = compression_args(compression, await pg_dump_major(pg_dump_bin))
+
+    # 2) Проверки драйвера — до запуска pg_dump
+    try:
+        target = await resolve_target(folder_id, sa_json, policy, name_prefix=params["database"])
+    except Exception as e:
+        return False, f"Upload failed ({(BACKUP_DRIVER or 'oauth').lower()}): {e}"
+
+    if incremental:
+        from utils.backup_incremental import run_chain_backup
+        ok, msg = await run_chain_backup(
+            params, pg_dump_bin, target, compress, dump_format, dump_jobs, policy.daily_days,
+        )
+        await save_backup_status(msg)
+        await _notify_partial(target)
+        return ok, msg
+
+    # 3) pg_dump → поток → загрузка
+    ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    ext = "dir.tar" if dump_format == "directory" else "backup"
+    fname = f"{params['database']}_{ts}.{ext}"
+    t0 = time.monotonic()
+    try:
+        res = await dump_and_upload(
+            target, params, pg_dump_bin, fname, compress, dump_format, dump_jobs,
+            manifest=BACKUP_VERIFY != "off",
+        )
+    except Exception as e:
+        return False, str(e)
+
+    duration = round(time.monotonic() - t0, 2)
+    size_mb = res.size / (1024 * 1024)
+    mode = f"{dump_format}/{compression_used}" + (f"/j{dump_jobs} dump={res.dump_sec}s" if dump_format == "directory" else "")
+    msg = f"OK: {fname} [{mode}] uploaded to {res.where}, size={size_mb:.2f} MB, duration={duration}s, {res.note}"
+
+    # 4) Сохраняем статус (и манифест — для тест-восстановления)
+    await save_backup_status(msg, res.manifest)
+    await _notify_partial(target)
+    return True, msg
 
-        params = parse_db_url(db_url)
-        ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-        fname = f"{params['database']}_{ts}.backup"
-
-        # 2) Дамп во временный файл
-        with tempfile.TemporaryDirectory() as tmpdir:
-            fpath = os.path.join(tmpdir, fname)
-
-            env = os.environ.copy()
-            if params["password"]:
-                env["PGPASSWORD"] = params["password"]
-
-            pg_dump_bin = _resolve_pg_dump()
-            if not pg_dump_bin:
-                return False, "pg_dump not found on PATH and PG_DUMP_PATH is invalid"
-
-            cmd = [
-                pg_dump_bin,
-                "-h", params["host"],
-                "-p", str(params["port"]),
-                "-U", params["user"],
-                "-d", params["database"],
-                "-F", "c",
-                "-Z", "9",
-                "-f", fpath,
-            ]
-
-            kw = dict(check=True, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            if sys.platform.startswith("win"):
-                kw["creationflags"] = 0x08000000  # CREATE_NO_WINDOW
-
-            t0 = time.monotonic()
-            try:
-                subprocess.run(cmd, timeout=900, **kw)
-            except subprocess.TimeoutExpired:
-                return False, "pg_dump timeout (900s)"
-            except subprocess.CalledProcessError as e:
-                return False, f"pg_dump failed: {e.stderr.decode(errors='ignore')[:400]}"
 
-            duration = round(time.monotonic() - t0, 2)
-            size_mb = _human_mb(fpath)
+async def _notify_partial(target) -> None:
+    """fan-out: бэкап удался, но часть мест не получила копию — админу отдельным сообщением."""
+    failures = getattr(target, "failures", None)
+    if failures:
+        await notify_admin(
+            "⚠️ Бэкап сохранён не во все места\n" + "\n".join(f"{d}: {e}" for d, e in failures.items())
+        )
 
-            # 3) Загрузка по драйверу
-            driver = (BACKUP_DRIVER or "oauth").lower()
-            try:
-                if driver == "webdav":
-                    remote_path, deleted = _webdav_upload_and_cleanup(
-                        fpath,
-                        fname,
-                        st.retention_days,
-                        name_prefix=params["database"],
-                    )
-                    msg = (f"OK: {fname} uploaded to WebDAV ({remote_path}), "
-                           f"size={size_mb:.2f} MB, duration={duration}s, deleted {deleted} old")
-
-                elif driver == "sa":
-                    if not build_drive_sa:
-                        return False, "Service Account mode requested but utils.gdrive is missing"
-                    if not st.gdrive_sa_json:
-                        return False, "Service Account JSON is not configured in backup_settings"
-                    drive = build_drive_sa(st.gdrive_sa_json)
-                    if not st.gdrive_folder_id:
-                        return False, "Google Drive not configured: Folder ID is empty"
-                    file_id = upload_file(drive, fpath, fname, st.gdrive_folder_id)
-                    try:
-                        deleted = cleanup_old(drive, st.gdrive_folder_id, st.retention_days, name_prefix=params["database"])
-                        msg = (f"OK: {fname} uploaded (id={file_id}), "
-                               f"size={size_mb:.2f} MB, duration={duration}s, deleted {deleted} old")
-                    except Exception as e:
-                        msg = (f"OK: {fname} uploaded (id={file_id}), "
-                               f"size={size_mb:.2f} MB, duration={duration}s; cleanup failed: {e}")
-
-                else:
-                    # 'oauth'
-                    if not st.gdrive_folder_id:
-                        return False, "Google Drive not configured: Folder ID is empty"
-                    drive = build_drive_oauth(GOOGLE_OAUTH_CLIENT_PATH, GOOGLE_OAUTH_TOKEN_PATH)
-                    file_id = upload_file(drive, fpath, fname, st.gdrive_folder_id)
-                    try:
-                        deleted = cleanup_old(drive, st.gdrive_folder_id, st.retention_days, name_prefix=params["database"])
-                        msg = (f"OK: {fname} uploaded (id={file_id}), "
-                               f"size={size_mb:.2f} MB, duration={duration}s, deleted {deleted} old")
-                    except Exception as e:
-                        msg = (f"OK: {fname} uploaded (id={file_id}), "
-                               f"size={size_mb:.2f} MB, duration={duration}s; cleanup failed: {e}")
-            except Exception as e:
-                return False, f"Upload failed ({driver}): {e}"
-
-        # 4) Сохраняем статус
-        st.last_run_at = datetime.utcnow()
-        st.last_status = msg[:500]
-        await s.commit()
 
-    return True, msg
+async def run_retention(db_url: str, dry_run: bool = True) -> Tuple[bool, str, Optional[RetentionReport]]:
+    """Очистка по текущей политике вне бэкапа (админка: предпросмотр / применить сейчас)."""
+    async with get_session() as s:
+        st = (await s.execute(select(BackupSettings).where(BackupSettings.id == 1))).scalar_one_or_none()
+        if not st:
+            return False, "Backup settings not found (id=1)", None
+        policy = retention_policy(st)
+        folder_id, sa_json = st.gdrive_folder_id, st.gdrive_sa_json
+    if not policy.enabled:
+        return False, "Retention is off (retention_days = 0)", None
+    params = parse_db_url(db_url)
+    try:
+        target = await resolve_target(folder_id, sa_json, policy, name_prefix=params["database"])
+        report = await target.cleanup(dry_run=dry_run)
+    except Exception as e:
+        return False, f"Retention failed: {e}", None
+    return not report.failed, f"{report.summary()} [{report.elapsed_sec}s]", report
 
 
 # -------------------- Restore command builder (server-only) --------------------
 
-def build_restore_cmd(filepath: str) -> str:
+def restore_jobs_for(filepath: str) -> int:
+    """-j N осмыслен только для custom (.backup/.dump) и directory архивов; SQL и .gz — в один поток."""
+    if os.path.isdir(filepath) or filepath.lower().endswith((".backup", ".dump")):
+        return max(1, RESTORE_JOBS)
+    return 1
+
+
+def build_restore_cmd(filepath: str, jobs: int = 1) -> str:
     """
     Собирает команду восстановления строго для сервера через системный скрипт.
+    Скрипт получает путь к файлу/каталогу и (при jobs > 1) число потоков вторым аргументом —
+    старые версии скрипта лишний аргумент просто игнорируют.
     """
     # Разрешаем restore только на сервере
     if os.environ.get("HOST_ROLE") and os.environ["HOST_ROLE"] != "server":
@@ -352,7 +877,104 @@ def build_restore_cmd(filepath: str) -> str:
     if not restore_path or not (os.path.isfile(restore_path) and os.access(restore_path, os.X_OK)):
         raise RuntimeError("RESTORE_SCRIPT_PATH не задан или не исполняем")
 
-    return f"sudo -n {shlex.quote(restore_path)} {shlex.quote(filepath)}"
+    cmd = f"sudo -n {shlex.quote(restore_path)} {shlex.quote(filepath)}"
+    if jobs > 1:
+        cmd += f" {int(jobs)}"
+    return cmd
+
+
+# -------------------- Restore: потоковый лог и тайминги по фазам --------------------
+
+# Фаза определяется по строке вывода скрипта: явный маркер "==> reindex" / "[phase] reindex"
+# или характерные слова (DROP DATABASE, pg_restore, REINDEX ...).
+RESTORE_PHASES: Tuple[Tuple[str, "re.Pattern[str]"], ...] = (
+    ("drop", re.compile(r"drop\s+(database|schema)|dropdb|terminat", re.I)),
+    ("restore", re.compile(r"pg_restore|psql|restor", re.I)),
+    ("reindex", re.compile(r"reindex|analyze|vacuum", re.I)),
+)
+_PHASE_MARK_RE = re.compile(r"^\s*(?:==>|\[phase\])\s*(\w+)", re.I)
+
+
+class PhaseTimer:
+    """Тайминги последовательных фаз: start() закрывает предыдущую фазу."""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self.current: Optional[str] = None
+        self._t0 = 0.0
+
+    def start(self, phase: str) -> None:
+        if phase == self.current:
+            return
+        self.stop()
+        self.current = phase
+        self._t0 = time.monotonic()
+
+    def stop(self) -> None:
+        if self.current:
+            self.timings[self.current] = round(self.timings.get(self.current, 0.0) + time.monotonic() - self._t0, 2)
+        self.current = None
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.timings[phase] = round(self.timings.get(phase, 0.0) + seconds, 2)
+
+    def summary(self) -> str:
+        return " · ".join(f"{k} {v:.1f}s" for k, v in self.timings.items()) or "—"
+
+
+def detect_phase(line: str, current: Optional[str]) -> Optional[str]:
+    m = _PHASE_MARK_RE.match(line)
+    if m:
+        return m.group(1).lower()
+    # по ключевым словам фаза только продвигается вперёд
+    order = [p for p, _ in RESTORE_PHASES]
+    start = order.index(current) + 1 if current in order else 0
+    for phase, rx in RESTORE_PHASES[start:]:
+        if rx.search(line):
+            return phase
+    return None
+
+
+async def stream_restore(
+        filepath: str,
+        env: dict,
+        log_path: str,
+        on_line: Callable[[str], Awaitable[None]],
+        timer: PhaseTimer,
+        jobs: int = 1,
+) -> int:
+    """
+    Запускает серверный скрипт восстановления и читает его вывод построчно:
+    каждая строка пишется в log_path (лог не копится в памяти) и отдаётся в on_line.
+    Возвращает код завершения.
+    """
+    cmd = build_restore_cmd(filepath, jobs)
+    proc = await asyncio.create_subprocess_shell(
+        cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, env=env, limit=1024 * 1024,
+    )
+    timer.start("drop")
+    try:
+        with open(log_path, "w", encoding="utf-8") as log:
+            assert proc.stdout is not None
+            while True:
+                raw = await proc.stdout.readline()
+                if not raw:
+                    break
+                line = raw.decode(errors="ignore").rstrip()
+                log.write(line + "\n")
+                phase = detect_phase(line, timer.current)
+                if phase:
+                    timer.start(phase)
+                await on_line(line)
+        code = await proc.wait()
+    except asyncio.CancelledError:
+        # отмена фоновой задачи: sudo передаёт сигнал скрипту
+        with contextlib.suppress(ProcessLookupError):
+            proc.terminate()
+        raise
+    finally:
+        timer.stop()
+    return code
 
 
 # --- Backward compatibility aliases -----------------------------------------
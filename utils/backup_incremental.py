@@ -0,0 +1,499 @@
+# utils/backup_incremental.py
+# Инкрементальные логические бэкапы для append-only таблиц (stock_movements, audit_logs).
+#
+# Цепочка = полный дамп + инкременты:
+#   • full (раз в full_every_days, при смене схемы или сломанной цепочке) — обычный pg_dump,
+#     восстанавливается и сам по себе; перед ним фиксируются watermarks = max(id) таблиц;
+#   • инкремент — pg_dump БЕЗ данных append-only таблиц (справочники/документы — небольшие)
+#     + для каждой append-only таблицы gzip-файл COPY строк с id в (watermark, max(id)].
+#   • манифест <db>_<chain>.manifest<seq>.json (накопительный) заливается после каждого шага,
+#     его же копия лежит в backup_settings.chain_state.
+#
+# Строку с меньшим id могут закоммитить позже строки с бо́льшим: id выдан транзакции, которая ещё
+# идёт. Поэтому после max(id) шаг ждёт, пока завершатся все транзакции, активные на тот момент
+# (pg_snapshot_xmin(pg_current_snapshot()) ≥ снятого xmax, до SETTLE_TIMEOUT_SEC): новые транзакции
+# получат id больше, так что все id ≤ watermark «осели». Не дождались (долгая транзакция) —
+# watermark не двигается, следующий инкремент выгрузит диапазон заново; полный дамп в этом случае
+# цепочку не начинает. Дубликаты при восстановлении отсекаются ON CONFLICT (id) DO NOTHING.
+# Восстановление цепочки — restore_chain() (CLI: scripts/restore_chain.py).
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import glob
+import gzip
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import asyncpg
+
+from database.db import get_session
+from database.models import BackupSettings
+from config import BACKUP_VERIFY
+from utils.backup import (
+    DUMP_TIMEOUT_SEC,
+    STREAM_CHUNK,
+    HashingStream,
+    UploadTarget,
+    _pg_env,
+    dump_and_upload,
+    parse_db_url,
+    pg_connect,
+    resolve_pg_restore,
+)
+from utils.webdav import PARTS_SUFFIX, join_parts
+
+APPEND_ONLY_TABLES: Tuple[str, ...] = ("stock_movements", "audit_logs")
+SETTLE_TIMEOUT_SEC = 120       # ожидание транзакций, активных на момент снятия max(id)
+SETTLE_POLL_SEC = 1.0
+MANIFEST_VERSION = 1
+
+
+# ---------------------------
+# Вспомогательное
+# ---------------------------
+def _qi(name: str) -> str:
+    """Кавычки для идентификатора PostgreSQL."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+async def _alembic_revision(conn: asyncpg.Connection) -> Optional[str]:
+    with contextlib.suppress(Exception):
+        return await conn.fetchval("SELECT version_num FROM alembic_version LIMIT 1")
+    return None
+
+
+async def _table_columns(conn: asyncpg.Connection, table: str) -> List[str]:
+    rows = await conn.fetch(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_schema = 'public' AND table_name = $1 ORDER BY ordinal_position",
+        table,
+    )
+    return [r["column_name"] for r in rows]
+
+
+async def _max_ids(conn: asyncpg.Connection) -> Dict[str, int]:
+    return {
+        t: int(await conn.fetchval(f"SELECT coalesce(max(id), 0) FROM {_qi(t)}"))
+        for t in APPEND_ONLY_TABLES
+    }
+
+
+async def _wait_settled(conn: asyncpg.Connection, timeout: float = SETTLE_TIMEOUT_SEC) -> bool:
+    """
+    Дождаться завершения транзакций, активных сейчас (их xid < xmax текущего снимка).
+    True — все id ≤ только что снятых max(id) закоммичены или откачены; False — таймаут.
+    """
+    horizon = await conn.fetchval("SELECT pg_snapshot_xmax(pg_current_snapshot())::text")
+    deadline = time.monotonic() + timeout
+    while not await conn.fetchval(
+            "SELECT pg_snapshot_xmin(pg_current_snapshot()) >= $1::text::xid8", horizon,
+    ):
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(SETTLE_POLL_SEC)
+    return True
+
+
+async def _single_chunk(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+
+def _now_iso() -> str:
+    return datetime.utcnow().replace(microsecond=0).isoformat()
+
+
+# ---------------------------
+# COPY → gzip → поток
+# ---------------------------
+class CopyStream:
+    """
+    COPY (SELECT ...) TO STDOUT через asyncpg, сжатие gzip на лету, чанки по chunk_size
+    (кратно 256 KiB — требование resumable upload Drive). rows — число строк после EOF.
+    """
+
+    def __init__(self, conn: asyncpg.Connection, query: str, *args, chunk_size: int = STREAM_CHUNK, level: int = 6):
+        self.conn = conn
+        self.query = query
+        self.args = args
+        self.chunk_size = chunk_size
+        self.level = level
+        self.rows = 0
+        self.bytes_total = 0
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=8)
+        comp = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip-обёртка
+
+        async def sink(data: bytes) -> None:
+            out = comp.compress(data)
+            if out:
+                await queue.put(out)
+
+        async def run() -> None:
+            try:
+                status = await self.conn.copy_from_query(self.query, *self.args, output=sink, format="text")
+                self.rows = int(str(status).split()[-1])
+                await queue.put(comp.flush())
+                await queue.put(None)
+            except Exception as e:
+                await queue.put(e)
+
+        task = asyncio.create_task(run())
+        buf = bytearray()
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise RuntimeError(f"COPY failed: {item}")
+                buf += item
+                while len(buf) >= self.chunk_size:
+                    out = bytes(buf[:self.chunk_size])
+                    del buf[:self.chunk_size]
+                    self.bytes_total += len(out)
+                    yield out
+            if buf:
+                self.bytes_total += len(buf)
+                yield bytes(buf)
+        finally:
+            if not task.done():
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError, Exception):
+                    await task
+
+
+# ---------------------------
+# Решение: полный дамп или инкремент
+# ---------------------------
+def full_reason(
+        state: Optional[dict],
+        database: str,
+        revision: Optional[str],
+        max_ids: Dict[str, int],
+        full_every_days: int,
+        retention_days: int,
+) -> Optional[str]:
+    """Причина начать новую цепочку или None, если можно дописать инкремент."""
+    if not state or state.get("version") != MANIFEST_VERSION or not state.get("base"):
+        return "no chain"
+    if state.get("database") != database:
+        return "database changed"
+    if state.get("alembic") != revision:
+        return "schema changed"
+    # база цепочки не должна пережить retention — иначе очистка удалит её раньше инкрементов
+    limit = max(1, full_every_days or 1)
+    if retention_days > 0:
+        limit = max(1, min(limit, retention_days - 1))
+    started = datetime.fromisoformat(state["base"]["created_at"])
+    age_days = (datetime.utcnow() - started).days
+    if age_days >= limit:
+        return f"base is {age_days}d old"
+    marks = state.get("watermarks") or {}
+    for t in APPEND_ONLY_TABLES:
+        if t not in marks:
+            return f"no watermark for {t}"
+        if marks[t] > max_ids[t]:
+            return f"{t} watermark ahead of table (restored DB?)"
+    return None
+
+
+# ---------------------------
+# Запуск (вызывается из utils.backup.run_backup)
+# ---------------------------
+async def run_chain_backup(
+        params: dict,
+        pg_dump_bin: str,
+        target: UploadTarget,
+        compress: List[str],
+        dump_format: str,
+        dump_jobs: int,
+        retention_days: int,
+) -> Tuple[bool, str]:
+    async with get_session() as s:
+        st = await s.get(BackupSettings, 1)
+        state = dict(st.chain_state or {}) if st else {}
+        full_every_days = st.full_every_days if st else 7
+
+    db = params["database"]
+    t0 = time.monotonic()
+    try:
+        conn = await pg_connect(params)
+    except Exception as e:
+        return False, f"DB connect failed: {e}"
+
+    try:
+        revision = await _alembic_revision(conn)
+        # watermarks фиксируем ДО pg_dump (и ждём, пока «осядут»): всё, что появится позже, — в следующий инкремент
+        upper = await _max_ids(conn)
+        settled = await _wait_settled(conn)
+        reason = full_reason(state, db, revision, upper, full_every_days, retention_days)
+
+        if reason:
+            chain_id = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+            ext = "dir.tar" if dump_format == "directory" else "backup"
+            fname = f"{db}_{chain_id}.full.{ext}"
+            res = await dump_and_upload(
+                target, params, pg_dump_bin, fname, compress, dump_format, dump_jobs,
+                manifest=BACKUP_VERIFY != "off", cleanup=False,
+            )
+            if not settled:
+                # без «осевших» watermarks цепочку не начинаем: дамп годен сам по себе, цепочка — в следующий раз
+                await _save_state({}, res.manifest)
+                duration = round(time.monotonic() - t0, 2)
+                return True, (
+                    f"OK: full {fname} ({reason}; chain deferred: transactions still open after "
+                    f"{SETTLE_TIMEOUT_SEC}s) uploaded to {res.where}, size={res.size / (1024 * 1024):.2f} MB, "
+                    f"duration={duration}s, {res.note}, {await _cleanup_note(target)}"
+                )
+            state = {
+                "version": MANIFEST_VERSION,
+                "database": db,
+                "chain_id": chain_id,
+                "alembic": revision,
+                "tables": list(APPEND_ONLY_TABLES),
+                "base": {
+                    "file": fname, "format": dump_format, "created_at": _now_iso(), "watermarks": upper,
+                    "size": res.size, "sha256": res.sha256,
+                },
+                "parts": [],
+                "watermarks": upper,
+            }
+            await _upload_manifest(target, state)
+            await _save_state(state, res.manifest)
+            duration = round(time.monotonic() - t0, 2)
+            return True, (
+                f"OK: full {fname} ({reason}) uploaded to {res.where}, "
+                f"size={res.size / (1024 * 1024):.2f} MB, duration={duration}s, {res.note}, "
+                f"{await _cleanup_note(target)}"
+            )
+
+        # даже без новых строк инкремент пишется: изменяемые таблицы могли поменяться
+        prev = state["watermarks"]
+        seq = len(state["parts"]) + 1
+        prefix = f"{db}_{state['chain_id']}.inc{seq:04d}"
+
+        # 1) всё, кроме данных append-only таблиц (свежая схема + изменяемые таблицы)
+        schema_file = f"{prefix}.rest.backup"
+        extra = [f"--exclude-table-data={t}" for t in APPEND_ONLY_TABLES]
+        rest = await dump_and_upload(
+            target, params, pg_dump_bin, schema_file, compress, "custom", 1, extra_args=extra, cleanup=False,
+        )
+        size = rest.size
+
+        # 2) новые строки append-only таблиц
+        files = []
+        total_rows = 0
+        for t in APPEND_ONLY_TABLES:
+            if upper[t] <= prev[t]:
+                continue
+            lo = prev[t]   # предыдущий watermark «осел»: строки с id ≤ него уже выгружены
+            cols = await _table_columns(conn, t)
+            query = (
+                f"SELECT {', '.join(_qi(c) for c in cols)} FROM {_qi(t)} "
+                f"WHERE id > $1 AND id <= $2 ORDER BY id"
+            )
+            stream = CopyStream(conn, query, lo, upper[t])
+            hashed = HashingStream(stream.chunks())
+            fname = f"{prefix}.{t}.copy.gz"
+            _, ref = await asyncio.wait_for(
+                target.upload(hashed.chunks(), fname), timeout=DUMP_TIMEOUT_SEC,
+            )
+            await target.verify(ref, hashed.size, hashed.sha256)
+            files.append({
+                "table": t, "file": fname, "columns": cols,
+                "from_id": lo, "to_id": upper[t], "rows": stream.rows,
+                "size": hashed.size, "sha256": hashed.sha256,
+            })
+            total_rows += stream.rows
+            size += stream.bytes_total
+
+        # не дождались активных транзакций — watermark на месте, диапазон повторится в следующем шаге
+        marks = upper if settled else prev
+        state["parts"].append({
+            "seq": seq, "created_at": _now_iso(), "rest_file": schema_file, "rest_sha256": rest.sha256,
+            "files": files, "watermarks": marks, "settled": settled,
+        })
+        state["watermarks"] = marks
+        await _upload_manifest(target, state)
+        await _save_state(state)
+    except asyncio.TimeoutError:
+        return False, f"incremental upload timeout ({DUMP_TIMEOUT_SEC}s)"
+    except Exception as e:
+        return False, str(e)
+    finally:
+        with contextlib.suppress(Exception):
+            await conn.close()
+
+    duration = round(time.monotonic() - t0, 2)
+    return True, (
+        f"OK: inc #{seq} of chain {state['chain_id']}: {total_rows} new rows"
+        f"{'' if settled else ' (watermark kept: transactions still open)'}, size={size / (1024 * 1024):.2f} MB, duration={duration}s, {await _cleanup_note(target)}"
+    )
+
+
+def manifest_name(state: dict) -> str:
+    return f"{state['database']}_{state['chain_id']}.manifest{len(state['parts']):04d}.json"
+
+
+async def _upload_manifest(target: UploadTarget, state: dict) -> None:
+    data = json.dumps(state, ensure_ascii=False, indent=1).encode("utf-8")
+    await target.upload(_single_chunk(data), manifest_name(state))
+
+
+async def _cleanup_note(target: UploadTarget) -> str:
+    """Очистка по GFS после того, как манифест новой цепочки уже на месте; вся цепочка — один набор."""
+    try:
+        return (await target.cleanup()).summary()
+    except Exception as e:
+        return f"cleanup failed: {e}"
+
+
+async def _save_state(state: dict, last_manifest: Optional[dict] = None) -> None:
+    async with get_session() as s:
+        st = await s.get(BackupSettings, 1)
+        if st:
+            st.chain_state = state
+            if last_manifest:
+                st.last_manifest = last_manifest
+            await s.commit()
+
+
+async def reset_chain() -> None:
+    """Следующий запуск сделает полный дамп."""
+    async with get_session() as s:
+        st = await s.get(BackupSettings, 1)
+        if st:
+            st.chain_state = None
+            await s.commit()
+
+
+# ---------------------------
+# Восстановление цепочки
+# ---------------------------
+def find_latest_manifest(folder: str) -> Optional[str]:
+    """Последний (накопительный) манифест в каталоге со скачанными файлами цепочки."""
+    found = sorted(glob.glob(os.path.join(folder, "*.manifest*.json")))
+    return found[-1] if found else None
+
+
+async def _pg_restore(pg_restore_bin: str, params: dict, path: str, args: List[str]) -> None:
+    cmd = [
+        pg_restore_bin,
+        "-h", params["host"], "-p", str(params["port"]), "-U", params["user"], "-d", params["database"],
+        "--no-owner", "--exit-on-error", *args, path,
+    ]
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE, env=_pg_env(params),
+    )
+    _, err = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"pg_restore failed (rc={proc.returncode}) on {os.path.basename(path)}: "
+                           f"{(err or b'').decode(errors='ignore')[:400]}")
+
+
+def _unpack_dir_tar(path: str, tmp: str) -> str:
+    out = os.path.join(tmp, os.path.basename(path)[:-len(".dir.tar")])
+    os.makedirs(out, exist_ok=True)
+    with tarfile.open(path, "r:") as tf:
+        tf.extractall(out, filter="data")
+    return out
+
+
+async def replay_copy_file(conn: asyncpg.Connection, table: str, columns: List[str], path: str) -> int:
+    """Дописывает строки из *.copy.gz; уже существующие id пропускаются. Возвращает число вставленных."""
+    cols = ", ".join(_qi(c) for c in columns)
+    async with conn.transaction():
+        await conn.execute(f"CREATE TEMP TABLE _chain_replay (LIKE {_qi(table)} INCLUDING DEFAULTS) ON COMMIT DROP")
+        with gzip.open(path, "rb") as f:
+            await conn.copy_to_table("_chain_replay", source=f, columns=columns, format="text")
+        status = await conn.execute(
+            f"INSERT INTO {_qi(table)} ({cols}) SELECT {cols} FROM _chain_replay ORDER BY id "
+            f"ON CONFLICT (id) DO NOTHING"
+        )
+    return int(status.split()[-1])
+
+
+async def restore_chain(
+        manifest_path: str,
+        db_url: str,
+        upto_seq: Optional[int] = None,
+        log: Callable[[str], None] = print,
+) -> None:
+    """
+    Восстановление: файлы цепочки лежат рядом с манифестом.
+      1) нет инкрементов → pg_restore полного дампа;
+      2) иначе pg_restore последнего *.rest.backup (актуальная схема и изменяемые таблицы),
+         затем данные append-only таблиц из полного дампа (--data-only -t ...),
+         затем по порядку все *.copy.gz (ON CONFLICT DO NOTHING);
+      3) sequences append-only таблиц подтягиваются к max(id).
+    """
+    folder = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        m = json.load(f)
+    if m.get("version") != MANIFEST_VERSION:
+        raise RuntimeError(f"Unsupported manifest version: {m.get('version')}")
+
+    parts = [p for p in m["parts"] if upto_seq is None or p["seq"] <= upto_seq]
+    needed = [m["base"]["file"]] + [p["rest_file"] for p in parts[-1:]] + [
+        x["file"] for p in parts for x in p["files"]
+    ]
+    for n in needed:
+        # WEBDAV_UPLOAD_MODE=parts: вместо файла скачан каталог <file>.parts — склеиваем
+        parts_dir = os.path.join(folder, n + PARTS_SUFFIX)
+        if not os.path.isfile(os.path.join(folder, n)) and os.path.isdir(parts_dir):
+            log(f"Склейка {n}{PARTS_SUFFIX}")
+            await asyncio.to_thread(join_parts, parts_dir, os.path.join(folder, n))
+    missing = [n for n in needed if not os.path.isfile(os.path.join(folder, n))]
+    if missing:
+        raise RuntimeError("Missing chain files:\n  - " + "\n  - ".join(missing))
+
+    pg_restore_bin = resolve_pg_restore()
+    if not pg_restore_bin:
+        raise RuntimeError("pg_restore not found on PATH")
+
+    params = parse_db_url(db_url)
+    tmp = tempfile.mkdtemp(prefix="botwb_chain_")
+    try:
+        base = os.path.join(folder, m["base"]["file"])
+        if base.endswith(".dir.tar"):
+            log("Распаковка полного дампа (directory)…")
+            base = await asyncio.to_thread(_unpack_dir_tar, base, tmp)
+
+        t0 = time.monotonic()
+        if not parts:
+            log(f"pg_restore {m['base']['file']}")
+            await _pg_restore(pg_restore_bin, params, base, ["--clean", "--if-exists"])
+        else:
+            rest = parts[-1]["rest_file"]
+            log(f"pg_restore {rest} (схема + изменяемые таблицы)")
+            await _pg_restore(pg_restore_bin, params, os.path.join(folder, rest), ["--clean", "--if-exists"])
+            tables = [a for t in m["tables"] for a in ("-t", t)]
+            log(f"pg_restore --data-only {', '.join(m['tables'])} из {m['base']['file']}")
+            await _pg_restore(pg_restore_bin, params, base, ["--data-only", *tables])
+
+        conn = await pg_connect(params)
+        try:
+            for p in parts:
+                for x in p["files"]:
+                    n = await replay_copy_file(conn, x["table"], x["columns"], os.path.join(folder, x["file"]))
+                    log(f"inc #{p['seq']}: {x['table']} +{n} (из {x['rows']})")
+            for t in m["tables"]:
+                await conn.execute(
+                    f"SELECT setval(pg_get_serial_sequence('{t}', 'id'), "
+                    f"GREATEST((SELECT coalesce(max(id), 0) FROM {_qi(t)}), 1))"
+                )
+        finally:
+            await conn.close()
+        log(f"Готово за {round(time.monotonic() - t0, 1)}s: full + {len(parts)} инкрементов")
+    finally:
+        await asyncio.to_thread(shutil.rmtree, tmp, True)
@@ -0,0 +1,307 @@
+# utils/backup_retention.py
+# Очистка старых бэкапов по политике GFS поверх существующих драйверов (WebDAV / Google Drive).
+#
+# Единица хранения — «набор»: все файлы с одной меткой <db>_YYYYMMDD_HHMMSS в имени
+# (дамп, его манифест, *.parts, вся инкрементальная цепочка). Политика:
+#   • daily   — все наборы моложе N дней (N = backup_settings.retention_days, 0 — не чистить);
+#   • weekly  — последний набор в каждой из N последних недель, где были бэкапы;
+#   • monthly — последний набор в каждом из N последних месяцев, где были бэкапы;
+#   • самый свежий набор не удаляется никогда (текущая цепочка инкрементов).
+# Файлы без метки времени или с чужим префиксом не трогаем.
+#
+# WebDAV: бэкапы лежат в ROOT/YYYY/MM/ — листинг идёт по месячным папкам (Depth: 1),
+# месяц, где удаляется всё, сносится одним DELETE; остальное — параллельно (DELETE_CONCURRENCY).
+# Drive: постраничный листинг с фильтром по имени на стороне сервера, удаление batch-запросами.
+# Локальный каталог (драйвер local): та же раскладка YYYY/MM, что и у WebDAV.
+
+from __future__ import annotations
+
+import asyncio
+import os
+import re
+import shutil
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from utils import webdav
+
+DELETE_CONCURRENCY = 8
+
+_TS_RE = re.compile(r"_(\d{8})_(\d{6})")
+_YEAR_RE = re.compile(r"^\d{4}$")
+_MONTH_RE = re.compile(r"^\d{2}$")
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    daily_days: int
+    weekly: int = 0
+    monthly: int = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.daily_days > 0
+
+
+@dataclass
+class RemoteItem:
+    name: str
+    ref: str                     # путь WebDAV или file id Drive
+    partition: str = ""          # "YYYY/MM" для WebDAV ("" — корень/Drive)
+
+
+@dataclass
+class RetentionReport:
+    dry_run: bool
+    kept_sets: Dict[str, str] = field(default_factory=dict)      # метка → причина
+    deleted_sets: List[str] = field(default_factory=list)
+    deleted_items: int = 0
+    failed: List[str] = field(default_factory=list)
+    elapsed_sec: float = 0.0
+
+    def summary(self) -> str:
+        verb = "would delete" if self.dry_run else "deleted"
+        s = f"retention: kept {len(self.kept_sets)} sets, {verb} {len(self.deleted_sets)} sets ({self.deleted_items} items)"
+        if self.failed:
+            s += f", FAILED {len(self.failed)}"
+        return s
+
+
+def backup_ts(name: str) -> Optional[datetime]:
+    m = _TS_RE.search(name)
+    if not m:
+        return None
+    try:
+        return datetime.strptime(m.group(1) + m.group(2), "%Y%m%d%H%M%S")
+    except ValueError:
+        return None
+
+
+def partition_for(filename: str) -> str:
+    """Папка YYYY/MM по метке в имени файла (цепочка инкрементов остаётся в папке своей базы)."""
+    ts = backup_ts(filename) or datetime.utcnow()
+    return ts.strftime("%Y/%m")
+
+
+def plan(sets: Dict[str, datetime], policy: RetentionPolicy, now: datetime) -> Dict[str, str]:
+    """Какие наборы оставить: метка → причина. Остальные — к удалению."""
+    keep: Dict[str, str] = {}
+    ordered = sorted(sets.items(), key=lambda kv: kv[1], reverse=True)
+    if not ordered:
+        return keep
+    keep[ordered[0][0]] = "latest"
+    for key, ts in ordered:
+        if (now - ts).days < policy.daily_days:
+            keep.setdefault(key, "daily")
+
+    def bucketed(n: int, bucket, reason: str) -> None:
+        seen = set()
+        for key, ts in ordered:
+            b = bucket(ts)
+            if b in seen:
+                continue
+            if len(seen) >= n:
+                break
+            seen.add(b)
+            keep.setdefault(key, reason)
+
+    if policy.weekly:
+        bucketed(policy.weekly, lambda ts: ts.isocalendar()[:2], "weekly")
+    if policy.monthly:
+        bucketed(policy.monthly, lambda ts: (ts.year, ts.month), "monthly")
+    return keep
+
+
+def _group(items: List[RemoteItem], name_prefix: str) -> Tuple[Dict[str, List[RemoteItem]], Dict[str, datetime]]:
+    groups: Dict[str, List[RemoteItem]] = {}
+    stamps: Dict[str, datetime] = {}
+    for it in items:
+        if not it.name.startswith(name_prefix):
+            continue
+        m = _TS_RE.search(it.name)
+        ts = backup_ts(it.name)
+        if not m or ts is None:
+            continue
+        key = m.group(1) + "_" + m.group(2)
+        groups.setdefault(key, []).append(it)
+        stamps[key] = ts
+    return groups, stamps
+
+
+# ---------------------------
+# Хранилища
+# ---------------------------
+class WebDAVStore:
+    def __init__(self, client: webdav.WebDAVClient, root: str):
+        self.client = client
+        self.root = "/" + root.strip("/") if root.strip("/") else ""
+
+    async def _ls(self, path: str) -> List[dict]:
+        try:
+            return await self.client.list_dir(path or "/")
+        except Exception:
+            return []
+
+    async def list(self) -> Tuple[List[RemoteItem], Dict[str, int]]:
+        """Файлы бэкапов + число элементов в каждой месячной папке."""
+        items: List[RemoteItem] = []
+        month_sizes: Dict[str, int] = {}
+
+        def add(entries: List[dict], base: str, partition: str) -> None:
+            for e in entries:
+                nm = (e.get("name") or "").rstrip("/")
+                if e.get("is_dir") and not nm.endswith(webdav.PARTS_SUFFIX):
+                    continue
+                items.append(RemoteItem(name=nm, ref=f"{base}/{nm}", partition=partition))
+
+        top = await self._ls(self.root)
+        add(top, self.root, "")  # старая раскладка: файлы прямо в корне
+        years = [e["name"].rstrip("/") for e in top if e.get("is_dir") and _YEAR_RE.match(e["name"].rstrip("/"))]
+        sem = asyncio.Semaphore(DELETE_CONCURRENCY)
+
+        async def ls(path: str) -> List[dict]:
+            async with sem:
+                return await self._ls(path)
+
+        year_lists = await asyncio.gather(*(ls(f"{self.root}/{y}") for y in years))
+        months = [
+            f"{y}/{e['name'].rstrip('/')}"
+            for y, entries in zip(years, year_lists)
+            for e in entries if e.get("is_dir") and _MONTH_RE.match(e["name"].rstrip("/"))
+        ]
+        month_lists = await asyncio.gather(*(ls(f"{self.root}/{m}") for m in months))
+        for m, entries in zip(months, month_lists):
+            month_sizes[m] = len(entries)
+            add(entries, f"{self.root}/{m}", m)
+        return items, month_sizes
+
+    async def delete(self, doomed: List[RemoteItem], month_sizes: Dict[str, int]) -> Tuple[int, List[str]]:
+        # месяц, в котором удаляется всё, — одним запросом
+        per_month: Dict[str, int] = {}
+        for it in doomed:
+            if it.partition:
+                per_month[it.partition] = per_month.get(it.partition, 0) + 1
+        whole = {m for m, n in per_month.items() if n == month_sizes.get(m)}
+        refs = [f"{self.root}/{m}" for m in whole] + [it.ref for it in doomed if it.partition not in whole]
+
+        sem = asyncio.Semaphore(DELETE_CONCURRENCY)
+        failed: List[str] = []
+
+        async def rm(ref: str) -> None:
+            async with sem:
+                try:
+                    await self.client.delete(ref)
+                except Exception as e:
+                    failed.append(f"{ref}: {e}")
+
+        await asyncio.gather(*(rm(r) for r in refs))
+        return len(doomed), failed
+
+
+class LocalStore:
+    """Каталог на диске сервера (драйвер local); файловые операции — в отдельном потоке."""
+
+    def __init__(self, root: str):
+        self.root = root.rstrip("/") or "/"
+
+    def _list_sync(self) -> Tuple[List[RemoteItem], Dict[str, int]]:
+        items: List[RemoteItem] = []
+        month_sizes: Dict[str, int] = {}
+
+        def add(base: str, partition: str) -> List[str]:
+            names = sorted(os.listdir(base))
+            for nm in names:
+                full = os.path.join(base, nm)
+                if os.path.isdir(full) and not nm.endswith(webdav.PARTS_SUFFIX):
+                    continue
+                items.append(RemoteItem(name=nm, ref=full, partition=partition))
+            return names
+
+        if not os.path.isdir(self.root):
+            return items, month_sizes
+        for y in add(self.root, ""):
+            if not (_YEAR_RE.match(y) and os.path.isdir(os.path.join(self.root, y))):
+                continue
+            for m in sorted(os.listdir(os.path.join(self.root, y))):
+                path = os.path.join(self.root, y, m)
+                if _MONTH_RE.match(m) and os.path.isdir(path):
+                    month_sizes[f"{y}/{m}"] = len(add(path, f"{y}/{m}"))
+        return items, month_sizes
+
+    def _delete_sync(self, refs: List[str]) -> List[str]:
+        failed: List[str] = []
+        for ref in refs:
+            try:
+                if os.path.isdir(ref):
+                    shutil.rmtree(ref)
+                else:
+                    os.remove(ref)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                failed.append(f"{ref}: {e}")
+        return failed
+
+    async def list(self) -> Tuple[List[RemoteItem], Dict[str, int]]:
+        return await asyncio.to_thread(self._list_sync)
+
+    async def delete(self, doomed: List[RemoteItem], month_sizes: Dict[str, int]) -> Tuple[int, List[str]]:
+        per_month: Dict[str, int] = {}
+        for it in doomed:
+            if it.partition:
+                per_month[it.partition] = per_month.get(it.partition, 0) + 1
+        whole = {m for m, n in per_month.items() if n == month_sizes.get(m)}
+        refs = [os.path.join(self.root, m) for m in whole] + [it.ref for it in doomed if it.partition not in whole]
+        return len(doomed), await asyncio.to_thread(self._delete_sync, refs)
+
+
+class DriveStore:
+    """Листинг и batch-удаление — через клиента из utils.gdrive_clients (Google или fake)."""
+
+    def __init__(self, client, folder_id: str):
+        self.client = client
+        self.folder_id = folder_id
+
+    async def list(self, name_prefix: str) -> List[RemoteItem]:
+        return [RemoteItem(name=name, ref=fid) for fid, name in await self.client.list(self.folder_id, name_prefix)]
+
+    async def delete(self, doomed: List[RemoteItem]) -> Tuple[int, List[str]]:
+        failed = await self.client.delete([it.ref for it in doomed])
+        return len(doomed) - len(failed), failed
+
+
+# ---------------------------
+# Запуск
+# ---------------------------
+async def apply_retention(
+        store,
+        name_prefix: str,
+        policy: RetentionPolicy,
+        dry_run: bool = False,
+        now: Optional[datetime] = None,
+) -> RetentionReport:
+    """Листинг → план GFS → удаление (или только отчёт при dry_run). Ошибки удаления — в report.failed."""
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()
+    report = RetentionReport(dry_run=dry_run)
+    if not policy.enabled:
+        return report
+
+    if isinstance(store, DriveStore):
+        items, month_sizes = await store.list(name_prefix), {}
+    else:
+        items, month_sizes = await store.list()
+    groups, stamps = _group(items, name_prefix)
+    report.kept_sets = plan(stamps, policy, now or datetime.utcnow())
+    report.deleted_sets = sorted(k for k in groups if k not in report.kept_sets)
+    doomed = [it for k in report.deleted_sets for it in groups[k]]
+    report.deleted_items = len(doomed)
+
+    if doomed and not dry_run:
+        if isinstance(store, DriveStore):
+            _, report.failed = await store.delete(doomed)
+        else:
+            _, report.failed = await store.delete(doomed, month_sizes)
+    report.elapsed_sec = round(loop.time() - t0, 2)
+    return report
@@ -0,0 +1,193 @@
+# utils/backup_verify.py
+# Тест-восстановление последнего полного бэкапа (по манифесту из backup_settings.last_manifest):
+#   1) скачать копию из хранилища, сверить размер и sha256;
+#   2) pg_restore --list (архив читается, оглавление целое);
+#   3) полное восстановление во временную БД <db>_restore_check;
+#   4) сравнить число строк по таблицам с манифестом, удалить временную БД.
+# Всё — подпроцессы asyncio и asyncpg, event loop бота не блокируется.
+# Провал — уведомление админу (utils.notify).
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+from sqlalchemy import select
+
+from database.db import get_session
+from database.models import BackupSettings
+from utils.backup import (
+    UploadTarget,
+    _pg_env,
+    count_rows,
+    parse_db_url,
+    pg_connect,
+    resolve_pg_restore,
+    resolve_target,
+    retention_policy,
+)
+from utils.notify import notify_admin
+
+TEST_RESTORE_TIMEOUT_SEC = 3600
+TEST_RESTORE_JOBS = 4
+
+
+def _scratch_name(database: str) -> str:
+    return f"{database}_restore_check"
+
+
+async def _run(cmd: List[str], env: dict) -> Tuple[int, str, str]:
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, env=env,
+    )
+    out, err = await proc.communicate()
+    return proc.returncode, out.decode(errors="ignore"), err.decode(errors="ignore")
+
+
+def _untar(path: str, out_dir: str) -> str:
+    os.makedirs(out_dir, exist_ok=True)
+    with tarfile.open(path, "r:") as tf:
+        tf.extractall(out_dir, filter="data")
+    os.remove(path)
+    return out_dir
+
+
+async def _drop_scratch(params: dict, scratch: str) -> None:
+    conn = await pg_connect(params, "postgres")
+    try:
+        await conn.execute(f'DROP DATABASE IF EXISTS "{scratch}" WITH (FORCE)')
+    finally:
+        await conn.close()
+
+
+async def _test_restore(target: UploadTarget, manifest: dict, params: dict) -> str:
+    """Возвращает отчёт; RuntimeError — проверка не пройдена."""
+    pg_restore_bin = resolve_pg_restore()
+    if not pg_restore_bin:
+        raise RuntimeError("pg_restore not found on PATH")
+
+    timings: List[str] = []
+    tmp = tempfile.mkdtemp(prefix="botwb_check_")
+    scratch = _scratch_name(params["database"])
+    env = _pg_env(params)
+    try:
+        # 1) скачивание + sha256
+        t0 = time.monotonic()
+        path = os.path.join(tmp, manifest["file"])
+        h = hashlib.sha256()
+        size = 0
+        with open(path, "wb") as f:
+            async for chunk in target.download(manifest["ref"]):
+                h.update(chunk)
+                size += len(chunk)
+                await asyncio.to_thread(f.write, chunk)
+        if size != manifest["size"] or h.hexdigest() != manifest["sha256"]:
+            raise RuntimeError(f"downloaded copy differs from manifest (size {size} vs {manifest['size']})")
+        timings.append(f"download {time.monotonic() - t0:.1f}s")
+        if path.endswith(".dir.tar"):
+            path = await asyncio.to_thread(_untar, path, os.path.join(tmp, "dump"))
+
+        # 2) оглавление
+        t0 = time.monotonic()
+        rc, out, err = await _run([pg_restore_bin, "--list", path], env)
+        if rc != 0:
+            raise RuntimeError(f"pg_restore --list failed: {err[:300]}")
+        toc = sum(1 for ln in out.splitlines() if ln and not ln.startswith(";"))
+        timings.append(f"list {time.monotonic() - t0:.1f}s ({toc} entries)")
+
+        # 3) восстановление во временную БД
+        t0 = time.monotonic()
+        await _drop_scratch(params, scratch)
+        conn = await pg_connect(params, "postgres")
+        try:
+            await conn.execute(f'CREATE DATABASE "{scratch}"')
+        finally:
+            await conn.close()
+        rc, _, err = await _run([
+            pg_restore_bin,
+            "-h", params["host"], "-p", str(params["port"]), "-U", params["user"], "-d", scratch,
+            "--no-owner", "--no-acl", "--exit-on-error", "-j", str(TEST_RESTORE_JOBS), path,
+        ], env)
+        if rc != 0:
+            raise RuntimeError(f"pg_restore into {scratch} failed: {err[:300]}")
+        timings.append(f"restore {time.monotonic() - t0:.1f}s")
+
+        # 4) строки
+        conn = await pg_connect(params, scratch)
+        try:
+            restored = await count_rows(conn)
+        finally:
+            await conn.close()
+        expected = manifest.get("row_counts") or {}
+        diff = [
+            f"{t}: {restored.get(t)} vs {n}"
+            for t, n in sorted(expected.items())
+            if restored.get(t) != n
+        ]
+        if diff:
+            raise RuntimeError("row counts differ: " + "; ".join(diff[:10]))
+        return f"{len(expected)} tables match, {', '.join(timings)}"
+    finally:
+        try:
+            await _drop_scratch(params, scratch)
+        except Exception:
+            pass
+        await asyncio.to_thread(shutil.rmtree, tmp, True)
+
+
+async def run_test_restore(db_url: str) -> Tuple[bool, str]:
+    """Тест-восстановление последнего бэкапа; результат пишется в backup_settings."""
+    async with get_session() as s:
+        st = (await s.execute(select(BackupSettings).where(BackupSettings.id == 1))).scalar_one_or_none()
+        if not st:
+            return False, "Backup settings not found (id=1)"
+        manifest = st.last_manifest
+        folder_id, sa_json, policy = st.gdrive_folder_id, st.gdrive_sa_json, retention_policy(st)
+
+    if not manifest:
+        return False, "No backup manifest yet — run a backup first"
+
+    params = parse_db_url(db_url)
+    t0 = time.monotonic()
+    try:
+        target = await resolve_target(folder_id, sa_json, policy, name_prefix=params["database"])
+        if target.driver != manifest.get("driver"):
+            raise RuntimeError(f"manifest is for driver {manifest.get('driver')}, current is {target.driver}")
+        report = await asyncio.wait_for(_test_restore(target, manifest, params), timeout=TEST_RESTORE_TIMEOUT_SEC)
+        ok, msg = True, f"OK: {manifest['file']} restorable; {report}"
+    except asyncio.TimeoutError:
+        ok, msg = False, f"FAIL: {manifest['file']}: timeout ({TEST_RESTORE_TIMEOUT_SEC}s)"
+    except Exception as e:
+        ok, msg = False, f"FAIL: {manifest['file']}: {e}"
+    msg += f" [{time.monotonic() - t0:.0f}s]"
+
+    async with get_session() as s:
+        st = await s.get(BackupSettings, 1)
+        if st:
+            st.last_test_restore_at = datetime.utcnow()
+            st.last_test_restore_status = msg[:255]
+            await s.commit()
+    return ok, msg
+
+
+async def maybe_test_restore(db_url: str) -> None:
+    """После планового бэкапа: тест-восстановление, если подошёл срок (test_restore_every_days)."""
+    async with get_session() as s:
+        st = await s.get(BackupSettings, 1)
+        if not st or not st.test_restore_every_days:
+            return
+        due = st.last_test_restore_at is None or (
+            datetime.utcnow() - st.last_test_restore_at >= timedelta(days=st.test_restore_every_days)
+        )
+    if not due:
+        return
+    ok, msg = await run_test_restore(db_url)
+    if not ok:
+        await notify_admin(f"❌ Тест-восстановление бэкапа не прошло\n{msg}")
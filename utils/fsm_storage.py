@@ -0,0 +1,115 @@
+# utils/fsm_storage.py
+# Хранилище FSM aiogram под STATE_BACKEND: memory — MemoryStorage (один процесс),
+# redis — RedisStorage aiogram, db — DbStorage (таблица fsm_states, одна строка на ключ).
+#
+#   dp = Dispatcher(storage=make_fsm_storage())
+#
+# Данные FSM сериализуются utils.shared_state.dumps — JSON с метками типов: в корзинах
+# упаковки/поставок ключи — int id товаров, в списках — кортежи; голый JSON превратил бы их в строки/списки.
+# Нечитаемая запись (старый формат, мусор) — пустые данные сценария, а не ошибка апдейта.
+# БД недоступна (аварийный режим, restore) — DbStorage работает на памяти процесса, чтобы сценарий
+# восстановления из бэкапа оставался рабочим.
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from config import STATE_BACKEND
+from database.db import get_session
+from database.models import FsmRecord
+from utils.shared_state import REDIS_PREFIX, dumps, loads, redis_client
+
+logger = logging.getLogger(__name__)
+
+
+def _loads_data(raw) -> Dict[str, Any]:
+    try:
+        data = loads(raw)
+    except (ValueError, TypeError) as e:
+        logger.warning("FSM data is not readable, reset: %r", e)
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+class DbStorage(BaseStorage):
+    """FSM в PostgreSQL: upsert по ключу, Core-запросы (мимо аудита)."""
+
+    def __init__(self):
+        self.fallback = MemoryStorage()
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        parts = (key.bot_id, key.chat_id, key.user_id, key.thread_id,
+                 getattr(key, "business_connection_id", None), key.destiny)
+        return ":".join("" if p is None else str(p) for p in parts)
+
+    async def _upsert(self, key: StorageKey, **values) -> None:
+        t = FsmRecord.__table__
+        stmt = pg_insert(t).values(key=self._key(key), **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[t.c.key],
+            set_={**{name: getattr(stmt.excluded, name) for name in values}, "updated_at": func.current_timestamp()},
+        )
+        async with get_session() as s:
+            await s.execute(stmt)
+            await s.commit()
+
+    async def _column(self, key: StorageKey, column: str):
+        t = FsmRecord.__table__
+        async with get_session() as s:
+            return await s.scalar(select(t.c[column]).where(t.c.key == self._key(key)))
+
+    @staticmethod
+    def _db_failed(op: str, e: Exception) -> None:
+        logger.warning("FSM %s: DB unavailable, using process memory: %r", op, e)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self.fallback.set_state(key, state)
+        try:
+            await self._upsert(key, state=state.state if isinstance(state, State) else state)
+        except Exception as e:
+            self._db_failed("set_state", e)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        try:
+            return await self._column(key, "state")
+        except Exception as e:
+            self._db_failed("get_state", e)
+            return await self.fallback.get_state(key)
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self.fallback.set_data(key, data)
+        try:
+            await self._upsert(key, data=dumps(data) if data else None)
+        except Exception as e:
+            self._db_failed("set_data", e)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        try:
+            raw = await self._column(key, "data")
+        except Exception as e:
+            self._db_failed("get_data", e)
+            return await self.fallback.get_data(key)
+        return _loads_data(raw) if raw else {}
+
+    async def close(self) -> None:
+        return None
+
+
+def make_fsm_storage() -> BaseStorage:
+    if STATE_BACKEND == "db":
+        return DbStorage()
+    if STATE_BACKEND == "redis":
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage(
+            redis_client(),
+            key_builder=DefaultKeyBuilder(prefix=f"{REDIS_PREFIX}:fsm", with_bot_id=True, with_destiny=True),
+            json_dumps=dumps, json_loads=_loads_data,
+        )
+    return MemoryStorage()
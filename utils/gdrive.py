@@ -10,8 +10,11 @@ from typing import Optional
 
 DRIVE_SCOPES = ["https://www.googleapis.com/auth/drive"]
 
+def build_credentials(sa_json: dict):
+    return service_account.Credentials.from_service_account_info(sa_json, scopes=DRIVE_SCOPES)
+
 def build_drive(sa_json: dict):
-    creds = service_account.Credentials.from_service_account_info(sa_json, scopes=DRIVE_SCOPES)
+    creds = build_credentials(sa_json)
     return build("drive", "v3", credentials=creds, cache_discovery=False)
 
 def upload_file(drive, local_path: str, file_name: str, folder_id: str) -> str:
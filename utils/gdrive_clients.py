@@ -0,0 +1,302 @@
+# utils/gdrive_clients.py
+# Реестр клиентов Google Drive: учётные данные, discovery-сервис и httpx-клиент создаются
+# один раз на процесс и переиспользуются бэкапом, retention, тест-восстановлением и
+# хендлерами токена (раньше каждый run_backup заново читал token.json и строил сервис).
+#
+#   • токен обновляется заранее — за REFRESH_MARGIN_SEC до истечения, под локом;
+#     обновлённый OAuth-токен сохраняется обратно в token.json;
+#   • invalidate() — после загрузки нового token.json / смены Service Account;
+#   • драйвер "fake" — Drive в локальном каталоге (GDRIVE_FAKE_DIR) с тем же интерфейсом,
+#     для проверки бэкапов без Google; свои драйверы — register_driver().
+#
+# Интерфейс клиента: upload / meta / download / list / delete (+ close).
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from config import GOOGLE_OAUTH_CLIENT_PATH, GOOGLE_OAUTH_TOKEN_PATH
+from utils.gdrive_stream import upload_stream, file_meta, download_stream
+from utils.lazy import lazy_import
+
+httpx = lazy_import("httpx")
+
+logger = logging.getLogger(__name__)
+
+REFRESH_MARGIN_SEC = 300
+DRIVE_BATCH = 100
+DRIVE_PAGE_SIZE = 1000
+GDRIVE_FAKE_DIR = os.getenv("GDRIVE_FAKE_DIR", "/tmp/botwb_fake_drive")
+
+
+class GoogleDriveClient:
+    """Живой клиент Drive: REST через общий httpx-клиент, list/delete — discovery-сервис в потоке."""
+
+    def __init__(self, driver: str, load_creds: Callable[[], object], persist: Optional[Callable[[object], None]] = None):
+        self.driver = driver
+        self._load_creds = load_creds
+        self._persist = persist
+        self._creds = None
+        self._service = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._lock = asyncio.Lock()
+
+    def _needs_refresh(self) -> bool:
+        c = self._creds
+        if not c.valid:
+            return True
+        expiry = getattr(c, "expiry", None)  # naive UTC у google-auth
+        return bool(expiry) and expiry - datetime.utcnow() < timedelta(seconds=REFRESH_MARGIN_SEC)
+
+    async def creds(self):
+        async with self._lock:
+            if self._creds is None:
+                self._creds = await asyncio.to_thread(self._load_creds)
+            if self._needs_refresh():
+                from google.auth.transport.requests import Request
+                await asyncio.to_thread(self._creds.refresh, Request())
+                if self._persist:
+                    try:
+                        await asyncio.to_thread(self._persist, self._creds)
+                    except Exception as e:
+                        logger.warning("Drive token persist failed: %r", e)
+            return self._creds
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(timeout=httpx.Timeout(60.0, read=300.0))
+        return self._http
+
+    def _get_service(self):
+        if self._service is None:
+            from googleapiclient.discovery import build
+            self._service = build("drive", "v3", credentials=self._creds, cache_discovery=False)
+        return self._service
+
+    async def upload(self, chunks: AsyncIterator[bytes], file_name: str, folder_id: str) -> str:
+        return await upload_stream(await self.creds(), chunks, file_name, folder_id, client=self.http)
+
+    async def meta(self, file_id: str) -> Tuple[Optional[int], Optional[str]]:
+        m = await file_meta(await self.creds(), file_id, client=self.http)
+        size = m.get("size")
+        return (int(size) if size is not None else None), m.get("sha256Checksum")
+
+    async def download(self, file_id: str) -> AsyncIterator[bytes]:
+        async for chunk in download_stream(await self.creds(), file_id, client=self.http):
+            yield chunk
+
+    def _list_sync(self, folder_id: str, name_prefix: str) -> List[Tuple[str, str]]:
+        drive = self._get_service()
+        q = f"'{folder_id}' in parents and trashed = false and name contains '{name_prefix}'"
+        out: List[Tuple[str, str]] = []
+        token = None
+        while True:
+            resp = drive.files().list(
+                q=q, spaces="drive", pageSize=DRIVE_PAGE_SIZE, pageToken=token,
+                fields="nextPageToken, files(id, name)",
+                supportsAllDrives=True, includeItemsFromAllDrives=True,
+            ).execute()
+            out.extend((f["id"], f["name"]) for f in resp.get("files", []))
+            token = resp.get("nextPageToken")
+            if not token:
+                return out
+
+    def _delete_sync(self, ids: List[str]) -> List[str]:
+        drive = self._get_service()
+        failed: List[str] = []
+
+        def cb(request_id, _response, exception):
+            if exception is not None:
+                failed.append(f"{request_id}: {exception}")
+
+        for i in range(0, len(ids), DRIVE_BATCH):
+            batch = drive.new_batch_http_request(callback=cb)
+            for fid in ids[i:i + DRIVE_BATCH]:
+                batch.add(drive.files().delete(fileId=fid, supportsAllDrives=True), request_id=fid)
+            batch.execute()
+        return failed
+
+    async def list(self, folder_id: str, name_prefix: str) -> List[Tuple[str, str]]:
+        """[(file id, name)] — постранично, фильтр по имени на стороне Drive."""
+        await self.creds()
+        return await asyncio.to_thread(self._list_sync, folder_id, name_prefix)
+
+    async def delete(self, ids: List[str]) -> List[str]:
+        """Batch-удаление; возвращает список ошибок."""
+        await self.creds()
+        return await asyncio.to_thread(self._delete_sync, ids)
+
+    async def close(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+
+class FakeDriveClient:
+    """Drive в локальном каталоге: <root>/<folder_id>/<id>__<name>. Тот же интерфейс, что у GoogleDriveClient."""
+
+    driver = "fake"
+
+    def __init__(self, root: str = GDRIVE_FAKE_DIR):
+        self.root = root
+
+    async def creds(self):
+        return None
+
+    def _path(self, file_id: str) -> str:
+        for folder in os.listdir(self.root) if os.path.isdir(self.root) else []:
+            base = os.path.join(self.root, folder)
+            for nm in os.listdir(base):
+                if nm.startswith(file_id + "__"):
+                    return os.path.join(base, nm)
+        raise RuntimeError(f"fake drive: file {file_id} not found")
+
+    async def upload(self, chunks: AsyncIterator[bytes], file_name: str, folder_id: str) -> str:
+        file_id = uuid.uuid4().hex
+        folder = os.path.join(self.root, folder_id or "root")
+        await asyncio.to_thread(os.makedirs, folder, exist_ok=True)
+        path = os.path.join(folder, f"{file_id}__{file_name}")
+        with open(path + ".tmp", "wb") as f:
+            async for c in chunks:
+                await asyncio.to_thread(f.write, c)
+        os.replace(path + ".tmp", path)
+        return file_id
+
+    async def meta(self, file_id: str) -> Tuple[Optional[int], Optional[str]]:
+        def _meta() -> Tuple[int, str]:
+            path = self._path(file_id)
+            h = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    h.update(block)
+            return os.path.getsize(path), h.hexdigest()
+        return await asyncio.to_thread(_meta)
+
+    async def download(self, file_id: str) -> AsyncIterator[bytes]:
+        path = await asyncio.to_thread(self._path, file_id)
+        with open(path, "rb") as f:
+            while True:
+                data = await asyncio.to_thread(f.read, 1024 * 1024)
+                if not data:
+                    return
+                yield data
+
+    async def list(self, folder_id: str, name_prefix: str) -> List[Tuple[str, str]]:
+        folder = os.path.join(self.root, folder_id or "root")
+        names = await asyncio.to_thread(lambda: os.listdir(folder) if os.path.isdir(folder) else [])
+        out = []
+        for nm in names:
+            file_id, _, name = nm.partition("__")
+            if name and not name.endswith(".tmp") and name_prefix in name:
+                out.append((file_id, name))
+        return out
+
+    async def delete(self, ids: List[str]) -> List[str]:
+        failed = []
+        for fid in ids:
+            try:
+                await asyncio.to_thread(os.remove, self._path(fid))
+            except Exception as e:
+                failed.append(f"{fid}: {e}")
+        return failed
+
+    async def close(self) -> None:
+        return None
+
+
+# ---------------------------
+# Фабрики драйверов
+# ---------------------------
+def _oauth_client(sa_json=None) -> GoogleDriveClient:
+    from utils.gdrive_oauth import load_credentials
+
+    def persist(creds) -> None:
+        with open(GOOGLE_OAUTH_TOKEN_PATH, "w", encoding="utf-8") as f:
+            f.write(creds.to_json())
+
+    return GoogleDriveClient(
+        "oauth", lambda: load_credentials(GOOGLE_OAUTH_CLIENT_PATH, GOOGLE_OAUTH_TOKEN_PATH), persist,
+    )
+
+
+def _sa_client(sa_json=None) -> GoogleDriveClient:
+    try:
+        from utils.gdrive import build_credentials
+    except Exception:
+        raise RuntimeError("Service Account mode requested but utils.gdrive is missing")
+    if not sa_json:
+        raise RuntimeError("Service Account JSON is not configured in backup_settings")
+    return GoogleDriveClient("sa", lambda: build_credentials(sa_json))
+
+
+_factories: Dict[str, Callable[..., object]] = {
+    "oauth": _oauth_client,
+    "sa": _sa_client,
+    "fake": lambda sa_json=None: FakeDriveClient(),
+}
+_clients: Dict[Tuple, object] = {}
+
+
+def register_driver(name: str, factory: Callable[..., object]) -> None:
+    """Свой драйвер (например, фейк с другим каталогом); сбрасывает закэшированный клиент с тем же именем."""
+    _factories[name] = factory
+    invalidate(name)
+
+
+def is_drive_driver(name: str) -> bool:
+    return name in _factories
+
+
+def _key(driver: str, sa_json) -> Tuple:
+    if driver == "sa" and sa_json:
+        return driver, sa_json.get("client_email"), sa_json.get("private_key_id")
+    return (driver,)
+
+
+def get_client(driver: str, sa_json=None):
+    """Клиент из кэша процесса (создаётся при первом обращении). RuntimeError — драйвер не настроен."""
+    key = _key(driver, sa_json)
+    client = _clients.get(key)
+    if client is None:
+        factory = _factories.get(driver)
+        if factory is None:
+            raise RuntimeError(f"Unknown Drive driver: {driver}")
+        client = _clients[key] = factory(sa_json)
+    return client
+
+
+def invalidate(driver: Optional[str] = None) -> None:
+    """Забыть клиентов (все или одного драйвера) — следующий get_client перечитает учётные данные."""
+    for key in [k for k in _clients if driver is None or k[0] == driver]:
+        client = _clients.pop(key)
+        close = getattr(client, "close", None)
+        if close:
+            try:
+                asyncio.get_running_loop().create_task(close())
+            except RuntimeError:
+                pass
+
+
+async def check_oauth() -> Tuple[bool, str]:
+    """Перечитать token.json и получить свежий access token (после загрузки нового токена)."""
+    invalidate("oauth")
+    try:
+        await get_client("oauth").creds()
+        return True, "токен проверен"
+    except Exception as e:
+        return False, f"токен не принят Google: {e}"
+
+
+async def close_all() -> None:
+    for client in list(_clients.values()):
+        try:
+            await client.close()
+        except Exception:
+            pass
+    _clients.clear()
@@ -9,7 +9,7 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 
 SCOPES = ["https://www.googleapis.com/auth/drive.file"]
 
-def build_drive_oauth(client_secret_path: str, token_path: str):
+def load_credentials(client_secret_path: str, token_path: str) -> Credentials:
     """
     Авторизация по OAuth (личный Google Drive).
     Сохраняет/читает токен из token_path.
@@ -29,6 +29,10 @@ def build_drive_oauth(client_secret_path: str, token_path: str):
         with open(token_path, "w", encoding="utf-8") as f:
             f.write(creds.to_json())
 
+    return creds
+
+def build_drive_oauth(client_secret_path: str, token_path: str):
+    creds = load_credentials(client_secret_path, token_path)
     return build("drive", "v3", credentials=creds, cache_discovery=False)
 
 def upload_file(drive, local_path: str, filename: str, folder_id: str) -> str:
@@ -0,0 +1,132 @@
+# utils/gdrive_stream.py
+# Потоковая загрузка в Google Drive через resumable upload (REST v3 + httpx),
+# без временного файла: размер заранее неизвестен, части по CHUNK байт.
+from __future__ import annotations
+
+import asyncio
+from typing import AsyncIterator, Optional
+
+from utils.lazy import lazy_import
+
+httpx = lazy_import("httpx")
+
+UPLOAD_URL = "https://www.googleapis.com/upload/drive/v3/files"
+FILES_URL = "https://www.googleapis.com/drive/v3/files"
+_GRANULARITY = 256 * 1024  # все части, кроме последней, кратны 256 KiB
+
+
+async def _bearer(creds) -> str:
+    """Токен google-auth; обновление (блокирующий HTTP) — в отдельном потоке."""
+    if not creds.valid:
+        from google.auth.transport.requests import Request
+        await asyncio.to_thread(creds.refresh, Request())
+    return f"Bearer {creds.token}"
+
+
+async def upload_stream(
+        creds,
+        chunks: AsyncIterator[bytes],
+        file_name: str,
+        folder_id: str,
+        mimetype: str = "application/octet-stream",
+        client: Optional[httpx.AsyncClient] = None,
+) -> str:
+    """
+    Загружает поток чанков в папку folder_id, возвращает file id.
+    Все чанки, кроме последнего, должны быть кратны 256 KiB.
+    Если итератор упал (например, pg_dump завершился с ошибкой), финальная часть
+    не отправляется — незавершённая сессия на стороне Drive файл не создаёт.
+    """
+    own = client is None
+    client = client or httpx.AsyncClient(timeout=httpx.Timeout(60.0, read=300.0))
+    try:
+        r = await client.post(
+            UPLOAD_URL,
+            params={"uploadType": "resumable", "supportsAllDrives": "true", "fields": "id"},
+            headers={
+                "Authorization": await _bearer(creds),
+                "Content-Type": "application/json; charset=UTF-8",
+                "X-Upload-Content-Type": mimetype,
+            },
+            json={"name": file_name, "parents": [folder_id]},
+        )
+        if r.status_code != 200 or "location" not in r.headers:
+            raise RuntimeError(f"Drive resumable init failed ({r.status_code}): {r.text[:400]}")
+        session_url = r.headers["location"]
+
+        offset = 0
+        pending: Optional[bytes] = None
+
+        async def _put(data: bytes, final: bool) -> httpx.Response:
+            end = offset + len(data) - 1
+            if final:
+                total = offset + len(data)
+                rng = f"bytes {offset}-{end}/{total}" if data else f"bytes */{total}"
+            else:
+                if len(data) % _GRANULARITY:
+                    raise ValueError("non-final chunk must be a multiple of 256 KiB")
+                rng = f"bytes {offset}-{end}/*"
+            return await client.put(
+                session_url,
+                content=data,
+                headers={"Authorization": await _bearer(creds), "Content-Range": rng},
+            )
+
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            if pending is not None:
+                resp = await _put(pending, final=False)
+                if resp.status_code != 308:
+                    raise RuntimeError(f"Drive chunk upload failed ({resp.status_code}): {resp.text[:400]}")
+                offset += len(pending)
+            pending = chunk
+
+        resp = await _put(pending or b"", final=True)
+        if resp.status_code not in (200, 201):
+            raise RuntimeError(f"Drive upload finalize failed ({resp.status_code}): {resp.text[:400]}")
+        return resp.json()["id"]
+    finally:
+        if own:
+            await client.aclose()
+
+
+async def file_meta(creds, file_id: str, client: Optional[httpx.AsyncClient] = None) -> dict:
+    """size / sha256Checksum / md5Checksum загруженного файла (Drive считает их сам)."""
+    own = client is None
+    client = client or httpx.AsyncClient(timeout=httpx.Timeout(60.0))
+    try:
+        r = await client.get(
+            f"{FILES_URL}/{file_id}",
+            params={"fields": "id,name,size,sha256Checksum,md5Checksum", "supportsAllDrives": "true"},
+            headers={"Authorization": await _bearer(creds)},
+        )
+        if r.status_code != 200:
+            raise RuntimeError(f"Drive files.get failed ({r.status_code}): {r.text[:400]}")
+        return r.json()
+    finally:
+        if own:
+            await client.aclose()
+
+
+async def download_stream(
+        creds, file_id: str, chunk_size: int = 1024 * 1024, client: Optional[httpx.AsyncClient] = None,
+) -> AsyncIterator[bytes]:
+    """Содержимое файла (alt=media) потоком."""
+    own = client is None
+    client = client or httpx.AsyncClient(timeout=httpx.Timeout(60.0, read=300.0))
+    try:
+        async with client.stream(
+            "GET",
+            f"{FILES_URL}/{file_id}",
+            params={"alt": "media", "supportsAllDrives": "true"},
+            headers={"Authorization": await _bearer(creds)},
+        ) as r:
+            if r.status_code != 200:
+                await r.aread()
+                raise RuntimeError(f"Drive download failed ({r.status_code}): {r.text[:400]}")
+            async for chunk in r.aiter_bytes(chunk_size):
+                yield chunk
+    finally:
+        if own:
+            await client.aclose()
@@ -0,0 +1,348 @@
+# utils/jobs.py
+# Фоновые задачи админки (бэкап, восстановление, очистка БД, тест-восстановление …)
+# поверх AsyncIOScheduler бота: хендлер только ставит задачу и сразу отвечает,
+# работа идёт вне обработки апдейта.
+#
+#   • single-flight: одна задача на «замок» (по умолчанию замок = kind; restore и wipe делят "db");
+#   • статус/прогресс/результат — в таблице bg_jobs (best-effort: при недоступной БД задача
+#     всё равно выполняется, статус живёт в памяти);
+#   • отмена: asyncio-таска задачи отменяется, сама задача может проверять ctx.cancelled.
+#
+# Замки — общие для всех воркеров: на время задачи отдельное соединение (без пула, AUTOCOMMIT)
+# держит pg_try_advisory_lock(GROUP_LOCK_NS, crc32(замок)) и замок своей строки
+# (ROW_LOCK_NS, id). Плановый бэкап ведущего и ручной restore с другого воркера не пересекутся.
+# Умер воркер — Postgres снимает его замки; recover() ведущего помечает прерванными только строки
+# со свободным замком, живые задачи других воркеров не трогает. Кто выполняет — bg_jobs.owner.
+# БД недоступна (аварийный режим) — остаётся замок в памяти процесса, как до общих замков.
+#
+# Пишем в bg_jobs через Core insert/update, а не ORM — иначе каждый апдейт прогресса
+# попадал бы в audit_logs через after_flush-листенер.
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import os
+import socket
+import time
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from config import DB_URL
+from database.db import get_session
+from database.models import BackgroundJob
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_SAVE_SEC = 2.0      # прогресс в БД — не чаще
+RECENT_LIMIT = 15
+
+ACTIVE_STATES = ("queued", "running")
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"[:64]
+
+# Пространства двухключевых advisory-замков (не пересекаются с одноключевым LEADER_LOCK_KEY)
+GROUP_LOCK_NS = 5150101      # (NS, crc32(замок группы)) — single-flight между воркерами
+ROW_LOCK_NS = 5150102        # (NS, bg_jobs.id) — «владелец жив»
+
+# Задачи, которые нельзя запускать одновременно друг с другом
+LOCK_GROUPS = {
+    "restore": "db",
+    "wipe": "db",
+    "backup": "backup",
+    "test_restore": "backup",
+}
+
+
+@dataclass
+class JobInfo:
+    id: int
+    kind: str
+    state: str = "queued"
+    progress: str = ""
+    result: str = ""
+    started_by: Optional[int] = None
+    owner: Optional[str] = None
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @property
+    def duration_sec(self) -> Optional[float]:
+        if not self.started_at:
+            return None
+        return round(((self.finished_at or datetime.utcnow()) - self.started_at).total_seconds(), 1)
+
+
+class JobContext:
+    """То, что получает функция задачи: прогресс и флаг отмены."""
+
+    def __init__(self, runner: "JobRunner", info: JobInfo):
+        self._runner = runner
+        self.info = info
+        self.cancelled = False
+        self._saved_at = 0.0
+
+    async def progress(self, text: str, force: bool = False) -> None:
+        self.info.progress = text[:255]
+        now = time.monotonic()
+        if force or now - self._saved_at >= PROGRESS_SAVE_SEC:
+            self._saved_at = now
+            await self._runner._save(self.info)
+
+
+def _lock_key(lock: str) -> int:
+    """crc32 замка → int4 для pg_advisory_lock(int, int)."""
+    k = zlib.crc32(lock.encode())
+    return k - (1 << 32) if k >= 1 << 31 else k
+
+
+def _row_info(r: Any) -> JobInfo:
+    return JobInfo(
+        id=r["id"], kind=r["kind"], state=r["state"], progress=r["progress"] or "",
+        result=r["result"] or "", started_by=r["started_by"], owner=r["owner"], created_at=r["created_at"],
+        started_at=r["started_at"], finished_at=r["finished_at"],
+    )
+
+
+JobFn = Callable[[JobContext], Awaitable[str]]
+DoneFn = Callable[[JobInfo], Awaitable[None]]
+
+
+class JobBusy(RuntimeError):
+    def __init__(self, running: JobInfo):
+        super().__init__(f"job #{running.id} ({running.kind}) is already {running.state}")
+        self.running = running
+
+
+class JobRunner:
+    def __init__(self):
+        self._scheduler = None
+        self._active: Dict[int, JobInfo] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._contexts: Dict[int, JobContext] = {}
+        self._locks: Dict[str, JobInfo] = {}
+        self._conns: Dict[int, AsyncConnection] = {}
+        self._local_ids = 0
+        self._engine = None
+
+    def set_scheduler(self, scheduler) -> None:
+        self._scheduler = scheduler
+
+    # ---- БД (best-effort) ----
+    def _lock_engine(self):
+        if self._engine is None:
+            self._engine = create_async_engine(DB_URL, poolclass=NullPool, isolation_level="AUTOCOMMIT")
+        return self._engine
+
+    def _local_id(self) -> int:
+        self._local_ids -= 1
+        return self._local_ids
+
+    async def _claim(self, info: JobInfo, lock: str) -> Tuple[int, Optional[AsyncConnection]]:
+        """
+        Общий замок группы + строка bg_jobs с замком строки, на одном соединении — его держим
+        до конца задачи. JobBusy — группу держит другой воркер. БД недоступна → (id < 0, None).
+        """
+        try:
+            conn = await self._lock_engine().connect()
+        except Exception as e:
+            logger.warning("bg_jobs lock unavailable, job kept in memory only: %r", e)
+            return self._local_id(), None
+        try:
+            got = await conn.scalar(select(func.pg_try_advisory_lock(GROUP_LOCK_NS, _lock_key(lock))))
+            if not got:
+                raise JobBusy(await self._busy_row(conn, lock))
+        except JobBusy:
+            await conn.close()
+            raise
+        except Exception as e:
+            await conn.close()
+            logger.warning("bg_jobs lock failed, job kept in memory only: %r", e)
+            return self._local_id(), None
+
+        t = BackgroundJob.__table__
+        try:
+            # замок строки берётся в том же INSERT: строка не видна другим без него
+            res = await conn.execute(
+                insert(t)
+                .values(kind=info.kind, state=info.state, started_by=info.started_by,
+                        owner=info.owner, created_at=info.created_at)
+                .returning(t.c.id, func.pg_try_advisory_lock(ROW_LOCK_NS, t.c.id))
+            )
+            return res.first()[0], conn
+        except Exception as e:
+            logger.warning("bg_jobs insert failed, job kept in memory only: %r", e)
+            return self._local_id(), conn   # замок группы всё равно держим
+
+    async def _busy_row(self, conn: AsyncConnection, lock: str) -> JobInfo:
+        """Задача, занявшая группу в другом воркере (для текста JobBusy)."""
+        kinds = [k for k, g in LOCK_GROUPS.items() if g == lock] or [lock]
+        t = BackgroundJob.__table__
+        with contextlib.suppress(Exception):
+            r = (await conn.execute(
+                select(t).where(t.c.kind.in_(kinds), t.c.state.in_(ACTIVE_STATES)).order_by(t.c.id.desc()).limit(1)
+            )).mappings().first()
+            if r is not None:
+                return _row_info(r)
+        return JobInfo(id=0, kind=lock, state="running")
+
+    async def _release(self, job_id: int) -> None:
+        # закрытие соединения (NullPool) завершает сессию — Postgres снимает оба замка
+        conn = self._conns.pop(job_id, None)
+        if conn is not None:
+            with contextlib.suppress(Exception):
+                await conn.close()
+
+    async def _save(self, info: JobInfo) -> None:
+        if info.id < 0:
+            return
+        values = dict(
+            kind=info.kind, state=info.state, progress=info.progress or None, result=info.result[:1024] or None,
+            started_by=info.started_by, owner=info.owner, created_at=info.created_at,
+            started_at=info.started_at, finished_at=info.finished_at,
+        )
+        try:
+            async with get_session() as s:
+                t = BackgroundJob.__table__
+                res = await s.execute(update(t).where(t.c.id == info.id).values(**values))
+                if res.rowcount == 0:
+                    # таблицу очистили/восстановили во время задачи — вернём строку
+                    await s.execute(insert(t).values(id=info.id, **values))
+                await s.commit()
+        except Exception as e:
+            logger.warning("bg_jobs update #%s failed: %r", info.id, e)
+
+    async def recover(self) -> None:
+        """
+        Ведущий при избрании: задачи в queued/running, чей воркер умер (замок строки свободен),
+        помечаем прерванными. Задачи живых воркеров держат свой замок — их не трогаем.
+        """
+        t = BackgroundJob.__table__
+        try:
+            async with self._lock_engine().connect() as conn:
+                rows = (await conn.execute(
+                    select(t.c.id, t.c.kind, t.c.owner).where(t.c.state.in_(ACTIVE_STATES))
+                )).all()
+                dead = []
+                for job_id, kind, owner in rows:
+                    # взятые здесь замки снимутся при закрытии соединения
+                    if await conn.scalar(select(func.pg_try_advisory_lock(ROW_LOCK_NS, job_id))):
+                        logger.warning("bg_jobs #%s (%s): worker %s is gone, marking failed", job_id, kind, owner)
+                        dead.append(job_id)
+                if dead:
+                    await conn.execute(
+                        update(t).where(t.c.id.in_(dead), t.c.state.in_(ACTIVE_STATES))
+                        .values(state="failed", result="interrupted by restart", finished_at=datetime.utcnow())
+                    )
+        except Exception as e:
+            logger.warning("bg_jobs recover skipped: %r", e)
+
+    async def close(self) -> None:
+        for job_id in list(self._conns):
+            await self._release(job_id)
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = None
+
+    # ---- Запуск ----
+    def running(self, kind: str) -> Optional[JobInfo]:
+        return self._locks.get(LOCK_GROUPS.get(kind, kind))
+
+    async def submit(
+            self,
+            kind: str,
+            fn: JobFn,
+            started_by: Optional[int] = None,
+            on_done: Optional[DoneFn] = None,
+    ) -> JobInfo:
+        """
+        Ставит задачу в работу и сразу возвращает её JobInfo.
+        JobBusy — если задача того же замка уже выполняется (single-flight), в этом или другом воркере.
+        """
+        lock = LOCK_GROUPS.get(kind, kind)
+        busy = self.running(kind)
+        if busy:
+            raise JobBusy(busy)
+        info = JobInfo(id=0, kind=kind, started_by=started_by, owner=WORKER_ID)
+        self._locks[lock] = info  # замок занят до первого await — двойной клик не проскочит
+        try:
+            info.id, conn = await self._claim(info, lock)
+        except BaseException:
+            self._locks.pop(lock, None)
+            raise
+        if conn is not None:
+            self._conns[info.id] = conn
+        self._active[info.id] = info
+        ctx = JobContext(self, info)
+        self._contexts[info.id] = ctx
+
+        async def _run() -> None:
+            self._tasks[info.id] = asyncio.current_task()
+            try:
+                info.state, info.started_at = "running", datetime.utcnow()
+                await self._save(info)
+                if ctx.cancelled:
+                    raise asyncio.CancelledError
+                info.result = (await fn(ctx)) or ""
+                info.state = "done"
+            except asyncio.CancelledError:
+                info.state, info.result = "cancelled", info.result or "cancelled by admin"
+            except Exception as e:
+                logger.exception("Job #%s (%s) failed", info.id, kind)
+                info.state, info.result = "failed", f"{type(e).__name__}: {e}"
+            finally:
+                info.finished_at = datetime.utcnow()
+                self._tasks.pop(info.id, None)
+                self._contexts.pop(info.id, None)
+                self._active.pop(info.id, None)
+                if self._locks.get(lock) is info:
+                    self._locks.pop(lock, None)
+            try:
+                await self._save(info)
+            finally:
+                await self._release(info.id)   # после финального статуса — recover не примет за «мёртвую»
+            if on_done:
+                try:
+                    await on_done(info)
+                except Exception as e:
+                    logger.warning("Job #%s on_done failed: %r", info.id, e)
+
+        if self._scheduler is not None:
+            self._scheduler.add_job(_run, id=f"bgjob_{info.id}", misfire_grace_time=None)
+        else:
+            asyncio.get_running_loop().create_task(_run())
+        return info
+
+    def cancel(self, job_id: int) -> bool:
+        ctx = self._contexts.get(job_id)
+        if ctx is None:
+            return False
+        ctx.cancelled = True
+        task = self._tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+        return True
+
+    # ---- Для /jobs ----
+    async def recent(self, limit: int = RECENT_LIMIT) -> List[JobInfo]:
+        out: Dict[int, JobInfo] = {}
+        try:
+            async with get_session() as s:
+                t = BackgroundJob.__table__
+                rows = (await s.execute(select(t).order_by(t.c.id.desc()).limit(limit))).mappings().all()
+            for r in rows:
+                out[r["id"]] = _row_info(r)
+        except Exception as e:
+            logger.warning("bg_jobs list failed: %r", e)
+        out.update(self._active)  # актуальный прогресс — из памяти
+        return sorted(out.values(), key=lambda j: j.created_at, reverse=True)[:limit]
+
+
+jobs = JobRunner()
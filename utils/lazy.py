@@ -0,0 +1,50 @@
+# utils/lazy.py
+# Отложенный импорт тяжёлых зависимостей (httpx, Google SDK …): модуль регистрируется в sys.modules
+# сразу, а реально исполняется при первом обращении к атрибуту. Роутеры бэкапов/интеграций
+# импортируются ботом всегда, но SDK грузятся только когда админ ими пользуется.
+#
+#   httpx = lazy_import("httpx")          # вместо import httpx
+#
+# Аннотации типов в модулях с `from __future__ import annotations` модуль не трогают;
+# `except httpx.HTTPError` вычисляется только при исключении. Если пакет не установлен —
+# ImportError при первом использовании (с подсказкой pip install), а не при старте бота.
+from __future__ import annotations
+
+import importlib.util
+import sys
+from types import ModuleType
+
+
+class _MissingModule(ModuleType):
+    """Заглушка для неустановленной опциональной зависимости."""
+
+    def __init__(self, name: str, hint: str):
+        super().__init__(name)
+        self._hint = hint
+
+    def __getattr__(self, attr: str):
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        raise ImportError(f"{self.__name__} is not installed ({self._hint})")
+
+
+def lazy_import(name: str, hint: str = "") -> ModuleType:
+    """Модуль `name`, исполняемый при первом обращении к атрибуту (importlib.util.LazyLoader)."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.loader is None:
+        return _MissingModule(name, hint or f"pip install {name}")
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def is_loaded(name: str) -> bool:
+    """Модуль реально исполнен (а не только зарегистрирован lazy_import). Сам модуль не загружает."""
+    module = sys.modules.get(name)
+    return module is not None and type(module).__name__ != "_LazyModule"
@@ -0,0 +1,192 @@
+# utils/metrics.py
+# Метрики процесса в формате Prometheus (text exposition 0.0.4) без внешних зависимостей.
+#
+#   UPDATE_SECONDS.observe(0.012, "callback", "report_all")
+#   UPDATE_ERRORS.inc("callback", "report_all", "OperationalError")
+#   runner = await start_metrics_server("127.0.0.1", 9101)   # GET /metrics
+#
+# Реестр — обычные dict'ы в памяти процесса: пишут middleware (middleware/metrics.py) и
+# SQL-события (database/sql_stats.py), читает HTTP-хендлер в том же event loop.
+# HTTP — aiohttp (ставится вместе с aiogram), слушаем только локальный адрес.
+from __future__ import annotations
+
+import bisect
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+# секунды: от быстрых callback'ов до тяжёлых отчётов
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# штуки: SQL-запросов за апдейт (N+1 видно сразу)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        self.name, self.doc, self.label_names = name, doc, tuple(labels)
+        REGISTRY.register(self)
+
+    def _key(self, values: Sequence[str]) -> LabelValues:
+        if len(values) != len(self.label_names):
+            raise ValueError(f"{self.name}: expected labels {self.label_names}, got {tuple(values)}")
+        return tuple(str(v) for v in values)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()):
+        super().__init__(name, doc, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.label_names, k)} {_fmt(v)}" for k, v in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels → [счётчики по корзинам (не накопительные) + корзина +Inf, sum]
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    def samples(self) -> List[str]:
+        out = []
+        for key, (counts, total) in sorted(self._series.items()):
+            acc = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                acc += n
+                le = 'le="%s"' % _fmt(bound)
+                out.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {acc}")
+            out.append(f"{self.name}_sum{_labels(self.label_names, key)} {_fmt(total[0])}")
+            out.append(f"{self.name}_count{_labels(self.label_names, key)} {acc}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name!r} already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# ---------------------------
+# Метрики бота
+# ---------------------------
+UPDATE_SECONDS = Histogram(
+    "bot_update_seconds", "Update handling latency by handler (callback namespace / command / FSM state).",
+    ("event", "handler"),
+)
+UPDATE_ERRORS = Counter(
+    "bot_update_errors_total", "Updates whose handler raised, by exception type.",
+    ("event", "handler", "error"),
+)
+UPDATE_SQL_STATEMENTS = Histogram(
+    "bot_update_sql_statements", "SQL statements executed while handling one update.",
+    ("event", "handler"), buckets=COUNT_BUCKETS,
+)
+UPDATE_SQL_SECONDS = Histogram(
+    "bot_update_sql_seconds", "Time spent in SQL statements while handling one update.",
+    ("event", "handler"),
+)
+SQL_STATEMENTS = Counter(
+    "bot_sql_statements_total", "SQL statements executed by the process (updates and background jobs).",
+)
+SQL_SECONDS = Counter(
+    "bot_sql_seconds_total", "Total time spent in SQL statements by the process.",
+)
+
+
+# ---------------------------
+# HTTP /metrics
+# ---------------------------
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+async def _metrics_view(request):
+    from aiohttp import web
+    return web.Response(body=REGISTRY.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+
+def add_metrics_route(app, path: str = "/metrics") -> None:
+    """Повесить /metrics на существующее aiohttp-приложение."""
+    app.router.add_get(path, _metrics_view)
+
+
+async def start_metrics_server(host: str, port: int):
+    """Отдельный HTTP-сервер только с /metrics; возвращает runner (await runner.cleanup() при остановке)."""
+    from aiohttp import web
+    app = web.Application()
+    add_metrics_route(app)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Metrics: http://%s:%s/metrics", host, port)
+    return runner
+
+
+async def stop_metrics_server(runner: Optional[object]) -> None:
+    if runner is not None:
+        await runner.cleanup()
@@ -0,0 +1,31 @@
+# utils/notify.py
+# Уведомления администратору из фоновых задач (планировщик, проверки бэкапов),
+# где нет под рукой объекта Bot. bot.py регистрирует бота при старте.
+from __future__ import annotations
+
+import logging
+from typing import Optional
+
+from aiogram import Bot
+
+from config import ADMIN_TELEGRAM_ID
+
+logger = logging.getLogger(__name__)
+
+_bot: Optional[Bot] = None
+
+
+def set_bot(bot: Bot) -> None:
+    global _bot
+    _bot = bot
+
+
+async def notify_admin(text: str) -> None:
+    """Сообщение админу; ошибки доставки только логируются (фоновая задача не должна падать)."""
+    if _bot is None or not ADMIN_TELEGRAM_ID:
+        logger.warning("notify_admin skipped (bot not set): %s", text)
+        return
+    try:
+        await _bot.send_message(ADMIN_TELEGRAM_ID, text[:4000])
+    except Exception as e:
+        logger.warning("notify_admin failed: %r", e)
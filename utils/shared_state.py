@@ -0,0 +1,240 @@
+# utils/shared_state.py
+# Состояние, которое должны видеть все процессы бота: заявки на доступ, последнее «контентное»
+# сообщение пользователя и т.п. Раньше — dict'ы модуля handlers/common.py.
+#
+#   pending_requests = shared_map("pending_requests")
+#   await pending_requests.set(user_id, "Иван")
+#   name = await pending_requests.get(user_id)        # None — нет записи
+#   await pending_requests.pop(user_id)
+#
+# Бэкенд — STATE_BACKEND: memory (один процесс, по умолчанию), db (таблица shared_state),
+# redis (хэш на namespace, REDIS_URL). Значения — JSON-совместимые; ключи приводятся к str.
+# db при недоступной БД (аварийный режим) пишет/читает память процесса — /start и бэкапы работают.
+# dumps/loads — кодек FSM-данных (utils/fsm_storage.py): JSON с явными метками для того, чего в JSON
+# нет — dict с не-строковыми ключами (корзины по int id товара), tuple, Decimal, datetime/date.
+# Не pickle: запись в общее хранилище не должна давать исполнение кода в боте.
+from __future__ import annotations
+
+import json
+import logging
+from abc import ABC, abstractmethod
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Optional, Union
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from config import REDIS_URL, STATE_BACKEND
+from database.db import get_session
+from database.models import SharedStateEntry
+
+logger = logging.getLogger(__name__)
+
+Key = Union[int, str]
+REDIS_PREFIX = "warehouse"
+
+
+# ---------------------------
+# Кодек: JSON с метками типов
+# ---------------------------
+_MAP, _TUPLE, _DECIMAL, _DATETIME, _DATE = "__map__", "__tuple__", "__decimal__", "__datetime__", "__date__"
+
+
+def _encode(value: Any) -> Any:
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, dict):
+        if all(isinstance(k, str) for k in value):
+            return {k: _encode(v) for k, v in value.items()}
+        return {_MAP: [[_encode(k), _encode(v)] for k, v in value.items()]}
+    if isinstance(value, tuple):
+        return {_TUPLE: [_encode(v) for v in value]}
+    if isinstance(value, list):
+        return [_encode(v) for v in value]
+    if isinstance(value, Decimal):
+        return {_DECIMAL: str(value)}
+    if isinstance(value, datetime):
+        return {_DATETIME: value.isoformat()}
+    if isinstance(value, date):
+        return {_DATE: value.isoformat()}
+    raise TypeError(f"{type(value).__name__} is not serializable in shared/FSM state")
+
+
+def _decode(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1:
+        (tag, v), = obj.items()
+        if tag == _MAP:
+            return {k: val for k, val in v}
+        if tag == _TUPLE:
+            return tuple(v)
+        if tag == _DECIMAL:
+            return Decimal(v)
+        if tag == _DATETIME:
+            return datetime.fromisoformat(v)
+        if tag == _DATE:
+            return date.fromisoformat(v)
+    return obj
+
+
+def dumps(value: Any) -> str:
+    return json.dumps(_encode(value), ensure_ascii=False, separators=(",", ":"))
+
+
+def loads(value: Union[str, bytes]) -> Any:
+    return json.loads(value, object_hook=_decode)
+
+
+class SharedMap(ABC):
+    """Словарь namespace → {key: value}, общий для процессов."""
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+
+    @abstractmethod
+    async def get(self, key: Key) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: Key, value: Any) -> None:
+        ...
+
+    @abstractmethod
+    async def pop(self, key: Key) -> Optional[Any]:
+        ...
+
+
+# ---------------------------
+# memory — локальный fallback
+# ---------------------------
+class MemoryMap(SharedMap):
+    def __init__(self, namespace: str):
+        super().__init__(namespace)
+        self._data: Dict[str, Any] = {}
+
+    async def get(self, key: Key) -> Optional[Any]:
+        return self._data.get(str(key))
+
+    async def set(self, key: Key, value: Any) -> None:
+        self._data[str(key)] = value
+
+    async def pop(self, key: Key) -> Optional[Any]:
+        return self._data.pop(str(key), None)
+
+
+# ---------------------------
+# db — таблица shared_state (Core, мимо аудита)
+# ---------------------------
+class DbMap(SharedMap):
+    def __init__(self, namespace: str):
+        super().__init__(namespace)
+        self.fallback = MemoryMap(namespace)
+
+    def _db_failed(self, op: str, e: Exception) -> None:
+        logger.warning("shared_state %s.%s: DB unavailable, using process memory: %r", self.namespace, op, e)
+
+    async def get(self, key: Key) -> Optional[Any]:
+        try:
+            return await self._get(key)
+        except Exception as e:
+            self._db_failed("get", e)
+            return await self.fallback.get(key)
+
+    async def set(self, key: Key, value: Any) -> None:
+        await self.fallback.set(key, value)
+        try:
+            await self._set(key, value)
+        except Exception as e:
+            self._db_failed("set", e)
+
+    async def pop(self, key: Key) -> Optional[Any]:
+        # источник истины — БД: если строку уже забрал другой воркер, локальная копия устарела
+        # (иначе действие по заявке выполнилось бы дважды); память — только когда БД недоступна
+        local = await self.fallback.pop(key)
+        try:
+            return await self._pop(key)
+        except Exception as e:
+            self._db_failed("pop", e)
+            return local
+
+    async def _get(self, key: Key) -> Optional[Any]:
+        t = SharedStateEntry.__table__
+        async with get_session() as s:
+            raw = await s.scalar(select(t.c.value).where(t.c.namespace == self.namespace, t.c.key == str(key)))
+        return None if raw is None else loads(raw)
+
+    async def _set(self, key: Key, value: Any) -> None:
+        t = SharedStateEntry.__table__
+        raw = dumps(value)
+        stmt = pg_insert(t).values(namespace=self.namespace, key=str(key), value=raw)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[t.c.namespace, t.c.key],
+            set_={"value": stmt.excluded.value, "updated_at": func.current_timestamp()},
+        )
+        async with get_session() as s:
+            await s.execute(stmt)
+            await s.commit()
+
+    async def _pop(self, key: Key) -> Optional[Any]:
+        t = SharedStateEntry.__table__
+        async with get_session() as s:
+            raw = await s.scalar(
+                delete(t).where(t.c.namespace == self.namespace, t.c.key == str(key)).returning(t.c.value)
+            )
+            await s.commit()
+        return None if raw is None else loads(raw)
+
+
+# ---------------------------
+# redis — HSET warehouse:<namespace> <key> <json>
+# ---------------------------
+_redis = None
+
+
+def redis_client():
+    """Общий клиент redis.asyncio (пакет redis — опциональная зависимость)."""
+    global _redis
+    if _redis is None:
+        try:
+            from redis.asyncio import Redis
+        except ImportError as e:
+            raise RuntimeError("STATE_BACKEND=redis requires the redis package (pip install redis)") from e
+        _redis = Redis.from_url(REDIS_URL)
+    return _redis
+
+
+async def close_redis() -> None:
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
+
+
+class RedisMap(SharedMap):
+    @property
+    def _hash(self) -> str:
+        return f"{REDIS_PREFIX}:{self.namespace}"
+
+    async def get(self, key: Key) -> Optional[Any]:
+        raw = await redis_client().hget(self._hash, str(key))
+        return None if raw is None else loads(raw)
+
+    async def set(self, key: Key, value: Any) -> None:
+        await redis_client().hset(self._hash, str(key), dumps(value))
+
+    async def pop(self, key: Key) -> Optional[Any]:
+        pipe = redis_client().pipeline(transaction=True)
+        pipe.hget(self._hash, str(key))
+        pipe.hdel(self._hash, str(key))
+        raw, _ = await pipe.execute()
+        return None if raw is None else loads(raw)
+
+
+_BACKENDS = {"memory": MemoryMap, "db": DbMap, "redis": RedisMap}
+
+
+def shared_map(namespace: str) -> SharedMap:
+    cls = _BACKENDS.get(STATE_BACKEND)
+    if cls is None:
+        raise RuntimeError(f"Unknown STATE_BACKEND={STATE_BACKEND!r} (memory | db | redis)")
+    return cls(namespace)
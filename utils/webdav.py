@@ -0,0 +1,589 @@
+# utils/webdav.py
+# Асинхронный WebDAV-клиент (httpx) и движок загрузки бэкапов.
+#
+# Режимы загрузки (WEBDAV_UPLOAD_MODE):
+#   • stream    — один PUT c Transfer-Encoding: chunked в <file>.part, затем MOVE; без
+#                 временных файлов. Тело — поток pg_dump, повторить его нельзя; небольшие
+#                 файлы (целиком в первом чанке) отправляются обычным PUT с повторами.
+#                 WEBDAV_STREAM_SPOOL_MB > 0 — отправленное копится в спуле (диск, не больше
+#                 лимита): оборвался PUT — поток дочитывается в спул и PUT повторяется из него
+#                 целиком; дамп больше лимита — без спула, как по умолчанию;
+#   • parts     — файл режется на части WEBDAV_PART_MB, каждая — отдельный PUT с повторами
+#                 (экспоненциальная задержка), до WEBDAV_PARALLEL частей параллельно.
+#                 На диске: каталог <file>.parts/ (00001.part…, index.json); склейка —
+#                 join_parts() / scripts/webdav_parts.py (обычный restore ждёт один файл —
+#                 поэтому parts только явным выбором);
+#   • nextcloud — chunking v2 Nextcloud (uploads/<user>/<id>/<n> + MOVE .file): те же
+#                 повторы и параллельность, но сервер собирает обычный файл;
+#   • auto      — nextcloud, если WEBDAV_BASE_URL вида …/remote.php/dav/files/<user>, иначе stream.
+#
+# Обрыв соединения стоит одной части: подтверждённые части повторно не шлются.
+# Самопроверка всех режимов против WebDAV-стенда в памяти: python scripts/webdav_parts.py check
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
+import uuid
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from xml.etree import ElementTree as ET
+
+from utils.lazy import lazy_import
+
+httpx = lazy_import("httpx")
+
+from config import (
+    WEBDAV_BASE_URL,
+    WEBDAV_USERNAME,
+    WEBDAV_PASSWORD,
+    WEBDAV_UPLOAD_MODE,
+    WEBDAV_PART_MB,
+    WEBDAV_PARALLEL,
+    WEBDAV_RETRIES,
+    WEBDAV_STREAM_SPOOL_MB,
+)
+
+UPLOAD_MODES = ("auto", "stream", "parts", "nextcloud")
+RETRY_STATUSES = {408, 423, 425, 429, 500, 502, 503, 504}
+RETRY_BASE_SEC = 1.0
+RETRY_MAX_SEC = 30.0
+SPOOL_CHUNK = 1024 * 1024
+PARTS_SUFFIX = ".parts"
+PARTS_INDEX = "index.json"
+
+_NEXTCLOUD_RE = re.compile(r"^(?P<root>.+/remote\.php/dav)/files/(?P<user>[^/]+)/?$")
+
+
+class RetryableError(RuntimeError):
+    pass
+
+
+def _parse_propfind(xml_text: str, remote_dir: str) -> List[dict]:
+    """
+    Разбор ответа PROPFIND (Depth: 1).
+    Возвращает словари: {"href","name","is_dir","modified"(datetime|None),"size"(int|None)}.
+    """
+    out: List[dict] = []
+    ns = {"d": "DAV:"}
+    root = ET.fromstring(xml_text)
+    for resp in root.findall("d:response", ns):
+        href_el = resp.find("d:href", ns)
+        if href_el is None:
+            continue
+        href = href_el.text or ""
+        prop = resp.find("d:propstat/d:prop", ns)
+        if prop is None:
+            continue
+        name_el = prop.find("d:displayname", ns)
+        name = name_el.text if name_el is not None else ""
+        rtype = prop.find("d:resourcetype", ns)
+        is_dir = rtype is not None and rtype.find("d:collection", ns) is not None
+        mod_el = prop.find("d:getlastmodified", ns)
+        modified_dt = None
+        if mod_el is not None and mod_el.text:
+            try:
+                modified_dt = parsedate_to_datetime(mod_el.text)
+                if modified_dt.tzinfo is None:
+                    modified_dt = modified_dt.replace(tzinfo=timezone.utc)
+            except Exception:
+                modified_dt = None
+
+        len_el = prop.find("d:getcontentlength", ns)
+        size = int(len_el.text) if len_el is not None and (len_el.text or "").isdigit() else None
+
+        # пропускаем сам каталог
+        if href.rstrip("/").endswith(remote_dir.strip("/")):
+            continue
+
+        if not name:
+            name = href.rstrip("/").split("/")[-1]
+
+        out.append({"href": href, "name": name, "is_dir": is_dir, "modified": modified_dt, "size": size})
+    return out
+
+
+async def with_retry(
+        op: Callable[[], Awaitable[httpx.Response]],
+        what: str,
+        retries: int = WEBDAV_RETRIES,
+) -> httpx.Response:
+    """
+    Повтор запроса при сетевых ошибках и статусах из RETRY_STATUSES:
+    задержка 1, 2, 4 … (не больше RETRY_MAX_SEC) с джиттером.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            r = await op()
+            if r.status_code in RETRY_STATUSES:
+                raise RetryableError(f"HTTP {r.status_code}")
+            return r
+        except (httpx.TransportError, RetryableError) as e:
+            if attempt >= max(1, retries):
+                raise RuntimeError(f"{what} failed after {attempt} attempts: {e!r}")
+            delay = min(RETRY_MAX_SEC, RETRY_BASE_SEC * 2 ** (attempt - 1))
+            await asyncio.sleep(delay * (0.5 + random.random() / 2))
+
+
+class WebDAVClient:
+    """Асинхронный WebDAV-клиент на httpx (не блокирует event loop бота)."""
+
+    def __init__(
+            self,
+            base_url: str,
+            username: str,
+            password: str,
+            transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.base = base_url.rstrip("/")
+        self.username = username
+        self.session = httpx.AsyncClient(
+            auth=(username, password),
+            timeout=httpx.Timeout(60.0, read=300.0, write=300.0),
+            transport=transport,
+        )
+        # каталоги, существование которых уже проверено (MKCOL не повторяем)
+        self._known_dirs: set[str] = set()
+
+    async def __aenter__(self) -> "WebDAVClient":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self.session.aclose()
+
+    def _url(self, path: str) -> str:
+        return f"{self.base}/{path.lstrip('/')}"
+
+    async def exists(self, remote_path: str) -> bool:
+        r = await with_retry(
+            lambda: self.session.request("PROPFIND", self._url(remote_path), headers={"Depth": "0"}),
+            "WebDAV PROPFIND",
+        )
+        return r.status_code == 207
+
+    async def mkcol_recursive(self, remote_dir: str) -> None:
+        norm = "/" + remote_dir.strip("/")
+        if norm in self._known_dirs or norm == "/":
+            return
+        # чаще всего каталог уже есть — один PROPFIND вместо MKCOL на каждый сегмент
+        if not await self.exists(norm):
+            cur = ""
+            for seg in [p for p in norm.split("/") if p]:
+                cur = f"{cur}/{seg}"
+                if cur in self._known_dirs:
+                    continue
+                # 201 — создано, 405 — уже существует
+                r = await with_retry(lambda: self.session.request("MKCOL", self._url(cur)), "WebDAV MKCOL")
+                if r.status_code not in (201, 405):
+                    raise RuntimeError(f"WebDAV MKCOL {cur} failed ({r.status_code}): {r.text[:400]}")
+                self._known_dirs.add(cur)
+        self._known_dirs.add(norm)
+
+    async def put_stream(self, remote_path: str, chunks: AsyncIterator[bytes]) -> None:
+        """PUT с Transfer-Encoding: chunked — тело читается из асинхронного итератора."""
+        r = await self.session.put(self._url(remote_path), content=chunks)
+        if r.status_code in RETRY_STATUSES:
+            raise RetryableError(f"WebDAV PUT failed ({r.status_code})")
+        if r.status_code not in (200, 201, 204):
+            raise RuntimeError(f"WebDAV PUT failed ({r.status_code}): {r.text[:400]}")
+
+    async def put_file(self, remote_path: str, f, retries: int = WEBDAV_RETRIES) -> None:
+        """PUT содержимого локального файла (с начала) — с повторами, каждый раз заново."""
+        async def body() -> AsyncIterator[bytes]:
+            await asyncio.to_thread(f.seek, 0)
+            while True:
+                buf = await asyncio.to_thread(f.read, SPOOL_CHUNK)
+                if not buf:
+                    return
+                yield buf
+
+        r = await with_retry(
+            lambda: self.session.put(self._url(remote_path), content=body()),
+            f"WebDAV PUT {remote_path}", retries,
+        )
+        if r.status_code not in (200, 201, 204):
+            raise RuntimeError(f"WebDAV PUT failed ({r.status_code}): {r.text[:400]}")
+
+    async def put_bytes(self, remote_path: str, data: bytes, headers: Optional[Dict[str, str]] = None) -> None:
+        """PUT известного тела — с повторами."""
+        r = await with_retry(
+            lambda: self.session.put(self._url(remote_path), content=data, headers=headers),
+            f"WebDAV PUT {remote_path}",
+        )
+        if r.status_code not in (200, 201, 204):
+            raise RuntimeError(f"WebDAV PUT failed ({r.status_code}): {r.text[:400]}")
+
+    async def get_bytes(self, remote_path: str) -> bytes:
+        r = await with_retry(lambda: self.session.get(self._url(remote_path)), f"WebDAV GET {remote_path}")
+        if r.status_code != 200:
+            raise RuntimeError(f"WebDAV GET failed ({r.status_code}): {r.text[:400]}")
+        return r.content
+
+    async def size_of(self, remote_path: str) -> Optional[int]:
+        """getcontentlength файла (None — сервер не сообщил)."""
+        r = await with_retry(
+            lambda: self.session.request(
+                "PROPFIND", self._url(remote_path), headers={"Depth": "0"},
+                content=b'<?xml version="1.0"?><d:propfind xmlns:d="DAV:"><d:prop>'
+                        b'<d:getcontentlength/></d:prop></d:propfind>',
+            ),
+            "WebDAV PROPFIND",
+        )
+        if r.status_code != 207:
+            raise RuntimeError(f"WebDAV PROPFIND {remote_path} failed ({r.status_code})")
+        m = re.search(r"getcontentlength[^>]*>(\d+)<", r.text)
+        return int(m.group(1)) if m else None
+
+    async def download_stream(self, remote_path: str, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+        async with self.session.stream("GET", self._url(remote_path)) as r:
+            if r.status_code != 200:
+                await r.aread()
+                raise RuntimeError(f"WebDAV GET failed ({r.status_code}): {r.text[:400]}")
+            async for chunk in r.aiter_bytes(chunk_size):
+                yield chunk
+
+    async def move(self, src_path: str, dst_path: str) -> None:
+        r = await with_retry(
+            lambda: self.session.request(
+                "MOVE", self._url(src_path),
+                headers={"Destination": self._url(dst_path), "Overwrite": "T"},
+            ),
+            "WebDAV MOVE",
+        )
+        if r.status_code not in (200, 201, 204):
+            raise RuntimeError(f"WebDAV MOVE failed ({r.status_code}): {r.text[:400]}")
+
+    async def list_dir(self, remote_dir: str) -> List[dict]:
+        headers = {"Depth": "1", "Content-Type": "text/xml; charset=utf-8"}
+        body = """<?xml version="1.0" encoding="utf-8" ?>
+<d:propfind xmlns:d="DAV:">
+  <d:prop>
+    <d:displayname />
+    <d:getlastmodified />
+    <d:getcontentlength />
+    <d:resourcetype />
+  </d:prop>
+</d:propfind>"""
+        r = await with_retry(
+            lambda: self.session.request(
+                "PROPFIND", self._url(remote_dir), content=body.encode("utf-8"), headers=headers
+            ),
+            "WebDAV PROPFIND",
+        )
+        if r.status_code != 207:
+            raise RuntimeError(f"WebDAV PROPFIND failed ({r.status_code}): {r.text[:400]}")
+        return _parse_propfind(r.text, remote_dir)
+
+    async def delete(self, remote_path: str) -> None:
+        r = await with_retry(lambda: self.session.delete(self._url(remote_path)), "WebDAV DELETE")
+        if r.status_code not in (200, 204, 404):
+            raise RuntimeError(f"WebDAV DELETE failed ({r.status_code}): {r.text[:400]}")
+        self._known_dirs.discard("/" + remote_path.strip("/"))
+
+
+# ---------------------------
+# Общий клиент процесса (пул соединений и кэш MKCOL живут между запусками бэкапа)
+# ---------------------------
+_client: Optional[WebDAVClient] = None
+
+
+def get_client() -> WebDAVClient:
+    global _client
+    if not WEBDAV_BASE_URL or not WEBDAV_USERNAME or not WEBDAV_PASSWORD:
+        raise RuntimeError("WebDAV not configured: WEBDAV_BASE_URL/WEBDAV_USERNAME/WEBDAV_PASSWORD are required")
+    if _client is None:
+        _client = WebDAVClient(WEBDAV_BASE_URL, WEBDAV_USERNAME, WEBDAV_PASSWORD)
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+# ---------------------------
+# Загрузка
+# ---------------------------
+def resolve_mode(client: WebDAVClient, mode: Optional[str] = None) -> str:
+    mode = (mode or WEBDAV_UPLOAD_MODE or "auto").lower()
+    if mode not in UPLOAD_MODES:
+        mode = "auto"
+    if mode == "auto":
+        return "nextcloud" if _NEXTCLOUD_RE.match(client.base) else "stream"
+    return mode
+
+
+async def _iter_parts(chunks: AsyncIterator[bytes], part_size: int) -> AsyncIterator[Tuple[int, bytes]]:
+    """Перенарезка потока на части ровно по part_size (последняя — остаток). Нумерация с 1."""
+    buf = bytearray()
+    n = 0
+    async for chunk in chunks:
+        buf += chunk
+        while len(buf) >= part_size:
+            n += 1
+            yield n, bytes(buf[:part_size])
+            del buf[:part_size]
+    if buf or n == 0:
+        yield n + 1, bytes(buf)
+
+
+async def upload_parts(
+        chunks: AsyncIterator[bytes],
+        put_part: Callable[[int, bytes], Awaitable[None]],
+        part_size: int,
+        parallel: int,
+) -> Tuple[int, int, str]:
+    """
+    Читает поток частями и отдаёт их put_part с ограниченной параллельностью
+    (в памяти не больше parallel + 1 частей). Первая ошибка отменяет остальные.
+    Возвращает (число частей, всего байт, sha256 целого файла).
+    """
+    sha = hashlib.sha256()
+    total = 0
+    count = 0
+    pending: set[asyncio.Task] = set()
+    try:
+        async for n, data in _iter_parts(chunks, part_size):
+            sha.update(data)
+            total += len(data)
+            count = n
+            pending.add(asyncio.create_task(put_part(n, data)))
+            if len(pending) >= max(1, parallel):
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    t.result()
+        if pending:
+            done, pending = await asyncio.wait(pending)
+            for t in done:
+                t.result()
+    finally:
+        for t in pending:
+            t.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    return count, total, sha.hexdigest()
+
+
+async def _upload_stream_mode(
+        client: WebDAVClient, chunks: AsyncIterator[bytes], remote_path: str, spool_limit: int,
+) -> None:
+    part_path = remote_path + ".part"
+    it = chunks.__aiter__()
+    first = b""
+    try:
+        first = await it.__anext__()
+        second = await it.__anext__()
+    except StopAsyncIteration:
+        # файл целиком в одном чанке (манифесты, маленькие инкременты) — можно повторять
+        await client.put_bytes(part_path, first)
+        await client.move(part_path, remote_path)
+        return
+
+    spool = tempfile.TemporaryFile(prefix="webdav-spool-") if spool_limit > 0 else None
+    spooled = 0
+    source_failed = False
+
+    async def keep(c: bytes) -> None:
+        # в спул, пока влезает в лимит; больше — спул выбрасывается, повтор невозможен
+        nonlocal spool, spooled
+        if spool is None:
+            return
+        if spooled + len(c) > spool_limit:
+            spool.close()
+            spool = None
+            return
+        await asyncio.to_thread(spool.write, c)
+        spooled += len(c)
+
+    async def tee() -> AsyncIterator[bytes]:
+        nonlocal source_failed
+        yield first
+        yield second
+        while True:
+            try:
+                c = await it.__anext__()
+            except StopAsyncIteration:
+                return
+            except BaseException:
+                source_failed = True   # ошибка источника (pg_dump) — повторять нечего
+                raise
+            await keep(c)   # до отправки: обрыв в любой момент не теряет взятого из потока
+            yield c
+
+    try:
+        await keep(first)
+        await keep(second)
+        try:
+            await client.put_stream(part_path, tee())
+        except (httpx.TransportError, RetryableError):
+            if spool is None or source_failed:
+                raise
+            async for c in it:
+                await keep(c)
+                if spool is None:
+                    raise
+            await client.put_file(part_path, spool, retries=max(1, WEBDAV_RETRIES - 1))
+    except Exception:
+        try:
+            await client.delete(part_path)
+        except Exception:
+            pass
+        raise
+    finally:
+        if spool is not None:
+            spool.close()
+    await client.move(part_path, remote_path)
+
+
+async def _upload_parts_mode(
+        client: WebDAVClient, chunks: AsyncIterator[bytes], remote_path: str, part_size: int, parallel: int,
+) -> None:
+    final_dir = remote_path + PARTS_SUFFIX
+    tmp_dir = final_dir + ".tmp"
+    await client.mkcol_recursive(tmp_dir)
+
+    async def put_part(n: int, data: bytes) -> None:
+        await client.put_bytes(f"{tmp_dir}/{n:05d}.part", data)
+
+    try:
+        count, total, sha = await upload_parts(chunks, put_part, part_size, parallel)
+        index = {
+            "file": os.path.basename(remote_path), "parts": count, "part_size": part_size,
+            "size": total, "sha256": sha,
+        }
+        await client.put_bytes(f"{tmp_dir}/{PARTS_INDEX}", json.dumps(index).encode("utf-8"))
+    except Exception:
+        try:
+            await client.delete(tmp_dir)
+        except Exception:
+            pass
+        raise
+    await client.move(tmp_dir, final_dir)
+    client._known_dirs.discard("/" + tmp_dir.strip("/"))
+
+
+async def _upload_nextcloud_mode(
+        client: WebDAVClient, chunks: AsyncIterator[bytes], remote_path: str, part_size: int, parallel: int,
+) -> None:
+    m = _NEXTCLOUD_RE.match(client.base)
+    if not m:
+        raise RuntimeError("nextcloud upload mode requires WEBDAV_BASE_URL …/remote.php/dav/files/<user>")
+    upload_url = f"{m.group('root')}/uploads/{m.group('user')}/botwb-{uuid.uuid4().hex}"
+    dest = {"Destination": client._url(remote_path)}
+    s = client.session
+
+    r = await with_retry(lambda: s.request("MKCOL", upload_url, headers=dest), "Nextcloud MKCOL upload")
+    if r.status_code not in (201, 405):
+        raise RuntimeError(f"Nextcloud chunked upload init failed ({r.status_code}): {r.text[:400]}")
+
+    async def put_part(n: int, data: bytes) -> None:
+        rr = await with_retry(
+            lambda: s.put(f"{upload_url}/{n:05d}", content=data, headers=dest), f"Nextcloud PUT part {n}",
+        )
+        if rr.status_code not in (200, 201, 204):
+            raise RuntimeError(f"Nextcloud PUT part {n} failed ({rr.status_code}): {rr.text[:400]}")
+
+    try:
+        _, total, _ = await upload_parts(chunks, put_part, part_size, parallel)
+        r = await with_retry(
+            lambda: s.request(
+                "MOVE", f"{upload_url}/.file",
+                headers={**dest, "Overwrite": "T", "OC-Total-Length": str(total)},
+            ),
+            "Nextcloud assemble",
+        )
+        if r.status_code not in (200, 201, 204):
+            raise RuntimeError(f"Nextcloud assemble failed ({r.status_code}): {r.text[:400]}")
+    except Exception:
+        try:
+            await s.delete(upload_url)
+        except Exception:
+            pass
+        raise
+
+
+async def upload(
+        client: WebDAVClient,
+        chunks: AsyncIterator[bytes],
+        remote_path: str,
+        mode: Optional[str] = None,
+        part_size: int = WEBDAV_PART_MB * 1024 * 1024,
+        parallel: int = WEBDAV_PARALLEL,
+        spool_limit: int = WEBDAV_STREAM_SPOOL_MB * 1024 * 1024,
+) -> str:
+    """Заливает поток в remote_path. Возвращает путь артефакта (для parts — каталог *.parts)."""
+    mode = resolve_mode(client, mode)
+    await client.mkcol_recursive(os.path.dirname(remote_path) or "/")
+    if mode == "parts":
+        await _upload_parts_mode(client, chunks, remote_path, part_size, parallel)
+        return remote_path + PARTS_SUFFIX
+    if mode == "nextcloud":
+        await _upload_nextcloud_mode(client, chunks, remote_path, part_size, parallel)
+        return remote_path
+    await _upload_stream_mode(client, chunks, remote_path, spool_limit)
+    return remote_path
+
+
+# ---------------------------
+# Чтение артефакта (проверка после загрузки, тест-восстановление)
+# ---------------------------
+async def artifact_size(client: WebDAVClient, remote_path: str) -> Optional[int]:
+    """Размер файла или сумма частей каталога *.parts."""
+    if remote_path.endswith(PARTS_SUFFIX):
+        items = await client.list_dir(remote_path)
+        return sum(it["size"] or 0 for it in items if it["name"].endswith(".part"))
+    return await client.size_of(remote_path)
+
+
+async def artifact_stream(client: WebDAVClient, remote_path: str) -> AsyncIterator[bytes]:
+    """Содержимое файла; для *.parts — части по порядку из index.json."""
+    if not remote_path.endswith(PARTS_SUFFIX):
+        async for chunk in client.download_stream(remote_path):
+            yield chunk
+        return
+    index = json.loads(await client.get_bytes(f"{remote_path}/{PARTS_INDEX}"))
+    for n in range(1, int(index["parts"]) + 1):
+        async for chunk in client.download_stream(f"{remote_path}/{n:05d}.part"):
+            yield chunk
+
+
+# ---------------------------
+# Склейка *.parts (для восстановления)
+# ---------------------------
+def join_parts(parts_dir: str, out_path: Optional[str] = None) -> str:
+    """
+    Склеивает локально скачанный каталог <file>.parts в файл, сверяя размер и sha256
+    из index.json. Возвращает путь к собранному файлу.
+    """
+    with open(os.path.join(parts_dir, PARTS_INDEX), "r", encoding="utf-8") as f:
+        index = json.load(f)
+    out_path = out_path or os.path.join(os.path.dirname(parts_dir.rstrip("/\\")), index["file"])
+    sha = hashlib.sha256()
+    total = 0
+    with open(out_path, "wb") as out:
+        for n in range(1, int(index["parts"]) + 1):
+            with open(os.path.join(parts_dir, f"{n:05d}.part"), "rb") as pf:
+                while True:
+                    buf = pf.read(1024 * 1024)
+                    if not buf:
+                        break
+                    sha.update(buf)
+                    total += len(buf)
+                    out.write(buf)
+    if total != index["size"] or sha.hexdigest() != index["sha256"]:
+        os.remove(out_path)
+        raise RuntimeError(f"Parts of {index['file']} are corrupted (size/sha256 mismatch)")
+    return out_path
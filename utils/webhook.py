@@ -0,0 +1,262 @@
+# utils/webhook.py
+# Приём апдейтов вебхуком (aiohttp) — альтернатива dp.start_polling, те же роутеры и middleware.
+#
+#   server = WebhookServer(dp, bot, path="/tg/webhook", secret="s3cr3t")
+#   await server.start("0.0.0.0", 8080)      # POST /tg/webhook, GET /tg/webhook/health
+#   ...
+#   await server.stop(drain_timeout=30)       # не принимать новые, дождаться апдейтов «в полёте»
+#
+# Telegram ждёт ответа на POST и при ошибке/таймауте шлёт апдейт повторно, поэтому апдейт
+# подтверждается сразу (200), а обрабатывается фоновой задачей. Подпись — заголовок
+# X-Telegram-Bot-Api-Secret-Token (сравнение за постоянное время); чужие POST → 401.
+# Во время остановки новые апдейты получают 503 — Telegram доставит их следующему процессу.
+#
+# Несколько воркеров (BOT_MODE=router): UpdateRouter принимает вебхук и пересылает тело апдейта
+# воркеру chat_id % N (WORKER_URLS) — апдейты одного чата всегда в одном процессе, поэтому локальные
+# файлы сценариев (загрузка бэкапа) и фоновые задачи админки остаются у «своего» воркера.
+# Код ответа воркера возвращается Telegram как есть (503 при дренаже/недоступности → повтор).
+from __future__ import annotations
+
+import asyncio
+import hmac
+import json
+import logging
+import secrets
+import signal
+from typing import Any, Dict, List, Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def make_secret() -> str:
+    """Случайный секрет допустимого для Telegram алфавита (A-Z a-z 0-9 _ -)."""
+    return secrets.token_urlsafe(32)
+
+
+class WebhookServer:
+    def __init__(self, dp: Dispatcher, bot: Bot, path: str, secret: str):
+        if not secret:
+            raise RuntimeError("Webhook secret is empty")
+        self.dp = dp
+        self.bot = bot
+        self.path = "/" + path.strip("/")
+        self.secret = secret
+        self._inflight: Set[asyncio.Task] = set()
+        self._draining = False
+        self._runner = None
+        self._site = None
+
+    # ---------------------------
+    # HTTP
+    # ---------------------------
+    async def _handle(self, request):
+        from aiohttp import web
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=401)
+        if self._draining:
+            return web.Response(status=503)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logger.warning("Webhook: bad update payload: %r", e)
+            return web.Response(status=400)
+
+        task = asyncio.create_task(self._process(update))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+        return web.Response(status=200)
+
+    async def _health(self, request):
+        from aiohttp import web
+        return web.json_response({"ok": not self._draining, "inflight": len(self._inflight)},
+                                 status=503 if self._draining else 200)
+
+    async def _process(self, update: Update) -> None:
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception:
+            logger.exception("Webhook: update %s failed", update.update_id)
+
+    def setup(self, app) -> None:
+        """Повесить маршруты на существующее aiohttp-приложение."""
+        app.router.add_post(self.path, self._handle)
+        app.router.add_get(self.path + "/health", self._health)
+
+    # ---------------------------
+    # Жизненный цикл
+    # ---------------------------
+    async def start(self, host: str, port: int) -> None:
+        from aiohttp import web
+        app = web.Application()
+        self.setup(app)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        self._site = web.TCPSite(self._runner, host, port)
+        await self._site.start()
+        logger.info("Webhook: listening on http://%s:%s%s", host, port, self.path)
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    async def drain(self, timeout: float) -> int:
+        """Перестать принимать апдейты и дождаться начатых; возвращает число не успевших."""
+        self._draining = True
+        pending = set(self._inflight)
+        if pending:
+            logger.info("Webhook: draining %d in-flight update(s), up to %ss", len(pending), timeout)
+            _, pending = await asyncio.wait(pending, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning("Webhook: %d update(s) cancelled after drain timeout", len(pending))
+        return len(pending)
+
+    async def stop(self, drain_timeout: float = 30) -> None:
+        await self.drain(drain_timeout)
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = self._site = None
+
+
+# ---------------------------
+# Маршрутизатор воркеров
+# ---------------------------
+# поля апдейта, где лежит чат (или пользователь, если чата нет)
+_CHAT_PATHS = (
+    ("message", "chat"), ("edited_message", "chat"), ("channel_post", "chat"),
+    ("edited_channel_post", "chat"), ("business_message", "chat"),
+    ("callback_query", "message", "chat"), ("callback_query", "from"),
+    ("my_chat_member", "chat"), ("chat_member", "chat"), ("chat_join_request", "chat"),
+    ("inline_query", "from"), ("chosen_inline_result", "from"),
+    ("shipping_query", "from"), ("pre_checkout_query", "from"), ("poll_answer", "user"),
+)
+
+
+def affinity_key(update: Dict[str, Any]) -> int:
+    """chat_id апдейта (или id пользователя); неизвестный тип — update_id."""
+    for path in _CHAT_PATHS:
+        node: Any = update
+        for part in path:
+            node = node.get(part) if isinstance(node, dict) else None
+        if isinstance(node, dict) and isinstance(node.get("id"), int):
+            return node["id"]
+    return int(update.get("update_id") or 0)
+
+
+class UpdateRouter:
+    def __init__(self, worker_urls: List[str], path: str, secret: str, timeout: float = 60):
+        if not worker_urls:
+            raise RuntimeError("WORKER_URLS is empty — nothing to route updates to")
+        if not secret:
+            raise RuntimeError("Webhook secret is empty")
+        self.workers = list(worker_urls)
+        self.path = "/" + path.strip("/")
+        self.secret = secret
+        self.timeout = timeout
+        self._http = None
+        self._runner = None
+
+    def worker_for(self, update: Dict[str, Any]) -> str:
+        return self.workers[affinity_key(update) % len(self.workers)]
+
+    async def _handle(self, request):
+        from aiohttp import ClientError, web
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=401)
+        body = await request.read()
+        try:
+            url = self.worker_for(json.loads(body))
+        except (ValueError, AttributeError) as e:
+            logger.warning("Router: bad update payload: %r", e)
+            return web.Response(status=400)
+        try:
+            async with self._http.post(url, data=body, headers={
+                SECRET_HEADER: self.secret, "Content-Type": "application/json",
+            }) as resp:
+                return web.Response(status=resp.status)
+        except (ClientError, asyncio.TimeoutError) as e:
+            logger.warning("Router: worker %s unavailable: %r", url, e)
+            return web.Response(status=503)
+
+    async def start(self, host: str, port: int) -> None:
+        from aiohttp import ClientSession, ClientTimeout, web
+        self._http = ClientSession(timeout=ClientTimeout(total=self.timeout))
+        app = web.Application()
+        app.router.add_post(self.path, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info("Router: http://%s:%s%s → %d worker(s)", host, port, self.path, len(self.workers))
+
+    async def stop(self) -> None:
+        # cleanup() дожидается начатых запросов — пересылки успевают получить ответ воркера
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+
+def _stop_event() -> asyncio.Event:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):  # Windows: только Ctrl+C через KeyboardInterrupt
+            pass
+    return stop
+
+
+async def _set_webhook(bot: Bot, base_url: str, path: str, secret: str, allowed_updates) -> None:
+    if base_url:
+        await bot.set_webhook(url=base_url + path, secret_token=secret, allowed_updates=allowed_updates)
+        logger.info("Webhook: registered %s%s", base_url, path)
+    else:
+        logger.warning("Webhook: WEBHOOK_BASE_URL is empty — setWebhook skipped")
+
+
+async def run_router(bot: Bot, worker_urls: List[str], *, host: str, port: int, path: str,
+                     secret: str, base_url: str = "", allowed_updates: Optional[List[str]] = None) -> None:
+    """Процесс-маршрутизатор: без БД и диспетчера, только пересылка апдейтов воркерам."""
+    router = UpdateRouter(worker_urls, path, secret)
+    stop = _stop_event()
+    try:
+        await router.start(host, port)
+        await _set_webhook(bot, base_url, router.path, secret, allowed_updates)
+        await stop.wait()
+        logger.info("Router: stopping")
+    finally:
+        await router.stop()
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, *, host: str, port: int, path: str,
+                      secret: Optional[str] = None, base_url: str = "", drain_timeout: float = 30) -> None:
+    """
+    Жизненный цикл бота в режиме вебхука (аналог dp.start_polling): startup-хуки, setWebhook,
+    ожидание SIGINT/SIGTERM, дренаж, shutdown-хуки. Вебхук при остановке не удаляется —
+    при перезапуске/раскатке Telegram держит апдейты у себя, пока процесс снова не ответит.
+    """
+    if not secret and not base_url:
+        raise RuntimeError("WEBHOOK_SECRET is required when WEBHOOK_BASE_URL is empty (webhook set up externally)")
+    secret = secret or make_secret()
+    server = WebhookServer(dp, bot, path, secret)
+
+    stop = _stop_event()
+
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    try:
+        await server.start(host, port)
+        await _set_webhook(bot, base_url, server.path, secret, dp.resolve_used_update_types())
+        await stop.wait()
+        logger.info("Webhook: stopping")
+    finally:
+        await server.stop(drain_timeout)
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)